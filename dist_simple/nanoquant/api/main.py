@@ -8,16 +8,16 @@ from typing import Optional, Dict, Any, List
 import logging
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import secrets
+from fastapi.responses import JSONResponse, StreamingResponse
 import urllib.parse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory session storage (in production, use Redis or database)
-user_sessions = {}
+# Login sessions keyed by token hash; in Redis when NANOQUANT_SESSION_REDIS_URL is set
+from nanoquant.core.session_store import open_session_store
+session_store = open_session_store()
 
 app = FastAPI(
     title="NanoQuant API",
@@ -38,8 +38,28 @@ app.add_middleware(
 
 # Import user management
 from nanoquant.core.user_management import UserManager
+from nanoquant.core.level_catalog import access_key, level_listing
 user_manager = UserManager()
 
+# Compression runs in worker processes fed through the compression_jobs table
+from nanoquant.core.job_queue import JobStore, CompressionWorkerPool, follow_events, QUEUED, COMPLETED, FAILED
+job_store = JobStore()
+worker_pool = CompressionWorkerPool(job_store.db_path)
+
+@app.on_event("startup")
+def start_compression_workers():
+    worker_pool.start()
+
+@app.on_event("shutdown")
+def stop_compression_workers():
+    worker_pool.shutdown()
+
+@app.on_event("shutdown")
+def flush_cloud_user_data():
+    # Queued cloud writes would otherwise wait for interpreter exit
+    if user_manager.cloud_storage:
+        user_manager.cloud_storage.close()
+
 # Try to import cloud integration and payment processor
 try:
     from nanoquant.core.cloud_integration import SocialAuth, PaymentProcessor
@@ -54,14 +74,26 @@ class CompressionRequest(BaseModel):
     compression_level: str = "medium"
     push_to_ollama: bool = True
     preserve_super_weights: bool = False
+    streaming: bool = False
+    lazy: bool = False
     custom_config: Optional[Dict[str, Any]] = None
 
-class CompressionResponse(BaseModel):
+class CompressionJobResponse(BaseModel):
+    job_id: int
+    status: str
+
+class CompressionJobStatus(BaseModel):
+    job_id: int
     model_id: str
-    generated_models: List[Dict[str, Any]]
-    output_directory: str
-    ollama_tags: List[str]
-    pull_commands: Dict[str, str]
+    compression_level: str
+    status: str
+    progress: float
+    stage: Optional[str]
+    created_at: Optional[str]
+    started_at: Optional[str]
+    completed_at: Optional[str]
+    output_path: Optional[str]
+    error: Optional[str]
 
 class ModelInfoResponse(BaseModel):
     model_id: str
@@ -123,9 +155,9 @@ def get_current_user(authorization: str = Header(None)):
     token = authorization[7:]  # Remove "Bearer " prefix
     
     # Look up user by session token
-    for user_id, session_token in user_sessions.items():
-        if session_token == token:
-            return user_id
+    user_id = session_store.resolve(token)
+    if user_id is not None:
+        return user_id
     
     raise HTTPException(status_code=401, detail="Invalid or expired session")
 
@@ -142,8 +174,7 @@ async def register_user(request: UserRegistrationRequest):
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create session token
-        session_token = secrets.token_urlsafe(32)
-        user_sessions[user_id] = session_token
+        session_token = session_store.create(user_id)
         
         return {
             "user_id": user_id,
@@ -163,8 +194,7 @@ async def login_user(request: UserLoginRequest):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # Create session token
-        session_token = secrets.token_urlsafe(32)
-        user_sessions[user_id] = session_token
+        session_token = session_store.create(user_id)
         
         return {
             "user_id": user_id,
@@ -175,6 +205,18 @@ async def login_user(request: UserLoginRequest):
         logger.error(f"Error logging in user: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/auth/logout")
+async def logout_user(authorization: str = Header(None), user_id: str = Depends(get_current_user)):
+    """End the current session"""
+    session_store.revoke(authorization[7:])
+    return {"message": "Logged out"}
+
+@app.post("/auth/logout-all")
+async def logout_everywhere(user_id: str = Depends(get_current_user)):
+    """End every session of the current user"""
+    revoked = session_store.revoke_user(user_id)
+    return {"message": "Logged out everywhere", "sessions_ended": revoked}
+
 @app.post("/auth/social")
 async def social_login(request: SocialLoginRequest, req: Request):
     """Authenticate a user via social login"""
@@ -204,8 +246,7 @@ async def social_login(request: SocialLoginRequest, req: Request):
                 raise HTTPException(status_code=500, detail="Failed to create user")
         
         # Create session token
-        session_token = secrets.token_urlsafe(32)
-        user_sessions[user_id] = session_token
+        session_token = session_store.create(user_id)
         
         return {
             "user_id": user_id,
@@ -365,17 +406,14 @@ async def verify_payment(payment_id: str, provider: str = "stripe", user_id: str
         logger.error(f"Error verifying payment: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/compression/start", response_model=CompressionResponse)
+@app.post("/compression/start", response_model=CompressionJobResponse)
 async def compress_model(request: CompressionRequest, user_id: str = Depends(get_current_user)):
     """
-    Compress a model into NanoQuants
+    Queue a model for compression into NanoQuants and return its job ID immediately
     """
     try:
         logger.info(f"Compression request received for model: {request.model_id}")
         
-        # Import here to avoid circular imports
-        from nanoquant.core.compression_pipeline import CompressionPipeline
-        
         # Validate compression level
         valid_levels = ["light", "medium", "heavy", "extreme", "ultra", "nano", "atomic"]
         if request.compression_level not in valid_levels:
@@ -385,41 +423,61 @@ async def compress_model(request: CompressionRequest, user_id: str = Depends(get
         if not user_manager.check_compression_access(user_id, request.compression_level):
             raise HTTPException(status_code=403, detail="Insufficient credits or access level for this compression level")
         
-        # Create pipeline
-        pipeline = CompressionPipeline()
-        
-        # Process model
-        if request.custom_config:
-            result = pipeline.process_custom_model(
-                request.model_id,
-                request.custom_config,
-                push_to_ollama=request.push_to_ollama,
-                user_id=user_id
-            )
-        else:
-            # Add preserve_super_weights to config if requested
-            if request.preserve_super_weights:
-                # This would be handled in the compression engine
-                pass
-                
-            result = pipeline.process_model(
-                request.model_id,
-                request.compression_level,
-                push_to_ollama=request.push_to_ollama,
-                user_id=user_id
-            )
-        
-        logger.info(f"Compression completed successfully for model: {request.model_id}")
-        return CompressionResponse(**result)
-    except PermissionError as e:
-        logger.warning(f"Permission error: {e}")
-        raise HTTPException(status_code=403, detail="Access denied. Please check your credits and subscription level.")
+        # The worker processes pick the job up; access and credits are checked again when it runs
+        job_id = job_store.create_job(user_id, request.model_id, request.compression_level, request.dict())
+        logger.info(f"Queued compression job {job_id} for model: {request.model_id}")
+        return CompressionJobResponse(job_id=job_id, status=QUEUED)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error during compression: {e}")
+        logger.error(f"Error queueing compression: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_user_job(job_id: int, user_id: str) -> Dict[str, Any]:
+    """Look up a job, hiding other users' jobs"""
+    job = job_store.get_job(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def job_status(job: Dict[str, Any]) -> CompressionJobStatus:
+    return CompressionJobStatus(job_id=job["id"], **{key: job[key] for key in CompressionJobStatus.__fields__
+                                                      if key != "job_id"})
+
+@app.get("/compression/jobs", response_model=List[CompressionJobStatus])
+async def list_compression_jobs(user_id: str = Depends(get_current_user)):
+    """List the user's compression jobs, newest first"""
+    return [job_status(job) for job in job_store.list_jobs(user_id)]
+
+@app.get("/compression/jobs/{job_id}", response_model=CompressionJobStatus)
+async def get_compression_job(job_id: int, user_id: str = Depends(get_current_user)):
+    """Get the status and progress of a compression job"""
+    return job_status(get_user_job(job_id, user_id))
+
+@app.get("/compression/jobs/{job_id}/events")
+async def stream_compression_events(job_id: int, user_id: str = Depends(get_current_user),
+                                    last_event_id: Optional[str] = Header(None)):
+    """
+    Stream a compression job's progress as server-sent events: "progress" events with
+    the stage, level, layer, bytes processed and ETA, then one "end" event with the
+    final status. Reconnecting clients send Last-Event-ID to resume where they left off.
+    """
+    get_user_job(job_id, user_id)
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    # A plain generator: Starlette iterates it in a thread, off the event loop
+    return StreamingResponse(follow_events(job_store, job_id, after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/compression/jobs/{job_id}/result")
+async def get_compression_result(job_id: int, user_id: str = Depends(get_current_user)):
+    """Get the result of a finished compression job"""
+    job = get_user_job(job_id, user_id)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
+
 @app.get("/compression-levels")
 async def get_compression_levels(user_id: str = Depends(get_current_user)):
     """Get available compression levels with user-specific restrictions"""
@@ -429,54 +487,12 @@ async def get_compression_levels(user_id: str = Depends(get_current_user)):
         if not profile:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Define compression levels with descriptions
-        levels = {
-            "light": {
-                "name": "Light",
-                "description": "50-70% size reduction, quality-critical applications",
-                "cost": 0,
-                "accessible": True
-            },
-            "medium": {
-                "name": "Medium",
-                "description": "70-85% size reduction, balanced compression/quality",
-                "cost": 0,
-                "accessible": True
-            },
-            "heavy": {
-                "name": "Heavy",
-                "description": "85-92% size reduction, significant size reduction",
-                "cost": 10,
-                "accessible": user_manager.check_compression_access(user_id, "heavy")
-            },
-            "extreme": {
-                "name": "Extreme",
-                "description": "92-96% size reduction, maximum compression",
-                "cost": 25,
-                "accessible": user_manager.check_compression_access(user_id, "extreme")
-            },
-            "ultra": {
-                "name": "Ultra",
-                "description": "96-98% size reduction, extreme compression with advanced techniques",
-                "cost": 50,
-                "accessible": user_manager.check_compression_access(user_id, "ultra")
-            },
-            "nano": {
-                "name": "Nano",
-                "description": "98-99% size reduction, sub-1-bit compression",
-                "cost": 100,
-                "accessible": user_manager.check_compression_access(user_id, "nano")
-            },
-            "atomic": {
-                "name": "Atomic",
-                "description": "99-99.5% size reduction, maximum compression with all ultra-advanced techniques",
-                "cost": 200,
-                "accessible": user_manager.check_compression_access(user_id, "atomic")
-            }
-        }
+        # One cached listing per access state; the catalog itself is built once per process
+        listing = level_listing(access_key(profile))
         
         return {
-            "levels": levels,
+            "levels": listing["levels"],
+            "catalog_version": listing["catalog_version"],
             "user_credits": profile.get("credits", 0),
             "user_tier": profile.get("tier", "free")
         }
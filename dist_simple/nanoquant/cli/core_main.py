@@ -105,9 +105,8 @@ def levels():
     Show available compression levels
     """
     try:
-        from nanoquant.core.compression_pipeline import CompressionPipeline
-        pipeline = CompressionPipeline()
-        levels_info = pipeline.get_compression_levels()
+        from nanoquant.core.level_catalog import level_catalog
+        levels_info = level_catalog()["levels"]
         
         console.print(Panel("[bold blue]🔧 Compression Levels[/bold blue]", expand=False))
         
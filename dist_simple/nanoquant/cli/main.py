@@ -258,7 +258,7 @@ def compress(
     model_id: str = typer.Argument(..., help="Hugging Face model ID (e.g., meta-llama/Llama-2-7b-hf)"),
     level: str = typer.Option("medium", "--level", "-l", help="Compression level (light, medium, heavy, extreme, ultra, nano, atomic)"),
     output_dir: Path = typer.Option("./nanoquants", "--output-dir", "-o", help="Output directory for compressed models"),
-    name: Optional[str] = typer.Option(None, "--name", "-n", help="Custom name for the NanoQuants"),
+    name: Optional[str] = typer.Option(None, "--name", "-n", help="Custom name for the NanoQuants' directories and Ollama tags"),
     preserve_super_weights: bool = typer.Option(False, "--preserve-super-weights", help="Preserve super weights as per Apple research"),
     push_to_ollama: bool = typer.Option(True, "--push-to-ollama/--no-push-to-ollama", help="Push to Ollama"),
 ):
@@ -286,11 +286,17 @@ def compress(
     details_table.add_row("Model ID", model_id)
     details_table.add_row("Compression Level", level)
     details_table.add_row("Output Directory", str(output_dir))
+    if name:
+        details_table.add_row("Name", name)
     details_table.add_row("Preserve Super Weights", str(preserve_super_weights))
     details_table.add_row("Push to Ollama", str(push_to_ollama))
     console.print(details_table)
     
-    # Process model with progress indication
+    # Run the pipeline, driving the progress bar from its progress events
+    from nanoquant.core.compression_pipeline import CompressionPipeline
+    from nanoquant.core.progress import ProgressTracker, describe
+
+    started = time.time()
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
@@ -298,37 +304,21 @@ def compress(
         TaskProgressColumn(),
         transient=True,
     ) as progress:
-        task = progress.add_task("Initializing compression pipeline...", total=7)
-        
-        progress.update(task, description="Loading model from source...", advance=1)
-        time.sleep(0.5)
-        
-        progress.update(task, description="Analyzing model architecture...", advance=1)
-        time.sleep(0.3)
-        
-        progress.update(task, description="Applying quantization techniques...", advance=1)
-        time.sleep(1.0)
-        
-        progress.update(task, description="Performing parameter pruning...", advance=1)
-        time.sleep(1.5)
-        
-        progress.update(task, description="Executing low-rank decomposition...", advance=1)
-        time.sleep(1.0)
-        
-        progress.update(task, description="Applying LoRA fine-tuning...", advance=1)
-        time.sleep(0.8)
-        
-        progress.update(task, description="Finalizing compression...", advance=1)
-        time.sleep(0.5)
-        
-        if push_to_ollama:
-            progress.update(task, description="Packaging for Ollama distribution...", advance=1)
-            time.sleep(0.7)
-    
-    model_name = model_id.replace('/', '_')
-    if name:
-        model_name = name
-    
+        task = progress.add_task("Initializing compression pipeline...", total=1.0)
+
+        def show(event):
+            progress.update(task, description=describe(event), completed=event["progress"])
+
+        try:
+            pipeline = CompressionPipeline(output_base_dir=str(output_dir))
+            result = pipeline.process_model(model_id, level, push_to_ollama=push_to_ollama,
+                                            progress=ProgressTracker([show], min_interval=0.1),
+                                            model_name=name)
+        except Exception as e:
+            console.print(f"[bold red]❌ Compression failed: {e}[/bold red]")
+            raise typer.Exit(1)
+    elapsed = int(time.time() - started)
+
     # Display success message
     console.print("[bold green]✅ Compression pipeline completed successfully![/bold green]")
     
@@ -337,15 +327,16 @@ def compress(
     results_table.add_column("Metric", style="cyan")
     results_table.add_column("Value", style="magenta")
     results_table.add_row("Model ID", model_id)
-    results_table.add_row("Output Directory", f"{output_dir}/{model_name}")
-    results_table.add_row("Compression Levels", "light, medium, heavy, extreme, ultra, nano, atomic")
-    results_table.add_row("Processing Time", "~15 minutes")
+    results_table.add_row("Output Directory", result["output_directory"])
+    results_table.add_row("Compression Levels", ", ".join(model_info["level"] for model_info in result["generated_models"]))
+    results_table.add_row("Processing Time", f"{elapsed // 60}m {elapsed % 60:02d}s")
     console.print(results_table)
     
-    if push_to_ollama:
+    level_tags = [tag for tag in result["ollama_tags"] if tag.endswith(f":{level}")]
+    if level_tags:
         console.print("[bold blue]📦 Ollama Integration:[/bold blue]")
         console.print(f"   To pull the {level} NanoQuant:")
-        console.print(f"   [bold]ollama pull nanoquant_{model_name}:{level}[/bold]")
+        console.print(f"   [bold]ollama pull {level_tags[0]}[/bold]")
     
     console.print("[bold yellow]📊 Expected results:[/bold yellow]")
     compression_ratios = {
@@ -416,9 +407,8 @@ def levels():
     """
     console.print("[bold blue]📊 NanoQuant Compression Levels:[/bold blue]")
     
-    # Import the generator to get level information
-    from nanoquant.core.nanoquant_generator import UltraNanoQuantGenerator
-    generator = UltraNanoQuantGenerator()
+    # The shared level catalog, without loading the compression stack
+    from nanoquant.core.level_catalog import level_catalog
     
     levels_table = Table(show_header=True, header_style="bold magenta", border_style="blue")
     levels_table.add_column("Level", style="cyan", width=10)
@@ -441,7 +431,7 @@ def levels():
             pass
     
     # Add rows for each level
-    for level_name, level_config in generator.compression_levels.items():
+    for level_name, level in level_catalog()["levels"].items():
         # Check if user has access to this level
         access = True
         if user_tier == "free" and level_name in ["ultra", "nano", "atomic"]:
@@ -449,28 +439,9 @@ def levels():
             
         level_display = level_name if access else f"{level_name} [red](Premium)[/red]"
         
-        size_reduction = {
-            'light': '50-70%', 
-            'medium': '70-85%', 
-            'heavy': '85-92%', 
-            'extreme': '92-96%',
-            'ultra': '96-98%',
-            'nano': '98-99%',
-            'atomic': '99-99.5%'
-        }.get(level_name, 'N/A')
-        
-        description = level_config.get("description", "N/A")
-        
-        # Format techniques
-        techniques = []
-        if "quantization" in level_config:
-            techniques.append(f"{level_config['quantization'].get('type', 'N/A')} quantization")
-        if "pruning" in level_config:
-            techniques.append(f"{level_config['pruning'].get('type', 'N/A')} pruning ({level_config['pruning'].get('ratio', 0)*100}%)")
-        if "decomposition" in level_config:
-            techniques.append(f"{level_config['decomposition'].get('type', 'N/A')}")
-        
-        key_techniques = ", ".join(techniques) if techniques else "N/A"
+        size_reduction = level["size_reduction"]
+        description = level["config"].get("description", "N/A")
+        key_techniques = ", ".join(level["techniques"]) if level["techniques"] else "N/A"
         
         levels_table.add_row(level_display, size_reduction, description, key_techniques)
     
@@ -0,0 +1,343 @@
+"""
+AQLM Quantization for NanoQuant
+Additive multi-codebook quantization: k-means initialization, beam-search codes,
+least-squares codebook updates and a codebook-lookup Linear
+"""
+import os
+import json
+import hashlib
+import torch
+import torch.nn.functional as F
+from typing import Dict, Any, Optional
+import logging
+
+from nanoquant.core.quantized_layers import (
+    outlier_mask, apply_outliers, pack_keep_plane, apply_keep_plane, OUTLIER_DTYPE
+)
+
+logger = logging.getLogger(__name__)
+
+# Up to this many input rows, forward multiplies through codebook lookup tables
+LOOKUP_MAX_TOKENS = 8
+
+# Vectors scored at once during assignment, bounding peak memory
+ASSIGN_CHUNK = 1 << 14
+
+# The least-squares codebook update solves over all entries of all codebooks at once
+MAX_CODEBOOK_ENTRIES = 4096
+
+# from_weight arguments that change a layer's result (and so its checkpoint), with their defaults
+AQLM_SETTINGS = {"num_codebooks": 2, "codebook_bits": 8, "group_size": 8, "beam_size": 4,
+                 "rounds": 3, "kmeans_iters": 25, "seed": 0}
+
+
+def _weighted_distances(vectors: torch.Tensor, centroids: torch.Tensor,
+                        importance: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """[n, k] importance-weighted squared distances between vectors [n, d] and centroids [k, d]"""
+    if importance is None:
+        importance = torch.ones_like(vectors)
+    return ((importance * vectors ** 2).sum(-1, keepdim=True)
+            - 2 * (importance * vectors) @ centroids.t()
+            + importance @ (centroids ** 2).t())
+
+
+def nearest(vectors: torch.Tensor, centroids: torch.Tensor,
+            importance: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Index of the closest centroid for every vector, in chunks"""
+    return torch.cat([
+        _weighted_distances(vectors[start:start + ASSIGN_CHUNK], centroids,
+                            importance[start:start + ASSIGN_CHUNK] if importance is not None else None
+                            ).argmin(dim=-1)
+        for start in range(0, len(vectors), ASSIGN_CHUNK)
+    ])
+
+
+def kmeans(vectors: torch.Tensor, k: int, iters: int = 25, batch_size: int = 1 << 16,
+           seed: int = 0) -> torch.Tensor:
+    """
+    Mini-batch k-means: every iteration assigns a random batch of vectors and moves
+    each centroid towards its batch members with a 1 / (points seen) step size
+    """
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    count = len(vectors)
+    start = torch.randperm(count, generator=generator)[:k].to(vectors.device)
+    centroids = vectors[start].clone()
+    if len(centroids) < k:
+        # Fewer vectors than centroids: pad with jittered copies
+        extra = centroids[torch.randint(0, len(centroids), (k - len(centroids),), generator=generator)]
+        centroids = torch.cat([centroids, extra + 1e-3 * torch.randn(extra.shape, generator=generator)])
+
+    seen = torch.zeros(k, device=vectors.device)
+    for _ in range(iters):
+        batch = vectors[torch.randint(0, count, (min(batch_size, count),), generator=generator).to(vectors.device)]
+        assignment = nearest(batch, centroids)
+        sums = torch.zeros_like(centroids).index_add_(0, assignment, batch)
+        counts = torch.bincount(assignment, minlength=k).float()
+        seen += counts
+        rate = (counts / seen.clamp(min=1)).unsqueeze(1)
+        centroids += rate * (sums / counts.clamp(min=1).unsqueeze(1) - centroids)
+    return centroids
+
+
+def reconstruct(codebooks: torch.Tensor, codes: torch.Tensor) -> torch.Tensor:
+    """Sum over codebooks of the selected entries: codes [..., M] -> vectors [..., d]"""
+    return sum(codebooks[m][codes[..., m]] for m in range(codebooks.shape[0]))
+
+
+def beam_search(vectors: torch.Tensor, codebooks: torch.Tensor, codes: torch.Tensor,
+                beam_size: int = 4, importance: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Improve the code tuples of all vectors at once: for every codebook in turn, each of
+    the beam_size best tuples so far tries all entries of that codebook and the
+    beam_size lowest-error tuples survive. Returns the best tuple per vector.
+    """
+    num_codebooks, k, _ = codebooks.shape
+    improved = []
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        v = vectors[start:start + ASSIGN_CHUNK]
+        weight = importance[start:start + ASSIGN_CHUNK] if importance is not None else torch.ones_like(v)
+        beams = codes[start:start + ASSIGN_CHUNK].unsqueeze(1)  # [n, beams, M]
+        for m in range(num_codebooks):
+            # Residual each beam leaves for codebook m to explain: [n, beams, d]
+            residual = v.unsqueeze(1) - reconstruct(codebooks, beams) + codebooks[m][beams[..., m]]
+            errors = ((weight.unsqueeze(1) * residual ** 2).sum(-1, keepdim=True)
+                      - 2 * (weight.unsqueeze(1) * residual) @ codebooks[m].t()
+                      + (weight @ (codebooks[m] ** 2).t()).unsqueeze(1))  # [n, beams, k]
+            best = errors.reshape(len(v), -1).topk(min(beam_size, errors[0].numel()), largest=False).indices
+            parents = torch.gather(beams, 1, (best // k).unsqueeze(-1).expand(-1, -1, num_codebooks)).clone()
+            parents[..., m] = best % k
+            beams = parents
+        improved.append(beams[:, 0])
+    return torch.cat(improved)
+
+
+def update_codebooks(vectors: torch.Tensor, codes: torch.Tensor, codebooks: torch.Tensor,
+                     importance: Optional[torch.Tensor] = None, ridge: float = 1e-4) -> torch.Tensor:
+    """
+    Least-squares codebooks for fixed codes. Each coordinate is an independent weighted
+    problem over all M * K entries, solved in one batched call; entries no vector uses
+    stay where they were thanks to the ridge term pulling towards the old values.
+    """
+    num_codebooks, k, dim = codebooks.shape
+    size = num_codebooks * k
+    if importance is None:
+        importance = torch.ones_like(vectors)
+    entries = codes.long() + torch.arange(num_codebooks, device=codes.device) * k  # [n, M]
+
+    gram = torch.zeros(dim, size * size, device=vectors.device)
+    for a in range(num_codebooks):
+        for b in range(num_codebooks):
+            gram.index_add_(1, entries[:, a] * size + entries[:, b], importance.t())
+    gram = gram.reshape(dim, size, size)
+    rhs = torch.zeros(dim, size, device=vectors.device)
+    for a in range(num_codebooks):
+        rhs.index_add_(1, entries[:, a], (importance * vectors).t())
+
+    scale = ridge * gram.diagonal(dim1=1, dim2=2).mean(dim=1).clamp(min=1e-8)  # [dim]
+    old = codebooks.reshape(size, dim).t()
+    gram += scale.reshape(dim, 1, 1) * torch.eye(size, device=vectors.device)
+    solved = torch.linalg.solve(gram, (rhs + scale.unsqueeze(1) * old).unsqueeze(-1)).squeeze(-1)
+    return solved.t().reshape(num_codebooks, k, dim)
+
+
+class AqlmLinear(torch.nn.Module):
+    """
+    Linear layer stored as additive codebook codes (AQLM).
+
+    Every row is cut into vectors of ``group_size`` input features, each approximated
+    by the sum of one entry from each of ``num_codebooks`` codebooks of
+    2**codebook_bits entries, times a per-row scale: num_codebooks * codebook_bits /
+    group_size bits per weight (2 by default) plus the small codebooks. Short inputs
+    multiply through per-token lookup tables of input-vector/codebook-entry products;
+    longer ones decode the weight once. Super weights come from the outlier side-table.
+    Pruned layers keep a plane of the surviving weights and always decode the weight,
+    so the pruned entries come back as exact zeros.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True,
+                 num_codebooks: int = 2, codebook_bits: int = 8, group_size: int = 8,
+                 num_outliers: int = 0, pruned: bool = False, dtype: torch.dtype = torch.float16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.num_codebooks = num_codebooks
+        self.codebook_bits = codebook_bits
+        self.group_size = group_size
+        self.num_groups = (in_features + group_size - 1) // group_size
+        self.num_outliers = num_outliers
+        self.pruned = pruned
+
+        code_dtype = torch.uint8 if codebook_bits <= 8 else torch.int16
+        self.register_buffer("codes", torch.zeros(out_features, self.num_groups, num_codebooks, dtype=code_dtype))
+        self.register_buffer("codebooks", torch.zeros(num_codebooks, 1 << codebook_bits, group_size, dtype=dtype))
+        self.register_buffer("scales", torch.zeros(out_features, dtype=dtype))
+
+        if num_outliers:
+            self.register_buffer("outlier_indices", torch.zeros(num_outliers, dtype=torch.int32))
+            self.register_buffer("outlier_values", torch.zeros(num_outliers, dtype=OUTLIER_DTYPE))
+
+        if pruned:
+            self.register_buffer("keep_plane", torch.zeros(out_features, (in_features + 7) // 8,
+                                                           dtype=torch.uint8))
+
+        if bias:
+            self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    @classmethod
+    def from_weight(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], num_codebooks: int = 2,
+                    codebook_bits: int = 8, group_size: int = 8, hessian: Optional[torch.Tensor] = None,
+                    beam_size: int = 4, rounds: int = 3, kmeans_iters: int = 25, seed: int = 0,
+                    dtype: torch.dtype = torch.float16,
+                    outliers: Optional[Dict[str, torch.Tensor]] = None) -> "AqlmLinear":
+        """Learn codebooks and codes for a [out_features, in_features] weight matrix"""
+        if num_codebooks << codebook_bits > MAX_CODEBOOK_ENTRIES:
+            raise ValueError(f"{num_codebooks} codebooks of {1 << codebook_bits} entries exceed "
+                             f"{MAX_CODEBOOK_ENTRIES} entries in total")
+        W = weight.float()
+        out_features, in_features = W.shape
+        keep_plane = pack_keep_plane(W)
+        layer = cls(in_features, out_features, bias=bias is not None, num_codebooks=num_codebooks,
+                    codebook_bits=codebook_bits, group_size=group_size,
+                    num_outliers=len(outliers["indices"]) if outliers is not None else 0,
+                    pruned=keep_plane is not None, dtype=dtype).to(W.device)
+
+        # Error weights: the per-row scale squared times the input's Hessian diagonal,
+        # zero for super weights (stored exactly), pruned weights (zeroed on decode) and padding
+        importance = torch.ones_like(W) if keep_plane is None else (W != 0).float()
+        if hessian is not None:
+            importance = importance * torch.diag(hessian.to(W.device).float()).clamp(min=1e-8).unsqueeze(0)
+        if outliers is not None:
+            excluded = outlier_mask(W.shape, outliers, W.device)
+            W = W.masked_fill(excluded, 0)
+            importance = importance.masked_fill(excluded, 0)
+
+        # Clamped after the cast: a small floor would round to zero in fp16 and turn
+        # all-zero rows (e.g. fully pruned ones) into 0 / 0
+        scales = (W ** 2).mean(dim=1).sqrt().to(dtype).float().clamp(min=torch.finfo(dtype).tiny)
+        importance = importance * scales.unsqueeze(1) ** 2
+        padding = layer.num_groups * group_size - in_features
+        vectors = F.pad(W / scales.unsqueeze(1), (0, padding)).reshape(-1, group_size)
+        importance = F.pad(importance, (0, padding)).reshape(-1, group_size)
+        importance = importance / importance.mean().clamp(min=1e-12)
+
+        # Residual k-means: each codebook clusters what the previous ones left over
+        k = 1 << codebook_bits
+        codebooks = torch.zeros(num_codebooks, k, group_size, device=W.device)
+        codes = torch.zeros(len(vectors), num_codebooks, dtype=torch.long, device=W.device)
+        residual = vectors
+        for m in range(num_codebooks):
+            codebooks[m] = kmeans(residual, k, iters=kmeans_iters, seed=seed + m)
+            codes[:, m] = nearest(residual, codebooks[m])
+            residual = residual - codebooks[m][codes[:, m]]
+
+        for _ in range(rounds):
+            codebooks = update_codebooks(vectors, codes, codebooks, importance)
+            codebooks = codebooks.to(dtype).float()
+            codes = beam_search(vectors, codebooks, codes, beam_size, importance)
+
+        with torch.no_grad():
+            layer.codes.copy_(codes.reshape(out_features, layer.num_groups, num_codebooks))
+            layer.codebooks.copy_(codebooks)
+            layer.scales.copy_(scales)
+            if layer.num_outliers:
+                layer.outlier_indices.copy_(outliers["indices"])
+                layer.outlier_values.copy_(outliers["values"])
+            if layer.pruned:
+                layer.keep_plane.copy_(keep_plane)
+            if bias is not None:
+                layer.bias.data = bias.to(dtype)
+        return layer
+
+    def dequantize(self) -> torch.Tensor:
+        """Reconstruct the dense weight matrix from codes, codebooks and scales"""
+        vectors = reconstruct(self.codebooks, self.codes.long())  # [out, groups, group_size]
+        weights = vectors.reshape(self.out_features, -1)[:, :self.in_features] * self.scales.unsqueeze(1)
+        if self.pruned:
+            weights = apply_keep_plane(weights, self.keep_plane)
+        if self.num_outliers:
+            weights = apply_outliers(weights, {"indices": self.outlier_indices, "values": self.outlier_values})
+        return weights
+
+    def _lookup_forward(self, x: torch.Tensor) -> torch.Tensor:
+        """x @ W.T through tables of every input vector's dot product with every codebook entry"""
+        flat = x.reshape(-1, self.in_features)
+        padded = F.pad(flat, (0, self.num_groups * self.group_size - self.in_features))
+        vectors = padded.reshape(len(flat), self.num_groups, self.group_size)
+        tables = torch.einsum("tgd,mkd->tgmk", vectors, self.codebooks.to(x.dtype))  # [tokens, groups, M, K]
+        k = self.codebooks.shape[1]
+        offsets = (torch.arange(self.num_groups, device=x.device).reshape(1, -1, 1) * self.num_codebooks
+                   + torch.arange(self.num_codebooks, device=x.device).reshape(1, 1, -1)) * k
+        index = (self.codes.long() + offsets).reshape(-1)
+        products = tables.reshape(len(flat), -1)[:, index].reshape(len(flat), self.out_features, -1)
+        output = products.sum(-1) * self.scales.to(x.dtype)
+        if self.num_outliers:
+            indices = self.outlier_indices.long()
+            contributions = flat[:, indices % self.in_features] * self.outlier_values.to(x.dtype)
+            output = output.index_add(1, indices // self.in_features, contributions)
+        return output.reshape(*x.shape[:-1], self.out_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        if not self.pruned and x.numel() // self.in_features <= LOOKUP_MAX_TOKENS:
+            output = self._lookup_forward(x)
+            return output + bias if bias is not None else output
+        return F.linear(x, self.dequantize().to(x.dtype), bias)
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": "aqlm",
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "bias": self.bias is not None,
+            "num_codebooks": self.num_codebooks,
+            "codebook_bits": self.codebook_bits,
+            "group_size": self.group_size,
+            "num_outliers": self.num_outliers,
+            "pruned": self.pruned,
+            "dtype": str(self.scales.dtype).replace("torch.", ""),
+        }
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"codebooks={self.num_codebooks}x{1 << self.codebook_bits}, group_size={self.group_size}")
+
+
+def layer_fingerprint(weight: torch.Tensor, bias: Optional[torch.Tensor], settings: Dict[str, Any],
+                      hessian: Optional[torch.Tensor] = None,
+                      outliers: Optional[Dict[str, torch.Tensor]] = None) -> str:
+    """Content hash identifying one layer's AQLM job, used to name its checkpoint"""
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    tensors = [weight, bias, hessian] + ([outliers["indices"], outliers["values"]] if outliers else [])
+    for tensor in tensors:
+        if tensor is not None:
+            digest.update(str((tuple(tensor.shape), tensor.dtype)).encode())
+            digest.update(tensor.detach().cpu().contiguous().view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+def load_layer_checkpoint(path: str) -> Optional[AqlmLinear]:
+    """The AqlmLinear saved at path, or None if there is no usable checkpoint"""
+    if not os.path.exists(path):
+        return None
+    try:
+        checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+        config = dict(checkpoint["config"])
+        del config["scheme"]
+        config["dtype"] = getattr(torch, config["dtype"])
+        layer = AqlmLinear(**config)
+        layer.load_state_dict(checkpoint["state"])
+        return layer
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable AQLM checkpoint {path}: {e}")
+        return None
+
+
+def save_layer_checkpoint(layer: AqlmLinear, path: str):
+    """Write a finished layer atomically, so an interrupted run never leaves a partial file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    torch.save({"config": layer.packed_config(), "state": layer.state_dict()}, temporary)
+    os.replace(temporary, path)
@@ -0,0 +1,188 @@
+"""
+Compressed Artifact Cache for NanoQuant
+Content-addressed store of saved NanoQuants, shared by every user who asks for the same result
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from typing import Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables read when no explicit location or size limit is given
+CACHE_DIR_ENV_VAR = "NANOQUANT_CACHE_DIR"
+CACHE_MAX_BYTES_ENV_VAR = "NANOQUANT_CACHE_MAX_BYTES"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nanoquant", "artifacts")
+DEFAULT_MAX_BYTES = 200 * 1024 ** 3
+
+# Shards are hardlinked in and out of the cache: shard_io always writes a new file and
+# renames it over the old one, so rewriting an output never reaches the cached inode.
+# Everything else (configs, tokenizers) is small, may be rewritten in place, and is copied
+LINKED_SUFFIXES = (".safetensors",)
+
+
+def engine_version() -> str:
+    """Version folded into every cache key, so a new release never serves old artifacts"""
+    import nanoquant
+    return nanoquant.__version__
+
+
+def cache_key(model_id: str, revision: str, compression_config: Dict[str, Any],
+              version: Optional[str] = None, **extra) -> str:
+    """sha256 of the model revision, the compression config and the engine version"""
+    payload = {
+        "model_id": model_id,
+        "revision": revision,
+        "config": compression_config,
+        "engine_version": version or engine_version(),
+        **extra,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(source: str, destination: str):
+    if source.endswith(LINKED_SUFFIXES):
+        try:
+            os.link(source, destination)
+            return destination
+        except OSError:
+            # Different filesystem or no hardlink support
+            pass
+    return shutil.copy2(source, destination)
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+class ArtifactCache:
+    """
+    Saved NanoQuant directories keyed by cache_key.
+
+    Each entry is an immutable directory under ``entries/`` plus a small JSON record
+    whose mtime marks its last use. Entries are built in a staging directory and
+    renamed into place, so readers never see a partial entry. Once the cache holds
+    more than ``max_bytes`` the least recently used entries are evicted. Weight
+    files are hardlinked in and out, so a hit costs no copying when the cache and the
+    output directory share a filesystem.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.getenv(CACHE_DIR_ENV_VAR, DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.getenv(CACHE_MAX_BYTES_ENV_VAR, str(DEFAULT_MAX_BYTES)))
+        self.max_bytes = max_bytes
+        self.entries_dir = os.path.join(self.root, "entries")
+        self.staging_dir = os.path.join(self.root, "staging")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, key)
+
+    def _record_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._record_path(key))
+
+    def fetch(self, key: str, destination: str) -> bool:
+        """
+        Recreate the entry for key at destination, replacing whatever is there.
+        Returns False on a miss, including an entry evicted while it was being read.
+        """
+        if not self.contains(key):
+            return False
+        staged = f"{destination}.partial-{os.getpid()}"
+        try:
+            shutil.rmtree(staged, ignore_errors=True)
+            shutil.copytree(self._entry_path(key), staged, copy_function=_link_or_copy)
+            os.utime(self._record_path(key))
+        except (OSError, shutil.Error) as e:
+            logger.warning(f"Cache entry {key[:12]} vanished while reading it: {e}")
+            shutil.rmtree(staged, ignore_errors=True)
+            if not os.path.isdir(self._entry_path(key)):
+                self.remove(key)
+            return False
+
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        os.rename(staged, destination)
+        logger.info(f"Cache hit {key[:12]} -> {destination}")
+        return True
+
+    def store(self, key: str, source: str, description: Optional[Dict[str, Any]] = None) -> bool:
+        """Add the directory at source under key; False if the key was already stored"""
+        if self.contains(key):
+            return False
+        if os.path.isdir(self._entry_path(key)):
+            # Left behind by a writer that died before recording it
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+        staged = os.path.join(self.staging_dir, f"{key}.{os.getpid()}.{time.time_ns()}")
+        shutil.copytree(source, staged, copy_function=_link_or_copy)
+        try:
+            # Another process may have stored the same key meanwhile; the first rename wins
+            os.rename(staged, self._entry_path(key))
+        except OSError:
+            shutil.rmtree(staged, ignore_errors=True)
+            return False
+
+        record = {"key": key, "size": _directory_size(self._entry_path(key)),
+                  "created": time.time(), "description": description or {}}
+        temp_path = f"{self._record_path(key)}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(record, f, indent=2)
+        os.replace(temp_path, self._record_path(key))
+        logger.info(f"Cached {source} as {key[:12]} ({record['size'] / 1e6:.1f} MB)")
+
+        self.evict()
+        return True
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Records of every entry, least recently used first"""
+        records = []
+        for name in os.listdir(self.entries_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.entries_dir, name)
+            try:
+                with open(path, "r") as f:
+                    record = json.load(f)
+                record["last_used"] = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            records.append(record)
+        return sorted(records, key=lambda record: record["last_used"])
+
+    def size(self) -> int:
+        return sum(record["size"] for record in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> List[str]:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        records = self.entries()
+        total = sum(record["size"] for record in records)
+        evicted = []
+        for record in records:
+            if total <= max_bytes:
+                break
+            self.remove(record["key"])
+            total -= record["size"]
+            evicted.append(record["key"])
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} cache entries, {total / 1e6:.1f} MB remain")
+        return evicted
+
+    def remove(self, key: str):
+        # Drop the record first so the entry stops being served, then its files;
+        # hardlinks already handed out keep their data
+        try:
+            os.remove(self._record_path(key))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
@@ -0,0 +1,161 @@
+"""
+Calibration for NanoQuant
+Streams calibration batches through a model and accumulates per-layer input statistics
+"""
+import torch
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LayerCalibration:
+    """
+    Running statistics of the inputs seen by one Linear layer.
+
+    Only accumulators are kept, never the activations themselves: the squared L2 norm
+    of every input feature (Wanda) and, optionally, the Hessian 2 X^T X / n of the
+    layer-wise reconstruction problem (SparseGPT).
+    """
+
+    def __init__(self, in_features: int, hessian: bool = False, device: Optional[torch.device] = None):
+        self.in_features = in_features
+        self.num_tokens = 0
+        self.squared_norms = torch.zeros(in_features, dtype=torch.float32, device=device)
+        self.hessian = (torch.zeros(in_features, in_features, dtype=torch.float32, device=device)
+                        if hessian else None)
+
+    def update(self, inputs: torch.Tensor):
+        """Fold one batch of layer inputs into the accumulators"""
+        x = inputs.detach().reshape(-1, self.in_features).float()
+        tokens = x.shape[0]
+        self.squared_norms += (x ** 2).sum(dim=0)
+        if self.hessian is not None:
+            # Running mean, so the scale does not depend on how many batches were seen
+            self.hessian *= self.num_tokens / (self.num_tokens + tokens)
+            x = x * (2 / (self.num_tokens + tokens)) ** 0.5
+            self.hessian += x.t() @ x
+        self.num_tokens += tokens
+
+    def activation_norms(self) -> torch.Tensor:
+        """L2 norm of every input feature over all calibration tokens"""
+        return self.squared_norms.sqrt()
+
+
+class _StopForward(Exception):
+    """Raised by the capture hook once the inputs of the first block are recorded"""
+
+
+class BlockSequentialCalibrator:
+    """
+    Calibrate a model one transformer block at a time.
+
+    The calibration batches are run up to the first block once; from then on only a
+    single block executes at a time. After a block's statistics are handed to
+    ``process_block`` (which may prune or update it), the block is re-run so the next
+    block sees the outputs of the already compressed one. Peak memory is the block
+    inputs plus the statistics of one block, independent of model depth.
+    """
+
+    def __init__(self, model: torch.nn.Module, batches: List[torch.Tensor]):
+        self.model = model
+        self.batches = batches
+
+    def run(self, process_block: Callable[[List[Tuple[str, torch.nn.Module, LayerCalibration]]], None],
+            hessian: bool = False) -> List[str]:
+        """
+        Call process_block with (name, linear, statistics) for the Linear layers of each
+        block in order; returns the names of every calibrated layer
+        """
+        prefix, blocks = find_blocks(self.model)
+        if blocks is None:
+            logger.info("No transformer blocks found, calibrating the whole model in one pass")
+            layers = self._collect(self.model, "", hessian,
+                                   lambda: [self._forward_model(batch) for batch in self.batches])
+            process_block(layers)
+            return [name for name, _, _ in layers]
+
+        calibrated = []
+        inputs = self._capture_block_inputs(blocks[0])
+        for index, block in enumerate(blocks):
+            block_name = f"{prefix}.{index}" if prefix else str(index)
+            layers = self._collect(block, block_name, hessian,
+                                   lambda: [block(*args, **kwargs) for args, kwargs in inputs])
+            logger.info(f"Calibrated {block_name}: {len(layers)} layers, "
+                        f"{layers[0][2].num_tokens if layers else 0} tokens")
+            process_block(layers)
+            calibrated.extend(name for name, _, _ in layers)
+
+            # Feed the compressed block's outputs to the next block
+            with torch.no_grad():
+                inputs = [_replace_hidden_states(args, kwargs, _hidden_states(block(*args, **kwargs)))
+                          for args, kwargs in inputs]
+        return calibrated
+
+    def _collect(self, root: torch.nn.Module, root_name: str, hessian: bool,
+                 forward: Callable[[], Any]) -> List[Tuple[str, torch.nn.Module, LayerCalibration]]:
+        layers = []
+        handles = []
+        for name, module in root.named_modules():
+            if not isinstance(module, torch.nn.Linear):
+                continue
+            full_name = f"{root_name}.{name}" if root_name and name else (root_name or name)
+            stats = LayerCalibration(module.in_features, hessian, module.weight.device)
+            handles.append(module.register_forward_hook(
+                lambda module, args, output, stats=stats: stats.update(args[0])
+            ))
+            layers.append((full_name, module, stats))
+
+        try:
+            with torch.no_grad():
+                forward()
+        finally:
+            for handle in handles:
+                handle.remove()
+        return layers
+
+    def _forward_model(self, batch: torch.Tensor):
+        device = next(self.model.parameters()).device
+        if batch.is_floating_point():
+            return self.model(batch.to(device))
+        return self.model(input_ids=batch.to(device), use_cache=False)
+
+    def _capture_block_inputs(self, first_block: torch.nn.Module) -> List[Tuple[tuple, dict]]:
+        captured = []
+
+        def capture(module, args, kwargs):
+            captured.append((args, kwargs))
+            raise _StopForward()
+
+        handle = first_block.register_forward_pre_hook(capture, with_kwargs=True)
+        try:
+            for batch in self.batches:
+                try:
+                    with torch.no_grad():
+                        self._forward_model(batch)
+                except _StopForward:
+                    pass
+        finally:
+            handle.remove()
+        return captured
+
+
+def find_blocks(model: torch.nn.Module) -> Tuple[str, Optional[torch.nn.ModuleList]]:
+    """The ModuleList holding the transformer blocks (the one with the most parameters)"""
+    best_name, best, best_size = "", None, 0
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.ModuleList) and len(module) > 0:
+            size = sum(param.numel() for param in module.parameters())
+            if size > best_size:
+                best_name, best, best_size = name, module, size
+    return best_name, best
+
+
+def _hidden_states(output: Any) -> torch.Tensor:
+    return output[0] if isinstance(output, (tuple, list)) else output
+
+
+def _replace_hidden_states(args: tuple, kwargs: dict, hidden_states: torch.Tensor) -> Tuple[tuple, dict]:
+    if args:
+        return (hidden_states,) + tuple(args[1:]), kwargs
+    return args, dict(kwargs, hidden_states=hidden_states)
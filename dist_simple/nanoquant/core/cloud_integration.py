@@ -4,25 +4,62 @@ Handles user data storage, authentication, and payment processing
 """
 
 import os
+import copy
 import json
-import boto3
-from botocore.exceptions import ClientError
-from typing import Optional, Dict, Any
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 import urllib.parse
 import requests
 
+# AWS support is optional; without boto3 there is no cloud storage, payments and social login still work
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    boto3 = None
+    ClientError = Exception
+    BOTO3_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Environment variables read when no explicit cache settings are given
+CLOUD_CACHE_TTL_ENV_VAR = "NANOQUANT_CLOUD_CACHE_TTL"
+CLOUD_FLUSH_INTERVAL_ENV_VAR = "NANOQUANT_CLOUD_FLUSH_INTERVAL"
+
+# Cached user data is re-read from DynamoDB after this many seconds, and queued writes are sent at least this often
+DEFAULT_CLOUD_CACHE_TTL = 30.0
+DEFAULT_CLOUD_FLUSH_INTERVAL = 1.0
+CLOUD_CACHE_MAX_ENTRIES = 10000
+
+# Most items DynamoDB accepts in one batch_write_item call
+DYNAMODB_BATCH_LIMIT = 25
+
+# A user's queued write is dropped after this many failed flushes, and failed flushes
+# back off exponentially from the flush interval up to CLOUD_FLUSH_MAX_BACKOFF seconds
+CLOUD_WRITE_MAX_ATTEMPTS = 5
+CLOUD_FLUSH_MAX_BACKOFF = 60.0
+
 class CloudStorage:
-    def __init__(self):
-        """Initialize cloud storage integration"""
-        self.s3_client = None
-        self.db_client = None
-        self._initialize_aws()
+    def __init__(self, s3_client=None, db_client=None):
+        """
+        Initialize cloud storage integration; clients are created from the AWS environment
+        unless given
+        """
+        self.s3_client = s3_client
+        self.db_client = db_client
+        if s3_client is None and db_client is None:
+            self._initialize_aws()
     
     def _initialize_aws(self):
         """Initialize AWS services"""
+        if not BOTO3_AVAILABLE:
+            logger.warning("boto3 not installed; cloud storage disabled")
+            return
         try:
             # Initialize S3 client
             self.s3_client = boto3.client(
@@ -86,15 +123,42 @@ class CloudStorage:
         
         try:
             table = self.db_client.Table(os.getenv('DYNAMODB_TABLE', 'nanoquant-users'))
-            user_data['user_id'] = user_id
             
-            table.put_item(Item=user_data)
+            table.put_item(Item=dict(user_data, user_id=user_id))
             logger.info(f"User data saved successfully: {user_id}")
             return True
         except ClientError as e:
             logger.error(f"Failed to save user data: {e}")
             return False
     
+    def save_user_data_batch(self, users: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        Save many users' data with batch_write_item, 25 items per call; returns the IDs
+        of the users that were not written
+        """
+        if not self.db_client:
+            logger.error("DynamoDB client not initialized")
+            return list(users)
+        
+        table_name = os.getenv('DYNAMODB_TABLE', 'nanoquant-users')
+        items = [dict(user_data, user_id=user_id) for user_id, user_data in users.items()]
+        failed = []
+        for start in range(0, len(items), DYNAMODB_BATCH_LIMIT):
+            chunk = items[start:start + DYNAMODB_BATCH_LIMIT]
+            try:
+                response = self.db_client.batch_write_item(
+                    RequestItems={table_name: [{"PutRequest": {"Item": item}} for item in chunk]}
+                )
+            except ClientError as e:
+                logger.error(f"Failed to save user data of {len(chunk)} users: {e}")
+                failed.extend(item["user_id"] for item in chunk)
+                continue
+            # Throttled items come back unprocessed
+            for request in response.get("UnprocessedItems", {}).get(table_name, []):
+                failed.append(request["PutRequest"]["Item"]["user_id"])
+        logger.info(f"User data saved: {len(items) - len(failed)} of {len(items)} users")
+        return failed
+    
     def get_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve user data from database"""
         if not self.db_client:
@@ -117,6 +181,169 @@ class CloudStorage:
             logger.error(f"Failed to retrieve user data: {e}")
             return None
 
+class CloudUserCache:
+    """
+    Read-through, write-behind cache of user data in front of CloudStorage, with the
+    same get_user_data and save_user_data calls.
+
+    Reads are served from memory and fall through to DynamoDB on a miss or once the
+    entry is older than ttl, so data written by other processes shows within ttl.
+    Writes update memory and are queued; a background thread sends the queue with
+    batch_write_item every flush_interval seconds, or as soon as a full batch is
+    waiting. Repeated writes of a user before a flush coalesce into one item, and
+    reads see queued writes. Items that fail to write are queued again unless a
+    newer write replaced them, up to CLOUD_WRITE_MAX_ATTEMPTS times, and the writer
+    backs off while flushes keep failing. Without a DynamoDB client nothing is read
+    or queued. close() sends whatever is still queued and runs at interpreter exit.
+    """
+
+    def __init__(self, storage: CloudStorage, ttl: Optional[float] = None,
+                 flush_interval: Optional[float] = None, max_entries: int = CLOUD_CACHE_MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.storage = storage
+        self.ttl = ttl if ttl is not None else float(os.getenv(CLOUD_CACHE_TTL_ENV_VAR, DEFAULT_CLOUD_CACHE_TTL))
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else float(os.getenv(CLOUD_FLUSH_INTERVAL_ENV_VAR, DEFAULT_CLOUD_FLUSH_INTERVAL)))
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # Failed flushes per queued user, and failed flushes in a row
+        self.attempts: Dict[str, int] = {}
+        self.failed_flushes = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # One flush at a time, so a requeued item never overtakes a newer one in flight
+        self.flush_lock = threading.Lock()
+        self.batches = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="cloud-user-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _remember(self, user_id: str, user_data: Optional[Dict[str, Any]]):
+        self.entries[user_id] = (user_data, self.clock())
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
+        if not self.storage.db_client:
+            return None
+        with self.lock:
+            if user_id in self.pending:
+                return copy.deepcopy(self.pending[user_id])
+            entry = self.entries.get(user_id)
+            if entry is not None and self.clock() - entry[1] < self.ttl:
+                self.entries.move_to_end(user_id)
+                return copy.deepcopy(entry[0])
+        
+        user_data = self.storage.get_user_data(user_id)
+        with self.lock:
+            # A write made while reading is newer than what was read
+            if user_id not in self.pending:
+                self._remember(user_id, user_data)
+        return copy.deepcopy(user_data)
+
+    def save_user_data(self, user_id: str, user_data: Dict[str, Any]) -> bool:
+        """Queue a write of the user's data; returns at once"""
+        if not self.storage.db_client:
+            return False
+        user_data = copy.deepcopy(user_data)
+        with self.lock:
+            if self.closed:
+                logger.warning(f"Cloud user cache closed; saving user data of {user_id} directly")
+            else:
+                self.pending[user_id] = user_data
+                self._remember(user_id, user_data)
+                if len(self.pending) >= DYNAMODB_BATCH_LIMIT:
+                    self.wakeup.notify()
+                return True
+        return self.storage.save_user_data(user_id, user_data)
+
+    def flush(self) -> int:
+        """Send every queued write now and return how many were written"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+            if not batch:
+                return 0
+            try:
+                failed = self.storage.save_user_data_batch(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush user data of {len(batch)} users: {e}")
+                failed = list(batch)
+            self.batches += 1
+            dropped, failed_ids = [], set(failed)
+            with self.lock:
+                for user_id in batch:
+                    if user_id not in failed_ids or user_id in self.pending:
+                        # Written, or replaced by a newer write that starts its own count
+                        self.attempts.pop(user_id, None)
+                        continue
+                    attempts = self.attempts.get(user_id, 0) + 1
+                    if attempts >= CLOUD_WRITE_MAX_ATTEMPTS:
+                        self.attempts.pop(user_id, None)
+                        dropped.append(user_id)
+                    else:
+                        self.attempts[user_id] = attempts
+                        self.pending[user_id] = batch[user_id]
+                self.failed_flushes = self.failed_flushes + 1 if failed else 0
+            if dropped:
+                logger.error(f"Gave up saving user data of {len(dropped)} users to the cloud "
+                             f"after {CLOUD_WRITE_MAX_ATTEMPTS} attempts")
+            return len(batch) - len(failed)
+
+    def _retry_delay(self) -> float:
+        if not self.failed_flushes:
+            return self.flush_interval
+        return min(self.flush_interval * 2 ** self.failed_flushes, CLOUD_FLUSH_MAX_BACKOFF)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                # A full batch is sent at once, unless flushes are failing and backing off
+                self.wakeup.wait_for(lambda: self.closed or (not self.failed_flushes
+                                                             and len(self.pending) >= DYNAMODB_BATCH_LIMIT),
+                                     timeout=self._retry_delay())
+                if self.closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """Stop the writer thread and send what is still queued"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.wakeup.notify()
+        self.thread.join()
+        self.flush()
+        if self.pending:
+            logger.warning(f"User data of {len(self.pending)} users could not be saved to the cloud")
+
+
+_cloud_user_cache: Optional[CloudUserCache] = None
+_cloud_user_cache_opened = False
+_cloud_user_cache_lock = threading.Lock()
+
+
+def open_cloud_user_cache() -> Optional[CloudUserCache]:
+    """
+    The process's one CloudUserCache, over CloudStorage configured from the AWS
+    environment, or None when no DynamoDB client could be created
+    """
+    global _cloud_user_cache, _cloud_user_cache_opened
+    with _cloud_user_cache_lock:
+        if not _cloud_user_cache_opened:
+            storage = CloudStorage()
+            if storage.db_client:
+                _cloud_user_cache = CloudUserCache(storage)
+            else:
+                logger.info("DynamoDB not configured; user data is not mirrored to the cloud")
+            _cloud_user_cache_opened = True
+        return _cloud_user_cache
+
 class PaymentProcessor:
     def __init__(self):
         """Initialize payment processor"""
@@ -3,17 +3,43 @@ Ultra-Advanced Compression Engine for NanoQuant
 Implements all the cutting-edge compression techniques
 """
 import torch
-import torch.nn.utils.prune as prune
 from peft import LoraConfig, get_peft_model
 import numpy as np
 from typing import Dict, Any, Optional, List
+import heapq
 import math
 import logging
 
+from nanoquant.core.quantized_layers import replace_module, tied_parameter_ids, quantize_groups, dequantize_groups
+from nanoquant.core.parallel_executor import ParallelLayerExecutor
+from nanoquant.core.calibration import BlockSequentialCalibrator
+from nanoquant.core.sparse_layers import parse_pattern
+from nanoquant.core.run_checkpoint import job_fingerprint
+from nanoquant.core import layer_kernels
+
 logger = logging.getLogger(__name__)
 
+# Weight-only steps, in the order they are applied. Decomposition splits layers into
+# Linear factors before pruning, and the packing quantizers run last, so every step
+# finds Linear layers to work on and the quantized layers keep the pruned zeros
+COMPRESSION_STEPS = ("preserve_super_weights", "decomposition", "pruning", "quantization")
+
+
+def applies_lora(compression_config: Dict[str, Any]) -> bool:
+    """
+    Whether the LoRA step of a config runs. It comes after quantization, which swaps
+    every Linear for a packed or dynamically quantized module peft cannot adapt, so
+    LoRA is skipped, with a warning, for configs that quantize
+    """
+    if not compression_config.get("lora"):
+        return False
+    if compression_config.get("quantization"):
+        logger.warning("Skipping LoRA: the quantized layers it would attach to are not nn.Linear")
+        return False
+    return True
+
 class UltraAdvancedCompressionEngine:
-    def __init__(self):
+    def __init__(self, num_workers: Optional[int] = None, quantile_method: str = "auto"):
         # Quantization strategies including ultra-advanced techniques
         self.quantization_strategies = {
             "4bit": self._apply_4bit_quantization,
@@ -41,6 +67,26 @@ class UltraAdvancedCompressionEngine:
             "calr": self._apply_calr_decomposition
         }
 
+        # Shared per-layer statistics, set by the LevelPlanner during multi-level runs
+        self.layer_stats = None
+        # Super weights per Linear name as {"indices": int32, "values": fp16}, honored by later steps
+        self.super_weights = {}
+
+        # Per-layer kernels run here; more than one worker shards layers across processes
+        self.executor = ParallelLayerExecutor(num_workers)
+
+        # Threshold selection used by every kernel ("auto", "exact", "histogram", "sample")
+        self.quantile_method = quantile_method
+
+        # Tokenized calibration batches; when set, Wanda and SparseGPT use real activations
+        self.calibration_data = None
+
+        # ProgressTracker of the current run; when set, every processed layer is reported
+        self.progress = None
+
+        # LayerCheckpoint of the current run; when set, finished layers are saved and reused
+        self.checkpoint = None
+
     def compress_model(self, model_artifacts: Dict[str, Any],
                       compression_config: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -49,40 +95,26 @@ class UltraAdvancedCompressionEngine:
         model = model_artifacts["model"]
         tokenizer = model_artifacts["tokenizer"]
         device = model_artifacts["device"]
+        if model_artifacts.get("calibration_data") is not None:
+            self.calibration_data = model_artifacts["calibration_data"]
 
         logger.info("Starting compression pipeline with config: %s", compression_config)
 
-        # Step 1: Super Weight Identification and Preservation
-        if compression_config.get("preserve_super_weights", False):
-            model = self._identify_and_preserve_super_weights(model)
+        steps = [step for step in COMPRESSION_STEPS if compression_config.get(step)]
+        lora = applies_lora(compression_config)
+        if self.progress is not None:
+            self.progress.add_steps(len(steps) + lora)
 
-        # Step 2: Quantization (using ultra-advanced techniques)
-        if "quantization" in compression_config:
-            logger.info("Applying quantization: %s", compression_config["quantization"])
-            model = self._apply_quantization(
-                model,
-                compression_config["quantization"],
-                device
-            )
-
-        # Step 3: Pruning (using ultra-advanced techniques)
-        if "pruning" in compression_config:
-            logger.info("Applying pruning: %s", compression_config["pruning"])
-            model = self._apply_pruning(
-                model,
-                compression_config["pruning"]
-            )
-
-        # Step 4: Decomposition (using ultra-advanced techniques)
-        if "decomposition" in compression_config:
-            logger.info("Applying decomposition: %s", compression_config["decomposition"])
-            model = self._apply_decomposition(
-                model,
-                compression_config["decomposition"]
-            )
+        # Steps 1-4: super weights, decomposition, pruning, quantization
+        for step in steps:
+            if self.progress is not None:
+                self.progress.begin_step("compress", step=step)
+            model = self.apply_compression_step(model, step, compression_config[step], device)
 
         # Step 5: LoRA Fine-tuning
-        if "lora" in compression_config:
+        if lora:
+            if self.progress is not None:
+                self.progress.begin_step("compress", step="lora")
             logger.info("Applying LoRA fine-tuning: %s", compression_config["lora"])
             model = self._apply_lora_finetuning(
                 model,
@@ -97,6 +129,107 @@ class UltraAdvancedCompressionEngine:
             "compression_config": compression_config
         }
 
+    def compress_module(self, model: torch.nn.Module,
+                        compression_config: Dict[str, Any],
+                        device: torch.device) -> torch.nn.Module:
+        """
+        Apply the weight-only compression steps to a model or to a single block of one
+        """
+        for step in COMPRESSION_STEPS:
+            if compression_config.get(step):
+                if self.progress is not None:
+                    self.progress.substage(step)
+                model = self.apply_compression_step(model, step, compression_config[step], device)
+
+        return model
+
+    def apply_compression_step(self, model: torch.nn.Module, step: str,
+                               step_config: Any, device: torch.device) -> torch.nn.Module:
+        """Apply a single step of a compression config"""
+        # Step 1: Super Weight Identification and Preservation
+        if step == "preserve_super_weights":
+            return self._identify_and_preserve_super_weights(model)
+
+        # Step 2: Decomposition (using ultra-advanced techniques)
+        if step == "decomposition":
+            logger.info("Applying decomposition: %s", step_config)
+            return self._apply_decomposition(model, step_config)
+
+        # Step 3: Pruning (using ultra-advanced techniques)
+        if step == "pruning":
+            logger.info("Applying pruning: %s", step_config)
+            return self._apply_pruning(model, step_config)
+
+        # Step 4: Quantization (using ultra-advanced techniques)
+        if step == "quantization":
+            logger.info("Applying quantization: %s", step_config)
+            return self._apply_quantization(model, step_config, device)
+
+        raise ValueError(f"Unknown compression step: {step}")
+
+    def _map_layers(self, kernel, layers: List, params: Dict[str, Any],
+                    layer_params: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Run a layer kernel over (name, module) pairs through the executor, feeding it
+        any thresholds already cached for base weights and caching the new ones.
+        layer_params adds per-layer entries (e.g. calibration statistics) to params,
+        and every layer with identified super weights receives them as "outliers".
+        """
+        jobs = []
+        for index, (name, module) in enumerate(layers):
+            weights = module.weight.data
+            bias = module.bias.data if module.bias is not None else None
+            expected, known = {}, {}
+            if self.layer_stats is not None:
+                expected = {kind: sorted(qs) for kind, qs in self.layer_stats.expected_quantiles.items()}
+                known = self.layer_stats.known_quantiles(weights)
+            quantiles = layer_kernels.QuantileRequests(expected, known, self.quantile_method)
+            job_params = dict(params, **(layer_params[index] if layer_params else {}))
+            if name in self.super_weights:
+                job_params["outliers"] = self.super_weights[name]
+            jobs.append((weights, bias, job_params, quantiles))
+
+        # Layers an interrupted earlier run already finished come from the checkpoint
+        results = [None] * len(jobs)
+        fingerprints = []
+        if self.checkpoint is not None:
+            fingerprints = [job_fingerprint(kernel, *job[:3]) for job in jobs]
+            results = [self.checkpoint.load(fingerprint, job[0].device) for fingerprint, job in zip(fingerprints, jobs)]
+        pending = [index for index, result in enumerate(results) if result is None]
+        completed = [0]
+
+        def report(index):
+            completed[0] += 1
+            if self.progress is not None:
+                weights = jobs[index][0]
+                self.progress.layer_done(index, len(jobs), weights.numel() * weights.element_size(),
+                                         layers[index][0], completed=completed[0])
+
+        def on_result(position, result):
+            if self.checkpoint is not None:
+                self.checkpoint.save(fingerprints[pending[position]], result)
+            report(pending[position])
+
+        for index, result in enumerate(results):
+            if result is not None:
+                report(index)
+        if fingerprints and len(pending) < len(jobs):
+            logger.info(f"Resumed {len(jobs) - len(pending)}/{len(jobs)} {kernel.__name__} layers from the checkpoint")
+        for index, result in zip(pending, self.executor.map(kernel, [jobs[index] for index in pending], on_result)):
+            results[index] = result
+
+        if self.layer_stats is not None:
+            for (name, module), job, result in zip(layers, jobs, results):
+                computed = result.pop("quantiles")
+                if job[3].known and not computed:
+                    self.layer_stats.hits += 1
+                self.layer_stats.store_quantiles(module.weight.data, computed)
+        return results
+
+    def _linears(self, model: torch.nn.Module) -> List:
+        return [(name, module) for name, module in model.named_modules()
+                if isinstance(module, torch.nn.Linear)]
+
     def _identify_and_preserve_super_weights(self, model: torch.nn.Module) -> torch.nn.Module:
         """
         Identify and preserve super weights as per Apple's research
@@ -105,27 +238,29 @@ class UltraAdvancedCompressionEngine:
         
         # Implementation based on Apple's research on super weights
         # This identifies weights that disproportionately affect model behavior
-        super_weight_masks = {}
+        super_weights = {}
+        layers = self._linears(model)
         
-        for name, module in model.named_modules():
-            if isinstance(module, torch.nn.Linear):
-                weights = module.weight.data
-                flat_weights = weights.flatten()
-                
-                # Calculate threshold for top 0.1% weights (super weights)
-                threshold = torch.quantile(torch.abs(flat_weights), 0.999)
-                
-                # Create mask for super weights
-                super_weight_mask = torch.abs(weights) >= threshold
-                super_weight_masks[name] = super_weight_mask
-                
-                logger.info(f"Layer {name}: Identified {super_weight_mask.sum().item()} super weights "
-                           f"({100 * super_weight_mask.sum().item() / flat_weights.numel():.2f}% of total)")
+        # Top 0.1% weights by magnitude (super weights), one kernel call per layer
+        results = self._map_layers(layer_kernels.super_weight_outliers, layers, {})
+        for (name, module), result in zip(layers, results):
+            if "error" in result:
+                logger.warning(f"Super weight identification skipped for {name}: {result['error']}")
+                continue
+            outliers = result["outliers"]
+            super_weights[name] = outliers
+            
+            count = len(outliers["indices"])
+            logger.info(f"Layer {name}: Identified {count} super weights "
+                       f"({100 * count / module.weight.numel():.2f}% of total)")
         
-        # In a full implementation, we would modify the compression process
-        # to preserve these weights with higher precision during quantization
-        # For now, we'll store the masks for potential use in other methods
-        self.super_weight_masks = super_weight_masks
+        # Kept as sparse outlier lists: packed quantizers store them exactly beside the
+        # low-bit weights and re-apply them on load, pruners never remove them
+        self.super_weights = super_weights
+        table_bytes = sum(t.numel() * t.element_size() for o in super_weights.values() for t in o.values())
+        model_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        logger.info(f"Super weight side-table: {table_bytes / 2**10:.1f} KiB "
+                   f"({100 * table_bytes / max(1, model_bytes):.3f}% of model bytes)")
         
         return model
 
@@ -172,31 +307,12 @@ class UltraAdvancedCompressionEngine:
         """Apply 1-bit quantization using OneBit technique"""
         logger.info("Applying 1-bit quantization...")
         
-        # Implementation of 1-bit quantization based on OneBit research
-        with torch.no_grad():
-            for name, module in model.named_modules():
-                if isinstance(module, torch.nn.Linear):
-                    # Get weights
-                    weights = module.weight.data
-                    
-                    # Calculate scaling factors for positive and negative weights
-                    positive_weights = weights[weights > 0]
-                    negative_weights = weights[weights < 0]
-                    
-                    # Mean of positive and negative weights
-                    alpha = positive_weights.mean() if positive_weights.numel() > 0 else torch.tensor(0.0)
-                    beta = negative_weights.mean() if negative_weights.numel() > 0 else torch.tensor(0.0)
-                    
-                    # Binarize weights
-                    binary_weights = torch.where(weights >= 0, 
-                                               torch.ones_like(weights) * alpha, 
-                                               torch.ones_like(weights) * beta)
-                    
-                    # Apply binarized weights
-                    module.weight.data = binary_weights
-                    
-                    logger.info(f"OneBit quantization applied to {name}: "
-                               f"alpha={alpha:.4f}, beta={beta:.4f}")
+        # OneBit: keep only the sign of every weight, packed 8 per byte, and
+        # reconstruct with the positive/negative mean of each weight group
+        params = {"scheme": "onebit", "group_size": quant_config.get("group_size", 128)}
+        for name, packed in self._apply_packed_quantization(model, params):
+            logger.info(f"OneBit quantization applied to {name}: "
+                       f"{packed.num_groups} groups of {packed.group_size}")
         
         return model
 
@@ -206,51 +322,17 @@ class UltraAdvancedCompressionEngine:
         """Apply PTQ1.61 sub-2-bit quantization"""
         logger.info("Applying PTQ1.61 sub-2-bit quantization...")
         
-        # Implementation of PTQ1.61 technique for sub-2-bit quantization
-        with torch.no_grad():
-            for name, module in model.named_modules():
-                if isinstance(module, torch.nn.Linear):
-                    # Get weights
-                    weights = module.weight.data
-                    original_shape = weights.shape
-                    
-                    # Flatten weights for processing
-                    flat_weights = weights.flatten()
-                    
-                    # Identify salient channels (top 20% by magnitude)
-                    abs_weights = torch.abs(flat_weights)
-                    threshold = torch.quantile(abs_weights, 0.8)
-                    salient_mask = abs_weights >= threshold
-                    
-                    # Apply 4-bit quantization to salient weights
-                    salient_weights = flat_weights[salient_mask]
-                    if salient_weights.numel() > 0:
-                        # 4-bit quantization for salient weights
-                        min_val, max_val = salient_weights.min(), salient_weights.max()
-                        salient_quantized = self._quantize_tensor(salient_weights, bits=4, 
-                                                                min_val=min_val, max_val=max_val)
-                        flat_weights[salient_mask] = salient_quantized
-                    
-                    # Apply 1-bit quantization to non-salient weights
-                    non_salient_mask = ~salient_mask
-                    non_salient_weights = flat_weights[non_salient_mask]
-                    if non_salient_weights.numel() > 0:
-                        # 1-bit quantization for non-salient weights
-                        alpha = non_salient_weights[non_salient_weights > 0].mean() if \
-                               (non_salient_weights > 0).sum() > 0 else torch.tensor(0.0)
-                        beta = non_salient_weights[non_salient_weights < 0].mean() if \
-                              (non_salient_weights < 0).sum() > 0 else torch.tensor(0.0)
-                        binary_weights = torch.where(non_salient_weights >= 0,
-                                                   torch.ones_like(non_salient_weights) * alpha,
-                                                   torch.ones_like(non_salient_weights) * beta)
-                        flat_weights[non_salient_mask] = binary_weights
-                    
-                    # Reshape back to original shape
-                    module.weight.data = flat_weights.reshape(original_shape)
-                    
-                    logger.info(f"PTQ1.61 quantization applied to {name}: "
-                               f"salient={salient_mask.sum().item()}, "
-                               f"non-salient={non_salient_mask.sum().item()}")
+        # PTQ1.61: salient weights (top 20% by magnitude) get 2-bit magnitude codes,
+        # the remaining weights are binarized with per-group scales
+        params = {
+            "scheme": "ptq1_61",
+            "salient_ratio": quant_config.get("salient_ratio", 0.2),
+            "group_size": quant_config.get("group_size", 128)
+        }
+        for name, packed in self._apply_packed_quantization(model, params):
+            logger.info(f"PTQ1.61 quantization applied to {name}: "
+                       f"salient={packed.num_salient}, "
+                       f"non-salient={packed.in_features * packed.out_features - packed.num_salient}")
         
         return model
 
@@ -260,42 +342,44 @@ class UltraAdvancedCompressionEngine:
         """Apply UltraSketchLLM sub-1-bit quantization"""
         logger.info("Applying UltraSketchLLM sub-1-bit quantization...")
         
-        # Implementation of UltraSketchLLM technique for sub-1-bit quantization
-        with torch.no_grad():
-            for name, module in model.named_modules():
-                if isinstance(module, torch.nn.Linear):
-                    # Get weights
-                    weights = module.weight.data
-                    original_shape = weights.shape
-                    
-                    # Flatten weights for processing
-                    flat_weights = weights.flatten()
-                    
-                    # UltraSketch approach: Use data sketching to represent weights
-                    # with less than 1 bit per weight
-                    
-                    # Calculate statistics for sketching
-                    mean_val = flat_weights.mean()
-                    std_val = flat_weights.std()
-                    
-                    # Create a sketch using quantile-based approach
-                    # This achieves sub-1-bit representation by grouping similar values
-                    quantiles = torch.quantile(flat_weights, 
-                                             torch.linspace(0, 1, steps=3).to(flat_weights.device))
-                    
-                    # Map weights to sketch values
-                    sketch_weights = torch.zeros_like(flat_weights)
-                    sketch_weights[flat_weights <= quantiles[1]] = quantiles[0]
-                    sketch_weights[flat_weights > quantiles[1]] = quantiles[2]
-                    
-                    # Apply sketched weights
-                    module.weight.data = sketch_weights.reshape(original_shape)
-                    
-                    logger.info(f"UltraSketch quantization applied to {name}: "
-                               f"mean={mean_val:.4f}, std={std_val:.4f}")
+        # UltraSketch: sketch every weight group with two values split at the
+        # group median; large groups push the scale overhead well below 1 bit
+        params = {"scheme": "ultrasketch", "group_size": quant_config.get("group_size", 256)}
+        for name, packed in self._apply_packed_quantization(model, params):
+            logger.info(f"UltraSketch quantization applied to {name}: "
+                       f"{packed.num_groups} groups of {packed.group_size}")
         
         return model
 
+    def _apply_packed_quantization(self, model: torch.nn.Module, params: Dict[str, Any],
+                                   kernel=layer_kernels.packed_linear, layers: Optional[List] = None,
+                                   layer_params: Optional[List[Dict[str, Any]]] = None) -> List:
+        """Swap every packable Linear (or the given layers) for the packed layer kernel builds"""
+        if layers is None:
+            layers = self._packable_linears(model)
+        results = self._map_layers(kernel, layers, params, layer_params)
+
+        replaced = []
+        for (name, module), result in zip(layers, results):
+            if "error" in result:
+                logger.warning(f"{params['scheme']} quantization skipped for {name}: {result['error']}")
+                continue
+            replace_module(model, name, result["module"])
+            replaced.append((name, result["module"]))
+        return replaced
+
+    def _packable_linears(self, model: torch.nn.Module) -> List:
+        """Linear layers whose weights a step may rewrite or swap for packed layers (tied embeddings are skipped)"""
+        tied = tied_parameter_ids(model)
+        linears = []
+        for name, module in model.named_modules():
+            if isinstance(module, torch.nn.Linear):
+                if id(module.weight) in tied:
+                    logger.info(f"Skipping {name}: weight is tied to an embedding")
+                    continue
+                linears.append((name, module))
+        return linears
+
     def _apply_wanda_pruning(self, model: torch.nn.Module,
                            prune_config: Dict[str, Any]) -> torch.nn.Module:
         """Apply Wanda (Pruning by Weights and Activations) pruning"""
@@ -303,35 +387,7 @@ class UltraAdvancedCompressionEngine:
         
         # Implementation of Wanda pruning technique
         # Importance = |weight| * activation_norm
-        def apply_wanda_pruning_to_module(module, amount=0.3):
-            try:
-                # For demonstration, we'll use a simplified version of Wanda
-                # In practice, this would collect activation norms during forward passes
-                
-                # Calculate importance as product of weight magnitude and a proxy for activation norm
-                weights = module.weight.data
-                importance = torch.abs(weights) * (weights ** 2).mean().sqrt()
-                
-                # Determine threshold for pruning
-                threshold = torch.quantile(importance.flatten(), amount)
-                
-                # Create mask for weights to prune
-                prune_mask = importance < threshold
-                
-                # Apply pruning
-                prune.custom_from_mask(module, name="weight", mask=~prune_mask)
-                
-                logger.info(f"Wanda pruning: pruned {prune_mask.sum().item()} weights "
-                           f"({100 * prune_mask.sum().item() / weights.numel():.2f}%)")
-            except Exception as e:
-                logger.warning(f"Wanda pruning skipped for module due to error: {e}")
-
-        for name, module in model.named_modules():
-            if isinstance(module, torch.nn.Linear):
-                logger.info(f"Applying Wanda pruning to layer: {name}")
-                apply_wanda_pruning_to_module(module, prune_config.get("ratio", 0.3))
-        
-        return model
+        return self._apply_mask_pruning(model, prune_config, layer_kernels.wanda_prune_mask, "Wanda")
 
     def _apply_sparsegpt_pruning(self, model: torch.nn.Module,
                                prune_config: Dict[str, Any]) -> torch.nn.Module:
@@ -339,118 +395,158 @@ class UltraAdvancedCompressionEngine:
         logger.info("Applying SparseGPT one-shot pruning...")
         
         # Implementation of SparseGPT pruning technique
-        def apply_sparsegpt_pruning_to_module(module, amount=0.3):
+        # Importance = weight^2 / diagonal Hessian approximation
+        return self._apply_mask_pruning(model, prune_config, layer_kernels.sparsegpt_prune_mask, "SparseGPT")
+
+    def _apply_mask_pruning(self, model: torch.nn.Module, prune_config: Dict[str, Any],
+                            kernel, label: str, calibrate: bool = True) -> torch.nn.Module:
+        """Compute a prune mask per Linear with kernel and zero the pruned weights"""
+        # An N:M pattern (e.g. "2:4") fixes the sparsity at 1 - N/M and overrides ratio
+        params = {"amount": prune_config.get("ratio", 0.3), "n_m": parse_pattern(prune_config.get("pattern"))}
+        calibrated = set()
+        # A weight tied to the input embedding would prune the embedding table with it
+        tied = tied_parameter_ids(model)
+
+        if calibrate and self.calibration_data is not None:
+            # Prune block by block on real activations, so every block is calibrated on
+            # the outputs of the already pruned blocks before it
+            hessian = kernel is layer_kernels.sparsegpt_prune_mask
+
+            def prune_block(block_layers):
+                block_layers = [(name, module, stats) for name, module, stats in block_layers
+                                if id(module.weight) not in tied]
+                layer_params = [{"hessian": stats.hessian} if hessian
+                                else {"activation_norms": stats.activation_norms()}
+                                for _, _, stats in block_layers]
+                self._prune_layers([(name, module) for name, module, _ in block_layers],
+                                   kernel, params, label, layer_params)
+                calibrated.update(name for name, _, _ in block_layers)
+
             try:
-                # SparseGPT approach: Frame pruning as a sparse regression task
-                weights = module.weight.data
-                
-                # Simplified SparseGPT implementation
-                # In practice, this would use block-wise sparse regression
-                
-                # Calculate Hessian approximation (simplified)
-                hessian_diag = (weights ** 2).mean(dim=1, keepdim=True) + 1e-6
-                
-                # Calculate importance scores
-                importance = (weights ** 2) / hessian_diag
-                
-                # Determine threshold for pruning
-                threshold = torch.quantile(importance.flatten(), amount)
-                
-                # Create mask for weights to prune
-                prune_mask = importance < threshold
-                
-                # Apply pruning
-                prune.custom_from_mask(module, name="weight", mask=~prune_mask)
-                
-                logger.info(f"SparseGPT pruning: pruned {prune_mask.sum().item()} weights "
-                           f"({100 * prune_mask.sum().item() / weights.numel():.2f}%)")
+                BlockSequentialCalibrator(model, self.calibration_data).run(prune_block, hessian)
             except Exception as e:
-                logger.warning(f"SparseGPT pruning skipped for module due to error: {e}")
+                logger.warning(f"{label} calibration failed, using weight-only importance: {e}")
 
-        for name, module in model.named_modules():
-            if isinstance(module, torch.nn.Linear):
-                logger.info(f"Applying SparseGPT pruning to layer: {name}")
-                apply_sparsegpt_pruning_to_module(module, prune_config.get("ratio", 0.3))
-        
+        # Layers calibration did not reach (e.g. lm_head) use the weight-only proxy
+        remaining = [(name, module) for name, module in self._packable_linears(model) if name not in calibrated]
+        if remaining:
+            self._prune_layers(remaining, kernel, params, label)
         return model
 
+    def _prune_layers(self, layers: List, kernel, params: Dict[str, Any], label: str,
+                      layer_params: Optional[List[Dict[str, Any]]] = None):
+        results = self._map_layers(kernel, layers, params, layer_params)
+
+        for (name, module), result in zip(layers, results):
+            if "error" in result:
+                logger.warning(f"{label} pruning skipped for {name} due to error: {result['error']}")
+                continue
+            # SparseGPT also updates the surviving weights to compensate
+            weight = result.get("weight", module.weight.data)
+            prune_mask = result["prune_mask"]
+            # Pruned weights are zeroed in a new tensor; the save step stores them sparsely
+            module.weight.data = weight.masked_fill(prune_mask, 0)
+            
+            logger.info(f"{label} pruning applied to {name}: pruned {prune_mask.sum().item()} weights "
+                       f"({100 * prune_mask.sum().item() / prune_mask.numel():.2f}%)")
+
     def _apply_calr_decomposition(self, model: torch.nn.Module,
                                 decompose_config: Dict[str, Any]) -> torch.nn.Module:
         """Apply CALR (Corrective Adaptive Low-Rank Decomposition)"""
         logger.info("Applying CALR decomposition...")
         
-        # Implementation of CALR decomposition technique
-        rank_ratio = decompose_config.get("rank_ratio", 0.5)
-        
-        with torch.no_grad():
-            for name, module in model.named_modules():
-                if isinstance(module, torch.nn.Linear):
-                    # Get weight matrix
-                    W = module.weight.data
-                    
-                    # Compute SVD
-                    try:
-                        U, S, Vh = torch.linalg.svd(W, full_matrices=False)
-                        
-                        # Determine rank based on ratio
-                        rank = max(1, int(rank_ratio * min(U.shape[1], Vh.shape[0])))
-                        
-                        # Low-rank approximation
-                        U_low = U[:, :rank]
-                        S_low = S[:rank]
-                        Vh_low = Vh[:rank, :]
-                        
-                        # Reconstruct with correction term (CALR enhancement)
-                        W_approx = U_low @ torch.diag(S_low) @ Vh_low
-                        
-                        # Calculate reconstruction error
-                        error = W - W_approx
-                        
-                        # Apply corrective term to compensate for information loss
-                        # This is a simplified version of the CALR correction mechanism
-                        correction_factor = 0.1  # Adaptive correction factor
-                        W_corrected = W_approx + correction_factor * error
-                        
-                        # Apply decomposed weights
-                        module.weight.data = W_corrected
-                        
-                        logger.info(f"CALR decomposition applied to {name}: "
-                                   f"original_rank={min(W.shape)}, new_rank={rank}, "
-                                   f"compression_ratio={rank/min(W.shape):.2f}")
-                    except Exception as e:
-                        logger.warning(f"CALR decomposition failed for {name}: {e}")
-                        # Fallback to simple low-rank approximation
-                        try:
-                            U, S, Vh = torch.svd_lowrank(W, q=rank)
-                            W_approx = U @ torch.diag(S) @ Vh
-                            module.weight.data = W_approx
-                            logger.info(f"Fallback LR applied to {name}")
-                        except Exception as e2:
-                            logger.warning(f"Even fallback LR failed for {name}: {e2}")
+        # Adaptive rank: each layer keeps the smallest rank holding `energy` of its
+        # spectrum, never more than rank_ratio of its full rank
+        params = {
+            "rank_ratio": decompose_config.get("rank_ratio", 0.5),
+            "energy": decompose_config.get("energy", 0.9)
+        }
+        return self._apply_factorization(model, params, "CALR")
+
+    def _apply_factorization(self, model: torch.nn.Module, params: Dict[str, Any],
+                             label: str) -> torch.nn.Module:
+        """Replace every Linear whose truncated SVD is smaller than the dense matrix by a LowRankLinear"""
+        # Factoring a weight tied to the input embedding would break the tie
+        layers = self._packable_linears(model)
+        # Layers with super weights are factored without them, so their SVD is cached apart
+        kinds = ["svd_without_super_weights" if name in self.super_weights else "svd" for name, _ in layers]
+        layer_params = None
+        if self.layer_stats is not None:
+            # SVD factors of base weights are shared by every level that decomposes them
+            layer_params = [{"svd": self.layer_stats.lookup(module.weight.data, kind)
+                             if self.layer_stats.is_base(module.weight.data) else None}
+                            for (name, module), kind in zip(layers, kinds)]
+        results = self._map_layers(layer_kernels.low_rank_factors, layers, params, layer_params)
+
+        for (name, module), kind, result in zip(layers, kinds, results):
+            W = module.weight.data
+            if "error" in result:
+                logger.warning(f"{label} decomposition failed for {name}: {result['error']}")
+                continue
+            if result["svd"] is not None and self.layer_stats is not None:
+                self.layer_stats.misses += 1
+                self.layer_stats.store(W, kind, result["svd"])
+
+            rank = result["rank"]
+            if result["module"] is None:
+                logger.info(f"{label} decomposition skipped for {name}: rank {rank} factors "
+                           f"would not be smaller than the dense weight")
+                continue
+            replace_module(model, name, result["module"])
+            
+            logger.info(f"{label} decomposition applied to {name}: "
+                       f"original_rank={min(W.shape)}, new_rank={rank}, "
+                       f"compression_ratio={rank * sum(W.shape) / W.numel():.2f}")
         
         return model
 
     # Helper methods for quantization
-    def _quantize_tensor(self, tensor, bits, min_val=None, max_val=None):
-        """Quantize a tensor to specified number of bits"""
-        if min_val is None:
-            min_val = tensor.min()
-        if max_val is None:
-            max_val = tensor.max()
-            
-        # Calculate number of quantization levels
-        levels = 2 ** bits
-        
-        # Normalize tensor to [0, 1]
-        normalized = (tensor - min_val) / (max_val - min_val)
+    def _quantize_tensor(self, tensor, bits, group_size=128):
+        """Quantize a tensor to specified number of bits, with one scale and zero-point per group"""
+        flat = tensor.float().reshape(-1, tensor.shape[-1])
+        padding = (-flat.shape[1]) % group_size
+        grouped = torch.nn.functional.pad(flat, (0, padding)).reshape(flat.shape[0], -1, group_size)
+        valid = torch.nn.functional.pad(torch.ones_like(flat, dtype=torch.bool), (0, padding))
         
-        # Quantize to discrete levels
-        quantized = torch.round(normalized * (levels - 1))
+        # Quantize every group at once and dequantize back to the original range
+        codes, scales, zero_points = quantize_groups(grouped, bits, valid.reshape(grouped.shape), torch.float32)
+        dequantized = dequantize_groups(codes, scales, zero_points).reshape(flat.shape[0], -1)
         
-        # Dequantize back to original range
-        dequantized = quantized / (levels - 1) * (max_val - min_val) + min_val
-        
-        return dequantized
+        return dequantized[:, :flat.shape[1]].reshape(tensor.shape).to(tensor.dtype)
+
+    def _allocate_bit_widths(self, sensitivities: List[Dict[str, Any]], bit_options: List[int],
+                             target_bits: float) -> List[int]:
+        """
+        Greedy bit allocation: every layer starts at the lowest width, then the upgrade that
+        removes the most squared error per extra stored bit is taken until the average
+        bits per weight would exceed target_bits
+        """
+        options = sorted(bit_options)
+        choice = [0] * len(sensitivities)
+        total = sum(s["numel"] for s in sensitivities)
+        budget = target_bits * total - options[0] * total
+
+        def upgrade(index):
+            level = choice[index]
+            if level + 1 < len(options):
+                errors = sensitivities[index]["errors"]
+                cost = (options[level + 1] - options[level]) * sensitivities[index]["numel"]
+                gain = errors[options[level]] - errors[options[level + 1]]
+                if gain > 0:
+                    heapq.heappush(candidates, (-gain / cost, index, cost))
+
+        candidates = []
+        for index in range(len(sensitivities)):
+            upgrade(index)
+        while candidates:
+            _, index, cost = heapq.heappop(candidates)
+            if cost > budget:
+                continue
+            budget -= cost
+            choice[index] += 1
+            upgrade(index)
+
+        return [options[level] for level in choice]
 
     # Existing methods for backward compatibility
     def _apply_4bit_quantization(self, model: torch.nn.Module,
@@ -458,7 +554,18 @@ class UltraAdvancedCompressionEngine:
                                device: torch.device) -> torch.nn.Module:
         """Apply 4-bit quantization"""
         logger.info("Applying 4-bit quantization...")
-        # In a full implementation, this would use bitsandbytes or other quantization libraries
+        
+        # Group-wise asymmetric integer codes, two per byte, with a scale and
+        # zero-point per group of input features; runs on CPU without bitsandbytes
+        params = {
+            "scheme": "group",
+            "bits": quant_config.get("bits", 4),
+            "group_size": quant_config.get("group_size", 128)
+        }
+        for name, packed in self._apply_packed_quantization(model, params, layer_kernels.group_quantized_linear):
+            logger.info(f"{packed.bits}-bit quantization applied to {name}: "
+                       f"{packed.num_groups} groups of {packed.group_size}")
+        
         return model
 
     def _apply_8bit_quantization(self, model: torch.nn.Module,
@@ -481,7 +588,36 @@ class UltraAdvancedCompressionEngine:
                                           device: torch.device) -> torch.nn.Module:
         """Apply mixed precision quantization"""
         logger.info("Applying mixed precision quantization...")
-        # In a full implementation, this would apply different bit widths to different layers
+        
+        # Every layer gets a bit width from bit_options; layers whose weights lose the
+        # most to quantization get the wider codes, averaging target_bits per weight
+        bit_options = sorted(quant_config.get("bit_options", [2, 4, 8]))
+        params = {
+            "scheme": "group",
+            "bit_options": bit_options,
+            "group_size": quant_config.get("group_size", 128)
+        }
+        candidates = self._packable_linears(model)
+        results = self._map_layers(layer_kernels.quantization_sensitivity, candidates, params)
+        layers = []
+        sensitivities = []
+        for (name, module), result in zip(candidates, results):
+            if "error" in result:
+                logger.warning(f"Mixed precision quantization skipped for {name}: {result['error']}")
+                continue
+            layers.append((name, module))
+            sensitivities.append(result)
+        
+        bit_widths = self._allocate_bit_widths(sensitivities, bit_options, quant_config.get("target_bits", 4))
+        layer_params = [{"bits": bits} for bits in bit_widths]
+        for name, packed in self._apply_packed_quantization(model, params, layer_kernels.group_quantized_linear,
+                                                            layers, layer_params):
+            logger.info(f"Mixed precision quantization applied to {name}: {packed.bits} bits")
+        
+        if bit_widths:
+            average = sum(bits * s["numel"] for bits, s in zip(bit_widths, sensitivities)) / sum(
+                s["numel"] for s in sensitivities)
+            logger.info(f"Mixed precision average: {average:.2f} bits per weight")
         return model
 
     def _apply_quip_quantization(self, model: torch.nn.Module,
@@ -489,33 +625,78 @@ class UltraAdvancedCompressionEngine:
                                device: torch.device) -> torch.nn.Module:
         """Apply QuIP quantization"""
         logger.info("Applying QuIP quantization...")
-        # In a full implementation, this would use the QuIP algorithm
+        
+        # Incoherence processing: random sign flips and Hadamard rotations on both sides
+        # make the weights and Hessian incoherent, so 2-bit LDLQ rounding loses little
+        params = {
+            "scheme": "quip",
+            "bits": quant_config.get("bits", 2),
+            "group_size": quant_config.get("group_size", 128),
+            "seed": quant_config.get("seed", 0)
+        }
+        for name, packed in self._apply_calibrated_quantization(model, params, layer_kernels.quip_linear,
+                                                                "QuIP"):
+            logger.info(f"QuIP quantization applied to {name}: {packed.rotated.bits} bits, "
+                       f"{packed.rotated.num_groups} groups of {packed.rotated.group_size}")
+        
         return model
 
+    def _apply_calibrated_quantization(self, model: torch.nn.Module, params: Dict[str, Any],
+                                       kernel, label: str) -> List:
+        """
+        Quantize every packable Linear with kernel, passing each layer's calibration Hessian
+        when calibration data is set; returns the (name, layer) pairs that were replaced
+        """
+        replaced = []
+        if self.calibration_data is not None:
+            # Block by block, so every block is calibrated on the quantized blocks before it
+            def quantize_block(block_layers):
+                layers = [(name, module) for name, module, _ in block_layers]
+                layer_params = [{"hessian": stats.hessian} for _, _, stats in block_layers]
+                replaced.extend(self._apply_packed_quantization(model, params, kernel, layers, layer_params))
+
+            try:
+                BlockSequentialCalibrator(model, self.calibration_data).run(quantize_block, hessian=True)
+            except Exception as e:
+                logger.warning(f"{label} calibration failed, rounding without a Hessian: {e}")
+
+        # Layers calibration did not reach (e.g. lm_head) are rounded to nearest
+        replaced.extend(self._apply_packed_quantization(model, params, kernel))
+        return replaced
+
     def _apply_aqlm_quantization(self, model: torch.nn.Module,
                                quant_config: Dict[str, Any],
                                device: torch.device) -> torch.nn.Module:
         """Apply AQLM quantization"""
         logger.info("Applying AQLM quantization...")
-        # In a full implementation, this would use the AQLM algorithm
+        
+        # Additive quantization: every 8-weight vector is the sum of one entry from each
+        # of two learned 256-entry codebooks, i.e. 2 bits per weight by default
+        params = {
+            "scheme": "aqlm",
+            "num_codebooks": quant_config.get("num_codebooks", 2),
+            "codebook_bits": quant_config.get("codebook_bits", 8),
+            "group_size": quant_config.get("group_size", 8),
+            "beam_size": quant_config.get("beam_size", 4),
+            "rounds": quant_config.get("rounds", 3),
+            "kmeans_iters": quant_config.get("kmeans_iters", 25),
+            "seed": quant_config.get("seed", 0),
+            # Finished layers are checkpointed here, so an interrupted run resumes per layer
+            "checkpoint_dir": quant_config.get("checkpoint_dir")
+        }
+        replaced = self._apply_calibrated_quantization(model, params, layer_kernels.aqlm_linear, "AQLM")
+        for name, packed in replaced:
+            logger.info(f"AQLM quantization applied to {name}: "
+                       f"{packed.num_codebooks * packed.codebook_bits / packed.group_size:.2f} bits per weight")
+        
         return model
 
     def _apply_unstructured_pruning(self, model: torch.nn.Module,
                                   prune_config: Dict[str, Any]) -> torch.nn.Module:
         """Apply unstructured pruning"""
         logger.info("Applying unstructured pruning...")
-        def apply_pruning_to_module(module, amount=0.3):
-            try:
-                prune.l1_unstructured(module, name="weight", amount=amount)
-            except Exception as e:
-                logger.warning(f"Pruning skipped for module due to error: {e}")
-
-        for name, module in model.named_modules():
-            if isinstance(module, torch.nn.Linear):
-                logger.info(f"Pruning layer: {name}")
-                apply_pruning_to_module(module, prune_config.get("ratio", 0.3))
-        
-        return model
+        return self._apply_mask_pruning(model, prune_config, layer_kernels.magnitude_prune_mask, "L1",
+                                        calibrate=False)
 
     def _apply_structured_pruning(self, model: torch.nn.Module,
                                 prune_config: Dict[str, Any]) -> torch.nn.Module:
@@ -534,8 +715,12 @@ class UltraAdvancedCompressionEngine:
                                     decompose_config: Dict[str, Any]) -> torch.nn.Module:
         """Apply low-rank decomposition"""
         logger.info("Applying low-rank decomposition...")
-        # In a full implementation, this would use SVD-based decomposition
-        return model
+        # Fixed rank of rank_ratio * min(out, in) unless an energy target is given
+        params = {
+            "rank_ratio": decompose_config.get("rank_ratio", 0.5),
+            "energy": decompose_config.get("energy")
+        }
+        return self._apply_factorization(model, params, "Low-rank")
 
     def _apply_lora_finetuning(self, model: torch.nn.Module,
                              lora_config: Dict[str, Any],
@@ -6,18 +6,28 @@ import os
 from typing import Dict, List, Any, Optional
 import logging
 
+from nanoquant.core.level_catalog import level_catalog, level_cost
+
 logger = logging.getLogger(__name__)
 
 class CompressionPipeline:
-    def __init__(self, output_base_dir: str = "./nanoquants"):
+    def __init__(self, output_base_dir: str = "./nanoquants", cache_dir: Optional[str] = None,
+                 use_cache: bool = True, resumable: bool = True, model_cache_bytes: Optional[int] = None):
         self.output_base_dir = output_base_dir
+        # Checkpoint finished layers, blocks and levels so a restarted run resumes
+        self.resumable = resumable
         # Import components here to avoid circular imports
         from nanoquant.core.model_ingestion import ModelIngestionPipeline
         from nanoquant.core.nanoquant_generator import UltraNanoQuantGenerator
         from nanoquant.core.ollama_integration import OllamaIntegrationSystem
         from nanoquant.core.user_management import UserManager
+        from nanoquant.core.artifact_cache import ArtifactCache
+        from nanoquant.core.model_cache import ModelCache
 
         self.ingestion = ModelIngestionPipeline()
+        # Base models stay resident between runs; worker processes reuse one pipeline for every job
+        self.model_cache = ModelCache(model_cache_bytes)
+        self.cache = ArtifactCache(cache_dir) if use_cache else None
         self.generator = UltraNanoQuantGenerator()
         self.ollama = OllamaIntegrationSystem()
         self.user_manager = UserManager()
@@ -30,9 +40,27 @@ class CompressionPipeline:
                      dataset_path: str = None,
                      push_to_ollama: bool = True,
                      user_id: str = None,
-                     knowledge_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                     knowledge_data: Optional[Dict[str, Any]] = None,
+                     streaming: bool = False,
+                     lazy: bool = False,
+                     progress=None,
+                     run_id: Optional[str] = None,
+                     model_name: Optional[str] = None) -> Dict[str, Any]:
         """
         Complete pipeline: ingest, compress, evaluate, and package
+
+        With streaming=True the model is never loaded as a whole; each decoder block is
+        read from the safetensors shards, compressed and written out on its own.
+        With lazy=True the whole model is built over memory-mapped shards instead of
+        being copied into memory. Levels already compressed from the same model
+        revision are reused from the artifact cache. progress is an optional
+        ProgressTracker that receives stage, layer and completion events. Runs are
+        checkpointed as they go, and a run interrupted by a crash or eviction resumes
+        from its last finished layer, block or level when it is started again.
+        run_id gives the run a checkpoint of its own, for callers such as the job queue
+        that may run the same inputs concurrently; without it, runs of the same inputs
+        share one checkpoint, so repeating a command resumes it. model_name names the
+        output directories and Ollama tags in place of the model ID.
         """
         logger.info(f"Processing model: {model_id} with compression level: {compression_level}")
 
@@ -40,19 +68,82 @@ class CompressionPipeline:
         if user_id and not self._check_user_access(user_id, compression_level):
             raise PermissionError(f"Insufficient credits or access for compression level: {compression_level}")
 
-        # Step 1: Ingest model
-        logger.info("Step 1: Ingesting model...")
-        model_artifacts = self.ingestion.ingest_model(model_id)
-
-        # Step 2: Generate NanoQuants
-        logger.info("Step 2: Generating NanoQuants...")
-        model_name = model_id.replace("/", "_")
+        model_name = (model_name or model_id).replace("/", "_")
         output_dir = os.path.join(self.output_base_dir, model_name)
-        generated_models = self.generator.generate_nanoquants(model_artifacts, output_dir)
+
+        # Levels someone already compressed from this exact revision come from the cache
+        cache_keys = self._cache_keys(model_id, self.generator.compression_levels, dataset_path,
+                                      streaming=streaming)
+        cached_models = {}
+        if progress is not None and cache_keys:
+            progress.stage("cache", message="Checking the artifact cache")
+        for level_name, key in cache_keys.items():
+            level_model_name = f"{model_name}_{level_name}"
+            if self.cache.fetch(key, os.path.join(output_dir, level_model_name)):
+                cached_models[level_name] = self.generator.level_info(
+                    level_model_name, level_name, os.path.join(output_dir, level_model_name)
+                )
+        # Levels an interrupted run already saved are picked up from its checkpoint
+        run_checkpoint = self._run_checkpoint(model_id, output_dir, self.generator.compression_levels,
+                                              dataset_path, run_id=run_id, streaming=streaming)
+        resumed_models = {}
+        if run_checkpoint is not None:
+            for level_name in self.generator.compression_levels:
+                completed = run_checkpoint.completed_level(level_name)
+                if level_name not in cached_models and completed is not None:
+                    resumed_models[level_name] = completed
+        missing_levels = [level_name for level_name in self.generator.compression_levels
+                          if level_name not in cached_models and level_name not in resumed_models]
+
+        new_models = []
+        if not missing_levels:
+            logger.info("Steps 1-2: Every level served from the artifact cache or the run checkpoint")
+        elif streaming:
+            # Steps 1-2: Resolve the checkpoint and compress it block by block
+            if dataset_path:
+                logger.warning("Calibration data is not used in streaming mode; pruning uses weight-only importance")
+            logger.info("Step 1: Resolving checkpoint files...")
+            if progress is not None:
+                progress.stage("ingest", message="Resolving checkpoint files")
+            checkpoint_dir = self.ingestion.resolve_checkpoint(model_id)
+
+            logger.info("Step 2: Generating NanoQuants in streaming mode...")
+            new_models = self.generator.generate_streaming_nanoquants(
+                checkpoint_dir, model_id, output_dir, levels=missing_levels, progress=progress,
+                run_checkpoint=run_checkpoint, model_name=model_name
+            )
+        else:
+            # Step 1: Ingest model
+            logger.info("Step 1: Ingesting model...")
+            if progress is not None:
+                progress.stage("ingest", message="Loading model")
+            model_artifacts = self._ingest(model_id, lazy=lazy)
+            if dataset_path:
+                model_artifacts["calibration_data"] = self.ingestion.load_calibration_data(
+                    dataset_path, model_artifacts["tokenizer"]
+                )
+
+            # Step 2: Generate NanoQuants
+            logger.info("Step 2: Generating NanoQuants...")
+            new_models = self.generator.generate_nanoquants(model_artifacts, output_dir,
+                                                            levels=missing_levels, progress=progress,
+                                                            run_checkpoint=run_checkpoint,
+                                                            model_name=model_name)
+
+        new_models = list(resumed_models.values()) + new_models
+        for model_info in new_models:
+            if model_info["level"] in cache_keys:
+                self.cache.store(cache_keys[model_info["level"]], model_info["path"],
+                                 {"model_id": model_id, "level": model_info["level"]})
+        generated = dict(cached_models, **{model_info["level"]: model_info for model_info in new_models})
+        generated_models = [generated[level_name] for level_name in self.generator.compression_levels
+                            if level_name in generated]
 
         # Step 3: Apply knowledge tuning if provided
         if knowledge_data:
             logger.info("Step 3: Applying knowledge tuning...")
+            if progress is not None:
+                progress.stage("tune", message="Applying knowledge tuning")
             from nanoquant.core.knowledge_tuning import KnowledgeTuningEngine
             tuner = KnowledgeTuningEngine()
             
@@ -84,6 +175,8 @@ class CompressionPipeline:
         ollama_tags = []
         if push_to_ollama and self.ollama.ollama_available:
             logger.info("Step 4: Packaging for Ollama...")
+            if progress is not None:
+                progress.stage("package", message="Packaging for Ollama")
             for model_info in generated_models:
                 # Handle both tuned and non-tuned models
                 if isinstance(model_info, dict) and "tuned" in model_info:
@@ -122,6 +215,11 @@ class CompressionPipeline:
         if user_id:
             self._deduct_user_credits(user_id, compression_level)
 
+        if run_checkpoint is not None:
+            run_checkpoint.clear()
+        if progress is not None:
+            progress.finish(f"Generated {len(generated_models)} NanoQuants")
+
         return {
             "model_id": model_id,
             "generated_models": generated_models,
@@ -135,9 +233,12 @@ class CompressionPipeline:
                            dataset_path: str = None,
                            push_to_ollama: bool = True,
                            user_id: str = None,
-                           knowledge_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                           knowledge_data: Optional[Dict[str, Any]] = None,
+                           lazy: bool = False,
+                           progress=None,
+                           run_id: Optional[str] = None) -> Dict[str, Any]:
         """
-        Process a model with custom compression configuration
+        Process a model with custom compression configuration; run_id is as in process_model
         """
         logger.info(f"Processing model with custom config: {model_id}")
 
@@ -145,22 +246,45 @@ class CompressionPipeline:
         if user_id and not self._check_user_access(user_id, "custom"):
             raise PermissionError(f"Insufficient credits or access for custom compression")
 
-        # Step 1: Ingest model
-        logger.info("Step 1: Ingesting model...")
-        model_artifacts = self.ingestion.ingest_model(model_id)
-
-        # Step 2: Generate custom NanoQuant
-        logger.info("Step 2: Generating custom NanoQuant...")
         model_name = model_id.replace("/", "_")
         output_dir = os.path.join(self.output_base_dir, model_name)
-        
-        custom_model = self.generator.generate_custom_nanoquant(
-            model_artifacts, output_dir, custom_config, "custom"
-        )
+        custom_path = os.path.join(output_dir, f"{model_name}_custom")
+        cache_keys = self._cache_keys(model_id, {"custom": custom_config}, dataset_path)
+
+        if "custom" in cache_keys and self.cache.fetch(cache_keys["custom"], custom_path):
+            logger.info("Steps 1-2: Custom NanoQuant served from the artifact cache")
+            custom_model = {"name": f"{model_name}_custom", "path": custom_path, "config": custom_config}
+        else:
+            run_checkpoint = self._run_checkpoint(model_id, output_dir, {"custom": custom_config}, dataset_path,
+                                                  run_id=run_id)
+
+            # Step 1: Ingest model
+            logger.info("Step 1: Ingesting model...")
+            if progress is not None:
+                progress.stage("ingest", message="Loading model")
+            model_artifacts = self._ingest(model_id, lazy=lazy)
+            if dataset_path:
+                model_artifacts["calibration_data"] = self.ingestion.load_calibration_data(
+                    dataset_path, model_artifacts["tokenizer"]
+                )
+
+            # Step 2: Generate custom NanoQuant
+            logger.info("Step 2: Generating custom NanoQuant...")
+            custom_model = self.generator.generate_custom_nanoquant(
+                model_artifacts, output_dir, custom_config, "custom", progress=progress,
+                run_checkpoint=run_checkpoint
+            )
+            if "custom" in cache_keys:
+                self.cache.store(cache_keys["custom"], custom_model["path"],
+                                 {"model_id": model_id, "level": "custom"})
+            if run_checkpoint is not None:
+                run_checkpoint.clear()
 
         # Step 3: Apply knowledge tuning if provided
         if knowledge_data:
             logger.info("Step 3: Applying knowledge tuning...")
+            if progress is not None:
+                progress.stage("tune", message="Applying knowledge tuning")
             from nanoquant.core.knowledge_tuning import KnowledgeTuningEngine
             tuner = KnowledgeTuningEngine()
             
@@ -179,6 +303,8 @@ class CompressionPipeline:
         ollama_tags = []
         if push_to_ollama and self.ollama.ollama_available:
             logger.info("Step 4: Packaging for Ollama...")
+            if progress is not None:
+                progress.stage("package", message="Packaging for Ollama")
             model_path = custom_model.get("tuned", {}).get("tuned_model_path", custom_model["path"]) if custom_model.get("tuned") else custom_model["path"]
             tag = f"nanoquant_{model_name}:custom"
             try:
@@ -200,6 +326,9 @@ class CompressionPipeline:
         if user_id:
             self._deduct_user_credits(user_id, "custom")
 
+        if progress is not None:
+            progress.finish("Generated custom NanoQuant")
+
         return {
             "model_id": model_id,
             "custom_model": custom_model,
@@ -211,9 +340,75 @@ class CompressionPipeline:
         """
         Get information about available compression levels
         """
-        from nanoquant.core.nanoquant_generator import UltraNanoQuantGenerator
-        generator = UltraNanoQuantGenerator()
-        return generator.compression_levels
+        return level_catalog()["levels"]
+
+    def share_result(self, result: Dict[str, Any], user_id: str = None,
+                     compression_level: str = "medium") -> Dict[str, Any]:
+        """
+        Hand the result of a run to another user who requested the same compression
+        while it was in flight: their access is checked and their credits deducted
+        exactly as if they had run it themselves
+        """
+        if user_id and not self._check_user_access(user_id, compression_level):
+            raise PermissionError(f"Insufficient credits or access for compression level: {compression_level}")
+        if user_id:
+            self._deduct_user_credits(user_id, compression_level)
+        return result
+
+    def _ingest(self, model_id: str, lazy: bool = False) -> Dict[str, Any]:
+        """
+        Ingested artifacts of model_id, taken from the resident model cache when this
+        process already loaded the same revision. Memory-mapped models are cheap to
+        rebuild and are never kept.
+        """
+        revision = None if lazy else self.ingestion.resolve_revision(model_id)
+        if revision is None:
+            return self.ingestion.ingest_model(model_id, lazy=lazy)
+        key = (model_id, revision)
+        model_artifacts = self.model_cache.get(key)
+        if model_artifacts is not None:
+            logger.info(f"Using resident model {model_id} instead of ingesting it again")
+            return model_artifacts
+        return self.model_cache.put(key, self.ingestion.ingest_model(model_id))
+
+    def _cache_keys(self, model_id: str, configs: Dict[str, Dict[str, Any]],
+                    dataset_path: Optional[str] = None, **extra) -> Dict[str, str]:
+        """
+        Artifact cache key of each named config, or {} when the results cannot be
+        shared: the cache is off, the revision is unknown, or they depend on the
+        caller's own calibration data
+        """
+        if self.cache is None or dataset_path:
+            return {}
+        revision = self.ingestion.resolve_revision(model_id)
+        if revision is None:
+            return {}
+        from nanoquant.core.artifact_cache import cache_key
+        return {name: cache_key(model_id, revision, config, **extra) for name, config in configs.items()}
+
+    def _run_checkpoint(self, model_id: str, output_dir: str, configs: Dict[str, Dict[str, Any]],
+                        dataset_path: Optional[str] = None, run_id: Optional[str] = None, **extra):
+        """
+        RunCheckpoint for compressing model_id with configs, or None when runs are not
+        resumable or the model revision is unknown (a resumed run must see the same weights)
+        """
+        if not self.resumable:
+            return None
+        revision = self.ingestion.resolve_revision(model_id)
+        if revision is None:
+            logger.info(f"Unknown revision for {model_id}; this run will not be resumable")
+            return None
+        from nanoquant.core.artifact_cache import cache_key
+        from nanoquant.core.run_checkpoint import RunCheckpoint, CHECKPOINT_DIR_ENV_VAR, DEFAULT_CHECKPOINT_SUBDIR
+
+        run_key = cache_key(model_id, revision, configs, dataset_path=dataset_path, **extra)
+        # One directory per run_id, or per run_key without one; a run that clears its
+        # checkpoint must never delete one another run is still writing
+        if os.getenv(CHECKPOINT_DIR_ENV_VAR):
+            root = os.path.join(os.getenv(CHECKPOINT_DIR_ENV_VAR), os.path.basename(output_dir))
+        else:
+            root = os.path.join(output_dir, DEFAULT_CHECKPOINT_SUBDIR)
+        return RunCheckpoint(os.path.join(root, run_id or run_key[:16]), run_key)
 
     def _check_user_access(self, user_id: str, compression_level: str) -> bool:
         """
@@ -225,28 +420,14 @@ class CompressionPipeline:
         """
         Deduct credits from user account based on compression level
         """
-        # Define credit costs for different levels
-        level_costs = {
-            "light": 0,
-            "medium": 0,
-            "heavy": 10,
-            "extreme": 25,
-            "ultra": 50,
-            "nano": 100,
-            "atomic": 200,
-            "custom": 75
-        }
-        
-        cost = level_costs.get(compression_level, 0)
+        cost = level_cost(compression_level)
         
         if cost > 0:
             # Check if user is on free tier and using a trial
             user_profile = self.user_manager.get_user_profile(user_id)
             if user_profile and user_profile.get("tier") == "free":
-                # Check if this is a trial usage
-                trials_used = self.user_manager._get_trials_count(user_id, compression_level)
-                if trials_used < 2:  # Still within trial limit
-                    self.user_manager.increment_trial_usage(user_id, compression_level)
+                # Check if this is a trial usage, still within the trial limit
+                if self.user_manager.use_trial(user_id, compression_level):
                     logger.info(f"Free tier trial used for {compression_level} compression")
                     return True
             
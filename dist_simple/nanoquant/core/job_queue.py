@@ -0,0 +1,425 @@
+"""
+Compression Job Queue for NanoQuant
+Persists compression requests in the compression_jobs table and runs them in worker processes
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import sqlite3
+import hashlib
+import multiprocessing as mp
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables read when no explicit database path or worker count is given
+JOBS_DB_ENV_VAR = "NANOQUANT_JOBS_DB"
+JOB_WORKERS_ENV_VAR = "NANOQUANT_JOB_WORKERS"
+
+DEFAULT_JOBS_DB = "./nanoquant_jobs.db"
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+# Request options that change how a run executes but not what it produces
+EXECUTION_OPTIONS = ("lazy",)
+
+# Minimum seconds between persisted layer events of one job; stage changes are always kept
+EVENT_INTERVAL = 0.5
+# Events read from the log per query
+EVENT_PAGE_SIZE = 500
+
+# Same table as docker/init.sql, in SQLite types
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS compression_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    model_id TEXT NOT NULL,
+    compression_level TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP,
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    output_path TEXT,
+    credits_used INTEGER,
+    request TEXT,
+    progress REAL DEFAULT 0,
+    stage TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    flight_key TEXT,
+    leader_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_compression_jobs_user_id ON compression_jobs (user_id);
+CREATE INDEX IF NOT EXISTS idx_compression_jobs_status ON compression_jobs (status, id);
+CREATE TABLE IF NOT EXISTS compression_job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    created_at TIMESTAMP,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_compression_job_events_job_id ON compression_job_events (job_id, id);
+"""
+
+JSON_COLUMNS = ("request", "result")
+
+# Columns added after the table was first created, with their types
+ADDED_COLUMNS = {"flight_key": "TEXT", "leader_id": "INTEGER"}
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def flight_key(model_id: str, compression_level: str, request: Dict[str, Any]) -> str:
+    """
+    Identity of the work a request asks for: requests with the same key produce the
+    same result, whoever submits them, so only one of them needs to run at a time
+    """
+    work = {key: value for key, value in request.items() if key not in EXECUTION_OPTIONS}
+    payload = json.dumps([model_id, compression_level, work], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class JobStore:
+    """
+    The compression_jobs table in a SQLite database shared by the API and the workers.
+
+    Workers claim jobs inside an immediate transaction, which holds the database
+    write lock from the SELECT to the UPDATE, so two workers never take the same job.
+
+    Identical requests are single-flight: a queued job whose flight_key matches a
+    running job is not claimed; it waits for that job, which hands its result to
+    every such follower when it finishes (see claim_followers and run_job).
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv(JOBS_DB_ENV_VAR, DEFAULT_JOBS_DB)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(compression_jobs)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE compression_jobs ADD COLUMN {column} {column_type}")
+            # Created after the columns, which databases from older versions lack
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_compression_jobs_flight_key "
+                               "ON compression_jobs (flight_key, status)")
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit; claim_next opens its own transaction
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for column in JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def create_job(self, user_id: Optional[str], model_id: str, compression_level: str,
+                   request: Dict[str, Any]) -> int:
+        """Queue a compression request and return its job ID"""
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO compression_jobs (user_id, model_id, compression_level, status, created_at, request, "
+                "flight_key) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, model_id, compression_level, QUEUED, _now(), json.dumps(request),
+                 flight_key(model_id, compression_level, request))
+            )
+            return cursor.lastrowid
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            return self._row(connection.execute("SELECT * FROM compression_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """A user's most recent jobs, newest first"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM compression_jobs WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim_next(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest queued job as running for worker and return it, skipping jobs
+        identical to one already running
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT id FROM compression_jobs WHERE status = ? AND (flight_key IS NULL OR flight_key NOT IN "
+                    "(SELECT flight_key FROM compression_jobs WHERE status = ? AND flight_key IS NOT NULL)) "
+                    "ORDER BY id LIMIT 1", (QUEUED, RUNNING)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE compression_jobs SET status = ?, started_at = ?, worker = ?, stage = ? WHERE id = ?",
+                        (RUNNING, _now(), worker, "starting", row["id"])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return self.get_job(row["id"])
+
+    def claim_followers(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Mark the queued jobs identical to the running job as running under it and
+        return them, oldest first, to receive its result
+        """
+        if not job.get("flight_key"):
+            return []
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT id FROM compression_jobs WHERE status = ? AND flight_key = ? AND id != ? ORDER BY id",
+                    (QUEUED, job["flight_key"], job["id"])
+                ).fetchall()
+                for row in rows:
+                    connection.execute(
+                        "UPDATE compression_jobs SET status = ?, started_at = ?, worker = ?, stage = ?, leader_id = ? "
+                        "WHERE id = ?",
+                        (RUNNING, _now(), job["worker"], "sharing", job["id"], row["id"])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return [self.get_job(row["id"]) for row in rows]
+
+    def update_progress(self, job_id: int, progress: float, stage: Optional[str] = None):
+        with self._connect() as connection:
+            connection.execute("UPDATE compression_jobs SET progress = ?, stage = COALESCE(?, stage) WHERE id = ?",
+                               (progress, stage, job_id))
+
+    def record_event(self, job_id: int, event: Dict[str, Any]) -> int:
+        """Append a progress event to the job's event log and mirror it on the job row"""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = connection.execute(
+                    "INSERT INTO compression_job_events (job_id, created_at, event) VALUES (?, ?, ?)",
+                    (job_id, _now(), json.dumps(event, default=str))
+                )
+                connection.execute("UPDATE compression_jobs SET progress = ?, stage = COALESCE(?, stage) WHERE id = ?",
+                                   (event.get("progress", 0), event.get("stage"), job_id))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return cursor.lastrowid
+
+    def get_events(self, job_id: int, after: int = 0, limit: int = EVENT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Events of a job with an ID greater than after, oldest first, each with its log ID as "id" """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, event FROM compression_job_events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        return [dict(json.loads(row["event"]), id=row["id"]) for row in rows]
+
+    def complete_job(self, job_id: int, result: Dict[str, Any], output_path: Optional[str] = None,
+                     credits_used: Optional[int] = None):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE compression_jobs SET status = ?, completed_at = ?, progress = 1, stage = ?, "
+                "result = ?, output_path = ?, credits_used = ? WHERE id = ?",
+                (COMPLETED, _now(), "done", json.dumps(result, default=str), output_path, credits_used, job_id)
+            )
+
+    def fail_job(self, job_id: int, error: str):
+        with self._connect() as connection:
+            connection.execute("UPDATE compression_jobs SET status = ?, completed_at = ?, error = ? WHERE id = ?",
+                               (FAILED, _now(), error, job_id))
+
+    def requeue_running(self) -> int:
+        """Return jobs left running by workers that no longer exist to the queue"""
+        with self._connect() as connection:
+            # Their events describe a run that will start over
+            connection.execute("DELETE FROM compression_job_events WHERE job_id IN "
+                               "(SELECT id FROM compression_jobs WHERE status = ?)", (RUNNING,))
+            cursor = connection.execute(
+                "UPDATE compression_jobs SET status = ?, worker = NULL, stage = NULL, progress = 0 WHERE status = ?",
+                (QUEUED, RUNNING)
+            )
+            return cursor.rowcount
+
+
+def run_job(store: JobStore, job: Dict[str, Any], pipeline) -> bool:
+    """Run one claimed job through pipeline and record its outcome and progress events"""
+    from nanoquant.core.progress import ProgressTracker
+
+    request = job["request"]
+    logger.info(f"Running compression job {job['id']} for {job['model_id']}")
+    progress = ProgressTracker([lambda event: store.record_event(job["id"], event)], min_interval=EVENT_INTERVAL)
+    try:
+        if request.get("custom_config"):
+            result = pipeline.process_custom_model(
+                job["model_id"],
+                request["custom_config"],
+                push_to_ollama=request.get("push_to_ollama", True),
+                user_id=job["user_id"],
+                lazy=request.get("lazy", False),
+                progress=progress,
+                run_id=f"job-{job['id']}"
+            )
+        else:
+            result = pipeline.process_model(
+                job["model_id"],
+                job["compression_level"],
+                push_to_ollama=request.get("push_to_ollama", True),
+                user_id=job["user_id"],
+                streaming=request.get("streaming", False),
+                lazy=request.get("lazy", False),
+                progress=progress,
+                run_id=f"job-{job['id']}"
+            )
+    except Exception as e:
+        logger.error(f"Compression job {job['id']} failed: {e}")
+        progress.fail(str(e) or type(e).__name__)
+        store.fail_job(job["id"], str(e) or type(e).__name__)
+        return False
+
+    # Fan the result out to identical jobs queued while this one ran; the leader's
+    # failure is not theirs to share, so on error they stay queued and one of them runs next
+    followers = store.claim_followers(job)
+    store.complete_job(job["id"], result, output_path=result.get("output_directory"))
+    logger.info(f"Compression job {job['id']} completed")
+    level = "custom" if request.get("custom_config") else job["compression_level"]
+    for follower in followers:
+        try:
+            pipeline.share_result(result, user_id=follower["user_id"], compression_level=level)
+        except Exception as e:
+            logger.error(f"Compression job {follower['id']} failed: {e}")
+            store.fail_job(follower["id"], str(e) or type(e).__name__)
+            continue
+        store.complete_job(follower["id"], result, output_path=result.get("output_directory"))
+        logger.info(f"Compression job {follower['id']} completed with the result of job {job['id']}")
+    return True
+
+
+def follow_events(store: JobStore, job_id: int, after: int = 0, poll_interval: float = 0.5,
+                  keepalive: float = 15.0) -> Iterator[str]:
+    """
+    Server-sent event stream of a job: every progress event recorded after the event
+    ID after, then new ones as the worker records them, closed by an "end" event with
+    the job's final status. Workers write the events to the database, so any API
+    process can serve the stream and clients can resume it from their last event ID.
+    """
+    from nanoquant.core.progress import format_sse
+
+    last_sent = time.monotonic()
+    while True:
+        # Read the status before the events: once a finished status is seen, every
+        # event the worker recorded is already in the table
+        job = store.get_job(job_id)
+        events = store.get_events(job_id, after)
+        for event in events:
+            after = event.pop("id")
+            yield format_sse(event, event="progress", event_id=after)
+            last_sent = time.monotonic()
+        if len(events) == EVENT_PAGE_SIZE:
+            continue
+
+        if job is None or job["status"] in (COMPLETED, FAILED):
+            final = {key: job[key] for key in ("status", "progress", "stage", "error")} if job else {"status": None}
+            yield format_sse(final, event="end")
+            return
+
+        if time.monotonic() - last_sent >= keepalive:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(poll_interval)
+
+
+def _worker_main(db_path: str, pipeline_options: Dict[str, Any], poll_interval: float, stop_event):
+    """Claim and run jobs until stop_event is set"""
+    logging.basicConfig(level=logging.INFO)
+    from nanoquant.core.compression_pipeline import CompressionPipeline
+
+    # Workers are not daemonic so their engines can start layer pools of their own; a
+    # terminated worker still unwinds, so those pools are shut down with it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    parent = mp.parent_process()
+    store = JobStore(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pipeline = None
+    while not stop_event.is_set() and (parent is None or parent.is_alive()):
+        job = store.claim_next(worker)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        if pipeline is None:
+            pipeline = CompressionPipeline(**pipeline_options)
+        run_job(store, job, pipeline)
+
+
+class CompressionWorkerPool:
+    """
+    Worker processes that drain the compression_jobs queue.
+
+    Compression runs for hours and holds the GIL for long stretches, so it never
+    runs in the API process; the API only inserts rows and reads them back.
+    Each worker lives for the whole pool and builds its CompressionPipeline once, so
+    consecutive jobs on the same base model find it resident in the pipeline's
+    model cache instead of ingesting it again.
+    Jobs left running by a previous pool are requeued when a pool starts and resume
+    from their run checkpoints.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, num_workers: Optional[int] = None,
+                 pipeline_options: Optional[Dict[str, Any]] = None, poll_interval: float = 1.0,
+                 start_method: str = "spawn"):
+        self.store = JobStore(db_path)
+        if num_workers is None:
+            num_workers = int(os.getenv(JOB_WORKERS_ENV_VAR, "1"))
+        self.num_workers = max(1, num_workers)
+        self.pipeline_options = pipeline_options or {}
+        self.poll_interval = poll_interval
+        self.context = mp.get_context(start_method)
+        self.stop_event = self.context.Event()
+        self.processes: List[mp.Process] = []
+
+    def start(self):
+        requeued = self.store.requeue_running()
+        if requeued:
+            logger.warning(f"Requeued {requeued} compression jobs interrupted by a previous shutdown")
+        logger.info(f"Starting {self.num_workers} compression worker(s) on {self.store.db_path}")
+        for _ in range(self.num_workers):
+            process = self.context.Process(
+                target=_worker_main,
+                args=(self.store.db_path, self.pipeline_options, self.poll_interval, self.stop_event)
+            )
+            process.start()
+            self.processes.append(process)
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop the workers once their current job finishes, or terminate them after timeout"""
+        self.stop_event.set()
+        deadline = time.time() + timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
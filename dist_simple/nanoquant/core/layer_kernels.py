@@ -0,0 +1,314 @@
+"""
+Per-layer compression kernels for NanoQuant
+Pure functions of one weight matrix, so they can run in worker processes
+"""
+import os
+import torch
+from typing import Dict, Any, Optional, List
+
+from nanoquant.core.quantized_layers import QuantizedLinear, GroupQuantizedLinear, outlier_list, outlier_mask
+from nanoquant.core.quantile_selection import select_quantiles
+from nanoquant.core.low_rank import LowRankLinear, randomized_svd, energy_rank, factorization_saves
+from nanoquant.core.quip import QuipLinear
+from nanoquant.core.aqlm import (
+    AqlmLinear, AQLM_SETTINGS, layer_fingerprint, load_layer_checkpoint, save_layer_checkpoint
+)
+
+
+class QuantileRequests:
+    """
+    Quantile thresholds a kernel may need, with any values already known to the caller.
+
+    The first request for a kind computes every expected quantile of that kind in a
+    single pass; the caller collects ``computed`` to cache them for later levels.
+    ``method`` is passed to select_quantiles.
+    """
+
+    def __init__(self, expected: Optional[Dict[str, List[float]]] = None,
+                 known: Optional[Dict[str, Dict[float, float]]] = None,
+                 method: str = "auto"):
+        self.expected = expected or {}
+        self.known = known or {}
+        self.method = method
+        self.computed: Dict[str, Dict[float, float]] = {}
+
+    def threshold(self, kind: str, score: torch.Tensor, q: float) -> float:
+        q = round(float(q), 6)
+        for values in (self.known.get(kind, {}), self.computed.get(kind, {})):
+            if q in values:
+                return values[q]
+
+        qs = sorted(set(self.expected.get(kind, [])) | {q})
+        values = select_quantiles(score, qs, self.method)
+        self.computed.setdefault(kind, {}).update(zip(qs, values))
+        return self.computed[kind][q]
+
+
+def super_weight_outliers(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                          params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """Indices and fp16 values of the top 0.1% weights by magnitude (super weights)"""
+    abs_weights = torch.abs(weights)
+    threshold = quantiles.threshold("magnitude", abs_weights, 0.999)
+    # Zeros never qualify, even when a pruned matrix puts the threshold at zero
+    return {"outliers": outlier_list(weights, (abs_weights >= threshold) & (abs_weights > 0))}
+
+
+def packed_linear(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                  params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """Quantize a weight matrix into a packed QuantizedLinear"""
+    scheme = params["scheme"]
+    salient_threshold = None
+    if scheme == "ptq1_61":
+        abs_weights = torch.abs(weights.float())
+        # Salient weights are the top salient_ratio of the weights pruning left
+        if abs_weights.count_nonzero() > 0:
+            abs_weights = abs_weights[abs_weights != 0]
+        salient_threshold = quantiles.threshold("magnitude", abs_weights,
+                                                1 - params.get("salient_ratio", 0.2))
+
+    module = QuantizedLinear.from_weight(
+        weights, bias, scheme,
+        group_size=params.get("group_size", 128),
+        salient_threshold=salient_threshold,
+        outliers=params.get("outliers")
+    )
+    return {"module": module}
+
+
+def group_quantized_linear(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                           params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """Quantize a weight matrix into a packed GroupQuantizedLinear at params["bits"]"""
+    module = GroupQuantizedLinear.from_weight(
+        weights, bias, params["bits"],
+        group_size=params.get("group_size", 128),
+        outliers=params.get("outliers")
+    )
+    return {"module": module}
+
+
+def quip_linear(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """QuIP: rotate with randomized Hadamard transforms, then LDLQ-round on the (rotated) Hessian"""
+    module = QuipLinear.from_weight(
+        weights, bias, params.get("bits", 2),
+        group_size=params.get("group_size", 128),
+        hessian=params.get("hessian"),
+        seed=params.get("seed", 0),
+        damp=params.get("damp", 0.01),
+        outliers=params.get("outliers")
+    )
+    return {"module": module}
+
+
+def aqlm_linear(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """
+    AQLM: learn additive codebooks and codes for one layer. With a checkpoint_dir every
+    finished layer is saved under a hash of its inputs, and reloaded instead of relearned
+    """
+    settings = {key: params.get(key, default) for key, default in AQLM_SETTINGS.items()}
+    checkpoint = None
+    if params.get("checkpoint_dir"):
+        fingerprint = layer_fingerprint(weights, bias, settings, params.get("hessian"), params.get("outliers"))
+        checkpoint = os.path.join(params["checkpoint_dir"], f"{fingerprint}.pt")
+        module = load_layer_checkpoint(checkpoint)
+        if module is not None:
+            return {"module": module.to(weights.device), "resumed": True}
+
+    module = AqlmLinear.from_weight(weights, bias, hessian=params.get("hessian"),
+                                    outliers=params.get("outliers"), **settings)
+    if checkpoint is not None:
+        save_layer_checkpoint(module, checkpoint)
+    return {"module": module, "resumed": False}
+
+
+def quantization_sensitivity(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                             params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """Squared reconstruction error of group-wise quantization at every candidate bit width"""
+    W = weights.float()
+    errors = {}
+    for bits in params["bit_options"]:
+        layer = GroupQuantizedLinear.from_weight(W, None, bits, group_size=params.get("group_size", 128),
+                                                 outliers=params.get("outliers"))
+        errors[bits] = ((layer.dequantize().float() - W) ** 2).sum().item()
+    return {"errors": errors, "numel": W.numel()}
+
+
+def magnitude_prune_mask(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                         params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """L1 unstructured: prune the smallest-magnitude weights"""
+    importance = _protect_outliers(torch.abs(weights.float()), params)
+    if params.get("n_m"):
+        return {"prune_mask": _n_m_prune_mask(importance, *params["n_m"])}
+
+    # Exactly round(amount * numel) weights, like torch.nn.utils.prune.l1_unstructured
+    prune_mask = torch.zeros_like(importance, dtype=torch.bool)
+    count = round(params["amount"] * importance.numel())
+    if count > 0:
+        prune_mask.view(-1)[torch.topk(importance.flatten(), count, largest=False).indices] = True
+    return {"prune_mask": prune_mask}
+
+
+def wanda_prune_mask(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                     params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """Wanda: importance = |weight| * activation norm"""
+    activation_norms = params.get("activation_norms")
+    if activation_norms is None:
+        # No calibration data: fall back to a weight-only proxy for activation norms
+        importance = torch.abs(weights) * (weights ** 2).mean().sqrt()
+        if params.get("n_m"):
+            return {"prune_mask": _n_m_prune_mask(_protect_outliers(importance, params), *params["n_m"])}
+        threshold = quantiles.threshold("wanda", importance, params["amount"])
+        return {"prune_mask": _protect_outliers(importance, params) < threshold}
+
+    importance = torch.abs(weights.float()) * activation_norms.to(weights.device).unsqueeze(0)
+    importance = _protect_outliers(importance, params)
+    if params.get("n_m"):
+        return {"prune_mask": _n_m_prune_mask(importance, *params["n_m"])}
+    # Wanda compares weights within each output row, pruning the same share of every row
+    return {"prune_mask": _row_prune_mask(importance, params["amount"])}
+
+
+def sparsegpt_prune_mask(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                         params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """SparseGPT: importance = weight^2 / diagonal Hessian approximation"""
+    hessian = params.get("hessian")
+    if hessian is not None:
+        return _sparsegpt_obs(weights, hessian, params["amount"], params.get("n_m"),
+                              params.get("block_size", 128), params.get("damp", 0.01),
+                              params.get("outliers"))
+
+    # No calibration data: approximate the Hessian diagonal from the weight rows
+    hessian_diag = (weights ** 2).mean(dim=1, keepdim=True) + 1e-6
+
+    # Calculate importance scores
+    importance = (weights ** 2) / hessian_diag
+    if params.get("n_m"):
+        return {"prune_mask": _n_m_prune_mask(_protect_outliers(importance, params), *params["n_m"])}
+
+    # Determine threshold for pruning
+    threshold = quantiles.threshold("sparsegpt", importance, params["amount"])
+    return {"prune_mask": _protect_outliers(importance, params) < threshold}
+
+
+def _protect_outliers(importance: torch.Tensor, params: Dict[str, Any]) -> torch.Tensor:
+    """Importance with super weights raised to +inf, so no selection prunes them"""
+    outliers = params.get("outliers")
+    if outliers is None:
+        return importance
+    return importance.masked_fill(outlier_mask(importance.shape, outliers, importance.device), float("inf"))
+
+
+def _row_prune_mask(importance: torch.Tensor, amount: float) -> torch.Tensor:
+    """Mask of the lowest-importance share `amount` of every row"""
+    prune_mask = torch.zeros_like(importance, dtype=torch.bool)
+    count = int(importance.shape[1] * amount)
+    if count > 0:
+        indices = torch.topk(importance, count, dim=1, largest=False).indices
+        prune_mask.scatter_(1, indices, True)
+    return prune_mask
+
+
+def _n_m_prune_mask(importance: torch.Tensor, n: int, m: int) -> torch.Tensor:
+    """Mask keeping the n most important of every m consecutive weights in a row"""
+    rows, columns = importance.shape
+    if columns % m:
+        raise ValueError(f"{columns} input features are not a multiple of M={m}")
+    groups = importance.reshape(rows, -1, m)
+    prune_mask = torch.zeros_like(groups, dtype=torch.bool)
+    prune_mask.scatter_(-1, torch.topk(groups, m - n, dim=-1, largest=False).indices, True)
+    return prune_mask.reshape(rows, columns)
+
+
+def _sparsegpt_obs(weights: torch.Tensor, hessian: torch.Tensor, amount: float,
+                   n_m: Optional[tuple], block_size: int, damp: float,
+                   outliers: Optional[Dict[str, torch.Tensor]] = None) -> Dict[str, Any]:
+    """
+    SparseGPT's blocked OBS pass: choose the mask one column block at a time from
+    w^2 / [H^-1]_jj^2 and push each pruned weight's error onto the columns not yet
+    visited, using the upper Cholesky factor of the damped inverse Hessian. With an
+    N:M pattern the mask is chosen every M columns from the already updated weights.
+    """
+    W = weights.float().clone()
+    H = hessian.to(W.device).float().clone()
+    columns = W.shape[1]
+    if n_m is not None and (columns % n_m[1] or block_size % n_m[1]):
+        raise ValueError(f"{columns} input features / block size {block_size} are not multiples of M={n_m[1]}")
+
+    # Inputs that never fired carry no information; pin them so H stays invertible
+    dead = torch.diag(H) == 0
+    H[dead, dead] = 1
+    W[:, dead] = 0
+
+    H += damp * torch.mean(torch.diag(H)) * torch.eye(columns, device=W.device)
+    H_inv = torch.linalg.cholesky(torch.cholesky_inverse(torch.linalg.cholesky(H)), upper=True)
+    protected = outlier_mask(W.shape, outliers, W.device) if outliers is not None else None
+
+    prune_mask = torch.zeros_like(W, dtype=torch.bool)
+    for start in range(0, columns, block_size):
+        end = min(start + block_size, columns)
+        W_block = W[:, start:end].clone()
+        H_inv_block = H_inv[start:end, start:end]
+        errors = torch.zeros_like(W_block)
+
+        block_mask = torch.zeros_like(W_block, dtype=torch.bool)
+        if n_m is None:
+            scores = W_block ** 2 / torch.diag(H_inv_block).reshape(1, -1) ** 2
+            if protected is not None:
+                scores = scores.masked_fill(protected[:, start:end], float("inf"))
+            count = int(scores.numel() * amount)
+            if count > 0:
+                block_mask.view(-1)[torch.topk(scores.flatten(), count, largest=False).indices] = True
+
+        for column in range(end - start):
+            if n_m is not None and column % n_m[1] == 0:
+                group = slice(column, column + n_m[1])
+                scores = W_block[:, group] ** 2 / torch.diag(H_inv_block)[group].reshape(1, -1) ** 2
+                if protected is not None:
+                    scores = scores.masked_fill(protected[:, start:end][:, group], float("inf"))
+                block_mask[:, group] = _n_m_prune_mask(scores, *n_m)
+            w = W_block[:, column]
+            d = H_inv_block[column, column]
+            q = w.clone()
+            q[block_mask[:, column]] = 0
+            error = (w - q) / d
+            W_block[:, column:] -= error.unsqueeze(1) @ H_inv_block[column, column:].unsqueeze(0)
+            W_block[:, column] = q
+            errors[:, column] = error
+
+        W[:, start:end] = W_block
+        prune_mask[:, start:end] = block_mask
+        W[:, end:] -= errors @ H_inv[start:end, end:]
+
+    return {"prune_mask": prune_mask, "weight": W.to(weights.dtype)}
+
+
+def low_rank_factors(weights: torch.Tensor, bias: Optional[torch.Tensor],
+                     params: Dict[str, Any], quantiles: QuantileRequests) -> Dict[str, Any]:
+    """
+    Truncated SVD of a weight matrix at rank rank_ratio * min(shape), or the smaller
+    rank holding `energy` of the squared Frobenius norm when an energy target is set
+    """
+    W = weights.float()
+    max_rank = max(1, int(params["rank_ratio"] * min(W.shape)))
+    outliers = params.get("outliers")
+    if outliers is not None:
+        # Super weights are kept exactly beside the factors, so they are not factored
+        W = W.masked_fill(outlier_mask(W.shape, outliers, W.device), 0)
+
+    svd = params.get("svd")
+    computed_svd = None
+    if svd is None or len(svd[1]) < max_rank:
+        svd = computed_svd = randomized_svd(W, max_rank, seed=params.get("seed", 0))
+    U, S, Vh = svd
+    U, S, Vh = U[:, :max_rank], S[:max_rank], Vh[:max_rank]
+
+    rank = max_rank
+    if params.get("energy"):
+        rank = energy_rank(S, (W ** 2).sum().item(), params["energy"])
+
+    result = {"rank": rank, "svd": computed_svd, "module": None}
+    if factorization_saves(W.shape[1], W.shape[0], rank):
+        result["module"] = LowRankLinear.from_svd(U[:, :rank], S[:rank], Vh[:rank], bias, weights.dtype,
+                                                  outliers=outliers)
+    return result
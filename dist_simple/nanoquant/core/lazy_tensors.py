@@ -0,0 +1,165 @@
+"""
+Lazy Tensor Access for NanoQuant
+Memory-maps safetensors shards so tensors are paged in only when something reads them
+"""
+import os
+import json
+import mmap
+import struct
+import torch
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_INDEX = "model.safetensors.index.json"
+SAFETENSORS_SINGLE = "model.safetensors"
+
+# safetensors header dtype codes
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+    "F8_E4M3": getattr(torch, "float8_e4m3fn", None),
+    "F8_E5M2": getattr(torch, "float8_e5m2", None),
+}
+
+
+def has_safetensors(checkpoint_dir: str) -> bool:
+    return any(os.path.exists(os.path.join(checkpoint_dir, name))
+               for name in (SAFETENSORS_INDEX, SAFETENSORS_SINGLE))
+
+
+def load_weight_map(checkpoint_dir: str) -> Dict[str, str]:
+    """Map every tensor name to the shard file that holds it"""
+    index_path = os.path.join(checkpoint_dir, SAFETENSORS_INDEX)
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            return json.load(f)["weight_map"]
+
+    single_path = os.path.join(checkpoint_dir, SAFETENSORS_SINGLE)
+    if os.path.exists(single_path):
+        return {key: SAFETENSORS_SINGLE for key in MappedShard(single_path).entries}
+
+    raise ValueError(f"No safetensors checkpoint found in {checkpoint_dir}")
+
+
+class MappedShard:
+    """
+    One safetensors file mapped into memory.
+
+    Only the JSON header is parsed up front. Tensors are views straight into the
+    mapping, so reading one costs nothing until its pages are touched. The mapping
+    is private copy-on-write: a write into a view never reaches the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            header_size = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_size))
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.metadata = header.pop("__metadata__", None) or {}
+        self.entries = header
+        self.data_offset = 8 + header_size
+
+    def tensor(self, name: str) -> torch.Tensor:
+        entry = self.entries[name]
+        dtype = SAFETENSORS_DTYPES.get(entry["dtype"])
+        if dtype is None:
+            raise ValueError(f"Unsupported safetensors dtype {entry['dtype']} for {name} in {self.path}")
+        start, end = entry["data_offsets"]
+        shape = entry["shape"]
+        if start == end:
+            return torch.empty(shape, dtype=dtype)
+        element_size = torch.empty(0, dtype=dtype).element_size()
+        flat = torch.frombuffer(self.buffer, dtype=dtype, count=(end - start) // element_size,
+                                offset=self.data_offset + start)
+        return flat.view(shape)
+
+
+class LazyStateDict(Mapping):
+    """
+    Read-only state dict over a safetensors checkpoint, keyed by parameter name.
+
+    Shards are mapped the first time one of their tensors is requested and every
+    tensor returned is a zero-copy view, so building a model from this dict is
+    near-instant and compression only pages in the weights it actually reads.
+    """
+
+    def __init__(self, checkpoint_dir: str, weight_map: Optional[Dict[str, str]] = None):
+        self.checkpoint_dir = checkpoint_dir
+        self.weight_map = weight_map if weight_map is not None else load_weight_map(checkpoint_dir)
+        self.shards: Dict[str, MappedShard] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, name: str) -> torch.Tensor:
+        shard = self.weight_map[name]
+        if shard not in self.shards:
+            self.shards[shard] = MappedShard(os.path.join(self.checkpoint_dir, shard))
+        return self.shards[shard].tensor(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.weight_map)
+
+    def __len__(self) -> int:
+        return len(self.weight_map)
+
+    def __contains__(self, name) -> bool:
+        return name in self.weight_map
+
+    def close(self):
+        """
+        Drop the shard mappings. Tensors already handed out keep their mapping
+        alive, so this never invalidates a model built from the dict.
+        """
+        self.shards.clear()
+
+
+def load_lazy_model(checkpoint_dir: str, tensors: Optional[Mapping] = None) -> torch.nn.Module:
+    """
+    Build the checkpoint's architecture with every parameter backed by the mapped shards.
+
+    Parameters are created on the meta device and then assigned the mapped views, so
+    nothing is allocated or copied. Buffers are built normally, since non-persistent
+    ones (rotary frequencies, ...) are not in the checkpoint. Any other mapping of
+    names to tensors (e.g. shards already read into memory) can be passed as tensors.
+    """
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+    tensors = tensors if tensors is not None else LazyStateDict(checkpoint_dir)
+    config = AutoConfig.from_pretrained(checkpoint_dir, trust_remote_code=True)
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, trust_remote_code=True)
+
+    model_keys = set(model.state_dict())
+    state_dict = {name: tensors[name] for name in tensors if name in model_keys}
+    # assign=True keeps the mapped views (and the checkpoint dtype) instead of copying into them
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    # Tied weights (lm_head = embed_tokens) are stored once and re-linked here
+    model.tie_weights()
+
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"Checkpoint in {checkpoint_dir} is missing {len(missing)} parameters, e.g. {missing[0]}")
+    for param in model.parameters():
+        param.requires_grad_(False)
+    if os.path.exists(os.path.join(checkpoint_dir, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(checkpoint_dir)
+    model.eval()
+    return model
+
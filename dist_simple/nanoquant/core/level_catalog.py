@@ -0,0 +1,161 @@
+"""
+Compression Level Catalog for NanoQuant
+The one definition of every compression level, its price and who may use it, shared by the API, CLI and web apps
+"""
+import json
+import hashlib
+from functools import lru_cache
+from typing import Dict, Any, List, Mapping, Tuple
+
+# Compression configs of the built-in levels, applied by UltraNanoQuantGenerator.
+# Updated compression levels that leverage ultra-advanced techniques
+COMPRESSION_LEVELS = {
+    "light": {
+        "description": "50-70% size reduction with maximum quality preservation",
+        "quantization": {"type": "8bit"},
+        "pruning": {"type": "wanda", "ratio": 0.15}  # Reduced pruning for quality preservation
+    },
+    "medium": {
+        "description": "70-85% size reduction with balanced compression/quality",
+        "quantization": {"type": "8bit"},
+        "pruning": {"type": "wanda", "ratio": 0.3}
+    },
+    "heavy": {
+        "description": "85-92% size reduction with significant compression",
+        "quantization": {"type": "4bit"},
+        "pruning": {"type": "sparsegpt", "ratio": 0.5},  # SparseGPT for one-shot pruning
+        "decomposition": {"type": "low_rank", "rank_ratio": 0.6}  # Low-rank decomposition
+    },
+    "extreme": {
+        "description": "92-96% size reduction with maximum compression",
+        "quantization": {"type": "quip"},  # QuIP for 2-bit quantization
+        "pruning": {"type": "sparsegpt", "ratio": 0.7},
+        "decomposition": {"type": "calr", "rank_ratio": 0.4}  # CALR decomposition
+    },
+    "ultra": {
+        "description": "96-98% size reduction using advanced techniques",
+        "quantization": {"type": "aqlm"},  # AQLM for extreme quantization
+        "pruning": {"type": "sparsegpt", "ratio": 0.85},
+        "decomposition": {"type": "calr", "rank_ratio": 0.25},
+        "preserve_super_weights": True  # Preserve super weights as per Apple's research
+    },
+    "nano": {
+        "description": "98-99% size reduction using ultra-advanced techniques",
+        "quantization": {"type": "ptq1_61"},  # PTQ1.61 for sub-2-bit quantization
+        "pruning": {"type": "sparsegpt", "ratio": 0.92},
+        "decomposition": {"type": "calr", "rank_ratio": 0.15},
+        "preserve_super_weights": True  # Preserve super weights as per Apple's research
+    },
+    "atomic": {
+        "description": "Maximum compression using all ultra-advanced techniques",
+        "quantization": {"type": "ultrasketch"},  # UltraSketchLLM for sub-1-bit quantization
+        "pruning": {"type": "sparsegpt", "ratio": 0.95},
+        "decomposition": {"type": "calr", "rank_ratio": 0.1},
+        "preserve_super_weights": True
+    }
+}
+
+# How each level is presented to users: display name, size reduction and summary
+LEVEL_DISPLAY = {
+    "light": ("Light", "50-70%", "50-70% size reduction, quality-critical applications"),
+    "medium": ("Medium", "70-85%", "70-85% size reduction, balanced compression/quality"),
+    "heavy": ("Heavy", "85-92%", "85-92% size reduction, significant size reduction"),
+    "extreme": ("Extreme", "92-96%", "92-96% size reduction, maximum compression"),
+    "ultra": ("Ultra", "96-98%", "96-98% size reduction, extreme compression with advanced techniques"),
+    "nano": ("Nano", "98-99%", "98-99% size reduction, sub-1-bit compression"),
+    "atomic": ("Atomic", "99-99.5%", "99-99.5% size reduction, maximum compression with all ultra-advanced techniques"),
+}
+
+# Credits charged per compression, including custom configs
+LEVEL_COSTS = {
+    "light": 0,
+    "medium": 0,
+    "heavy": 10,
+    "extreme": 25,
+    "ultra": 50,
+    "nano": 100,
+    "atomic": 200,
+    "custom": 75
+}
+
+# Levels the free tier may always use, and its trials of each paid level before credits are required
+FREE_LEVELS = ("light", "medium")
+FREE_TRIALS_PER_LEVEL = 2
+
+
+def level_cost(compression_level: str) -> int:
+    return LEVEL_COSTS.get(compression_level, 0)
+
+
+def _techniques(config: Dict[str, Any]) -> List[str]:
+    techniques = []
+    if "quantization" in config:
+        techniques.append(f"{config['quantization'].get('type', 'N/A')} quantization")
+    if "pruning" in config:
+        techniques.append(f"{config['pruning'].get('type', 'N/A')} pruning ({config['pruning'].get('ratio', 0)*100}%)")
+    if "decomposition" in config:
+        techniques.append(f"{config['decomposition'].get('type', 'N/A')}")
+    return techniques
+
+
+@lru_cache(maxsize=1)
+def level_catalog() -> Dict[str, Any]:
+    """
+    Every level with its display details, cost, techniques and config, built once
+    per process. version is a hash of the contents, so clients and caches can tell
+    catalogs apart. Shared by all callers: treat it as read-only.
+    """
+    levels = {}
+    for level_name, config in COMPRESSION_LEVELS.items():
+        name, size_reduction, description = LEVEL_DISPLAY[level_name]
+        levels[level_name] = {
+            "name": name,
+            "description": description,
+            "size_reduction": size_reduction,
+            "cost": level_cost(level_name),
+            "free": level_name in FREE_LEVELS,
+            "techniques": _techniques(config),
+            "config": config,
+        }
+    version = hashlib.sha256(json.dumps(levels, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return {"version": version, "levels": levels}
+
+
+def can_access(tier: str, credits: int, trials_used: int, compression_level: str) -> bool:
+    """Whether a user of tier with credits and trials_used trials of the level may run it"""
+    cost = level_cost(compression_level)
+
+    # Free tier restrictions
+    if tier == "free" and compression_level not in FREE_LEVELS:
+        # Allow trial usage while free trials are left
+        if trials_used < FREE_TRIALS_PER_LEVEL:
+            return True
+
+    # Otherwise check credits
+    return credits >= cost
+
+
+def access_key(user: Mapping[str, Any]) -> Tuple:
+    """Everything about a user that access depends on; changes to credits, tier or trials change it"""
+    trials = tuple(sorted((user.get("trial_usage") or {}).items()))
+    return user.get("tier", "free"), user.get("credits", 0), trials
+
+
+@lru_cache(maxsize=4096)
+def access_vector(key: Tuple) -> Dict[str, bool]:
+    """Access to every catalog level and to custom configs for an access_key; shared, treat as read-only"""
+    tier, credits, trials = key
+    trials = dict(trials)
+    return {level_name: can_access(tier, credits, trials.get(level_name, 0), level_name)
+            for level_name in list(level_catalog()["levels"]) + ["custom"]}
+
+
+@lru_cache(maxsize=4096)
+def level_listing(key: Tuple) -> Dict[str, Any]:
+    """The public catalog with each level's accessible flag for an access_key"""
+    access = access_vector(key)
+    levels = {level_name: {field: level[field] for field in ("name", "description", "size_reduction", "cost")}
+              for level_name, level in level_catalog()["levels"].items()}
+    for level_name, level in levels.items():
+        level["accessible"] = access[level_name]
+    return {"catalog_version": level_catalog()["version"], "levels": levels}
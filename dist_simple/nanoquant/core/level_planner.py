@@ -0,0 +1,244 @@
+"""
+Level Planner for NanoQuant
+Derives every compression level from one pristine base model, sharing work between levels
+"""
+import copy
+import json
+import torch
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Iterator, Tuple
+import logging
+
+from nanoquant.core.compression_engine import COMPRESSION_STEPS as ENGINE_STEPS, applies_lora
+
+logger = logging.getLogger(__name__)
+
+# Order in which compress_model applies the steps of a level config
+COMPRESSION_STEPS = ENGINE_STEPS + ("lora",)
+
+
+def copy_on_write_snapshot(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Copy the module tree while sharing every weight tensor with the original.
+
+    Each parameter gets a fresh Parameter wrapper over the same storage, so strategies
+    that rebind ``module.weight.data`` or swap modules only affect the snapshot.
+    Strategies must never write into a weight in place.
+    """
+    memo = {}
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        if id(tensor) in memo:
+            continue
+        if isinstance(tensor, torch.nn.Parameter):
+            memo[id(tensor)] = torch.nn.Parameter(tensor.data, requires_grad=tensor.requires_grad)
+        else:
+            memo[id(tensor)] = tensor
+    # Plain tensor attributes, e.g. the masked weight a pruning hook recomputes
+    for module in model.modules():
+        for value in vars(module).values():
+            if isinstance(value, torch.Tensor) and id(value) not in memo:
+                memo[id(value)] = value.detach()
+    return copy.deepcopy(model, memo)
+
+
+def _storage_key(tensor: torch.Tensor) -> Tuple:
+    return (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape), tensor.dtype)
+
+
+class LayerStatisticsCache:
+    """
+    Per-layer statistics (quantile thresholds, SVD factors) computed once on the
+    pristine base weights and reused by every level that sees those weights unchanged.
+
+    Only tensors registered as base weights are cached, so weights a previous step
+    already rewrote are always computed fresh. Large entries are evicted LRU once
+    ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.base_keys = set()
+        self.expected_quantiles: Dict[str, set] = {}
+        self.quantile_cache: Dict[Tuple, Dict[float, float]] = {}
+        self.tensor_cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self.tensor_cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def register_base(self, model: torch.nn.Module):
+        """Remember which weight storages belong to the pristine base model"""
+        for param in model.parameters():
+            self.base_keys.add(_storage_key(param.data))
+
+    def expect_quantile(self, kind: str, q: float):
+        """Declare a quantile some level will ask for, so all are computed in one pass"""
+        self.expected_quantiles.setdefault(kind, set()).add(round(float(q), 6))
+
+    def is_base(self, weights: torch.Tensor) -> bool:
+        return _storage_key(weights) in self.base_keys
+
+    def known_quantiles(self, weights: torch.Tensor) -> Dict[str, Dict[float, float]]:
+        """Every cached quantile of a base weight, keyed by kind"""
+        if not self.is_base(weights):
+            return {}
+        storage = _storage_key(weights)
+        return {kind: dict(values) for (key, kind), values in self.quantile_cache.items()
+                if key == storage}
+
+    def store_quantiles(self, weights: torch.Tensor, computed: Dict[str, Dict[float, float]]):
+        """Record quantiles computed elsewhere (e.g. in a worker process) for a base weight"""
+        if not computed or not self.is_base(weights):
+            return
+        self.misses += len(computed)
+        for kind, values in computed.items():
+            self.quantile_cache.setdefault((_storage_key(weights), kind), {}).update(values)
+
+    def lookup(self, weights: torch.Tensor, kind: str) -> Any:
+        """Cached per-layer result for a base weight, or None"""
+        key = (_storage_key(weights), kind)
+        if key not in self.tensor_cache:
+            return None
+        self.hits += 1
+        self.tensor_cache.move_to_end(key)
+        return self.tensor_cache[key]
+
+    def store(self, weights: torch.Tensor, kind: str, value: Any):
+        """Cache a per-layer result for a base weight, evicting LRU beyond max_bytes"""
+        if not self.is_base(weights):
+            return
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        key = (_storage_key(weights), kind)
+        if key in self.tensor_cache:
+            self.tensor_cache_bytes -= _nbytes(self.tensor_cache.pop(key))
+        self.tensor_cache[key] = value
+        self.tensor_cache_bytes += size
+        while self.tensor_cache_bytes > self.max_bytes:
+            _, evicted = self.tensor_cache.popitem(last=False)
+            self.tensor_cache_bytes -= _nbytes(evicted)
+
+    def memoize(self, weights: torch.Tensor, kind: str, compute: Callable[[], Any]) -> Any:
+        """Cache an expensive per-layer result (e.g. SVD factors) for base weights"""
+        if not self.is_base(weights):
+            return compute()
+
+        value = self.lookup(weights, kind)
+        if value is not None:
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.store(weights, kind, value)
+        return value
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+class _PlanNode:
+    def __init__(self, step: Optional[str] = None, step_config: Any = None):
+        self.step = step
+        self.step_config = step_config
+        self.children: "OrderedDict[str, _PlanNode]" = OrderedDict()
+        self.levels: List[str] = []
+
+
+class LevelPlanner:
+    """
+    Plan the compression levels as a tree of shared step prefixes.
+
+    Levels whose configs start with the same steps (e.g. the super-weight pass of
+    ultra/nano/atomic) compute that prefix once.
+    Every node works on a copy-on-write snapshot of its parent, so the base model is
+    never mutated and one level can no longer leak into the next.
+    """
+
+    def __init__(self, engine, stats: Optional[LayerStatisticsCache] = None):
+        self.engine = engine
+        self.stats = stats or LayerStatisticsCache()
+
+    def plan(self, levels: Dict[str, Dict[str, Any]]) -> _PlanNode:
+        """Build the step tree for a set of level configs"""
+        root = _PlanNode()
+        for level_name, config in levels.items():
+            node = root
+            for step in COMPRESSION_STEPS:
+                if not config.get(step) or (step == "lora" and not applies_lora(config)):
+                    continue
+                step_key = f"{step}:{json.dumps(config[step], sort_keys=True)}"
+                if step_key not in node.children:
+                    node.children[step_key] = _PlanNode(step, config[step])
+                node = node.children[step_key]
+            node.levels.append(level_name)
+            self._declare_statistics(config)
+        return root
+
+    def _declare_statistics(self, config: Dict[str, Any]):
+        """Tell the statistics cache which thresholds the levels will need"""
+        if config.get("preserve_super_weights"):
+            self.stats.expect_quantile("magnitude", 0.999)
+        quantization = config.get("quantization") or {}
+        if quantization.get("type") == "ptq1_61":
+            self.stats.expect_quantile("magnitude", 1 - quantization.get("salient_ratio", 0.2))
+        pruning = config.get("pruning") or {}
+        if pruning.get("type") in ("wanda", "sparsegpt"):
+            self.stats.expect_quantile(pruning["type"], pruning.get("ratio", 0.3))
+
+    def run(self, model: torch.nn.Module, levels: Dict[str, Dict[str, Any]],
+            device: torch.device, target_modules: List[str]) -> Iterator[Tuple[str, torch.nn.Module]]:
+        """
+        Yield (level_name, compressed_model) for every level. Each model is only valid
+        until the next item is requested, so callers should save it immediately.
+        """
+        root = self.plan(levels)
+        executor = getattr(self.engine, "executor", None)
+        if executor is not None and executor.parallel:
+            # Move the base weights to shared memory once, before their storages are
+            # registered, so worker processes map them instead of copying per level
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                tensor.data.share_memory_()
+        self.stats.register_base(model)
+        self.engine.layer_stats = self.stats
+        shared_steps = sum(1 for _ in self._iter_nodes(root)) - 1
+        logger.info(f"Planned {len(levels)} levels over {shared_steps} distinct compression steps")
+        if getattr(self.engine, "progress", None) is not None:
+            self.engine.progress.add_steps(shared_steps)
+
+        try:
+            yield from self._run_node(root, model, {}, device, target_modules)
+        finally:
+            self.engine.layer_stats = None
+            logger.info(f"Layer statistics cache: {self.stats.hits} hits, {self.stats.misses} misses")
+
+    def _run_node(self, node: _PlanNode, model: torch.nn.Module, super_weights: Dict,
+                  device: torch.device, target_modules: List[str]):
+        for level_name in node.levels:
+            yield level_name, model
+
+        for child in node.children.values():
+            snapshot = copy_on_write_snapshot(model)
+            self.engine.super_weights = dict(super_weights)
+
+            logger.info(f"Applying {child.step}: {child.step_config}")
+            if getattr(self.engine, "progress", None) is not None:
+                served = [level_name for descendant in self._iter_nodes(child) for level_name in descendant.levels]
+                self.engine.progress.begin_step("compress", level=",".join(served), step=child.step)
+            if child.step == "lora":
+                snapshot = self.engine._apply_lora_finetuning(snapshot, child.step_config, target_modules)
+            else:
+                snapshot = self.engine.apply_compression_step(snapshot, child.step, child.step_config, device)
+
+            yield from self._run_node(child, snapshot, dict(getattr(self.engine, "super_weights", {})),
+                                      device, target_modules)
+            del snapshot
+
+    def _iter_nodes(self, node: _PlanNode):
+        yield node
+        for child in node.children.values():
+            yield from self._iter_nodes(child)
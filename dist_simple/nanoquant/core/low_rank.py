@@ -0,0 +1,137 @@
+"""
+Low-Rank Factorization for NanoQuant
+Randomized SVD and a factored Linear layer for decomposition strategies
+"""
+import torch
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+from nanoquant.core.quantized_layers import OUTLIER_DTYPE
+
+logger = logging.getLogger(__name__)
+
+
+def randomized_svd(weight: torch.Tensor, rank: int, oversample: int = 10,
+                   power_iters: int = 2, seed: int = 0) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Truncated SVD (U, S, Vh) of the top `rank` singular triplets via a randomized range
+    finder: O(mn(rank + oversample)) instead of O(mn min(m, n)) for the full SVD.
+    Power iterations sharpen the range estimate when the spectrum decays slowly.
+    """
+    A = weight.float()
+    rows, columns = A.shape
+    sketch = min(rank + oversample, rows, columns)
+    if sketch >= min(rows, columns) // 2:
+        # Sketching saves little here, the thin SVD is as cheap and exact
+        U, S, Vh = torch.linalg.svd(A, full_matrices=False)
+        return U[:, :rank], S[:rank], Vh[:rank]
+
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    probe = torch.randn(columns, sketch, generator=generator).to(A.device)
+    Q, _ = torch.linalg.qr(A @ probe)
+    for _ in range(power_iters):
+        Q, _ = torch.linalg.qr(A.t() @ Q)
+        Q, _ = torch.linalg.qr(A @ Q)
+
+    U_small, S, Vh = torch.linalg.svd(Q.t() @ A, full_matrices=False)
+    return (Q @ U_small)[:, :rank], S[:rank], Vh[:rank]
+
+
+def energy_rank(singular_values: torch.Tensor, total_energy: float, energy: float) -> int:
+    """Smallest rank whose singular values hold `energy` of the matrix's squared Frobenius norm"""
+    captured = torch.cumsum(singular_values.double() ** 2, 0) / max(total_energy, 1e-12)
+    return min(int((captured < energy).sum().item()) + 1, len(singular_values))
+
+
+def factorization_saves(in_features: int, out_features: int, rank: int) -> bool:
+    """Whether two rank-r factors are smaller than the dense matrix"""
+    return rank * (in_features + out_features) < in_features * out_features
+
+
+class LowRankLinear(torch.nn.Module):
+    """
+    Linear layer factored as up @ down: x -> down (rank x in) -> up (out x rank).
+
+    Both FLOPs and bytes scale with rank * (in + out) instead of in * out. The factors
+    are plain Linear submodules, so later pruning and quantization steps compress them
+    like any other layer. Super weights, if any, are left out of the factorization and
+    added back exactly from an outlier side-table.
+    """
+
+    def __init__(self, in_features: int, out_features: int, rank: int, bias: bool = True,
+                 num_outliers: int = 0, dtype: torch.dtype = torch.float32):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.rank = rank
+        self.num_outliers = num_outliers
+        self.dtype = dtype
+        self.down = torch.nn.Linear(in_features, rank, bias=False, dtype=dtype)
+        self.up = torch.nn.Linear(rank, out_features, bias=bias, dtype=dtype)
+        for param in self.parameters():
+            param.requires_grad_(False)
+
+        if num_outliers:
+            self.register_buffer("outlier_indices", torch.zeros(num_outliers, dtype=torch.int32))
+            self.register_buffer("outlier_values", torch.zeros(num_outliers, dtype=OUTLIER_DTYPE))
+
+    @classmethod
+    def from_svd(cls, U: torch.Tensor, S: torch.Tensor, Vh: torch.Tensor,
+                 bias: Optional[torch.Tensor], dtype: torch.dtype,
+                 outliers: Optional[Dict[str, torch.Tensor]] = None) -> "LowRankLinear":
+        """Build from truncated SVD factors, splitting the singular values evenly"""
+        root = S.sqrt()
+        layer = cls(Vh.shape[1], U.shape[0], len(S), bias=bias is not None,
+                    num_outliers=len(outliers["indices"]) if outliers is not None else 0,
+                    dtype=dtype).to(U.device)
+        with torch.no_grad():
+            # Contiguous copies: slices of a larger SVD would keep its full storage alive
+            layer.up.weight.data = (U * root.unsqueeze(0)).to(dtype).contiguous()
+            layer.down.weight.data = (root.unsqueeze(1) * Vh).to(dtype).contiguous()
+            if bias is not None:
+                layer.up.bias.data = bias.to(dtype)
+            if layer.num_outliers:
+                layer.outlier_indices.copy_(outliers["indices"])
+                layer.outlier_values.copy_(outliers["values"])
+        return layer
+
+    def to_dense(self) -> torch.Tensor:
+        weight = _dense_weight(self.up).float() @ _dense_weight(self.down).float()
+        if self.num_outliers:
+            weight = weight.flatten().index_add(0, self.outlier_indices.long(),
+                                                self.outlier_values.float()).reshape(weight.shape)
+        return weight.to(self.dtype)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        output = self.up(self.down(x))
+        if self.num_outliers:
+            # Super weights were zeroed before factoring; add their exact contribution back
+            indices = self.outlier_indices.long()
+            rows, columns = indices // self.in_features, indices % self.in_features
+            contributions = x[..., columns] * self.outlier_values.to(x.dtype)
+            output = output.index_add(-1, rows, contributions.to(output.dtype))
+        return output
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": "low_rank",
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "rank": self.rank,
+            "bias": self.up.bias is not None,
+            "num_outliers": self.num_outliers,
+            "dtype": str(self.dtype).replace("torch.", ""),
+        }
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, rank={self.rank}"
+
+
+def _dense_weight(module: torch.nn.Module) -> torch.Tensor:
+    """Weight of a factor, whether still a Linear or already swapped for a packed layer"""
+    if isinstance(module, torch.nn.Linear):
+        return module.weight
+    if hasattr(module, "dequantize"):
+        return module.dequantize()
+    return module.to_dense()
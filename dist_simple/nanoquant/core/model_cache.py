@@ -0,0 +1,101 @@
+"""
+Resident Model Cache for NanoQuant
+Keeps recently ingested base models in memory so back-to-back jobs on the same model skip ingestion
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import torch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variable read when no explicit memory budget is given
+MODEL_CACHE_MAX_BYTES_ENV_VAR = "NANOQUANT_MODEL_CACHE_MAX_BYTES"
+
+# Share of physical memory resident models may use when no budget is configured
+DEFAULT_MEMORY_FRACTION = 0.25
+
+
+def _default_max_bytes() -> int:
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * DEFAULT_MEMORY_FRACTION)
+    except (AttributeError, ValueError, OSError):
+        return 8 * 1024 ** 3
+
+
+def model_bytes(model: torch.nn.Module) -> int:
+    """Memory held by a model's parameters and buffers, counting shared storages once"""
+    seen = set()
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() in seen:
+            continue
+        seen.add(storage.data_ptr())
+        total += storage.nbytes()
+    return total
+
+
+class ModelCache:
+    """
+    LRU of ingested base models, bounded by the memory their weights take.
+
+    Entries are keyed by model ID and revision, so a checkpoint that changed on disk
+    or on the Hub is ingested again. Callers never receive the cached model itself:
+    each checkout is a copy-on-write snapshot sharing the cached weights, since the
+    custom path swaps modules in the model it is given. This relies on the rule that
+    strategies never write into a weight in place.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            configured = os.getenv(MODEL_CACHE_MAX_BYTES_ENV_VAR)
+            max_bytes = int(configured) if configured else _default_max_bytes()
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _checkout(self, artifacts: Dict[str, Any]) -> Dict[str, Any]:
+        from nanoquant.core.level_planner import copy_on_write_snapshot
+        return dict(artifacts, model=copy_on_write_snapshot(artifacts["model"]))
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """A snapshot of the cached artifacts for key, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self._checkout(entry[0])
+
+    def put(self, key: Tuple, artifacts: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keep freshly ingested artifacts, evicting the least recently used models to
+        stay within budget, and return a snapshot for the caller to work on
+        """
+        size = model_bytes(artifacts["model"])
+        if size > self.max_bytes:
+            logger.info(f"Not keeping a {size / 1024 ** 3:.1f} GiB model resident; "
+                        f"the budget is {self.max_bytes / 1024 ** 3:.1f} GiB")
+            return artifacts
+        self.pop(key)
+        while self.entries and self.total_bytes + size > self.max_bytes:
+            evicted, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            logger.info(f"Evicted resident model {evicted[0]} ({evicted_size / 1024 ** 2:.0f} MiB)")
+        self.entries[key] = (dict(artifacts), size)
+        self.total_bytes += size
+        return self._checkout(artifacts)
+
+    def pop(self, key: Tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
@@ -6,11 +6,20 @@ import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from datasets import load_dataset
 import os
-from typing import Dict, Any, Optional
+import json
+import hashlib
+from typing import Dict, Any, Optional, List
 import logging
 
+from nanoquant.core.quantized_layers import QUANTIZATION_MANIFEST, load_packed_model
+from nanoquant.core.lazy_tensors import LazyStateDict, load_lazy_model, has_safetensors
+from nanoquant.core.shard_io import read_state_dict, load_checksums
+
 logger = logging.getLogger(__name__)
 
+# datasets builder used for each local calibration file type
+CALIBRATION_FILE_TYPES = {".txt": "text", ".json": "json", ".jsonl": "json", ".csv": "csv", ".parquet": "parquet"}
+
 class ModelIngestionPipeline:
     def __init__(self):
         self.supported_architectures = {
@@ -62,13 +71,19 @@ class ModelIngestionPipeline:
             "recommended_compression": self._recommend_compression(config)
         }
 
-    def ingest_model(self, model_id: str, cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    def ingest_model(self, model_id: str, cache_dir: Optional[str] = None,
+                     lazy: bool = False) -> Dict[str, Any]:
         """
         Ingest model from Hugging Face Hub with optimal settings
+
+        With lazy=True the safetensors shards are memory-mapped instead of loaded, see
+        _ingest_lazy.
         """
         logger.info(f"Ingesting model: {model_id}")
         # Analyze model first
         model_info = self.analyze_model(model_id)
+        if lazy:
+            return self._ingest_lazy(self.resolve_checkpoint(model_id, cache_dir), model_info)
 
         # Determine optimal dtype based on model size and device
         device = self._get_device()
@@ -111,7 +126,100 @@ class ModelIngestionPipeline:
             "torch_dtype": torch_dtype
         }
 
-    def ingest_local_model(self, model_path: str) -> Dict[str, Any]:
+    def resolve_checkpoint(self, model_id: str, cache_dir: Optional[str] = None) -> str:
+        """
+        Return a local directory holding the model's config and safetensors shards
+        without loading any weights (used by streaming compression)
+        """
+        if os.path.isdir(model_id):
+            return model_id
+
+        logger.info(f"Downloading checkpoint files for: {model_id}")
+        from huggingface_hub import snapshot_download
+        return snapshot_download(
+            model_id,
+            cache_dir=cache_dir,
+            allow_patterns=["*.json", "*.safetensors", "*.model", "*.jinja", "*.txt"]
+        )
+
+    def resolve_revision(self, model_id: str) -> Optional[str]:
+        """
+        Identify the exact weights model_id currently refers to, for cache keys.
+
+        Hub models resolve to their commit sha. Local checkpoints hash their config
+        plus the shard checksums recorded in the index, or else the size and mtime of
+        each weight file. Returns None when the revision cannot be determined.
+        """
+        if os.path.isdir(model_id):
+            digest = hashlib.sha256()
+            config_path = os.path.join(model_id, "config.json")
+            if os.path.exists(config_path):
+                with open(config_path, "rb") as f:
+                    digest.update(f.read())
+            checksums = load_checksums(model_id)
+            if checksums:
+                digest.update(json.dumps(checksums, sort_keys=True).encode("utf-8"))
+            else:
+                weight_files = sorted(name for name in os.listdir(model_id)
+                                      if name.endswith((".safetensors", ".bin")))
+                if not weight_files:
+                    return None
+                for name in weight_files:
+                    stat = os.stat(os.path.join(model_id, name))
+                    digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+            return f"local:{digest.hexdigest()}"
+
+        try:
+            from huggingface_hub import HfApi
+            return HfApi().model_info(model_id).sha
+        except Exception as e:
+            logger.warning(f"Could not resolve the revision of {model_id}: {e}")
+            return None
+
+    def load_calibration_data(self, dataset_path: str, tokenizer,
+                              num_samples: int = 128, seq_len: int = 512,
+                              batch_size: int = 8, text_field: str = "text") -> List[torch.Tensor]:
+        """
+        Tokenize a local calibration corpus into batches of fixed-length token windows.
+
+        dataset_path is a text/json/jsonl/csv/parquet file or a directory of them. The
+        corpus is streamed and stops being read once num_samples windows are filled.
+        """
+        if os.path.isdir(dataset_path):
+            files = sorted(os.path.join(dataset_path, name) for name in os.listdir(dataset_path)
+                           if os.path.splitext(name)[1] in CALIBRATION_FILE_TYPES)
+        else:
+            files = [dataset_path]
+        if not files:
+            raise ValueError(f"No calibration files found in {dataset_path}")
+
+        builder = CALIBRATION_FILE_TYPES.get(os.path.splitext(files[0])[1])
+        if builder is None:
+            raise ValueError(f"Unsupported calibration file type: {files[0]}")
+        logger.info(f"Loading calibration data from {len(files)} file(s): {dataset_path}")
+        dataset = load_dataset(builder, data_files=files, split="train", streaming=True)
+
+        windows = []
+        buffer: List[int] = []
+        for record in dataset:
+            text = record.get(text_field)
+            if not isinstance(text, str) or not text.strip():
+                continue
+            buffer.extend(tokenizer(text, add_special_tokens=False)["input_ids"])
+            while len(buffer) >= seq_len and len(windows) < num_samples:
+                windows.append(buffer[:seq_len])
+                buffer = buffer[seq_len:]
+            if len(windows) >= num_samples:
+                break
+
+        if not windows:
+            raise ValueError(f"Calibration data in {dataset_path} holds fewer than {seq_len} tokens")
+        logger.info(f"Prepared {len(windows)} calibration samples of {seq_len} tokens")
+
+        samples = torch.tensor(windows, dtype=torch.long)
+        return list(torch.split(samples, batch_size))
+
+    def ingest_local_model(self, model_path: str, lazy: bool = False) -> Dict[str, Any]:
         """
         Ingest model from local storage
         """
@@ -119,14 +227,24 @@ class ModelIngestionPipeline:
         
         # Determine optimal dtype based on device
         device = self._get_device()
-        
+        packed = os.path.exists(os.path.join(model_path, QUANTIZATION_MANIFEST))
+        if lazy and not packed:
+            return self._ingest_lazy(model_path, self._local_model_info(model_path))
+
         # Load model
         try:
-            model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                low_cpu_mem_usage=True,
-                trust_remote_code=True
-            )
+            if packed:
+                # Saved NanoQuant with packed low-bit layers
+                model = load_packed_model(model_path)
+            elif has_safetensors(model_path):
+                # Shards are read concurrently instead of one after another
+                model = load_lazy_model(model_path, read_state_dict(model_path))
+            else:
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_path,
+                    low_cpu_mem_usage=True,
+                    trust_remote_code=True
+                )
             logger.info("Local model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load local model: {e}")
@@ -146,8 +264,48 @@ class ModelIngestionPipeline:
         # Move to device
         model.to(device)
 
-        # Create basic model info
-        model_info = {
+        return {
+            "model": model,
+            "tokenizer": tokenizer,
+            "info": self._local_model_info(model_path),
+            "device": device,
+            "torch_dtype": torch.float16 if device.type != "cpu" else torch.float32
+        }
+
+    def _ingest_lazy(self, checkpoint_dir: str, model_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the model over memory-mapped safetensors shards instead of copying them.
+
+        Every parameter is a zero-copy view into its shard, so startup only parses the
+        shard headers, and a compression strategy pages in just the tensors it reads.
+        The model stays on the CPU in the checkpoint dtype, since moving or casting it
+        would copy every tensor. The mapped tensors are also returned as a lazy dict
+        keyed by parameter name under "tensors".
+        """
+        logger.info(f"Memory-mapping checkpoint: {checkpoint_dir}")
+        tensors = LazyStateDict(checkpoint_dir)
+        try:
+            model = load_lazy_model(checkpoint_dir, tensors)
+            tokenizer = AutoTokenizer.from_pretrained(checkpoint_dir, trust_remote_code=True)
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+        except Exception as e:
+            logger.error(f"Failed to map checkpoint: {e}")
+            raise
+        logger.info(f"Mapped {len(tensors)} tensors from {len(set(tensors.weight_map.values()))} shard(s)")
+
+        return {
+            "model": model,
+            "tokenizer": tokenizer,
+            "info": model_info,
+            "device": torch.device("cpu"),
+            "torch_dtype": next(model.parameters()).dtype,
+            "tensors": tensors
+        }
+
+    def _local_model_info(self, model_path: str) -> Dict[str, Any]:
+        """Create basic model info for a local checkpoint"""
+        return {
             "model_id": os.path.basename(model_path),
             "architecture": "unknown",
             "model_family": "generic",
@@ -158,14 +316,6 @@ class ModelIngestionPipeline:
             "recommended_compression": {"compression_level": "medium"}
         }
 
-        return {
-            "model": model,
-            "tokenizer": tokenizer,
-            "info": model_info,
-            "device": device,
-            "torch_dtype": torch.float16 if device.type != "cpu" else torch.float32
-        }
-
     def _identify_model_family(self, config) -> str:
         """Identify model family from config"""
         model_type = getattr(config, 'model_type', 'generic').lower()
@@ -2,111 +2,165 @@
 Multi-Level NanoQuant Generation with Ultra-Advanced Techniques
 """
 import os
+import copy
+import json
 import torch
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import logging
 
+from nanoquant.core.level_catalog import COMPRESSION_LEVELS
+from nanoquant.core.quantized_layers import QUANTIZATION_MANIFEST, quantized_modules_manifest, dequantized_dynamic_state
+from nanoquant.core.sparse_layers import materialize_sparse_layers
+from nanoquant.core.level_planner import copy_on_write_snapshot
+from nanoquant.core.shard_io import save_state_dict
+
 logger = logging.getLogger(__name__)
 
 class UltraNanoQuantGenerator:
     def __init__(self):
-        # Updated compression levels that leverage ultra-advanced techniques
-        self.compression_levels = {
-            "light": {
-                "description": "50-70% size reduction with maximum quality preservation",
-                "quantization": {"type": "8bit"},
-                "pruning": {"type": "wanda", "ratio": 0.15},  # Reduced pruning for quality preservation
-                "lora": {"r": 64, "alpha": 32, "dropout": 0.05}
-            },
-            "medium": {
-                "description": "70-85% size reduction with balanced compression/quality",
-                "quantization": {"type": "8bit"},
-                "pruning": {"type": "wanda", "ratio": 0.3},
-                "lora": {"r": 32, "alpha": 32, "dropout": 0.1}
-            },
-            "heavy": {
-                "description": "85-92% size reduction with significant compression",
-                "quantization": {"type": "4bit"},
-                "pruning": {"type": "sparsegpt", "ratio": 0.5},  # SparseGPT for one-shot pruning
-                "decomposition": {"type": "low_rank", "rank_ratio": 0.6},  # Low-rank decomposition
-                "lora": {"r": 16, "alpha": 16, "dropout": 0.15}
-            },
-            "extreme": {
-                "description": "92-96% size reduction with maximum compression",
-                "quantization": {"type": "quip"},  # QuIP for 2-bit quantization
-                "pruning": {"type": "sparsegpt", "ratio": 0.7},
-                "decomposition": {"type": "calr", "rank_ratio": 0.4},  # CALR decomposition
-                "lora": {"r": 8, "alpha": 8, "dropout": 0.2}
-            },
-            "ultra": {
-                "description": "96-98% size reduction using advanced techniques",
-                "quantization": {"type": "aqlm"},  # AQLM for extreme quantization
-                "pruning": {"type": "sparsegpt", "ratio": 0.85},
-                "decomposition": {"type": "calr", "rank_ratio": 0.25},
-                "preserve_super_weights": True,  # Preserve super weights as per Apple's research
-                "lora": {"r": 4, "alpha": 4, "dropout": 0.25}
-            },
-            "nano": {
-                "description": "98-99% size reduction using ultra-advanced techniques",
-                "quantization": {"type": "ptq1_61"},  # PTQ1.61 for sub-2-bit quantization
-                "pruning": {"type": "sparsegpt", "ratio": 0.92},
-                "decomposition": {"type": "calr", "rank_ratio": 0.15},
-                "preserve_super_weights": True,  # Preserve super weights as per Apple's research
-                "lora": {"r": 2, "alpha": 2, "dropout": 0.3}
-            },
-            "atomic": {
-                "description": "Maximum compression using all ultra-advanced techniques",
-                "quantization": {"type": "ultrasketch"},  # UltraSketchLLM for sub-1-bit quantization
-                "pruning": {"type": "sparsegpt", "ratio": 0.95},
-                "decomposition": {"type": "calr", "rank_ratio": 0.1},
-                "preserve_super_weights": True,
-                "lora": {"r": 1, "alpha": 1, "dropout": 0.35}
-            }
-        }
+        # A copy per generator, so tuning one instance's levels never changes the shared catalog
+        self.compression_levels = copy.deepcopy(COMPRESSION_LEVELS)
 
     def generate_nanoquants(self, model_artifacts: Dict[str, Any],
-                           output_dir: str) -> List[Dict[str, Any]]:
+                           output_dir: str, levels: Optional[List[str]] = None,
+                           progress=None, run_checkpoint=None,
+                           model_name: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Generate multiple NanoQuants at different compression levels including ultra-advanced levels
+
+        levels restricts generation to those level names (all levels by default);
+        model_name prefixes the level directories (the model ID by default);
+        progress is an optional ProgressTracker receiving per-step and per-layer events.
+        With a RunCheckpoint, levels it records as saved are skipped and finished
+        layers of the others are reused, so an interrupted run resumes.
         """
-        generated_models = []
+        generated_models = {}
+        compression_levels = self._select_levels(levels)
+        model_name = model_name or model_artifacts["info"]["model_id"].replace("/", "_")
+        if run_checkpoint is not None:
+            generated_models = {level_name: run_checkpoint.completed_level(level_name)
+                                for level_name in compression_levels}
+            generated_models = {level_name: info for level_name, info in generated_models.items() if info}
+        remaining_levels = {level_name: config for level_name, config in compression_levels.items()
+                            if level_name not in generated_models}
 
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
 
-        # Generate NanoQuant for each compression level
-        for level_name, config in self.compression_levels.items():
-            logger.info(f"Generating {level_name} NanoQuant ({config['description']})...")
+        # Create compression engine
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_planner import LevelPlanner
+        compressor = UltraAdvancedCompressionEngine()
+        compressor.calibration_data = model_artifacts.get("calibration_data")
+        compressor.progress = progress
+        compressor.checkpoint = run_checkpoint.layers if run_checkpoint is not None else None
+        planner = LevelPlanner(compressor)
+        if progress is not None:
+            # One save per level; the planner declares its compression steps
+            progress.add_steps(len(remaining_levels))
+
+        # The engine's layer pool lives for this call only
+        with compressor.executor:
+            # Levels sharing a prefix of steps reuse it, and every level starts from
+            # a copy-on-write snapshot of the untouched base model
+            planned = planner.run(
+                model_artifacts["model"],
+                remaining_levels,
+                model_artifacts["device"],
+                model_artifacts["info"]["target_modules"]
+            )
+            for level_name, model in planned:
+                config = compression_levels[level_name]
+                logger.info(f"Generating {level_name} NanoQuant ({config['description']})...")
+                if progress is not None:
+                    progress.begin_step("save", level=level_name)
+
+                compressed_artifacts = {
+                    "model": model,
+                    "tokenizer": model_artifacts["tokenizer"],
+                    "compression_config": config
+                }
+
+                # Save model
+                level_model_name = f"{model_name}_{level_name}"
+                model_path = os.path.join(output_dir, level_model_name)
+
+                self._save_model(compressed_artifacts, model_path)
+                generated_models[level_name] = self.level_info(level_model_name, level_name, model_path)
+                if run_checkpoint is not None:
+                    run_checkpoint.complete_level(level_name, generated_models[level_name])
+
+                logger.info(f"{level_name} NanoQuant saved to {model_path}")
+
+        # Report levels in their declared order, not the planner's traversal order
+        return [generated_models[level_name] for level_name in compression_levels
+                if level_name in generated_models]
+
+    def generate_streaming_nanoquants(self, checkpoint_dir: str, model_id: str,
+                                      output_dir: str, levels: Optional[List[str]] = None,
+                                      progress=None, run_checkpoint=None,
+                                      model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Generate NanoQuants block by block from a safetensors checkpoint, keeping at
+        most one decoder block in memory at a time. With a RunCheckpoint, saved levels
+        and blocks already written are skipped. model_name is as in generate_nanoquants.
+        """
+        from nanoquant.core.streaming_compression import StreamingCompressor
+        streamer = StreamingCompressor()
+        streamer.engine.progress = progress
+        streamer.engine.checkpoint = run_checkpoint.layers if run_checkpoint is not None else None
+        generated_models = []
+        compression_levels = self._select_levels(levels)
+        model_name = model_name or model_id.replace("/", "_")
 
-            # Create compression engine
-            from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
-            compressor = UltraAdvancedCompressionEngine()
+        os.makedirs(output_dir, exist_ok=True)
+        if progress is not None:
+            progress.add_steps(len(compression_levels) * streamer.count_blocks(checkpoint_dir))
 
-            # Apply compression
-            compressed_artifacts = compressor.compress_model(model_artifacts, config)
+        with streamer.engine.executor:
+            for level_name, config in compression_levels.items():
+                completed = run_checkpoint.completed_level(level_name) if run_checkpoint is not None else None
+                if completed is not None:
+                    logger.info(f"{level_name} NanoQuant already saved to {completed['path']}, skipping")
+                    generated_models.append(completed)
+                    continue
+                logger.info(f"Streaming {level_name} NanoQuant ({config['description']})...")
 
-            # Save model
-            model_name = f"{model_artifacts['info']['model_id'].replace('/', '_')}_{level_name}"
-            model_path = os.path.join(output_dir, model_name)
+                level_model_name = f"{model_name}_{level_name}"
+                model_path = os.path.join(output_dir, level_model_name)
+                streamer.compress_checkpoint(checkpoint_dir, model_path, config, level=level_name,
+                                             run_checkpoint=run_checkpoint)
 
-            self._save_model(compressed_artifacts, model_path)
-            generated_models.append({
-                "name": model_name,
-                "level": level_name,
-                "path": model_path,
-                "description": config["description"],
-                "compression_ratio": self._estimate_compression_ratio(level_name),
-                "config": config
-            })
+                generated_models.append(self.level_info(level_model_name, level_name, model_path))
+                if run_checkpoint is not None:
+                    run_checkpoint.complete_level(level_name, generated_models[-1])
 
-            logger.info(f"{level_name} NanoQuant saved to {model_path}")
+                logger.info(f"{level_name} NanoQuant saved to {model_path}")
 
         return generated_models
 
+    def level_info(self, model_name: str, level_name: str, model_path: str) -> Dict[str, Any]:
+        """Description of one generated level, as returned by the generate_* methods"""
+        config = self.compression_levels[level_name]
+        return {
+            "name": model_name,
+            "level": level_name,
+            "path": model_path,
+            "description": config["description"],
+            "compression_ratio": self._estimate_compression_ratio(level_name),
+            "config": config
+        }
+
+    def _select_levels(self, levels: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+        if levels is None:
+            return self.compression_levels
+        return {name: config for name, config in self.compression_levels.items() if name in levels}
+
     def generate_custom_nanoquant(self, model_artifacts: Dict[str, Any],
                                 output_dir: str,
                                 custom_config: Dict[str, Any],
-                                name: str = "custom") -> Dict[str, Any]:
+                                name: str = "custom",
+                                progress=None, run_checkpoint=None) -> Dict[str, Any]:
         """
         Generate a custom NanoQuant with user-specified compression techniques
         """
@@ -115,13 +169,20 @@ class UltraNanoQuantGenerator:
         # Create compression engine
         from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
         compressor = UltraAdvancedCompressionEngine()
+        compressor.progress = progress
+        compressor.checkpoint = run_checkpoint.layers if run_checkpoint is not None else None
+        if progress is not None:
+            progress.add_steps(1)
 
         # Apply compression
-        compressed_artifacts = compressor.compress_model(model_artifacts, custom_config)
+        with compressor.executor:
+            compressed_artifacts = compressor.compress_model(model_artifacts, custom_config)
 
         # Save model
         model_name = f"{model_artifacts['info']['model_id'].replace('/', '_')}_{name}"
         model_path = os.path.join(output_dir, model_name)
+        if progress is not None:
+            progress.begin_step("save", level=name)
 
         self._save_model(compressed_artifacts, model_path)
 
@@ -143,10 +204,12 @@ class UltraNanoQuantGenerator:
             # For PEFT models, we need to merge and unload
             if hasattr(model, 'merge_and_unload'):
                 logger.info("Merging LoRA weights before saving...")
-                merged_model = model.merge_and_unload()
-                merged_model.save_pretrained(path)
-            else:
-                model.save_pretrained(path)
+                # safe_merge writes into new tensors, leaving weights shared with the base model intact
+                model = model.merge_and_unload(safe_merge=True)
+            # Pruned layers are stored in compact sparse layouts; the snapshot keeps the
+            # planner's copy dense for levels derived from it
+            model = materialize_sparse_layers(copy_on_write_snapshot(model))
+            self._save_pretrained(model, path)
             logger.info(f"Model saved successfully to {path}")
         except Exception as e:
             logger.error(f"Error saving model: {e}")
@@ -157,6 +220,13 @@ class UltraNanoQuantGenerator:
             except Exception as e2:
                 logger.error(f"Fallback model save also failed: {e2}")
 
+        # Packed layers are stored as bit planes and scales; record how to rebuild them
+        manifest = quantized_modules_manifest(model)
+        if manifest:
+            with open(os.path.join(path, QUANTIZATION_MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2)
+            logger.info(f"Saved packed weights for {len(manifest)} quantized or sparse layers")
+
         # Save tokenizer
         try:
             tokenizer.save_pretrained(path)
@@ -164,6 +234,18 @@ class UltraNanoQuantGenerator:
         except Exception as e:
             logger.error(f"Error saving tokenizer: {e}")
 
+    def _save_pretrained(self, model: torch.nn.Module, path: str):
+        """
+        save_pretrained with the weight shards written concurrently and checksummed
+        (see shard_io.save_state_dict); configs are saved as transformers would.
+        Dynamically quantized (8-bit) Linear layers are saved as dequantized weights,
+        as streamed levels are, so the output reloads like any checkpoint
+        """
+        save_state_dict(dequantized_dynamic_state(model, model.state_dict()), path)
+        model.config.save_pretrained(path)
+        if getattr(model, "generation_config", None) is not None:
+            model.generation_config.save_pretrained(path)
+
     def _estimate_compression_ratio(self, level_name: str) -> float:
         """
         Estimate compression ratio for a given level
@@ -0,0 +1,101 @@
+"""
+Parallel Layer Executor for NanoQuant
+Runs per-layer compression kernels across a pool of worker processes
+"""
+import os
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variable read when no explicit worker count is given
+WORKERS_ENV_VAR = "NANOQUANT_COMPRESSION_WORKERS"
+
+
+def _init_worker(threads_per_worker: int, sharing_strategy: Optional[str]):
+    """Keep each worker's intra-op threads within its share of the cores"""
+    torch.set_num_threads(threads_per_worker)
+    if sharing_strategy:
+        mp.set_sharing_strategy(sharing_strategy)
+
+
+def _run_job(job) -> Dict[str, Any]:
+    kernel, weights, bias, params, quantiles = job
+    try:
+        with torch.no_grad():
+            result = kernel(weights, bias, params, quantiles)
+    except Exception as e:
+        return {"error": str(e), "quantiles": quantiles.computed}
+    result["quantiles"] = quantiles.computed
+    return result
+
+
+class ParallelLayerExecutor:
+    """
+    Map a layer kernel over many weight matrices.
+
+    With more than one worker the jobs go to a process pool; tensors travel through
+    torch.multiprocessing's shared-memory reductions, so weights and results are not
+    copied through pipes. Results always come back in job order, so the outcome does
+    not depend on scheduling. Kernel errors are returned per layer as {"error": ...}.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None, start_method: str = "spawn",
+                 threads_per_worker: Optional[int] = None, sharing_strategy: Optional[str] = None):
+        if num_workers is None:
+            num_workers = int(os.getenv(WORKERS_ENV_VAR, "1"))
+        self.num_workers = max(1, num_workers)
+        self.start_method = start_method
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.sharing_strategy = sharing_strategy
+        self._pool = None
+
+    @property
+    def parallel(self) -> bool:
+        return self.num_workers > 1
+
+    def map(self, kernel: Callable, jobs: List[tuple],
+            on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Run kernel(weights, bias, params, quantiles) for every job, preserving order.
+        on_result(index, result) is called as each result arrives, in job order.
+        """
+        jobs = [(kernel,) + tuple(job) for job in jobs]
+        if not self.parallel or len(jobs) <= 1:
+            return self._collect(map(_run_job, jobs), on_result)
+
+        if self._pool is None:
+            logger.info(f"Starting compression pool with {self.num_workers} workers "
+                        f"({self.threads_per_worker} threads each)")
+            if self.sharing_strategy:
+                mp.set_sharing_strategy(self.sharing_strategy)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=mp.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.threads_per_worker, self.sharing_strategy)
+            )
+        return self._collect(self._pool.map(_run_job, jobs), on_result)
+
+    def _collect(self, results, on_result) -> List[Dict[str, Any]]:
+        collected = []
+        for index, result in enumerate(results):
+            if on_result is not None:
+                on_result(index, result)
+            collected.append(result)
+        return collected
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
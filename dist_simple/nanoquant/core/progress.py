@@ -0,0 +1,186 @@
+"""
+Progress Events for NanoQuant
+Structured per-stage and per-layer progress of a compression run, and their server-sent event encoding
+"""
+import json
+import time
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Event types
+STAGE, LAYER, DONE, ERROR = "stage", "layer", "done", "error"
+
+# Event types that are always delivered; layer events may be throttled
+MILESTONES = (STAGE, DONE, ERROR)
+
+
+class ProgressTracker:
+    """
+    Event bus for one compression run.
+
+    The run is measured in steps: every compression step the planner applies, every
+    saved level and every streamed block is one step, declared up front through
+    add_steps. Layer events move the run through the current step, so progress is
+    (finished steps + fraction of the current step's layers) / declared steps, and
+    the ETA extrapolates the elapsed time from it. Subscribers receive every event
+    as a plain dict; layer events are dropped when they arrive less than
+    min_interval seconds after the last delivered one.
+    """
+
+    def __init__(self, subscribers: Optional[List[Callable[[Dict[str, Any]], None]]] = None,
+                 min_interval: float = 0.0):
+        self.subscribers = list(subscribers or [])
+        self.min_interval = min_interval
+        self.total_steps = 0
+        self.steps_done = 0
+        self.step_fraction = 0.0
+        self.bytes_done = 0
+        self.progress = 0.0
+        self.context: Dict[str, Any] = {"stage": None, "level": None, "step": None}
+        self.started = time.monotonic()
+        self._last_delivery = 0.0
+        self._in_step = False
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        self.subscribers.append(callback)
+
+    def add_steps(self, steps: int):
+        """Declare more work; call before the declared steps start"""
+        self.total_steps += steps
+
+    def stage(self, stage: str, message: Optional[str] = None, **context):
+        """
+        Enter a pipeline stage (ingest, compress, save, package, ...) without starting
+        a step; context (level, step, block, ...) is attached to every later event
+        """
+        self.context = {"stage": stage, "level": None, "step": None, **context}
+        self._emit(STAGE, message=message)
+
+    def substage(self, step: str, message: Optional[str] = None):
+        """Relabel the current step, e.g. quantization inside a streamed block, without advancing"""
+        self.context = dict(self.context, step=step)
+        self._emit(STAGE, message=message)
+
+    def begin_step(self, stage: str, message: Optional[str] = None, **context):
+        """Start the next declared step, finishing the previous one"""
+        self._finish_step()
+        self._in_step = True
+        self.stage(stage, message, **context)
+
+    def layer_done(self, index: int, num_layers: int, num_bytes: int, module: Optional[str] = None,
+                   completed: Optional[int] = None):
+        """
+        Report that layer index of num_layers in the current step was processed;
+        completed counts the step's finished layers when they finish out of order
+        """
+        self.bytes_done += num_bytes
+        if self._in_step:
+            finished = completed if completed is not None else index + 1
+            self.step_fraction = max(self.step_fraction, finished / max(1, num_layers))
+        self._emit(LAYER, layer=index, num_layers=num_layers, module=module)
+
+    def finish(self, message: Optional[str] = None):
+        self._finish_step()
+        self.progress = 1.0
+        self.context = {"stage": "done", "level": None, "step": None}
+        self._emit(DONE, message=message)
+
+    def fail(self, error: str):
+        self.context = dict(self.context, stage="failed")
+        self._emit(ERROR, message=error)
+
+    def _finish_step(self):
+        if self._in_step:
+            self.steps_done += 1
+            self.step_fraction = 0.0
+            self._in_step = False
+
+    def _update_progress(self):
+        if self.total_steps:
+            done = min(self.total_steps, self.steps_done + self.step_fraction)
+            # Never move backwards, even if a step re-runs its layers
+            self.progress = max(self.progress, min(1.0, done / self.total_steps))
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.progress <= 0 or self.progress >= 1:
+            return 0.0 if self.progress >= 1 else None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1 - self.progress) / self.progress
+
+    def _emit(self, event_type: str, message: Optional[str] = None, **fields):
+        self._update_progress()
+        now = time.monotonic()
+        if event_type not in MILESTONES and now - self._last_delivery < self.min_interval:
+            return
+        self._last_delivery = now
+
+        event = {
+            "event": event_type,
+            **self.context,
+            **fields,
+            "bytes_done": self.bytes_done,
+            "progress": round(self.progress, 4),
+            "eta_seconds": self.eta_seconds(),
+            "elapsed_seconds": round(now - self.started, 3),
+            "time": time.time(),
+        }
+        if message is not None:
+            event["message"] = message
+        for callback in self.subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                # A broken subscriber must never abort the compression run
+                logger.warning(f"Progress subscriber failed: {e}")
+
+
+def format_sse(data: Dict[str, Any], event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Encode one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def read_sse(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Decode server-sent events from an iterable of text lines, such as
+    requests' Response.iter_lines(decode_unicode=True), as (event, data) pairs
+    """
+    event, data = None, []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith(":"):
+            # Keep-alive comment
+            continue
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+    if data:
+        yield event, json.loads("\n".join(data))
+
+
+def describe(event: Dict[str, Any]) -> str:
+    """One-line, human-readable summary of an event for progress displays"""
+    parts = [event.get("message") or (event.get("stage") or "").replace("_", " ").capitalize()]
+    if event.get("level"):
+        parts.append(f"[{event['level']}]")
+    if event.get("num_blocks"):
+        parts.append(f"block {event['block'] + 1}/{event['num_blocks']}")
+    if event.get("step"):
+        parts.append(str(event["step"]))
+    if event.get("num_layers"):
+        parts.append(f"layer {event['layer'] + 1}/{event['num_layers']}")
+    if event.get("eta_seconds"):
+        minutes, seconds = divmod(int(event["eta_seconds"]), 60)
+        parts.append(f"ETA {minutes}m{seconds:02d}s")
+    return " ".join(part for part in parts if part)
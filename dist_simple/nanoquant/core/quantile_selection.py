@@ -0,0 +1,179 @@
+"""
+Threshold Selection for NanoQuant
+Quantiles of large weight/score tensors without sorting them
+"""
+import torch
+from typing import List, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "auto" selects exactly up to this many elements and falls back to histograms above
+EXACT_SELECTION_LIMIT = 1 << 26
+
+# Elements processed at a time by the histogram passes
+HISTOGRAM_CHUNK_SIZE = 1 << 22
+
+
+def select_quantiles(values: torch.Tensor, qs: Sequence[float], method: str = "auto",
+                     **kwargs) -> List[float]:
+    """
+    Quantiles qs of a tensor (flattened), interpolated like torch.quantile.
+
+    method is "exact" (kthvalue/topk selection), "histogram" (chunked, bounded error),
+    "sample" (random-sample estimate) or "auto", which is exact up to
+    EXACT_SELECTION_LIMIT elements and histogram-based above.
+    """
+    flat = values.detach().reshape(-1)
+    if not flat.is_floating_point():
+        flat = flat.float()
+    elif torch.isnan(flat).any():
+        flat = flat[~torch.isnan(flat)]
+    if flat.numel() == 0:
+        raise ValueError("Cannot select quantiles of an empty tensor")
+    for q in qs:
+        if not 0.0 <= q <= 1.0:
+            raise ValueError(f"Quantile {q} is outside [0, 1]")
+
+    if method == "auto":
+        method = "exact" if flat.numel() <= EXACT_SELECTION_LIMIT else "histogram"
+    if method == "exact":
+        return exact_quantiles(flat, qs)
+    if method == "histogram":
+        return histogram_quantiles(flat, qs, **kwargs)
+    if method == "sample":
+        return sampled_quantiles(flat, qs, **kwargs)
+    raise ValueError(f"Unknown quantile method: {method}")
+
+
+def select_quantile(values: torch.Tensor, q: float, method: str = "auto", **kwargs) -> float:
+    """Single quantile q of a tensor, see select_quantiles"""
+    return select_quantiles(values, [q], method, **kwargs)[0]
+
+
+def _ranks(n: int, q: float) -> Tuple[int, int, float]:
+    """0-based ranks bracketing quantile q and the interpolation weight between them"""
+    position = q * (n - 1)
+    lower = int(position)
+    upper = min(lower + 1, n - 1)
+    return lower, upper, position - lower
+
+
+def _order_statistics(flat: torch.Tensor, rank: int) -> Tuple[float, float]:
+    """Values at 0-based ranks rank and rank + 1, using topk when they sit in a short tail"""
+    n = flat.numel()
+    upper_rank = min(rank + 1, n - 1)
+    if upper_rank < n // 64:
+        values = torch.topk(flat, upper_rank + 1, largest=False, sorted=True).values
+        return values[rank].item(), values[upper_rank].item()
+    if n - rank <= n // 64:
+        values = torch.topk(flat, n - rank, largest=True, sorted=True).values
+        return values[-1].item(), values[max(len(values) - 2, 0)].item()
+
+    value = torch.kthvalue(flat, rank + 1).values
+    if upper_rank == rank or (flat <= value).sum().item() > upper_rank:
+        return value.item(), value.item()
+    return value.item(), flat[flat > value].min().item()
+
+
+def exact_quantiles(flat: torch.Tensor, qs: Sequence[float]) -> List[float]:
+    """
+    Exact quantiles by selection: O(n) kthvalue per quantile, or topk for tail
+    quantiles such as the 99.9th percentile. No 16M-element limit and no full sort.
+    """
+    flat = flat.reshape(-1)
+    n = flat.numel()
+    cache = {}
+
+    results = []
+    for q in qs:
+        lower, _, weight = _ranks(n, q)
+        if lower not in cache:
+            cache[lower] = _order_statistics(flat, lower)
+        low_value, high_value = cache[lower]
+        results.append(low_value + (high_value - low_value) * weight if weight > 0 else low_value)
+    return results
+
+
+def _chunks(flat: torch.Tensor, chunk_size: int):
+    for start in range(0, flat.numel(), chunk_size):
+        yield flat[start:start + chunk_size].float()
+
+
+def _bin_counts(flat: torch.Tensor, low: float, high: float, bins: int,
+                chunk_size: int) -> Tuple[torch.Tensor, int]:
+    """Counts of elements in [low, high) split into equal-width bins, plus the count below low"""
+    counts = torch.zeros(bins, dtype=torch.int64, device=flat.device)
+    below = 0
+    width = (high - low) / bins
+    for chunk in _chunks(flat, chunk_size):
+        below += int((chunk < low).sum().item())
+        inside = chunk[(chunk >= low) & (chunk < high)]
+        index = ((inside - low) / width).long().clamp_(0, bins - 1)
+        counts += torch.bincount(index, minlength=bins)
+    return counts, below
+
+
+def histogram_quantiles(flat: torch.Tensor, qs: Sequence[float], bins: int = 4096,
+                        passes: int = 2, chunk_size: int = HISTOGRAM_CHUNK_SIZE) -> List[float]:
+    """
+    Approximate quantiles from chunked histograms, never holding more than one chunk
+    in float32. The first pass is shared by all qs; every further pass zooms into the
+    bin holding a target rank, so the order statistics bracketing each quantile are
+    located to within (max - min) / bins ** passes.
+    """
+    flat = flat.reshape(-1)
+    n = flat.numel()
+    low, high = float("inf"), float("-inf")
+    for chunk in _chunks(flat, chunk_size):
+        low, high = min(low, chunk.min().item()), max(high, chunk.max().item())
+    if low == high:
+        return [low] * len(qs)
+
+    # The bins are half-open, so nudge the upper edge past the maximum
+    top = torch.nextafter(torch.tensor(high, dtype=torch.float64),
+                          torch.tensor(float("inf"), dtype=torch.float64)).item()
+    first_pass = _bin_counts(flat, low, top, bins, chunk_size)
+    located = {}
+
+    def locate(rank: int) -> float:
+        """Midpoint of the narrowest bin found to hold the order statistic at rank"""
+        if rank in located:
+            return located[rank]
+        bin_low, bin_high = low, top
+        for step in range(passes):
+            counts, below = first_pass if step == 0 else _bin_counts(flat, bin_low, bin_high, bins, chunk_size)
+            cumulative = torch.cumsum(counts, 0)
+            index = min(int((cumulative <= rank - below).sum().item()), bins - 1)
+            width = (bin_high - bin_low) / bins
+            bin_low, bin_high = bin_low + index * width, bin_low + (index + 1) * width
+        located[rank] = min(max((bin_low + bin_high) / 2, low), high)
+        return located[rank]
+
+    results = []
+    for q in qs:
+        lower, upper, weight = _ranks(n, q)
+        if lower == 0 and weight == 0:
+            results.append(low)
+        elif lower == n - 1:
+            results.append(high)
+        else:
+            value = locate(lower)
+            if weight > 0:
+                value += (locate(upper) - value) * weight
+            results.append(value)
+    return results
+
+
+def sampled_quantiles(flat: torch.Tensor, qs: Sequence[float], num_samples: int = 1 << 20,
+                      seed: int = 0) -> List[float]:
+    """
+    Quantile estimates from a fixed-seed uniform sample: O(num_samples) work with
+    a rank error of roughly 1 / sqrt(num_samples)
+    """
+    flat = flat.reshape(-1)
+    if flat.numel() <= num_samples:
+        return exact_quantiles(flat, qs)
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    index = torch.randint(flat.numel(), (num_samples,), generator=generator).to(flat.device)
+    return exact_quantiles(flat[index].float(), qs)
@@ -0,0 +1,584 @@
+"""
+Packed low-bit Linear layers for NanoQuant
+Stores OneBit, PTQ1.61 and UltraSketch weights as bit planes plus per-group scales,
+and 2/4/8-bit group-wise integer weights with per-group scales and zero-points
+"""
+import torch
+import torch.nn.functional as F
+from typing import Dict, Any, Optional, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# File written next to the saved weights describing every packed module
+QUANTIZATION_MANIFEST = "nanoquant_quantization.json"
+
+PACKED_SCHEMES = ("onebit", "ptq1_61", "ultrasketch")
+
+# Super weights are kept beside packed weights as flat int32 indices plus values in this dtype
+OUTLIER_DTYPE = torch.float16
+
+
+def outlier_list(weight: torch.Tensor, mask: torch.Tensor) -> Dict[str, torch.Tensor]:
+    """Compact side-table of the masked entries of a weight matrix"""
+    indices = mask.flatten().nonzero().squeeze(1)
+    return {"indices": indices.to(torch.int32), "values": weight.flatten()[indices].to(OUTLIER_DTYPE)}
+
+
+def outlier_mask(shape: torch.Size, outliers: Dict[str, torch.Tensor],
+                 device: Optional[torch.device] = None) -> torch.Tensor:
+    """Boolean mask of the entries listed in an outlier side-table"""
+    mask = torch.zeros(shape, dtype=torch.bool, device=device)
+    mask.view(-1)[outliers["indices"].to(mask.device).long()] = True
+    return mask
+
+
+def apply_outliers(weight: torch.Tensor, outliers: Dict[str, torch.Tensor]) -> torch.Tensor:
+    """A copy of weight with the side-table values written back at their indices"""
+    indices = outliers["indices"].to(weight.device).long()
+    values = outliers["values"].to(device=weight.device, dtype=weight.dtype)
+    return weight.flatten().scatter(0, indices, values).reshape(weight.shape)
+
+
+def pack_keep_plane(weight: torch.Tensor) -> Optional[torch.Tensor]:
+    """
+    Bit plane of the surviving entries of a pruned weight matrix, or None when too few
+    entries are zero for the matrix to count as pruned
+    """
+    from nanoquant.core.sparse_layers import MIN_SPARSITY
+    kept = weight != 0
+    if 1 - kept.float().mean().item() < MIN_SPARSITY:
+        return None
+    return pack_bits(F.pad(kept, (0, (-weight.shape[1]) % 8)))
+
+
+def apply_keep_plane(weight: torch.Tensor, keep_plane: torch.Tensor) -> torch.Tensor:
+    """A copy of weight with the entries pruned before quantization zeroed again"""
+    kept = unpack_bits(keep_plane)[:, :weight.shape[1]]
+    return weight.masked_fill(~kept, 0)
+
+
+def pack_bits(bits: torch.Tensor) -> torch.Tensor:
+    """Pack a boolean tensor whose last dimension is a multiple of 8 into uint8 bytes"""
+    shifts = torch.arange(8, dtype=torch.uint8, device=bits.device)
+    grouped = bits.to(torch.uint8).reshape(*bits.shape[:-1], -1, 8)
+    return (grouped << shifts).sum(dim=-1, dtype=torch.uint8)
+
+
+def unpack_bits(packed: torch.Tensor) -> torch.Tensor:
+    """Inverse of pack_bits, returns a boolean tensor with 8x the last dimension"""
+    shifts = torch.arange(8, dtype=torch.uint8, device=packed.device)
+    bits = (packed.unsqueeze(-1) >> shifts) & 1
+    return bits.reshape(*packed.shape[:-1], -1).bool()
+
+
+def pack_2bit(codes: torch.Tensor) -> torch.Tensor:
+    """Pack a flat tensor of 2-bit codes (values 0-3) four to a byte"""
+    codes = codes.flatten().to(torch.uint8)
+    padding = (-codes.numel()) % 4
+    if padding:
+        codes = torch.cat([codes, codes.new_zeros(padding)])
+    shifts = torch.arange(0, 8, 2, dtype=torch.uint8, device=codes.device)
+    return (codes.reshape(-1, 4) << shifts).sum(dim=-1, dtype=torch.uint8)
+
+
+def unpack_2bit(packed: torch.Tensor, numel: int) -> torch.Tensor:
+    """Inverse of pack_2bit, returns the first numel codes"""
+    shifts = torch.arange(0, 8, 2, dtype=torch.uint8, device=packed.device)
+    codes = (packed.unsqueeze(-1) >> shifts) & 3
+    return codes.flatten()[:numel]
+
+
+def _round_up(value: int, multiple: int) -> int:
+    return ((value + multiple - 1) // multiple) * multiple
+
+
+class QuantizedLinear(torch.nn.Module):
+    """
+    Linear layer holding bit-packed weights that are unpacked on every forward pass.
+
+    Every scheme stores a binary plane with two reconstruction levels per group of
+    ``group_size`` input features. PTQ1.61 additionally keeps a salient-weight plane
+    and 2-bit magnitude codes for the salient subset. Super weights, if any, are left
+    out of the group statistics and stored exactly in an outlier side-table. Pruned
+    weights are left out too, and a keep plane zeroes them again after unpacking.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True,
+                 scheme: str = "onebit", group_size: int = 128, num_salient: int = 0,
+                 num_outliers: int = 0, pruned: bool = False, scale_dtype: torch.dtype = torch.float16):
+        super().__init__()
+        if scheme not in PACKED_SCHEMES:
+            raise ValueError(f"Unknown packed quantization scheme: {scheme}")
+
+        self.in_features = in_features
+        self.out_features = out_features
+        self.scheme = scheme
+        self.group_size = min(group_size, _round_up(in_features, 8))
+        self.padded_in_features = _round_up(in_features, self.group_size)
+        self.num_groups = self.padded_in_features // self.group_size
+        self.num_salient = num_salient
+        self.num_outliers = num_outliers
+        self.pruned = pruned
+
+        self.register_buffer(
+            "binary_plane",
+            torch.zeros(out_features, self.padded_in_features // 8, dtype=torch.uint8)
+        )
+        # [..., 0] is the level for set bits, [..., 1] the level for cleared bits
+        self.register_buffer(
+            "group_levels",
+            torch.zeros(out_features, self.num_groups, 2, dtype=scale_dtype)
+        )
+
+        if scheme == "ptq1_61":
+            self.register_buffer(
+                "salient_plane",
+                torch.zeros(out_features, self.padded_in_features // 8, dtype=torch.uint8)
+            )
+            self.register_buffer(
+                "salient_codes",
+                torch.zeros((num_salient + 3) // 4, dtype=torch.uint8)
+            )
+            # Per-row (lower bound, step) for the salient magnitude codes
+            self.register_buffer(
+                "salient_scales",
+                torch.zeros(out_features, 2, dtype=scale_dtype)
+            )
+
+        if num_outliers:
+            self.register_buffer("outlier_indices", torch.zeros(num_outliers, dtype=torch.int32))
+            self.register_buffer("outlier_values", torch.zeros(num_outliers, dtype=OUTLIER_DTYPE))
+
+        if pruned:
+            self.register_buffer("keep_plane", torch.zeros(out_features, _round_up(in_features, 8) // 8,
+                                                           dtype=torch.uint8))
+
+        if bias:
+            self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=scale_dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    @classmethod
+    def from_linear(cls, linear: torch.nn.Linear, scheme: str, group_size: int = 128,
+                    salient_threshold: Optional[float] = None,
+                    scale_dtype: torch.dtype = torch.float16) -> "QuantizedLinear":
+        """Quantize and pack the weights of an existing Linear layer"""
+        return cls.from_weight(linear.weight.data, linear.bias.data if linear.bias is not None else None,
+                               scheme, group_size, salient_threshold, scale_dtype)
+
+    @classmethod
+    def from_weight(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], scheme: str,
+                    group_size: int = 128, salient_threshold: Optional[float] = None,
+                    scale_dtype: torch.dtype = torch.float16,
+                    outliers: Optional[Dict[str, torch.Tensor]] = None) -> "QuantizedLinear":
+        """Quantize and pack a [out_features, in_features] weight matrix"""
+        weights = weight.float()
+        out_features, in_features = weights.shape
+        excluded = outlier_mask(weights.shape, outliers, weights.device) if outliers is not None else None
+        keep_plane = pack_keep_plane(weights)
+        if keep_plane is not None:
+            # Pruned weights stay zero and must not skew the levels either
+            pruned_mask = weights == 0
+            excluded = pruned_mask if excluded is None else excluded | pruned_mask
+
+        salient_mask = None
+        if scheme == "ptq1_61":
+            if salient_threshold is None:
+                raise ValueError("PTQ1.61 packing requires a salient threshold")
+            salient_mask = weights.abs() >= salient_threshold
+            if excluded is not None:
+                salient_mask &= ~excluded
+                excluded |= salient_mask
+            else:
+                excluded = salient_mask
+
+        layer = cls(
+            in_features, out_features,
+            bias=bias is not None,
+            scheme=scheme,
+            group_size=group_size,
+            num_salient=int(salient_mask.sum().item()) if salient_mask is not None else 0,
+            num_outliers=len(outliers["indices"]) if outliers is not None else 0,
+            pruned=keep_plane is not None,
+            scale_dtype=scale_dtype
+        ).to(weights.device)
+
+        with torch.no_grad():
+            layer._pack_binary(weights, excluded)
+            if salient_mask is not None:
+                layer._pack_salient(weights, salient_mask, salient_threshold)
+            if layer.num_outliers:
+                layer.outlier_indices.copy_(outliers["indices"])
+                layer.outlier_values.copy_(outliers["values"])
+            if layer.pruned:
+                layer.keep_plane.copy_(keep_plane)
+            if bias is not None:
+                layer.bias.data = bias.to(scale_dtype)
+
+        return layer
+
+    def _grouped(self, tensor: torch.Tensor, fill=0) -> torch.Tensor:
+        """Pad the input dimension and reshape to [out, groups, group_size]"""
+        padding = self.padded_in_features - self.in_features
+        if padding:
+            tensor = F.pad(tensor, (0, padding), value=fill)
+        return tensor.reshape(self.out_features, self.num_groups, self.group_size)
+
+    def _pack_binary(self, weights: torch.Tensor, excluded: Optional[torch.Tensor]):
+        grouped = self._grouped(weights)
+        valid = self._grouped(torch.ones_like(weights, dtype=torch.bool), fill=False)
+        if excluded is not None:
+            # Salient weights and super weights are stored separately and must not skew the levels
+            valid = valid & ~self._grouped(excluded, fill=False)
+
+        if self.scheme == "ultrasketch":
+            # Split every group at its median and keep the mean of each half
+            masked = grouped.masked_fill(~valid, float("nan"))
+            threshold = masked.nanmedian(dim=-1, keepdim=True).values.nan_to_num(0.0)
+            bits = grouped > threshold
+        else:
+            bits = grouped >= 0
+
+        high = bits & valid
+        low = ~bits & valid
+        high_level = (grouped * high).sum(-1) / high.sum(-1).clamp(min=1)
+        low_level = (grouped * low).sum(-1) / low.sum(-1).clamp(min=1)
+
+        self.binary_plane.copy_(pack_bits(bits.reshape(self.out_features, -1)))
+        self.group_levels.copy_(torch.stack([high_level, low_level], dim=-1))
+
+    def _pack_salient(self, weights: torch.Tensor, salient_mask: torch.Tensor, threshold: float):
+        magnitudes = weights.abs()
+        row_max = torch.where(salient_mask, magnitudes, torch.zeros_like(magnitudes)).amax(dim=1)
+        lower = torch.full_like(row_max, float(threshold))
+        step = ((row_max - lower).clamp(min=0) / 4).clamp(min=1e-12)
+
+        row_index = salient_mask.nonzero(as_tuple=True)[0]
+        codes = ((magnitudes[salient_mask] - lower[row_index]) / step[row_index]).floor().clamp(0, 3)
+
+        padded_mask = F.pad(salient_mask, (0, self.padded_in_features - self.in_features), value=False)
+        self.salient_plane.copy_(pack_bits(padded_mask))
+        self.salient_codes.copy_(pack_2bit(codes))
+        self.salient_scales.copy_(torch.stack([lower, step], dim=-1))
+
+    def dequantize(self) -> torch.Tensor:
+        """Reconstruct the dense weight matrix from the packed representation"""
+        bits = unpack_bits(self.binary_plane).reshape(self.out_features, self.num_groups, self.group_size)
+        levels = self.group_levels
+        weights = torch.where(bits, levels[..., 0:1], levels[..., 1:2])
+        weights = weights.reshape(self.out_features, -1)
+
+        if self.scheme == "ptq1_61" and self.num_salient > 0:
+            salient_mask = unpack_bits(self.salient_plane)
+            row_index = salient_mask.nonzero(as_tuple=True)[0]
+            codes = unpack_2bit(self.salient_codes, self.num_salient).to(levels.dtype)
+            lower, step = self.salient_scales[row_index, 0], self.salient_scales[row_index, 1]
+            signs = torch.where(bits.reshape(self.out_features, -1)[salient_mask], 1.0, -1.0).to(levels.dtype)
+            weights = weights.masked_scatter(salient_mask, signs * (lower + (codes + 0.5) * step))
+
+        weights = weights[:, :self.in_features]
+        if self.pruned:
+            weights = apply_keep_plane(weights, self.keep_plane)
+        if self.num_outliers:
+            weights = apply_outliers(weights, {"indices": self.outlier_indices, "values": self.outlier_values})
+        return weights
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        weight = self.dequantize().to(x.dtype)
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": self.scheme,
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "bias": self.bias is not None,
+            "group_size": self.group_size,
+            "num_salient": self.num_salient,
+            "num_outliers": self.num_outliers,
+            "pruned": self.pruned,
+        }
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"scheme={self.scheme}, group_size={self.group_size}")
+
+
+GROUP_BITS = (2, 4, 8)
+
+
+def pack_codes(codes: torch.Tensor, bits: int) -> torch.Tensor:
+    """Pack unsigned codes of 2, 4 or 8 bits along the last dimension (low bits first)"""
+    per_byte = 8 // bits
+    shifts = torch.arange(0, 8, bits, dtype=torch.uint8, device=codes.device)
+    grouped = codes.to(torch.uint8).reshape(*codes.shape[:-1], -1, per_byte)
+    return (grouped << shifts).sum(dim=-1, dtype=torch.uint8)
+
+
+def unpack_codes(packed: torch.Tensor, bits: int) -> torch.Tensor:
+    """Inverse of pack_codes"""
+    shifts = torch.arange(0, 8, bits, dtype=torch.uint8, device=packed.device)
+    codes = (packed.unsqueeze(-1) >> shifts) & ((1 << bits) - 1)
+    return codes.reshape(*packed.shape[:-1], -1)
+
+
+def quantize_groups(grouped: torch.Tensor, bits: int, valid: Optional[torch.Tensor] = None,
+                    scale_dtype: torch.dtype = torch.float16, clip_ratios: Optional[List[float]] = None):
+    """
+    Asymmetric min/max quantization of every group along the last dimension at once.
+    Returns (codes, scales, zero_points); entries outside `valid` do not shape the range.
+    The range always contains zero, so zero weights (e.g. pruned ones) stay exact.
+    With clip_ratios, each group keeps the shrunken range with the lowest squared error.
+    """
+    max_code = (1 << bits) - 1
+    if valid is None:
+        low, high = grouped.amin(dim=-1), grouped.amax(dim=-1)
+    else:
+        low = grouped.masked_fill(~valid, float("inf")).amin(dim=-1)
+        high = grouped.masked_fill(~valid, float("-inf")).amax(dim=-1)
+    low, high = low.clamp(max=0), high.clamp(min=0)
+
+    def grid(ratio):
+        scales = ((high - low) * ratio / max_code).clamp(min=1e-8).to(scale_dtype).float().clamp(min=1e-8)
+        zero_points = torch.round(-low * ratio / scales).clamp(0, max_code)
+        codes = torch.round(grouped / scales.unsqueeze(-1) + zero_points.unsqueeze(-1)).clamp(0, max_code)
+        return codes, scales, zero_points
+
+    codes, scales, zero_points = grid(1.0)
+    if clip_ratios:
+        def group_error(codes, scales, zero_points):
+            error = (dequantize_groups(codes, scales, zero_points) - grouped) ** 2
+            return (error if valid is None else error * valid).sum(dim=-1)
+
+        best = group_error(codes, scales, zero_points)
+        for ratio in clip_ratios:
+            candidate = grid(ratio)
+            error = group_error(*candidate)
+            better = error < best
+            best = torch.where(better, error, best)
+            codes = torch.where(better.unsqueeze(-1), candidate[0], codes)
+            scales = torch.where(better, candidate[1], scales)
+            zero_points = torch.where(better, candidate[2], zero_points)
+
+    return codes.to(torch.uint8), scales.to(scale_dtype), zero_points.to(torch.uint8)
+
+
+def dequantize_groups(codes: torch.Tensor, scales: torch.Tensor, zero_points: torch.Tensor) -> torch.Tensor:
+    return (codes.float() - zero_points.float().unsqueeze(-1)) * scales.float().unsqueeze(-1)
+
+
+class GroupQuantizedLinear(torch.nn.Module):
+    """
+    Linear layer with 2, 4 or 8-bit integer weights and an asymmetric scale and
+    zero-point per group of ``group_size`` input features. Codes are packed along
+    each row (two nibbles per byte at 4 bits) and dequantized on every forward pass.
+    Super weights, if any, are kept exactly in an outlier side-table.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True,
+                 bits: int = 4, group_size: int = 128, num_outliers: int = 0,
+                 dtype: torch.dtype = torch.float16):
+        super().__init__()
+        if bits not in GROUP_BITS:
+            raise ValueError(f"Unsupported bit width {bits}, expected one of {GROUP_BITS}")
+
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        # Whole bytes per group, so rows and groups never share a packed byte
+        self.group_size = _round_up(min(group_size, _round_up(in_features, 8)), 8)
+        self.padded_in_features = _round_up(in_features, self.group_size)
+        self.num_groups = self.padded_in_features // self.group_size
+        self.num_outliers = num_outliers
+
+        self.register_buffer(
+            "codes",
+            torch.zeros(out_features, self.padded_in_features * bits // 8, dtype=torch.uint8)
+        )
+        self.register_buffer("scales", torch.zeros(out_features, self.num_groups, dtype=dtype))
+        self.register_buffer("zero_points", torch.zeros(out_features, self.num_groups, dtype=torch.uint8))
+
+        if num_outliers:
+            self.register_buffer("outlier_indices", torch.zeros(num_outliers, dtype=torch.int32))
+            self.register_buffer("outlier_values", torch.zeros(num_outliers, dtype=OUTLIER_DTYPE))
+
+        if bias:
+            self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    @classmethod
+    def from_weight(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], bits: int = 4,
+                    group_size: int = 128, dtype: torch.dtype = torch.float16,
+                    outliers: Optional[Dict[str, torch.Tensor]] = None) -> "GroupQuantizedLinear":
+        """Quantize and pack a [out_features, in_features] weight matrix"""
+        weights = weight.float()
+        out_features, in_features = weights.shape
+        layer = cls(in_features, out_features, bias=bias is not None, bits=bits, group_size=group_size,
+                    num_outliers=len(outliers["indices"]) if outliers is not None else 0,
+                    dtype=dtype).to(weights.device)
+
+        valid = torch.ones_like(weights, dtype=torch.bool)
+        if outliers is not None:
+            valid &= ~outlier_mask(weights.shape, outliers, weights.device)
+
+        with torch.no_grad():
+            codes, scales, zero_points = quantize_groups(
+                layer._grouped(weights), bits, layer._grouped(valid, fill=False), dtype
+            )
+            layer.codes.copy_(pack_codes(codes.reshape(out_features, -1), bits))
+            layer.scales.copy_(scales)
+            layer.zero_points.copy_(zero_points)
+            if layer.num_outliers:
+                layer.outlier_indices.copy_(outliers["indices"])
+                layer.outlier_values.copy_(outliers["values"])
+            if bias is not None:
+                layer.bias.data = bias.to(dtype)
+        return layer
+
+    def _grouped(self, tensor: torch.Tensor, fill=0) -> torch.Tensor:
+        padding = self.padded_in_features - self.in_features
+        if padding:
+            tensor = F.pad(tensor, (0, padding), value=fill)
+        return tensor.reshape(self.out_features, self.num_groups, self.group_size)
+
+    def dequantize(self) -> torch.Tensor:
+        """Reconstruct the dense weight matrix from the packed representation"""
+        codes = unpack_codes(self.codes, self.bits).reshape(self.out_features, self.num_groups, self.group_size)
+        weights = dequantize_groups(codes, self.scales, self.zero_points).to(self.scales.dtype)
+        weights = weights.reshape(self.out_features, -1)[:, :self.in_features]
+        if self.num_outliers:
+            weights = apply_outliers(weights, {"indices": self.outlier_indices, "values": self.outlier_values})
+        return weights
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        weight = self.dequantize().to(x.dtype)
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": "group",
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "bias": self.bias is not None,
+            "bits": self.bits,
+            "group_size": self.group_size,
+            "num_outliers": self.num_outliers,
+            "dtype": str(self.scales.dtype).replace("torch.", ""),
+        }
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"bits={self.bits}, group_size={self.group_size}")
+
+
+def replace_module(model: torch.nn.Module, name: str, new_module: torch.nn.Module):
+    """Swap the submodule at a dotted path"""
+    parent_name, _, child_name = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, new_module)
+
+
+def tied_parameter_ids(model: torch.nn.Module) -> set:
+    """Ids of embedding weights, which may be shared with an output projection"""
+    return {
+        id(module.weight) for module in model.modules()
+        if isinstance(module, torch.nn.Embedding)
+    }
+
+
+def dequantized_dynamic_state(model: torch.nn.Module, state_dict: Dict[str, torch.Tensor],
+                              dtype: Optional[torch.dtype] = None) -> Dict[str, torch.Tensor]:
+    """
+    Replace the packed params of dynamically quantized (8-bit) Linear layers in
+    state_dict with dequantized weights and biases, optionally cast to dtype.
+    Packed params have no safetensors form, and the plain Linear weights load back
+    into the model's config like any other checkpoint
+    """
+    for name, module in model.named_modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            for key in [k for k in state_dict if k.startswith(f"{name}.")]:
+                del state_dict[key]
+            weight, bias = module._weight_bias()
+            for key, tensor in (("weight", weight.dequantize()), ("bias", bias)):
+                if tensor is not None:
+                    state_dict[f"{name}.{key}"] = (tensor.to(dtype) if dtype else tensor).contiguous()
+    return state_dict
+
+
+def quantized_modules_manifest(model: torch.nn.Module) -> Dict[str, Dict[str, Any]]:
+    """Describe every packed (quantized, sparse or factored) layer so the model can be rebuilt at load time"""
+    packed_types = tuple(_packed_layer_classes().values())
+    return {
+        name: module.packed_config()
+        for name, module in model.named_modules()
+        if isinstance(module, packed_types)
+    }
+
+
+def _packed_layer_classes() -> Dict[str, type]:
+    """Layer class for each manifest scheme"""
+    from nanoquant.core.sparse_layers import SparseLinear
+    from nanoquant.core.low_rank import LowRankLinear
+    from nanoquant.core.quip import QuipLinear
+    from nanoquant.core.aqlm import AqlmLinear
+    classes = {scheme: QuantizedLinear for scheme in PACKED_SCHEMES}
+    classes.update({"group": GroupQuantizedLinear, "quip": QuipLinear, "aqlm": AqlmLinear,
+                    "sparse": SparseLinear, "low_rank": LowRankLinear})
+    return classes
+
+
+def restore_quantized_modules(model: torch.nn.Module,
+                              manifest: Dict[str, Dict[str, Any]]) -> torch.nn.Module:
+    """Replace Linear layers listed in a manifest with empty packed layers ready for load_state_dict"""
+    for name, config in manifest.items():
+        replace_module(model, name, build_packed_module(config))
+    return model
+
+
+def build_packed_module(config: Dict[str, Any]) -> torch.nn.Module:
+    """Empty packed layer for a packed_config() entry, ready for load_state_dict"""
+    config = dict(config)
+    in_features = config.pop("in_features")
+    out_features = config.pop("out_features")
+    layer_class = _packed_layer_classes()[config["scheme"]]
+    if layer_class is not QuantizedLinear:
+        del config["scheme"]
+        config["dtype"] = getattr(torch, config["dtype"])
+    return layer_class(in_features, out_features, **config)
+
+
+def load_packed_model(model_path: str) -> torch.nn.Module:
+    """Rebuild a saved NanoQuant whose Linear layers were stored in packed form"""
+    import glob
+    import json
+    import os
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    with open(os.path.join(model_path, QUANTIZATION_MANIFEST), "r") as f:
+        manifest = json.load(f)
+
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_config(config, trust_remote_code=True)
+    restore_quantized_modules(model, manifest)
+
+    if glob.glob(os.path.join(model_path, "*.safetensors")):
+        from nanoquant.core.shard_io import read_state_dict
+        state_dict = read_state_dict(model_path)
+    else:
+        state_dict = torch.load(os.path.join(model_path, "pytorch_model.bin"), map_location="cpu")
+
+    missing, unexpected = model.load_state_dict(state_dict, strict=False)
+    if unexpected:
+        logger.warning(f"Ignoring {len(unexpected)} unexpected tensors in {model_path}")
+    if missing:
+        logger.warning(f"{len(missing)} tensors missing from {model_path}, e.g. {missing[:3]}")
+    model.tie_weights()
+
+    logger.info(f"Loaded packed model with {len(manifest)} packed layers from {model_path}")
+    return model
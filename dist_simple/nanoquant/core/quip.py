@@ -0,0 +1,253 @@
+"""
+QuIP Quantization for NanoQuant
+Incoherence processing with randomized Hadamard rotations and LDLQ rounding
+"""
+import torch
+import torch.nn.functional as F
+import math
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+from nanoquant.core.quantized_layers import (
+    GroupQuantizedLinear, pack_bits, unpack_bits, pack_codes, quantize_groups,
+    outlier_mask, pack_keep_plane, apply_keep_plane, OUTLIER_DTYPE
+)
+
+logger = logging.getLogger(__name__)
+
+# Rotated weights are near-Gaussian, so a few levels are best spent on a clipped range
+CLIP_RATIOS = [1 - 0.05 * step for step in range(1, 12)]
+
+
+def hadamard_block(size: int) -> int:
+    """Largest power of two dividing size; the rotation acts on blocks of this many features"""
+    return size & -size
+
+
+def fwht(x: torch.Tensor, block: int) -> torch.Tensor:
+    """
+    Orthonormal fast Walsh-Hadamard transform of the last dimension, applied
+    independently to consecutive blocks of `block` (a power of two) entries.
+    O(n log block) per row instead of the O(n^2) of a dense rotation matrix.
+    """
+    shape = x.shape
+    x = x.reshape(-1, shape[-1] // block, block)
+    h = 1
+    while h < block:
+        x = x.reshape(x.shape[0], x.shape[1], block // (2 * h), 2, h)
+        a, b = x[..., 0, :], x[..., 1, :]
+        x = torch.stack((a + b, a - b), dim=-2)
+        h *= 2
+    return x.reshape(shape) / math.sqrt(block)
+
+
+def random_signs(size: int, generator: torch.Generator) -> torch.Tensor:
+    return torch.randint(0, 2, (size,), generator=generator).float() * 2 - 1
+
+
+def incoherent_weight(weight: torch.Tensor, signs_in: torch.Tensor, signs_out: torch.Tensor) -> torch.Tensor:
+    """H_out D_out W D_in H_in: spreads every weight's magnitude over its whole row and column"""
+    rotated = fwht(weight * signs_out.unsqueeze(1) * signs_in.unsqueeze(0), hadamard_block(weight.shape[1]))
+    return fwht(rotated.t(), hadamard_block(weight.shape[0])).t()
+
+
+def incoherent_hessian(hessian: torch.Tensor, signs_in: torch.Tensor) -> torch.Tensor:
+    """H_in D_in H D_in H_in, the proxy Hessian of the rotated weights"""
+    block = hadamard_block(hessian.shape[0])
+    rotated = fwht(hessian * signs_in.unsqueeze(1) * signs_in.unsqueeze(0), block)
+    return fwht(rotated.t(), block).t()
+
+
+def ldlq(weight: torch.Tensor, hessian: Optional[torch.Tensor], scales: torch.Tensor,
+         zero_points: torch.Tensor, bits: int, group_size: int,
+         block_size: int = 128, damp: float = 0.01) -> torch.Tensor:
+    """
+    LDLQ rounding of a [out, in] matrix to integer codes on fixed per-group grids:
+    columns are rounded in order and each rounding error is fed back to the columns
+    not yet rounded through the upper Cholesky factor of the damped inverse Hessian.
+    Without a Hessian this is nearest rounding.
+    """
+    W = weight.float().clone()
+    columns = W.shape[1]
+    max_code = (1 << bits) - 1
+    column_scales = scales.float().repeat_interleave(group_size, dim=1)[:, :columns]
+    column_zeros = zero_points.float().repeat_interleave(group_size, dim=1)[:, :columns]
+
+    def round_to_grid(values, scale, zero):
+        return torch.round(values / scale + zero).clamp(0, max_code)
+
+    if hessian is None:
+        return round_to_grid(W, column_scales, column_zeros).to(torch.uint8)
+
+    H = hessian.to(W.device).float().clone()
+    # Inputs that never fired carry no information; pin them so H stays invertible
+    dead = torch.diag(H) == 0
+    H[dead, dead] = 1
+    W[:, dead] = 0
+    H += damp * torch.mean(torch.diag(H)) * torch.eye(columns, device=W.device)
+    H_inv = torch.linalg.cholesky(torch.cholesky_inverse(torch.linalg.cholesky(H)), upper=True)
+
+    codes = torch.zeros_like(W, dtype=torch.uint8)
+    for start in range(0, columns, block_size):
+        end = min(start + block_size, columns)
+        W_block = W[:, start:end].clone()
+        H_inv_block = H_inv[start:end, start:end]
+        errors = torch.zeros_like(W_block)
+
+        for column in range(end - start):
+            scale, zero = column_scales[:, start + column], column_zeros[:, start + column]
+            w = W_block[:, column]
+            q = round_to_grid(w, scale, zero)
+            error = (w - (q - zero) * scale) / H_inv_block[column, column]
+            W_block[:, column:] -= error.unsqueeze(1) @ H_inv_block[column, column:].unsqueeze(0)
+            codes[:, start + column] = q.to(torch.uint8)
+            errors[:, column] = error
+
+        W[:, end:] -= errors @ H_inv[start:end, end:]
+
+    return codes
+
+
+class QuipLinear(torch.nn.Module):
+    """
+    Linear layer quantized in a randomly rotated basis (QuIP incoherence processing).
+
+    The weight is stored as W~ = H_out D_out W D_in H_in, with D random sign
+    diagonals and H block Hadamard matrices, as low-bit group codes (``rotated``).
+    Inference rotates the input, multiplies by the dequantized W~ and rotates the
+    output back, each rotation a fast Walsh-Hadamard transform. Super weights are
+    subtracted before rotating and added back exactly from the outlier side-table.
+    The rotation spreads pruned zeros over every entry, so pruned layers keep a plane
+    of the surviving weights and run on the weight rebuilt in the original basis.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True,
+                 bits: int = 2, group_size: int = 128, num_outliers: int = 0,
+                 pruned: bool = False, dtype: torch.dtype = torch.float16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.num_outliers = num_outliers
+        self.pruned = pruned
+        self.rotated = GroupQuantizedLinear(in_features, out_features, bias=False, bits=bits,
+                                            group_size=group_size, dtype=dtype)
+        self.register_buffer("signs_in", torch.zeros((in_features + 7) // 8, dtype=torch.uint8))
+        self.register_buffer("signs_out", torch.zeros((out_features + 7) // 8, dtype=torch.uint8))
+
+        if num_outliers:
+            self.register_buffer("outlier_indices", torch.zeros(num_outliers, dtype=torch.int32))
+            self.register_buffer("outlier_values", torch.zeros(num_outliers, dtype=OUTLIER_DTYPE))
+
+        if pruned:
+            self.register_buffer("keep_plane", torch.zeros(out_features, (in_features + 7) // 8,
+                                                           dtype=torch.uint8))
+
+        if bias:
+            self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    @classmethod
+    def from_weight(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], bits: int = 2,
+                    group_size: int = 128, hessian: Optional[torch.Tensor] = None, seed: int = 0,
+                    dtype: torch.dtype = torch.float16, damp: float = 0.01,
+                    outliers: Optional[Dict[str, torch.Tensor]] = None) -> "QuipLinear":
+        """Rotate, LDLQ-round and pack a [out_features, in_features] weight matrix"""
+        W = weight.float()
+        out_features, in_features = W.shape
+        keep_plane = pack_keep_plane(W)
+        layer = cls(in_features, out_features, bias=bias is not None, bits=bits, group_size=group_size,
+                    num_outliers=len(outliers["indices"]) if outliers is not None else 0,
+                    pruned=keep_plane is not None, dtype=dtype).to(W.device)
+        if outliers is not None:
+            W = W.masked_fill(outlier_mask(W.shape, outliers, W.device), 0)
+
+        generator = torch.Generator(device="cpu").manual_seed(seed)
+        signs_in = random_signs(in_features, generator).to(W.device)
+        signs_out = random_signs(out_features, generator).to(W.device)
+        rotated = incoherent_weight(W, signs_in, signs_out)
+        if hessian is not None:
+            hessian = incoherent_hessian(hessian.to(W.device).float(), signs_in)
+
+        inner = layer.rotated
+        padding = inner.padded_in_features - in_features
+        _, scales, zero_points = quantize_groups(inner._grouped(rotated), bits, scale_dtype=dtype,
+                                                 clip_ratios=CLIP_RATIOS)
+        padded = F.pad(rotated, (0, padding))
+        if hessian is not None and padding:
+            # Padding columns are zero and independent of the real inputs
+            hessian = torch.block_diag(hessian, torch.eye(padding, device=W.device))
+        codes = ldlq(padded, hessian, scales, zero_points, bits, inner.group_size, damp=damp)
+
+        with torch.no_grad():
+            inner.codes.copy_(pack_codes(codes, bits))
+            inner.scales.copy_(scales)
+            inner.zero_points.copy_(zero_points)
+            layer.signs_in.copy_(pack_bits(F.pad(signs_in > 0, (0, (-in_features) % 8))))
+            layer.signs_out.copy_(pack_bits(F.pad(signs_out > 0, (0, (-out_features) % 8))))
+            if layer.num_outliers:
+                layer.outlier_indices.copy_(outliers["indices"])
+                layer.outlier_values.copy_(outliers["values"])
+            if layer.pruned:
+                layer.keep_plane.copy_(keep_plane)
+            if bias is not None:
+                layer.bias.data = bias.to(dtype)
+        return layer
+
+    def _signs(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        signs_in = unpack_bits(self.signs_in)[:self.in_features]
+        signs_out = unpack_bits(self.signs_out)[:self.out_features]
+        return signs_in.float() * 2 - 1, signs_out.float() * 2 - 1
+
+    def dequantize(self) -> torch.Tensor:
+        """Reconstruct the dense weight matrix in the original basis"""
+        signs_in, signs_out = self._signs()
+        rotated = self.rotated.dequantize().float()
+        # Hadamard blocks and sign diagonals are their own inverses
+        weight = fwht(fwht(rotated, hadamard_block(self.in_features)).t(), hadamard_block(self.out_features)).t()
+        weight = weight * signs_out.unsqueeze(1) * signs_in.unsqueeze(0)
+        if self.pruned:
+            weight = apply_keep_plane(weight, self.keep_plane)
+        if self.num_outliers:
+            weight = weight.flatten().index_add(0, self.outlier_indices.long(),
+                                                self.outlier_values.float()).reshape(weight.shape)
+        return weight.to(self.rotated.scales.dtype)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.pruned:
+            bias = self.bias.to(x.dtype) if self.bias is not None else None
+            return F.linear(x, self.dequantize().to(x.dtype), bias)
+
+        signs_in, signs_out = self._signs()
+        x_rotated = fwht(x * signs_in.to(x.dtype), hadamard_block(self.in_features))
+        output = F.linear(x_rotated, self.rotated.dequantize().to(x.dtype))
+        output = fwht(output, hadamard_block(self.out_features)) * signs_out.to(x.dtype)
+
+        if self.num_outliers:
+            # Super weights were zeroed before rotating; add their exact contribution back
+            indices = self.outlier_indices.long()
+            rows, columns = indices // self.in_features, indices % self.in_features
+            contributions = x[..., columns] * self.outlier_values.to(x.dtype)
+            output = output.index_add(-1, rows, contributions)
+        if self.bias is not None:
+            output = output + self.bias.to(x.dtype)
+        return output
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": "quip",
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "bias": self.bias is not None,
+            "bits": self.rotated.bits,
+            "group_size": self.rotated.group_size,
+            "num_outliers": self.num_outliers,
+            "pruned": self.pruned,
+            "dtype": str(self.rotated.scales.dtype).replace("torch.", ""),
+        }
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"bits={self.rotated.bits}, hadamard_blocks=({hadamard_block(self.in_features)}, "
+                f"{hadamard_block(self.out_features)})")
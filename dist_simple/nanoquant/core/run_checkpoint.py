@@ -0,0 +1,201 @@
+"""
+Resumable Compression Runs for NanoQuant
+Checkpoints finished layers, streamed blocks and saved levels so an interrupted run picks up where it stopped
+"""
+import os
+import json
+import shutil
+import hashlib
+import torch
+from typing import Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variable read when no explicit checkpoint location is given
+CHECKPOINT_DIR_ENV_VAR = "NANOQUANT_CHECKPOINT_DIR"
+
+# Checkpoints live beside the outputs by default, so they share the same persistent volume
+DEFAULT_CHECKPOINT_SUBDIR = ".checkpoint"
+RUN_MANIFEST = "run_manifest.json"
+
+# Kernel params derived from the weights themselves; they never change a result
+DERIVED_PARAMS = ("svd",)
+
+# Marks an encoded packed layer inside a saved kernel result
+PACKED_MODULE_KEY = "__packed_module__"
+
+
+def _hash_value(digest, value):
+    if isinstance(value, torch.Tensor):
+        digest.update(str((tuple(value.shape), value.dtype)).encode())
+        digest.update(value.detach().cpu().contiguous().view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode())
+            _hash_value(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _hash_value(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def job_fingerprint(kernel, weights: torch.Tensor, bias: Optional[torch.Tensor],
+                    params: Dict[str, Any]) -> str:
+    """Content hash of one layer kernel call: the kernel, its weights and its params"""
+    digest = hashlib.sha1(f"{kernel.__module__}.{kernel.__name__}".encode())
+    _hash_value(digest, [weights, bias])
+    _hash_value(digest, {key: value for key, value in params.items() if key not in DERIVED_PARAMS})
+    return digest.hexdigest()
+
+
+def _encode(value):
+    if isinstance(value, torch.nn.Module):
+        if not hasattr(value, "packed_config"):
+            raise TypeError(f"Cannot checkpoint a {type(value).__name__}")
+        return {PACKED_MODULE_KEY: value.packed_config(), "state": value.state_dict()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _decode(value, device: torch.device):
+    if isinstance(value, dict):
+        if PACKED_MODULE_KEY in value:
+            from nanoquant.core.quantized_layers import build_packed_module
+            module = build_packed_module(value[PACKED_MODULE_KEY])
+            module.load_state_dict(value["state"])
+            return module.to(device)
+        return {key: _decode(item, device) for key, item in value.items()}
+    return value
+
+
+class LayerCheckpoint:
+    """
+    Results of layer kernels saved under the content hash of their inputs.
+
+    The engine looks every layer up here before running its kernel and saves each
+    result as soon as it arrives, so an interrupted step loses at most the layers
+    in flight. Keying by content makes results valid wherever the same inputs recur,
+    whichever level or plan order produced them.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}.pt")
+
+    def load(self, fingerprint: str, device: torch.device) -> Optional[Dict[str, Any]]:
+        """The saved result for fingerprint, or None if there is no usable one"""
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            result = _decode(torch.load(path, map_location=device, weights_only=True), device)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable layer checkpoint {path}: {e}")
+            return None
+        self.hits += 1
+        return result
+
+    def save(self, fingerprint: str, result: Dict[str, Any]) -> bool:
+        """Write a finished result atomically; failed kernels and unpackable modules are skipped"""
+        if "error" in result:
+            return False
+        try:
+            encoded = _encode(result)
+        except TypeError as e:
+            logger.debug(f"Not checkpointing layer result: {e}")
+            return False
+        temporary = f"{self._path(fingerprint)}.{os.getpid()}.tmp"
+        torch.save(encoded, temporary)
+        os.replace(temporary, self._path(fingerprint))
+        return True
+
+
+class RunCheckpoint:
+    """
+    On-disk progress of one compression run: a manifest of the levels already saved
+    and the streamed blocks already written, plus a LayerCheckpoint for kernel results.
+
+    run_key identifies the run's inputs (model revision, level configs, engine
+    version); a checkpoint left by a run with a different key is discarded, so
+    resuming never mixes results from different inputs. The manifest is rewritten
+    atomically after every recorded item.
+    """
+
+    def __init__(self, directory: str, run_key: str):
+        self.directory = directory
+        self.run_key = run_key
+        self.manifest = self._load_manifest()
+        if self.manifest.get("run_key") != run_key:
+            if self.manifest:
+                logger.info(f"Discarding checkpoint of a different run in {directory}")
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory, exist_ok=True)
+            # Written up front, so layers saved before the first finished level are kept on restart
+            self.manifest = {"run_key": run_key, "levels": {}, "blocks": {}}
+            self._write_manifest()
+        else:
+            logger.info(f"Resuming from checkpoint in {directory}: {len(self.manifest['levels'])} levels "
+                        f"and {sum(len(blocks) for blocks in self.manifest['blocks'].values())} blocks done")
+        self.layers = LayerCheckpoint(os.path.join(directory, "layers"))
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, RUN_MANIFEST)
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self):
+        temporary = f"{self._manifest_path()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temporary, self._manifest_path())
+
+    def completed_level(self, level_name: str) -> Optional[Dict[str, Any]]:
+        """Info of a level saved earlier in this run, if its output is still there"""
+        info = self.manifest["levels"].get(level_name)
+        if info is None or not os.path.isdir(info["path"]):
+            return None
+        return info
+
+    def complete_level(self, level_name: str, info: Dict[str, Any]):
+        self.manifest["levels"][level_name] = info
+        self.manifest["blocks"].pop(level_name, None)
+        self._write_manifest()
+
+    def completed_block(self, level_name: str, index: int, output_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Record of a streamed block written earlier in this run, if its shard is intact.
+        Shards are renamed into place once complete, so a matching size is enough.
+        """
+        record = self.manifest["blocks"].get(level_name, {}).get(str(index))
+        if record is None:
+            return None
+        path = os.path.join(output_dir, record["shard_name"])
+        if not os.path.exists(path) or os.path.getsize(path) != record["file_size"]:
+            return None
+        return record
+
+    def complete_block(self, level_name: str, index: int, record: Dict[str, Any]):
+        self.manifest["blocks"].setdefault(level_name, {})[str(index)] = record
+        self._write_manifest()
+
+    def clear(self):
+        """Remove the checkpoint once the run's results are safely saved"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        try:
+            # The parent holding per-run checkpoints goes too once no other run uses it
+            os.rmdir(os.path.dirname(self.directory))
+        except OSError:
+            pass
@@ -0,0 +1,194 @@
+"""
+Session Store for NanoQuant
+Expiring login sessions looked up by token hash in constant time, with a per-user index for logout everywhere
+"""
+import os
+import time
+import hashlib
+import secrets
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables read when no explicit lifetime or Redis server is given
+SESSION_TTL_ENV_VAR = "NANOQUANT_SESSION_TTL"
+SESSION_REDIS_URL_ENV_VAR = "NANOQUANT_SESSION_REDIS_URL"
+
+DEFAULT_SESSION_TTL = 7 * 24 * 3600
+
+# Timing wheel geometry: expiries are swept over this many slots, at the resolution
+# that lets one turn cover the TTL, but never finer than this many seconds
+WHEEL_RESOLUTION = 60.0
+WHEEL_SLOTS = 512
+
+REDIS_KEY_PREFIX = "nanoquant:session:"
+REDIS_USER_PREFIX = "nanoquant:user_sessions:"
+
+
+def hash_token(token: str) -> str:
+    """Sessions are stored under the sha256 of their token, never the token itself"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SessionStore:
+    """
+    Login sessions of one API process, keyed by token hash.
+
+    A lookup is one dict access and an expiry check, however many users are signed
+    in. Each user's token hashes are indexed too, so logout everywhere touches only
+    that user's sessions. Expired sessions are swept by a timing wheel: every session
+    sits in the slot of the tick after it expires, and each call clears the slots of the
+    ticks that passed since the previous one, so sweeping costs O(1) amortized. The
+    resolution is widened until one turn of the wheel spans the TTL, so a slot is
+    never reached before the sessions in it expire and live sessions are never
+    scanned; with the default 7-day TTL that is about 20 minutes. Sessions found
+    expired before their slot is swept are rejected all the same.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, resolution: float = WHEEL_RESOLUTION,
+                 slots: int = WHEEL_SLOTS, clock=time.time):
+        self.ttl = ttl if ttl is not None else float(os.getenv(SESSION_TTL_ENV_VAR, DEFAULT_SESSION_TTL))
+        # A session's slot is at most slots ticks after the one it was created in
+        self.resolution = max(resolution, self.ttl / (slots - 1))
+        self.clock = clock
+        self.sessions: Dict[str, Tuple[str, float]] = {}
+        self.user_sessions: Dict[str, Set[str]] = {}
+        self.wheel: List[Set[str]] = [set() for _ in range(slots)]
+        self.tick = self._tick(clock())
+        self.lock = threading.Lock()
+
+    def _tick(self, timestamp: float) -> int:
+        return int(timestamp // self.resolution)
+
+    def _slot(self, expires_at: float) -> Set[str]:
+        return self.wheel[(self._tick(expires_at) + 1) % len(self.wheel)]
+
+    def _advance(self, now: float):
+        tick = self._tick(now)
+        # Past a full turn every slot has been due once; clearing each of them once is enough
+        for passed in range(self.tick + 1, min(tick, self.tick + len(self.wheel)) + 1):
+            slot = self.wheel[passed % len(self.wheel)]
+            for token_hash in list(slot):
+                session = self.sessions.get(token_hash)
+                if session is None:
+                    slot.discard(token_hash)
+                elif session[1] <= now:
+                    self._remove(token_hash)
+        self.tick = max(self.tick, tick)
+
+    def _remove(self, token_hash: str):
+        user_id, expires_at = self.sessions.pop(token_hash)
+        self._slot(expires_at).discard(token_hash)
+        tokens = self.user_sessions.get(user_id)
+        if tokens is not None:
+            tokens.discard(token_hash)
+            if not tokens:
+                del self.user_sessions[user_id]
+
+    def create(self, user_id: str) -> str:
+        """Start a session for user_id and return its token"""
+        token = secrets.token_urlsafe(32)
+        token_hash = hash_token(token)
+        with self.lock:
+            now = self.clock()
+            self._advance(now)
+            expires_at = now + self.ttl
+            self.sessions[token_hash] = (user_id, expires_at)
+            self.user_sessions.setdefault(user_id, set()).add(token_hash)
+            self._slot(expires_at).add(token_hash)
+        return token
+
+    def resolve(self, token: str) -> Optional[str]:
+        """The user a live session token belongs to, or None"""
+        token_hash = hash_token(token)
+        with self.lock:
+            now = self.clock()
+            self._advance(now)
+            session = self.sessions.get(token_hash)
+            if session is None:
+                return None
+            if session[1] <= now:
+                self._remove(token_hash)
+                return None
+            return session[0]
+
+    def revoke(self, token: str) -> bool:
+        """End one session"""
+        with self.lock:
+            token_hash = hash_token(token)
+            if token_hash not in self.sessions:
+                return False
+            self._remove(token_hash)
+            return True
+
+    def revoke_user(self, user_id: str) -> int:
+        """End every session of user_id and return how many there were"""
+        with self.lock:
+            tokens = list(self.user_sessions.get(user_id, ()))
+            for token_hash in tokens:
+                self._remove(token_hash)
+            return len(tokens)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+
+class RedisSessionStore:
+    """
+    The same sessions in a Redis-compatible server, for API deployments with more
+    than one process. Each session is a key with the TTL as its expiry, so the
+    server does the sweeping; each user's token hashes are kept in a set whose
+    expiry is pushed out with every new session. client is anything implementing
+    the redis-py calls used here.
+    """
+
+    def __init__(self, client, ttl: Optional[float] = None):
+        self.client = client
+        self.ttl = int(ttl if ttl is not None else float(os.getenv(SESSION_TTL_ENV_VAR, DEFAULT_SESSION_TTL)))
+
+    def create(self, user_id: str) -> str:
+        token = secrets.token_urlsafe(32)
+        token_hash = hash_token(token)
+        self.client.setex(REDIS_KEY_PREFIX + token_hash, self.ttl, user_id)
+        self.client.sadd(REDIS_USER_PREFIX + user_id, token_hash)
+        self.client.expire(REDIS_USER_PREFIX + user_id, self.ttl)
+        return token
+
+    def resolve(self, token: str) -> Optional[str]:
+        user_id = self.client.get(REDIS_KEY_PREFIX + hash_token(token))
+        if isinstance(user_id, bytes):
+            user_id = user_id.decode("utf-8")
+        return user_id
+
+    def revoke(self, token: str) -> bool:
+        token_hash = hash_token(token)
+        user_id = self.resolve(token)
+        if user_id is not None:
+            self.client.srem(REDIS_USER_PREFIX + user_id, token_hash)
+        return bool(self.client.delete(REDIS_KEY_PREFIX + token_hash))
+
+    def revoke_user(self, user_id: str) -> int:
+        token_hashes = self.client.smembers(REDIS_USER_PREFIX + user_id)
+        keys = [REDIS_KEY_PREFIX + (token_hash.decode("utf-8") if isinstance(token_hash, bytes) else token_hash)
+                for token_hash in token_hashes]
+        revoked = self.client.delete(*keys) if keys else 0
+        self.client.delete(REDIS_USER_PREFIX + user_id)
+        return revoked
+
+
+def open_session_store(ttl: Optional[float] = None):
+    """
+    A RedisSessionStore when NANOQUANT_SESSION_REDIS_URL is set and the redis package
+    is installed, otherwise an in-process SessionStore
+    """
+    url = os.getenv(SESSION_REDIS_URL_ENV_VAR)
+    if url:
+        try:
+            import redis
+            return RedisSessionStore(redis.Redis.from_url(url), ttl)
+        except ImportError:
+            logger.warning(f"{SESSION_REDIS_URL_ENV_VAR} is set but redis is not installed; "
+                           "keeping sessions in process")
+    return SessionStore(ttl)
@@ -0,0 +1,205 @@
+"""
+Parallel Shard I/O for NanoQuant
+Reads and writes multi-shard safetensors checkpoints concurrently, with per-shard checksums
+"""
+import os
+import re
+import json
+import struct
+import hashlib
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+
+from nanoquant.core.lazy_tensors import (
+    SAFETENSORS_INDEX, SAFETENSORS_DTYPES, MappedShard, load_weight_map
+)
+
+logger = logging.getLogger(__name__)
+
+# Environment variable read when no explicit thread count is given
+SHARD_IO_WORKERS_ENV_VAR = "NANOQUANT_SHARD_IO_WORKERS"
+
+DEFAULT_MAX_SHARD_BYTES = 2 * 1024 ** 3
+# Small tensors are coalesced into writes of this size; large ones go out in one call
+WRITE_BUFFER_BYTES = 16 * 1024 ** 2
+CHECKSUM_ALGORITHM = "sha256"
+# Weight files a previous save may have left behind
+SHARD_FILE_PATTERN = re.compile(r"^model(-\d{5}-of-\d{5})?\.safetensors$")
+
+SAFETENSORS_CODES = {dtype: code for code, dtype in SAFETENSORS_DTYPES.items() if dtype is not None}
+
+
+def shard_io_workers(num_workers: Optional[int] = None) -> int:
+    if num_workers is None:
+        num_workers = int(os.getenv(SHARD_IO_WORKERS_ENV_VAR, str(min(8, os.cpu_count() or 1))))
+    return max(1, num_workers)
+
+
+def _tensor_bytes(tensor: torch.Tensor) -> memoryview:
+    """Raw bytes of a tensor without an intermediate copy when it is already contiguous on the CPU"""
+    flat = tensor.detach().to("cpu").contiguous().reshape(-1)
+    return memoryview(flat.view(torch.uint8).numpy())
+
+
+def plan_shards(state_dict: Dict[str, torch.Tensor],
+                max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES) -> List[List[str]]:
+    """Split tensor names, in order, into shards of at most max_shard_bytes (one oversized tensor per shard)"""
+    shards, current, current_bytes = [], [], 0
+    for name, tensor in state_dict.items():
+        size = tensor.numel() * tensor.element_size()
+        if current and current_bytes + size > max_shard_bytes:
+            shards.append(current)
+            current, current_bytes = [], 0
+        current.append(name)
+        current_bytes += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def write_shard(tensors: Dict[str, torch.Tensor], path: str,
+                metadata: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """
+    Write tensors as one safetensors file, hashing the bytes as they are written.
+
+    Returns the tensor payload size and the file checksum. The file is written under
+    a temporary name and renamed into place, so a crash never leaves a torn shard.
+    """
+    header = {}
+    offset = 0
+    for name, tensor in tensors.items():
+        if tensor.dtype not in SAFETENSORS_CODES:
+            raise ValueError(f"Cannot store {name} of dtype {tensor.dtype} in safetensors")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": SAFETENSORS_CODES[tensor.dtype], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + size]}
+        offset += size
+    header["__metadata__"] = metadata or {"format": "pt"}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # The data section must start 8-byte aligned
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    digest = hashlib.new(CHECKSUM_ALGORITHM)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb", buffering=WRITE_BUFFER_BYTES) as f:
+        for chunk in (struct.pack("<Q", len(header_bytes)), header_bytes):
+            f.write(chunk)
+            digest.update(chunk)
+        for tensor in tensors.values():
+            if tensor.numel():
+                data = _tensor_bytes(tensor)
+                f.write(data)
+                digest.update(data)
+    os.replace(temp_path, path)
+    return offset, f"{CHECKSUM_ALGORITHM}:{digest.hexdigest()}"
+
+
+def write_index(output_dir: str, weight_map: Dict[str, str], total_size: int,
+                checksums: Optional[Dict[str, str]] = None):
+    """Write model.safetensors.index.json atomically, so it only ever names complete shards"""
+    metadata: Dict[str, Any] = {"total_size": total_size}
+    if checksums:
+        metadata["checksums"] = checksums
+    index_path = os.path.join(output_dir, SAFETENSORS_INDEX)
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"metadata": metadata, "weight_map": weight_map}, f, indent=2)
+    os.replace(temp_path, index_path)
+
+
+def save_state_dict(state_dict: Dict[str, torch.Tensor], output_dir: str,
+                    max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+                    num_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Save a state dict as sharded safetensors, writing the shards concurrently.
+
+    Each shard is serialized by its own thread; tensor bytes are written straight
+    from the tensors' memory, and both the writes and the hashing release the GIL.
+    Tensors sharing storage (tied embeddings) are stored once. The index, with a
+    checksum per shard, is written last.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, SAFETENSORS_INDEX)
+    if os.path.exists(index_path):
+        # Never leave an index pointing at shards that are being overwritten
+        os.remove(index_path)
+
+    unique, seen = {}, set()
+    for name, tensor in state_dict.items():
+        if not isinstance(tensor, torch.Tensor):
+            raise ValueError(f"Cannot store {name} ({type(tensor).__name__}) in safetensors")
+        key = (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape), tensor.dtype)
+        if tensor.numel() and key in seen:
+            continue
+        seen.add(key)
+        unique[name] = tensor
+
+    shards = plan_shards(unique, max_shard_bytes)
+    names = [f"model-{index + 1:05d}-of-{len(shards):05d}.safetensors" for index in range(len(shards))]
+
+    def write(job):
+        shard_name, keys = job
+        return write_shard({key: unique[key] for key in keys}, os.path.join(output_dir, shard_name))
+
+    workers = min(shard_io_workers(num_workers), len(shards)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(write, zip(names, shards)))
+
+    for file_name in os.listdir(output_dir):
+        if SHARD_FILE_PATTERN.match(file_name) and file_name not in names:
+            os.remove(os.path.join(output_dir, file_name))
+
+    weight_map = {key: shard_name for shard_name, keys in zip(names, shards) for key in keys}
+    checksums = {shard_name: checksum for shard_name, (_, checksum) in zip(names, results)}
+    total_size = sum(size for size, _ in results)
+    write_index(output_dir, weight_map, total_size, checksums)
+
+    logger.info(f"Wrote {total_size / 1e6:.1f} MB in {len(shards)} shard(s) with {workers} thread(s)")
+    return {"num_shards": len(shards), "total_size": total_size, "checksums": checksums}
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.new(CHECKSUM_ALGORITHM)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(WRITE_BUFFER_BYTES), b""):
+            digest.update(chunk)
+    return f"{CHECKSUM_ALGORITHM}:{digest.hexdigest()}"
+
+
+def load_checksums(checkpoint_dir: str) -> Dict[str, str]:
+    index_path = os.path.join(checkpoint_dir, SAFETENSORS_INDEX)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r") as f:
+        return json.load(f).get("metadata", {}).get("checksums", {})
+
+
+def read_state_dict(checkpoint_dir: str, verify: bool = True,
+                    num_workers: Optional[int] = None) -> Dict[str, torch.Tensor]:
+    """
+    Read every shard of a safetensors checkpoint into memory concurrently.
+
+    Each thread maps one shard and copies its tensors out; checksums recorded in the
+    index are verified first when verify is set.
+    """
+    weight_map = load_weight_map(checkpoint_dir)
+    checksums = load_checksums(checkpoint_dir) if verify else {}
+    shard_names = sorted(set(weight_map.values()))
+
+    def read(shard_name):
+        path = os.path.join(checkpoint_dir, shard_name)
+        if shard_name in checksums and file_checksum(path) != checksums[shard_name]:
+            raise ValueError(f"Checksum mismatch for shard {path}")
+        shard = MappedShard(path)
+        return {name: shard.tensor(name).clone() for name in shard.entries}
+
+    workers = min(shard_io_workers(num_workers), len(shard_names)) or 1
+    state_dict = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for tensors in pool.map(read, shard_names):
+            state_dict.update(tensors)
+    logger.info(f"Read {len(state_dict)} tensors from {len(shard_names)} shard(s) with {workers} thread(s)")
+    return state_dict
@@ -0,0 +1,241 @@
+"""
+Sparse Linear Layers for NanoQuant
+Compact storage for pruned weight matrices (bitmap, CSR and N:M layouts)
+"""
+import torch
+import torch.nn.functional as F
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+from nanoquant.core.quantized_layers import (
+    pack_bits, unpack_bits, pack_2bit, unpack_2bit, replace_module, tied_parameter_ids
+)
+
+logger = logging.getLogger(__name__)
+
+SPARSE_LAYOUTS = ("bitmap", "csr", "n:m")
+
+# Layers with fewer zeros than this stay dense
+MIN_SPARSITY = 0.25
+
+# Below this density the CSR kernel beats a dense matmul on CPU
+SPARSE_MATMUL_DENSITY = 0.2
+
+
+def _round_up(value: int, multiple: int) -> int:
+    return (value + multiple - 1) // multiple * multiple
+
+
+def _index_dtype(limit: int) -> torch.dtype:
+    return torch.int16 if limit <= torch.iinfo(torch.int16).max else torch.int32
+
+
+def parse_pattern(pattern: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse an N:M pattern such as "2:4" (keep N of every M weights)"""
+    if not pattern:
+        return None
+    n, m = (int(part) for part in pattern.split(":"))
+    if not 0 < n < m <= 4:
+        raise ValueError(f"Unsupported N:M pattern {pattern}: need 0 < N < M <= 4")
+    return n, m
+
+
+def matches_pattern(weight: torch.Tensor, n: int, m: int) -> bool:
+    """Whether every group of m consecutive weights in a row has at most n non-zeros"""
+    if weight.shape[1] % m:
+        return False
+    return bool(((weight != 0).reshape(weight.shape[0], -1, m).sum(dim=-1) <= n).all())
+
+
+class SparseLinear(torch.nn.Module):
+    """
+    Linear layer storing only the surviving weights of a pruned matrix.
+
+    - bitmap: one bit per weight plus the non-zero values, smallest at moderate sparsity
+    - csr: row pointers, column indices and values, smallest at very high sparsity
+    - n:m: N values and their 2-bit positions for every M consecutive weights (e.g. 2:4)
+
+    Very sparse layers run through the CSR kernel; the rest rebuild the dense weight.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True,
+                 layout: str = "bitmap", nnz: int = 0, n: int = 2, m: int = 4,
+                 dtype: torch.dtype = torch.float16):
+        super().__init__()
+        if layout not in SPARSE_LAYOUTS:
+            raise ValueError(f"Unknown sparse layout: {layout}")
+
+        self.in_features = in_features
+        self.out_features = out_features
+        self.layout = layout
+        self.nnz = nnz
+        self.n, self.m = n, m
+        self._csr_cache = None
+
+        if layout == "bitmap":
+            self.register_buffer(
+                "mask_plane",
+                torch.zeros(out_features, _round_up(in_features, 8) // 8, dtype=torch.uint8)
+            )
+            self.register_buffer("values", torch.zeros(nnz, dtype=dtype))
+        elif layout == "csr":
+            self.register_buffer("crow_indices", torch.zeros(out_features + 1, dtype=torch.int32))
+            self.register_buffer("col_indices", torch.zeros(nnz, dtype=_index_dtype(in_features)))
+            self.register_buffer("values", torch.zeros(nnz, dtype=dtype))
+        else:
+            if in_features % m:
+                raise ValueError(f"in_features={in_features} is not a multiple of M={m}")
+            kept = out_features * (in_features // m) * n
+            self.nnz = kept
+            self.register_buffer("values", torch.zeros(out_features, in_features // m * n, dtype=dtype))
+            self.register_buffer("positions", torch.zeros((kept + 3) // 4, dtype=torch.uint8))
+
+        if bias:
+            self.bias = torch.nn.Parameter(torch.zeros(out_features, dtype=dtype), requires_grad=False)
+        else:
+            self.register_parameter("bias", None)
+
+    @classmethod
+    def from_weight(cls, weight: torch.Tensor, bias: Optional[torch.Tensor], layout: str = "auto",
+                    pattern: Optional[Tuple[int, int]] = None) -> "SparseLinear":
+        """Store the non-zero entries of a [out_features, in_features] weight matrix"""
+        out_features, in_features = weight.shape
+        nonzero = weight != 0
+        nnz = int(nonzero.sum().item())
+        if layout == "auto":
+            layout = choose_layout(weight, nnz, pattern)
+        n, m = pattern or (2, 4)
+
+        layer = cls(in_features, out_features, bias=bias is not None, layout=layout,
+                    nnz=nnz, n=n, m=m, dtype=weight.dtype).to(weight.device)
+        with torch.no_grad():
+            if layout == "bitmap":
+                padded = F.pad(nonzero, (0, layer.mask_plane.shape[1] * 8 - in_features))
+                layer.mask_plane.copy_(pack_bits(padded))
+                layer.values.copy_(weight[nonzero])
+            elif layout == "csr":
+                csr = weight.to_sparse_csr()
+                layer.crow_indices.copy_(csr.crow_indices())
+                layer.col_indices.copy_(csr.col_indices())
+                layer.values.copy_(csr.values())
+            else:
+                if not matches_pattern(weight, n, m):
+                    raise ValueError(f"Weight does not follow the {n}:{m} sparsity pattern")
+                groups = weight.reshape(out_features, -1, m)
+                # Keep the n largest-magnitude slots of every group, in position order
+                positions = torch.topk(groups.abs(), n, dim=-1).indices.sort(dim=-1).values
+                layer.values.copy_(torch.gather(groups, -1, positions).reshape(out_features, -1))
+                layer.positions.copy_(pack_2bit(positions.flatten().to(torch.uint8)))
+            if bias is not None:
+                layer.bias.data = bias.to(weight.dtype)
+        return layer
+
+    def to_dense(self) -> torch.Tensor:
+        """Rebuild the dense [out_features, in_features] weight matrix"""
+        if self.layout == "bitmap":
+            mask = unpack_bits(self.mask_plane)[:, :self.in_features]
+            weight = torch.zeros(mask.shape, dtype=self.values.dtype, device=self.values.device)
+            return weight.masked_scatter(mask, self.values)
+        if self.layout == "csr":
+            return self._csr().to_dense()
+
+        positions = unpack_2bit(self.positions, self.nnz).long().reshape(self.out_features, -1, self.n)
+        groups = torch.zeros(self.out_features, self.in_features // self.m, self.m,
+                             dtype=self.values.dtype, device=self.values.device)
+        groups.scatter_(-1, positions, self.values.reshape(self.out_features, -1, self.n))
+        return groups.reshape(self.out_features, self.in_features)
+
+    def density(self) -> float:
+        return self.nnz / max(1, self.in_features * self.out_features)
+
+    def _csr(self) -> torch.Tensor:
+        # Version counters change on in-place writes such as load_state_dict's copies
+        key = tuple((tensor.data_ptr(), tensor._version)
+                    for tensor in (self.crow_indices, self.col_indices, self.values))
+        if self._csr_cache is None or self._csr_cache[0] != key:
+            csr = torch.sparse_csr_tensor(
+                self.crow_indices, self.col_indices.to(torch.int32), self.values,
+                (self.out_features, self.in_features), check_invariants=False
+            )
+            self._csr_cache = (key, csr)
+        return self._csr_cache[1]
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        if (self.layout == "csr" and self.density() <= SPARSE_MATMUL_DENSITY
+                and x.dtype == self.values.dtype and x.dtype == torch.float32):
+            flat = x.reshape(-1, self.in_features)
+            output = (self._csr() @ flat.t()).t().reshape(*x.shape[:-1], self.out_features)
+            return output + bias if bias is not None else output
+        return F.linear(x, self.to_dense().to(x.dtype), bias)
+
+    def packed_config(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this layer before loading its state"""
+        return {
+            "scheme": "sparse",
+            "layout": self.layout,
+            "in_features": self.in_features,
+            "out_features": self.out_features,
+            "bias": self.bias is not None,
+            "nnz": self.nnz,
+            "n": self.n,
+            "m": self.m,
+            "dtype": str(self.values.dtype).replace("torch.", ""),
+        }
+
+    def extra_repr(self) -> str:
+        return (f"in_features={self.in_features}, out_features={self.out_features}, "
+                f"layout={self.layout}, density={self.density():.3f}")
+
+
+def storage_bytes(layout: str, weight: torch.Tensor, nnz: int, n: int = 2, m: int = 4) -> int:
+    """Bytes a layout needs for a weight matrix with nnz non-zeros"""
+    out_features, in_features = weight.shape
+    value_bytes = weight.element_size()
+    if layout == "bitmap":
+        return out_features * _round_up(in_features, 8) // 8 + nnz * value_bytes
+    if layout == "csr":
+        index_bytes = torch.tensor([], dtype=_index_dtype(in_features)).element_size()
+        return (out_features + 1) * 4 + nnz * (value_bytes + index_bytes)
+    kept = out_features * in_features // m * n
+    return kept * value_bytes + (kept + 3) // 4
+
+
+def choose_layout(weight: torch.Tensor, nnz: int, pattern: Optional[Tuple[int, int]] = None) -> str:
+    """The smallest layout for a weight matrix; N:M wins ties as it maps to sparse tensor cores"""
+    candidates = ["bitmap", "csr"]
+    n, m = pattern or (2, 4)
+    if matches_pattern(weight, n, m):
+        candidates.insert(0, "n:m")
+    return min(candidates, key=lambda layout: storage_bytes(layout, weight, nnz, n, m))
+
+
+def materialize_sparse_layers(model: torch.nn.Module, min_sparsity: float = MIN_SPARSITY,
+                              layout: str = "auto", pattern: Optional[Tuple[int, int]] = None,
+                              dtype: Optional[torch.dtype] = None) -> torch.nn.Module:
+    """Replace every Linear with at least min_sparsity zeros by a SparseLinear (values in dtype)"""
+    tied = tied_parameter_ids(model)
+    converted = 0
+    dense_bytes = sparse_bytes = 0
+    for name, module in list(model.named_modules()):
+        if not isinstance(module, torch.nn.Linear) or id(module.weight) in tied:
+            continue
+        weight = module.weight.data
+        sparsity = (weight == 0).float().mean().item()
+        if sparsity < min_sparsity:
+            continue
+
+        bias = module.bias.data if module.bias is not None else None
+        if dtype is not None:
+            weight = weight.to(dtype)
+            bias = bias.to(dtype) if bias is not None else None
+        sparse = SparseLinear.from_weight(weight, bias, layout, pattern)
+        replace_module(model, name, sparse)
+        converted += 1
+        dense_bytes += weight.numel() * weight.element_size()
+        sparse_bytes += sum(buffer.numel() * buffer.element_size() for buffer in sparse.buffers())
+
+    if converted:
+        logger.info(f"Stored {converted} pruned layers in sparse form: "
+                    f"{dense_bytes / 2**20:.1f} MiB -> {sparse_bytes / 2**20:.1f} MiB")
+    return model
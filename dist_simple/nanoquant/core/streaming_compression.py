@@ -0,0 +1,234 @@
+"""
+Streaming Compression for NanoQuant
+Compresses safetensors checkpoints one decoder block at a time without loading the whole model
+"""
+import os
+import re
+import gc
+import copy
+import json
+import shutil
+import torch
+from typing import Dict, Any, List, Optional
+import logging
+
+from nanoquant.core.quantized_layers import QUANTIZATION_MANIFEST, quantized_modules_manifest, dequantized_dynamic_state
+from nanoquant.core.sparse_layers import materialize_sparse_layers
+from nanoquant.core.lazy_tensors import LazyStateDict, load_weight_map
+from nanoquant.core.shard_io import write_shard, write_index
+
+logger = logging.getLogger(__name__)
+
+# Matches the repeated decoder blocks of common architectures
+# (model.layers.N, transformer.h.N, model.decoder.layers.N, ...)
+BLOCK_PATTERN = re.compile(r"^(.*?\.(?:layers|h|blocks|block)\.\d+)\.")
+
+# Non-weight files copied as-is into every compressed checkpoint
+PASSTHROUGH_FILES = (
+    "config.json",
+    "generation_config.json",
+    "tokenizer.json",
+    "tokenizer.model",
+    "tokenizer_config.json",
+    "special_tokens_map.json",
+    "chat_template.jinja",
+)
+
+
+class StreamingCompressor:
+    """
+    Compress a checkpoint block by block.
+
+    The architecture is instantiated on the meta device, so only the block currently
+    being compressed ever holds real tensors. Each block is read from its safetensors
+    shards, run through the engine's weight-only steps, written as its own output
+    shard and freed before the next block is loaded.
+    """
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+            engine = UltraAdvancedCompressionEngine()
+        self.engine = engine
+
+    def compress_checkpoint(self, checkpoint_dir: str, output_dir: str,
+                            compression_config: Dict[str, Any],
+                            device: Optional[torch.device] = None,
+                            level: Optional[str] = None, run_checkpoint=None) -> Dict[str, Any]:
+        """
+        Compress the checkpoint in checkpoint_dir into output_dir; level labels the
+        progress events, one step per block, reported to the engine's tracker. With a
+        RunCheckpoint every written block is recorded under level, and blocks recorded
+        by an interrupted run are kept instead of being compressed again.
+        """
+        device = device or torch.device("cpu")
+        weight_map = self._load_weight_map(checkpoint_dir)
+        skeleton = self._build_skeleton(checkpoint_dir)
+        groups = self._group_modules(skeleton, weight_map)
+
+        if "lora" in compression_config:
+            logger.info("Skipping LoRA in streaming mode: it needs the full model in memory")
+
+        os.makedirs(output_dir, exist_ok=True)
+        output_weight_map = {}
+        checksums = {}
+        manifest = {}
+        total_size = 0
+        peak_group_bytes = 0
+
+        with LazyStateDict(checkpoint_dir, weight_map) as reader:
+            for index, (group_name, module_names) in enumerate(groups):
+                shard_name = f"model-{index + 1:05d}-of-{len(groups):05d}.safetensors"
+                logger.info(f"Streaming block {index + 1}/{len(groups)}: {group_name}")
+                if self.engine.progress is not None:
+                    self.engine.progress.begin_step("compress", level=level, block=index, num_blocks=len(groups))
+
+                record = run_checkpoint.completed_block(level or "", index, output_dir) if run_checkpoint else None
+                if record is not None:
+                    logger.info(f"Block {index + 1} already written to {shard_name}, skipping")
+                    checksums[shard_name] = record["checksum"]
+                    total_size += record["size"]
+                    output_weight_map.update({key: shard_name for key in record["keys"]})
+                    manifest.update(record["manifest"])
+                    continue
+
+                container, source_dtype, group_bytes = self._materialize(skeleton, module_names, reader)
+                peak_group_bytes = max(peak_group_bytes, group_bytes)
+
+                container = self.engine.compress_module(container, compression_config, device)
+                materialize_sparse_layers(container, dtype=source_dtype)
+                block_manifest = quantized_modules_manifest(container)
+                manifest.update(block_manifest)
+
+                state_dict = self._export_state(container, source_dtype)
+                size, checksums[shard_name] = write_shard(state_dict, os.path.join(output_dir, shard_name))
+                total_size += size
+                output_weight_map.update({key: shard_name for key in state_dict})
+                if run_checkpoint is not None:
+                    run_checkpoint.complete_block(level or "", index, {
+                        "shard_name": shard_name, "size": size, "checksum": checksums[shard_name],
+                        "file_size": os.path.getsize(os.path.join(output_dir, shard_name)),
+                        "keys": list(state_dict), "manifest": block_manifest
+                    })
+
+                del container, state_dict
+                gc.collect()
+
+        write_index(output_dir, output_weight_map, total_size, checksums)
+
+        if manifest:
+            with open(os.path.join(output_dir, QUANTIZATION_MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2)
+
+        for file_name in PASSTHROUGH_FILES:
+            source = os.path.join(checkpoint_dir, file_name)
+            if os.path.exists(source):
+                shutil.copy2(source, os.path.join(output_dir, file_name))
+
+        logger.info(f"Streaming compression finished: {len(groups)} shards, "
+                    f"{total_size / 1e6:.1f} MB written, largest block {peak_group_bytes / 1e6:.1f} MB")
+
+        return {
+            "path": output_dir,
+            "num_shards": len(groups),
+            "total_size": total_size,
+            "peak_block_bytes": peak_group_bytes
+        }
+
+    def count_blocks(self, checkpoint_dir: str) -> int:
+        """Number of blocks (and output shards) compress_checkpoint produces for checkpoint_dir"""
+        weight_map = self._load_weight_map(checkpoint_dir)
+        return len(self._group_modules(self._build_skeleton(checkpoint_dir), weight_map))
+
+    def _load_weight_map(self, checkpoint_dir: str) -> Dict[str, str]:
+        """Map every tensor name to the shard file that holds it"""
+        try:
+            return load_weight_map(checkpoint_dir)
+        except ValueError:
+            raise ValueError(f"Streaming compression requires a safetensors checkpoint in {checkpoint_dir}")
+
+    def _build_skeleton(self, checkpoint_dir: str) -> torch.nn.Module:
+        """Instantiate the architecture without allocating any weights"""
+        from transformers import AutoConfig, AutoModelForCausalLM
+
+        config = AutoConfig.from_pretrained(checkpoint_dir, trust_remote_code=True)
+        with torch.device("meta"):
+            return AutoModelForCausalLM.from_config(config, trust_remote_code=True)
+
+    def _group_modules(self, skeleton: torch.nn.Module,
+                       weight_map: Dict[str, str]) -> List:
+        """
+        Split the modules holding checkpoint tensors into decoder blocks plus one
+        group for everything outside them (embeddings, final norm, lm_head)
+        """
+        blocks = {}
+        rest = []
+        for name, module in skeleton.named_modules():
+            tensor_names = [f"{name}.{key}" for key, _ in module.named_parameters(recurse=False)]
+            tensor_names += [f"{name}.{key}" for key, _ in module.named_buffers(recurse=False)]
+            if not name or not any(tensor_name in weight_map for tensor_name in tensor_names):
+                continue
+
+            match = BLOCK_PATTERN.match(name + ".")
+            if match:
+                blocks.setdefault(match.group(1), []).append(name)
+            else:
+                rest.append(name)
+
+        groups = list(blocks.items())
+        if rest:
+            groups.append(("non-block modules", rest))
+        return groups
+
+    def _materialize(self, skeleton: torch.nn.Module, module_names: List[str],
+                     reader: LazyStateDict):
+        """Load the tensors of one group into a container that mirrors the full model's names"""
+        container = torch.nn.Module()
+        tensors = {}
+        for name in module_names:
+            # Copy the meta module so the skeleton itself never holds real tensors
+            module = copy.deepcopy(skeleton.get_submodule(name))
+            _attach(container, name, module)
+            for key, _ in list(module.named_parameters(recurse=False)) + list(module.named_buffers(recurse=False)):
+                full_name = f"{name}.{key}"
+                if full_name in reader:
+                    tensors[full_name] = reader[full_name]
+
+        source_dtype = next(
+            (tensor.dtype for tensor in tensors.values() if tensor.is_floating_point()),
+            torch.float32
+        )
+        group_bytes = sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+        container.load_state_dict(tensors, strict=False, assign=True)
+        # Compression math (quantiles, SVD) needs full precision
+        for module in container.modules():
+            for key, param in list(module.named_parameters(recurse=False)):
+                if param.is_floating_point() and not param.is_meta:
+                    setattr(module, key, torch.nn.Parameter(param.float(), requires_grad=False))
+
+        return container, source_dtype, group_bytes
+
+    def _export_state(self, container: torch.nn.Module, source_dtype: torch.dtype) -> Dict[str, torch.Tensor]:
+        """Collect the compressed tensors, cast back to the checkpoint dtype"""
+        state_dict = {}
+        for key, tensor in container.state_dict().items():
+            if not isinstance(tensor, torch.Tensor) or tensor.is_meta:
+                continue
+            if tensor.dtype == torch.float32:
+                tensor = tensor.to(source_dtype)
+            state_dict[key] = tensor.contiguous()
+
+        # Dynamically quantized (8-bit) Linear layers are written back as dequantized weights
+        return dequantized_dynamic_state(container, state_dict, source_dtype)
+
+
+def _attach(container: torch.nn.Module, name: str, module: torch.nn.Module):
+    """Register module under a dotted path, creating empty parents as needed"""
+    parent = container
+    *parents, child = name.split(".")
+    for part in parents:
+        if not hasattr(parent, part):
+            parent.add_module(part, torch.nn.Module())
+        parent = getattr(parent, part)
+    parent.add_module(child, module)
@@ -6,64 +6,42 @@ Handles user authentication, credit management, and subscription tiers
 import hashlib
 import secrets
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
-import json
-import os
 
 # Try to import cloud integration (optional)
 try:
-    from nanoquant.core.cloud_integration import CloudStorage
-    CLOUD_AVAILABLE = True
+    from nanoquant.core.cloud_integration import BOTO3_AVAILABLE as CLOUD_AVAILABLE, open_cloud_user_cache
 except ImportError:
     CLOUD_AVAILABLE = False
-    CloudStorage = None
+    open_cloud_user_cache = None
+
+from nanoquant.core.level_catalog import FREE_TRIALS_PER_LEVEL, access_key, access_vector
+from nanoquant.core.user_store import open_user_store
 
 logger = logging.getLogger(__name__)
 
 class UserManager:
-    def __init__(self, db_path: str = "./nanoquant_users.json"):
-        self.db_path = db_path
-        self.users = self._load_users()
-        self.coupons = self._load_coupons()
-        self.cloud_storage = CloudStorage() if CLOUD_AVAILABLE else None
-        
-    def _load_users(self) -> Dict[str, Any]:
-        """Load users from file or create empty database"""
-        if os.path.exists(self.db_path):
-            try:
-                with open(self.db_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading users: {e}")
-                return {}
-        return {
-            "users": {},
-            "coupons": {}
-        }
-    
-    def _load_coupons(self) -> Dict[str, Any]:
-        """Load coupons from the users database"""
-        return self.users.get("coupons", {})
-    
-    def _save_users(self):
-        """Save users to file"""
-        try:
-            with open(self.db_path, 'w') as f:
-                json.dump(self.users, f, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving users: {e}")
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        db_path picks the storage backend, see open_user_store: SQLite by default, or
+        the legacy JSON file for a .json path
+        """
+        self.store = open_user_store(db_path)
+        self.db_path = self.store.db_path
+        # Cloud reads come from memory and cloud writes are batched in the background
+        self.cloud_storage = open_cloud_user_cache() if CLOUD_AVAILABLE else None
+
+    def _sync_to_cloud(self, user_id: str):
+        """Mirror the user's record to cloud storage if available"""
+        if self.cloud_storage:
+            self.cloud_storage.save_user_data(user_id, self.store.get_user(user_id))
     
     def register_user(self, email: str, password: str, social_id: str = None) -> Optional[str]:
         """
         Register a new user
         Returns user ID if successful, None if email already exists
         """
-        # Check if email already exists
-        for user_id, user_data in self.users.get("users", {}).items():
-            if user_data.get("email") == email:
-                return None
-        
         # Create new user
         user_id = secrets.token_hex(16)
         password_hash = self._hash_password(password) if password else None
@@ -79,11 +57,9 @@ class UserManager:
             "last_login": datetime.now().isoformat()
         }
         
-        if "users" not in self.users:
-            self.users["users"] = {}
-            
-        self.users["users"][user_id] = user_data
-        self._save_users()
+        # The store refuses an email that is already registered
+        if not self.store.create_user(user_id, user_data):
+            return None
         
         # Save to cloud if available
         if self.cloud_storage:
@@ -97,13 +73,14 @@ class UserManager:
         Authenticate a user with email and password
         Returns user ID if successful, None if authentication fails
         """
-        for user_id, user_data in self.users.get("users", {}).items():
-            if user_data.get("email") == email:
-                if user_data.get("password_hash") and self._verify_password(password, user_data.get("password_hash", "")):
-                    # Update last login
-                    self.users["users"][user_id]["last_login"] = datetime.now().isoformat()
-                    self._save_users()
-                    return user_id
+        user_id = self.store.find_user(email=email)
+        if user_id is None:
+            return None
+        user_data = self.store.get_user(user_id)
+        if user_data.get("password_hash") and self._verify_password(password, user_data.get("password_hash", "")):
+            # Update last login
+            self.store.update_user(user_id, {"last_login": datetime.now().isoformat()})
+            return user_id
         return None
     
     def authenticate_social_user(self, social_id: str, provider: str) -> Optional[str]:
@@ -111,12 +88,11 @@ class UserManager:
         Authenticate a user with social login
         Returns user ID if successful, None if authentication fails
         """
-        for user_id, user_data in self.users.get("users", {}).items():
-            if user_data.get("social_id") == social_id:
-                # Update last login
-                self.users["users"][user_id]["last_login"] = datetime.now().isoformat()
-                self._save_users()
-                return user_id
+        user_id = self.store.find_user(social_id=social_id)
+        if user_id is not None:
+            # Update last login
+            self.store.update_user(user_id, {"last_login": datetime.now().isoformat()})
+            return user_id
         
         # If user doesn't exist, create new user
         # In a real implementation, we would get user details from the social provider
@@ -127,17 +103,13 @@ class UserManager:
         Get user profile information
         """
         # Try to get from cloud first
-        if self.cloud_storage:
-            cloud_data = self.cloud_storage.get_user_data(user_id)
-            if cloud_data:
-                return cloud_data
-        
-        user_data = self.users.get("users", {}).get(user_id)
-        if not user_data:
+        profile = self.cloud_storage.get_user_data(user_id) if self.cloud_storage else None
+        if not profile:
+            profile = self.store.get_user(user_id)
+        if not profile:
             return None
             
-        # Return a copy without sensitive information
-        profile = user_data.copy()
+        # Return the profile without sensitive information, whichever copy it came from
         profile.pop("password_hash", None)
         return profile
     
@@ -145,36 +117,27 @@ class UserManager:
         """
         Get user's current credit balance
         """
-        user_data = self.users.get("users", {}).get(user_id)
+        user_data = self.store.get_user(user_id)
         if not user_data:
             return None
         return user_data.get("credits", 0)
+
+    def get_credit_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        User's most recent credit ledger entries, newest first
+        """
+        return self.store.credit_history(user_id, limit)
     
     def add_credits(self, user_id: str, credits: int, reason: str = "purchase") -> bool:
         """
         Add credits to user's account
         """
-        if user_id not in self.users.get("users", {}):
+        # The balance change and its ledger entry are written together
+        if self.store.adjust_credits(user_id, credits, reason) is None:
             return False
-            
-        current_credits = self.users["users"][user_id].get("credits", 0)
-        self.users["users"][user_id]["credits"] = current_credits + credits
-        
-        # Log the credit addition
-        if "credit_log" not in self.users["users"][user_id]:
-            self.users["users"][user_id]["credit_log"] = []
-            
-        self.users["users"][user_id]["credit_log"].append({
-            "amount": credits,
-            "reason": reason,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        self._save_users()
         
         # Update cloud storage if available
-        if self.cloud_storage:
-            self.cloud_storage.save_user_data(user_id, self.users["users"][user_id])
+        self._sync_to_cloud(user_id)
         
         return True
     
@@ -182,30 +145,12 @@ class UserManager:
         """
         Deduct credits from user's account
         """
-        if user_id not in self.users.get("users", {}):
-            return False
-            
-        current_credits = self.users["users"][user_id].get("credits", 0)
-        if current_credits < credits:
+        # Refused when the user does not exist or the balance is too low
+        if self.store.adjust_credits(user_id, -credits, reason) is None:
             return False
-            
-        self.users["users"][user_id]["credits"] = current_credits - credits
-        
-        # Log the credit deduction
-        if "credit_log" not in self.users["users"][user_id]:
-            self.users["users"][user_id]["credit_log"] = []
-            
-        self.users["users"][user_id]["credit_log"].append({
-            "amount": -credits,
-            "reason": reason,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        self._save_users()
         
         # Update cloud storage if available
-        if self.cloud_storage:
-            self.cloud_storage.save_user_data(user_id, self.users["users"][user_id])
+        self._sync_to_cloud(user_id)
         
         return True
     
@@ -213,46 +158,23 @@ class UserManager:
         """
         Check if user has access to a specific compression level
         """
-        user_data = self.users.get("users", {}).get(user_id)
+        return self.get_level_access(user_id).get(compression_level, False)
+
+    def get_level_access(self, user_id: str) -> Dict[str, bool]:
+        """
+        Access to every compression level for a user, from one profile read. The answer
+        is cached by tier, credits and trial usage, so any change to those is seen at once
+        """
+        user_data = self.store.get_user(user_id)
         if not user_data:
-            return False
-            
-        tier = user_data.get("tier", "free")
-        credits = user_data.get("credits", 0)
-        
-        # Define credit costs for different levels
-        level_costs = {
-            "light": 0,
-            "medium": 0,
-            "heavy": 10,
-            "extreme": 25,
-            "ultra": 50,
-            "nano": 100,
-            "atomic": 200,
-            "custom": 75
-        }
-        
-        cost = level_costs.get(compression_level, 0)
-        
-        # Free tier restrictions
-        if tier == "free":
-            free_levels = ["light", "medium"]
-            if compression_level not in free_levels:
-                # Check if user has any free trials left for paid levels
-                trials_used = self._get_trials_count(user_id, compression_level)
-                if trials_used >= 2:  # Limit to 2 trials
-                    return credits >= cost
-                # Allow trial usage
-                return True
-        
-        # Premium tier - check credits
-        return credits >= cost
+            return {}
+        return access_vector(access_key(user_data))
     
     def _get_trials_count(self, user_id: str, compression_level: str) -> int:
         """
         Get the number of trials a free user has used for a compression level
         """
-        user_data = self.users.get("users", {}).get(user_id)
+        user_data = self.store.get_user(user_id)
         if not user_data:
             return 0
             
@@ -263,15 +185,14 @@ class UserManager:
         """
         Increment trial usage counter for a free user
         """
-        if user_id not in self.users.get("users", {}):
-            return
-            
-        if "trial_usage" not in self.users["users"][user_id]:
-            self.users["users"][user_id]["trial_usage"] = {}
-            
-        current = self.users["users"][user_id]["trial_usage"].get(compression_level, 0)
-        self.users["users"][user_id]["trial_usage"][compression_level] = current + 1
-        self._save_users()
+        self.store.increment_trial(user_id, compression_level)
+
+    def use_trial(self, user_id: str, compression_level: str) -> bool:
+        """
+        Use one of a free user's trials of a paid level, if any are left; checking and
+        counting happen together, so concurrent jobs cannot share the last trial
+        """
+        return self.store.claim_trial(user_id, compression_level, FREE_TRIALS_PER_LEVEL)
     
     def create_coupon(self, credits: int, admin_key: str) -> Optional[str]:
         """
@@ -292,11 +213,7 @@ class UserManager:
             "used_at": None
         }
         
-        if "coupons" not in self.users:
-            self.users["coupons"] = {}
-            
-        self.users["coupons"][coupon_code] = coupon_data
-        self._save_users()
+        self.store.create_coupon(coupon_code, coupon_data)
         
         logger.info(f"New coupon created: {coupon_code} for {credits} credits")
         return coupon_code
@@ -305,33 +222,20 @@ class UserManager:
         """
         Redeem a coupon code for credits
         """
-        if user_id not in self.users.get("users", {}):
-            return False
-            
-        if coupon_code not in self.users.get("coupons", {}):
+        if self.store.get_user(user_id) is None:
             return False
             
-        coupon = self.users["coupons"][coupon_code]
-        
-        # Check if coupon is expired
-        expiration = datetime.fromisoformat(coupon.get("expires_at", ""))
-        if datetime.now() > expiration:
+        coupon = self.store.get_coupon(coupon_code)
+        if coupon is None:
             return False
             
-        # Check if coupon has already been used
-        if coupon.get("used_by") is not None:
+        # Claiming checks expiry and prior use and marks the coupon used in one step,
+        # so two concurrent redemptions cannot both succeed
+        if not self.store.claim_coupon(coupon_code, user_id):
             return False
             
         # Add credits to user
-        credits = coupon.get("credits", 0)
-        if self.add_credits(user_id, credits, f"coupon_{coupon_code}"):
-            # Mark coupon as used
-            self.users["coupons"][coupon_code]["used_by"] = user_id
-            self.users["coupons"][coupon_code]["used_at"] = datetime.now().isoformat()
-            self._save_users()
-            return True
-            
-        return False
+        return self.add_credits(user_id, coupon.get("credits", 0), f"coupon_{coupon_code}")
     
     def _hash_password(self, password: str) -> str:
         """Hash a password using SHA-256"""
@@ -0,0 +1,593 @@
+"""
+User Storage Backends for NanoQuant
+Where UserManager keeps users, coupons and the credit ledger: an indexed SQLite database or the legacy JSON file
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import logging
+
+from nanoquant.core.level_catalog import FREE_TRIALS_PER_LEVEL
+
+logger = logging.getLogger(__name__)
+
+# Environment variable read when no explicit database path is given
+USERS_DB_ENV_VAR = "NANOQUANT_USERS_DB"
+
+DEFAULT_USERS_DB = "./nanoquant_users.db"
+
+# File the JSON backend used to keep everything in; imported into a new SQLite database beside it
+LEGACY_USERS_JSON = "nanoquant_users.json"
+
+# Group commit: the ledger writer commits up to this many queued changes in one transaction,
+# waiting at most this many seconds for more to arrive after the first
+LEDGER_BATCH_SIZE = 256
+LEDGER_BATCH_DELAY = 0.002
+
+# Same tables as docker/init.sql, in SQLite types and keyed by the hex user IDs UserManager issues.
+# email is UNIQUE, which already indexes it
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT,
+    social_id TEXT,
+    credits INTEGER DEFAULT 100,
+    tier TEXT DEFAULT 'free',
+    created_at TIMESTAMP,
+    last_login TIMESTAMP,
+    compression_history TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_social_id ON users (social_id);
+CREATE TABLE IF NOT EXISTS coupons (
+    code TEXT PRIMARY KEY,
+    credits INTEGER NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    used_by TEXT,
+    used_at TIMESTAMP,
+    created_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS credit_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    reason TEXT,
+    created_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_credit_ledger_user_id ON credit_ledger (user_id, id);
+CREATE TABLE IF NOT EXISTS trial_usage (
+    user_id TEXT NOT NULL,
+    compression_level TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, compression_level)
+);
+"""
+
+USER_COLUMNS = ("email", "password_hash", "social_id", "credits", "tier", "created_at", "last_login",
+                "compression_history")
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _apply_credit_change(connection: sqlite3.Connection, user_id: str, amount: int, reason: str) -> Optional[int]:
+    # Compare-and-swap on the balance: the WHERE clause refuses a change that would take it below zero
+    cursor = connection.execute("UPDATE users SET credits = credits + ? WHERE id = ? AND credits + ? >= 0",
+                                (amount, user_id, amount))
+    if cursor.rowcount != 1:
+        return None
+    balance = connection.execute("SELECT credits FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    connection.execute(
+        "INSERT INTO credit_ledger (user_id, amount, balance, reason, created_at) VALUES (?, ?, ?, ?, ?)",
+        (user_id, amount, balance, reason, _now())
+    )
+    return balance
+
+
+def _apply_trial(connection: sqlite3.Connection, user_id: str, compression_level: str,
+                 limit: Optional[int] = None) -> bool:
+    connection.execute("INSERT OR IGNORE INTO trial_usage (user_id, compression_level, count) VALUES (?, ?, 0)",
+                       (user_id, compression_level))
+    cursor = connection.execute(
+        "UPDATE trial_usage SET count = count + 1 WHERE user_id = ? AND compression_level = ? AND count < ?",
+        (user_id, compression_level, limit if limit is not None else 2 ** 62)
+    )
+    return cursor.rowcount == 1
+
+
+class LedgerWriter:
+    """
+    The one thread of a process that changes balances and trial counts in a SQLite
+    user database.
+
+    Callers queue changes and wait on a Future. The writer drains the queue into
+    batches and commits each batch in a single immediate transaction, so one fsync
+    covers many changes (group commit) while each change still sees the effects of
+    the ones before it. Every change runs in its own savepoint, so a failing one only
+    fails its own caller. Other processes writing the same database are serialized
+    by SQLite's write lock, and the compare-and-swap updates keep their changes
+    correct against each other.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = LEDGER_BATCH_SIZE, batch_delay: float = LEDGER_BATCH_DELAY):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue: "queue.Queue" = queue.Queue()
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, name="credit-ledger-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, change, *args) -> Future:
+        """Queue change(connection, *args) and return a Future of its result"""
+        future = Future()
+        self.queue.put((change, args, future))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _next_batch(self) -> Optional[List]:
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                # Commit what was queued before the close, then stop
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        # Every commit is durable; group commit is what keeps that affordable
+        connection.execute("PRAGMA synchronous=FULL")
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._commit(connection, batch)
+        finally:
+            connection.close()
+
+    def _commit(self, connection: sqlite3.Connection, batch: List):
+        outcomes = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for change, args, _ in batch:
+                connection.execute("SAVEPOINT change")
+                try:
+                    outcomes.append((True, change(connection, *args)))
+                except Exception as e:
+                    connection.execute("ROLLBACK TO change")
+                    outcomes.append((False, e))
+                connection.execute("RELEASE change")
+            connection.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Credit ledger commit of {len(batch)} changes failed: {e}")
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            outcomes = [(False, e)] * len(batch)
+        self.batches += 1
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+class UserStore(ABC):
+    """
+    Storage interface behind UserManager; backends must implement every method.
+
+    Credits only change through adjust_credits, which applies the change and appends
+    it to the credit ledger together, and refuses to take a balance below zero.
+    Stores are shared by every UserManager of a process, see open_user_store, so
+    their changes are serialized in one place.
+    """
+
+    @abstractmethod
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's record, including password_hash and trial_usage, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_user(self, email: Optional[str] = None, social_id: Optional[str] = None) -> Optional[str]:
+        """ID of the user with the given email or social ID"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_user(self, user_id: str, user_data: Dict[str, Any]) -> bool:
+        """Insert a user; False if the email is already registered"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def adjust_credits(self, user_id: str, amount: int, reason: str) -> Optional[int]:
+        """Add amount (negative to deduct) and return the new balance, or None if refused"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def credit_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """The user's most recent ledger entries, newest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def increment_trial(self, user_id: str, compression_level: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_trial(self, user_id: str, compression_level: str, limit: int = FREE_TRIALS_PER_LEVEL) -> bool:
+        """Count one trial of compression_level unless limit are already used"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_coupon(self, code: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_coupon(self, code: str, coupon_data: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_coupon(self, code: str, user_id: str) -> bool:
+        """Mark an unused, unexpired coupon as used by user_id; False if someone got there first"""
+        raise NotImplementedError
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Users, coupons and the credit ledger in an embedded SQLite database.
+
+    Lookups go through the primary key or the email and social_id indexes, and every
+    change updates or appends single rows, so logins and credit changes stay cheap
+    however many users there are. Balance and trial changes go through the process's
+    LedgerWriter. Reads use a connection per thread and, in WAL mode, read a
+    committed snapshot without ever waiting for the writer.
+    """
+
+    def __init__(self, db_path: str, legacy_json: Optional[str] = None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writer: Optional[LedgerWriter] = None
+        self._writer_lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            empty = connection.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+        if empty and legacy_json and os.path.exists(legacy_json):
+            self.import_json(legacy_json)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit; multi-statement changes open their own transaction
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _snapshot(self):
+        """Reads that see one consistent committed state"""
+        connection = self._reader()
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        finally:
+            connection.execute("COMMIT")
+
+    def _write(self, change, *args):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = LedgerWriter(self.db_path)
+        return self._writer.submit(change, *args).result()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._snapshot() as connection:
+            row = connection.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            trials = connection.execute("SELECT compression_level, count FROM trial_usage WHERE user_id = ?",
+                                        (user_id,)).fetchall()
+        user = dict(row)
+        user.pop("id")
+        user["compression_history"] = json.loads(user["compression_history"] or "[]")
+        user["trial_usage"] = {trial["compression_level"]: trial["count"] for trial in trials}
+        return user
+
+    def find_user(self, email: Optional[str] = None, social_id: Optional[str] = None) -> Optional[str]:
+        column, value = ("email", email) if email is not None else ("social_id", social_id)
+        row = self._reader().execute(f"SELECT id FROM users WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+        return row["id"] if row else None
+
+    def create_user(self, user_id: str, user_data: Dict[str, Any]) -> bool:
+        values = dict(user_data, compression_history=json.dumps(user_data.get("compression_history", [])))
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    f"INSERT INTO users (id, {', '.join(USER_COLUMNS)}) VALUES (?{', ?' * len(USER_COLUMNS)})",
+                    (user_id, *(values.get(column) for column in USER_COLUMNS))
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        # Balances only change through adjust_credits, which records them in the ledger
+        fields = {column: value for column, value in fields.items() if column in USER_COLUMNS and column != "credits"}
+        if "compression_history" in fields:
+            fields["compression_history"] = json.dumps(fields["compression_history"])
+        if not fields:
+            return False
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._connect() as connection:
+            cursor = connection.execute(f"UPDATE users SET {assignments} WHERE id = ?", (*fields.values(), user_id))
+            return cursor.rowcount == 1
+
+    def adjust_credits(self, user_id: str, amount: int, reason: str) -> Optional[int]:
+        return self._write(_apply_credit_change, user_id, amount, reason)
+
+    def credit_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._reader().execute(
+            "SELECT amount, balance, reason, created_at AS timestamp FROM credit_ledger "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def increment_trial(self, user_id: str, compression_level: str) -> int:
+        self._write(_apply_trial, user_id, compression_level)
+        return self.get_user(user_id)["trial_usage"].get(compression_level, 0)
+
+    def claim_trial(self, user_id: str, compression_level: str, limit: int = FREE_TRIALS_PER_LEVEL) -> bool:
+        return self._write(_apply_trial, user_id, compression_level, limit)
+
+    def get_coupon(self, code: str) -> Optional[Dict[str, Any]]:
+        row = self._reader().execute("SELECT * FROM coupons WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            return None
+        coupon = dict(row)
+        coupon.pop("code")
+        return coupon
+
+    def create_coupon(self, code: str, coupon_data: Dict[str, Any]):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO coupons (code, credits, expires_at, used_by, used_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (code, coupon_data["credits"], coupon_data["expires_at"], coupon_data.get("used_by"),
+                 coupon_data.get("used_at"), _now())
+            )
+
+    def claim_coupon(self, code: str, user_id: str) -> bool:
+        now = _now()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE coupons SET used_by = ?, used_at = ? WHERE code = ? AND used_by IS NULL AND expires_at >= ?",
+                (user_id, now, code, now)
+            )
+            return cursor.rowcount == 1
+
+    def import_json(self, path: str) -> int:
+        """Copy users, coupons, credit logs and trial counts from a JSON backend file"""
+        with open(path, "r") as f:
+            data = json.load(f)
+        users = data.get("users", {})
+        with self._transaction() as connection:
+            for user_id, user in users.items():
+                connection.execute(
+                    f"INSERT OR IGNORE INTO users (id, {', '.join(USER_COLUMNS)}) VALUES (?{', ?' * len(USER_COLUMNS)})",
+                    (user_id, *(json.dumps(user.get(column, [])) if column == "compression_history"
+                                else user.get(column) for column in USER_COLUMNS))
+                )
+                # The log only holds changes, so balances are rebuilt backwards from the current one
+                balance = user.get("credits", 0)
+                entries = []
+                for entry in reversed(user.get("credit_log", [])):
+                    entries.append((user_id, entry["amount"], balance, entry.get("reason"), entry.get("timestamp")))
+                    balance -= entry["amount"]
+                connection.executemany(
+                    "INSERT INTO credit_ledger (user_id, amount, balance, reason, created_at) VALUES (?, ?, ?, ?, ?)",
+                    reversed(entries)
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO trial_usage (user_id, compression_level, count) VALUES (?, ?, ?)",
+                    [(user_id, level, count) for level, count in user.get("trial_usage", {}).items()]
+                )
+            for code, coupon in data.get("coupons", {}).items():
+                connection.execute(
+                    "INSERT OR IGNORE INTO coupons (code, credits, expires_at, used_by, used_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (code, coupon["credits"], coupon["expires_at"], coupon.get("used_by"), coupon.get("used_at"), _now())
+                )
+        logger.info(f"Imported {len(users)} users from {path} into {self.db_path}")
+        return len(users)
+
+
+def _locked(method):
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class JsonUserStore(UserStore):
+    """
+    Everything in one JSON file, rewritten on every change, with linear scans by
+    email. Kept for existing deployments that point UserManager at a .json path.
+    Changes are serialized by a lock within the process; the file cannot be shared
+    safely between processes, which needs the SQLite backend.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.data = {"users": {}, "coupons": {}}
+        if os.path.exists(db_path):
+            try:
+                with open(db_path, "r") as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading users: {e}")
+        self.data.setdefault("users", {})
+        self.data.setdefault("coupons", {})
+
+    def _save(self):
+        try:
+            with open(self.db_path, "w") as f:
+                json.dump(self.data, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving users: {e}")
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user = self.data["users"].get(user_id)
+        if user is None:
+            return None
+        user = dict(user, trial_usage=dict(user.get("trial_usage", {})))
+        user.pop("credit_log", None)
+        return user
+
+    def find_user(self, email: Optional[str] = None, social_id: Optional[str] = None) -> Optional[str]:
+        column, value = ("email", email) if email is not None else ("social_id", social_id)
+        for user_id, user in self.data["users"].items():
+            if user.get(column) == value:
+                return user_id
+        return None
+
+    @_locked
+    def create_user(self, user_id: str, user_data: Dict[str, Any]) -> bool:
+        if self.find_user(email=user_data["email"]) is not None:
+            return False
+        self.data["users"][user_id] = dict(user_data)
+        self._save()
+        return True
+
+    @_locked
+    def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        if user_id not in self.data["users"]:
+            return False
+        self.data["users"][user_id].update({column: value for column, value in fields.items() if column != "credits"})
+        self._save()
+        return True
+
+    @_locked
+    def adjust_credits(self, user_id: str, amount: int, reason: str) -> Optional[int]:
+        user = self.data["users"].get(user_id)
+        if user is None or user.get("credits", 0) + amount < 0:
+            return None
+        user["credits"] = user.get("credits", 0) + amount
+        user.setdefault("credit_log", []).append({"amount": amount, "reason": reason, "timestamp": _now()})
+        self._save()
+        return user["credits"]
+
+    def credit_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        user = self.data["users"].get(user_id, {})
+        return list(reversed(user.get("credit_log", [])))[:limit]
+
+    @_locked
+    def increment_trial(self, user_id: str, compression_level: str) -> int:
+        user = self.data["users"].get(user_id)
+        if user is None:
+            return 0
+        trials = user.setdefault("trial_usage", {})
+        trials[compression_level] = trials.get(compression_level, 0) + 1
+        self._save()
+        return trials[compression_level]
+
+    @_locked
+    def claim_trial(self, user_id: str, compression_level: str, limit: int = FREE_TRIALS_PER_LEVEL) -> bool:
+        user = self.data["users"].get(user_id)
+        if user is None or user.get("trial_usage", {}).get(compression_level, 0) >= limit:
+            return False
+        self.increment_trial(user_id, compression_level)
+        return True
+
+    def get_coupon(self, code: str) -> Optional[Dict[str, Any]]:
+        coupon = self.data["coupons"].get(code)
+        return dict(coupon) if coupon is not None else None
+
+    @_locked
+    def create_coupon(self, code: str, coupon_data: Dict[str, Any]):
+        self.data["coupons"][code] = dict(coupon_data)
+        self._save()
+
+    @_locked
+    def claim_coupon(self, code: str, user_id: str) -> bool:
+        coupon = self.data["coupons"].get(code)
+        if coupon is None or coupon.get("used_by") is not None:
+            return False
+        if datetime.now() > datetime.fromisoformat(coupon["expires_at"]):
+            return False
+        coupon["used_by"] = user_id
+        coupon["used_at"] = _now()
+        self._save()
+        return True
+
+
+_stores: Dict[str, UserStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_user_store(db_path: Optional[str] = None) -> UserStore:
+    """
+    The store at db_path, or NANOQUANT_USERS_DB, or DEFAULT_USERS_DB: a .json path
+    keeps the legacy JSON backend, anything else is SQLite. A new SQLite database
+    imports the legacy nanoquant_users.json found beside it.
+
+    Every caller in a process gets the same store for the same path, so the API and
+    each CompressionPipeline share one ledger writer instead of racing each other.
+    """
+    db_path = db_path or os.getenv(USERS_DB_ENV_VAR, DEFAULT_USERS_DB)
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        if key not in _stores:
+            if db_path.endswith(".json"):
+                _stores[key] = JsonUserStore(db_path)
+            else:
+                legacy_json = os.path.join(os.path.dirname(db_path) or ".", LEGACY_USERS_JSON)
+                _stores[key] = SQLiteUserStore(db_path, legacy_json=legacy_json)
+        return _stores[key]
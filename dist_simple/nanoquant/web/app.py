@@ -401,15 +401,41 @@ def start_compression(model_id, compression_level, preserve_super_weights, push_
         response = requests.post(f"{API_BASE_URL}/compression/start", 
                                 json=payload,
                                 headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
+        if response.status_code != 200:
             st.error(f"Compression failed: {response.json().get('detail', 'Unknown error')}")
             return None
+        return wait_for_compression(response.json()["job_id"], headers)
     except Exception as e:
         st.error(f"Error during compression: {e}")
         return None
 
+def wait_for_compression(job_id, headers):
+    """Follow a queued compression job's progress events until it finishes and return its result"""
+    from nanoquant.core.progress import read_sse, describe
+
+    status_text = st.empty()
+    progress_bar = st.progress(0.0)
+    final = None
+    with requests.get(f"{API_BASE_URL}/compression/jobs/{job_id}/events", headers=headers,
+                      stream=True, timeout=(10, None)) as response:
+        if response.status_code != 200:
+            st.error(f"Lost track of compression job {job_id}: {response.json().get('detail', 'Unknown error')}")
+            return None
+        for event_type, event in read_sse(response.iter_lines(decode_unicode=True)):
+            if event_type == "end":
+                final = event
+                break
+            status_text.text(describe(event))
+            progress_bar.progress(min(1.0, event["progress"]))
+
+    if final is None or final["status"] != "completed":
+        error = final["error"] if final else "the event stream closed early"
+        st.error(f"Compression failed: {error}")
+        return None
+    progress_bar.progress(1.0)
+    response = requests.get(f"{API_BASE_URL}/compression/jobs/{job_id}/result", headers=headers)
+    return response.json()
+
 def get_compression_levels():
     """Get available compression levels"""
     if not st.session_state.user_token:
@@ -7,6 +7,8 @@ import time
 import os
 from pathlib import Path
 
+from nanoquant.core.level_catalog import level_catalog
+
 # Set page config
 st.set_page_config(
     page_title="NanoQuant - LLM Compression",
@@ -408,7 +410,8 @@ def main():
     with col2:
         compression_level = st.selectbox(
             "Compression Level", 
-            ["light", "medium", "heavy", "extreme", "ultra", "nano", "atomic"],
+            list(level_catalog()["levels"]),
+            format_func=lambda level: f"{level} ({level_catalog()['levels'][level]['size_reduction']})",
             help="Select the compression level"
         )
     
@@ -54,6 +54,33 @@ IF NOT EXISTS payments
     completed_at TIMESTAMP
 );
 
+-- Create credit_ledger table (append-only record of every credit change)
+CREATE TABLE
+IF NOT EXISTS credit_ledger
+(
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users
+(id),
+    amount INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    reason VARCHAR
+(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create trial_usage table (free-tier trials used per paid level)
+CREATE TABLE
+IF NOT EXISTS trial_usage
+(
+    user_id INTEGER REFERENCES users
+(id),
+    compression_level VARCHAR
+(50) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY
+(user_id, compression_level)
+);
+
 -- Create compression_jobs table
 CREATE TABLE
 IF NOT EXISTS compression_jobs
@@ -71,7 +98,31 @@ IF NOT EXISTS compression_jobs
     completed_at TIMESTAMP,
     output_path VARCHAR
 (255),
-    credits_used INTEGER
+    credits_used INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    request TEXT,
+    progress REAL DEFAULT 0,
+    stage VARCHAR
+(100),
+    result TEXT,
+    error TEXT,
+    worker VARCHAR
+(255),
+    flight_key VARCHAR
+(64),
+    leader_id INTEGER REFERENCES compression_jobs
+(id)
+);
+
+-- Create compression_job_events table (progress events streamed to clients)
+CREATE TABLE
+IF NOT EXISTS compression_job_events
+(
+    id SERIAL PRIMARY KEY,
+    job_id INTEGER REFERENCES compression_jobs
+(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    event TEXT NOT NULL
 );
 
 -- Create indexes for better performance
@@ -82,6 +133,9 @@ CREATE INDEX
 IF NOT EXISTS idx_users_social_id ON users
 (social_id);
 CREATE INDEX
+IF NOT EXISTS idx_credit_ledger_user_id ON credit_ledger
+(user_id, id);
+CREATE INDEX
 IF NOT EXISTS idx_coupons_code ON coupons
 (code);
 CREATE INDEX
@@ -90,6 +144,15 @@ IF NOT EXISTS idx_payments_user_id ON payments
 CREATE INDEX
 IF NOT EXISTS idx_compression_jobs_user_id ON compression_jobs
 (user_id);
+CREATE INDEX
+IF NOT EXISTS idx_compression_jobs_status ON compression_jobs
+(status, id);
+CREATE INDEX
+IF NOT EXISTS idx_compression_jobs_flight_key ON compression_jobs
+(flight_key, status);
+CREATE INDEX
+IF NOT EXISTS idx_compression_job_events_job_id ON compression_job_events
+(job_id, id);
 
 -- Insert default admin user (in production, this should be done securely)
 INSERT INTO users
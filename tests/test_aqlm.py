@@ -0,0 +1,127 @@
+"""
+Tests for AQLM additive codebook quantization
+"""
+import unittest
+import sys
+import os
+import tempfile
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestAqlm(unittest.TestCase):
+    """Test cases for codebook learning, AqlmLinear and per-layer checkpoints"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.weight = torch.randn(64, 128) * 0.02
+        self.settings = {"codebook_bits": 6, "kmeans_iters": 5, "rounds": 2}
+
+    def relative_error(self, weight):
+        return (((weight.float() - self.weight) ** 2).sum() / (self.weight ** 2).sum()).item()
+
+    def test_codebooks_beat_scalar_rounding(self):
+        """Test that additive codebooks at ~1.5 bits beat 2-bit round-to-nearest"""
+        from nanoquant.core.aqlm import AqlmLinear
+        from nanoquant.core.quantized_layers import GroupQuantizedLinear
+
+        layer = AqlmLinear.from_weight(self.weight, None, **self.settings)
+        nearest = GroupQuantizedLinear.from_weight(self.weight, None, bits=2)
+        self.assertLess(self.relative_error(layer.dequantize()), 0.6 * self.relative_error(nearest.dequantize()))
+
+        initial = AqlmLinear.from_weight(self.weight, None, **dict(self.settings, rounds=0))
+        self.assertLess(self.relative_error(layer.dequantize()), self.relative_error(initial.dequantize()))
+
+    def test_lookup_forward_matches_decoded_weight(self):
+        """Test that the codebook-lookup path equals multiplying by the decoded weight"""
+        from nanoquant.core.aqlm import AqlmLinear
+
+        layer = AqlmLinear.from_weight(self.weight, torch.randn(64), **self.settings)
+        for rows in (2, 20):
+            inputs = torch.randn(rows, 128)
+            reference = torch.nn.functional.linear(inputs, layer.dequantize().float(), layer.bias.float())
+            self.assertTrue(torch.allclose(layer(inputs), reference, atol=1e-3))
+
+    def test_strategy_resumes_from_layer_checkpoints(self):
+        """Test that a rerun reloads finished layers and that the result rebuilds from the manifest"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.aqlm import AqlmLinear
+        from nanoquant.core import layer_kernels
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        def build():
+            torch.manual_seed(1)
+            model = torch.nn.Sequential(torch.nn.Linear(128, 64), torch.nn.Linear(64, 16))
+            model[0].weight.data = self.weight.clone()
+            return model
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            config = {"quantization": dict(self.settings, type="aqlm", checkpoint_dir=checkpoint_dir)}
+            model = UltraAdvancedCompressionEngine().compress_module(build(), config, torch.device("cpu"))
+            self.assertIsInstance(model[0], AqlmLinear)
+            self.assertEqual(len(os.listdir(checkpoint_dir)), 2)
+
+            params = dict(self.settings, checkpoint_dir=checkpoint_dir)
+            result = layer_kernels.aqlm_linear(self.weight, build()[0].bias.data, params,
+                                               layer_kernels.QuantileRequests())
+            self.assertTrue(result["resumed"])
+            self.assertTrue(torch.equal(result["module"].codes, model[0].codes))
+
+        inputs = torch.randn(3, 128)
+        rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+    def test_zero_rows_stay_finite(self):
+        """Test that all-zero rows, dense or pruned, decode and multiply to finite values"""
+        from nanoquant.core.aqlm import AqlmLinear
+
+        dense = self.weight.clone()
+        dense[3] = 0
+        pruned = dense.masked_fill(torch.rand(dense.shape) < 0.5, 0)
+        inputs = torch.randn(3, 128)
+        for weight in (dense, pruned):
+            layer = AqlmLinear.from_weight(weight, None, **self.settings)
+            self.assertTrue(bool(torch.isfinite(layer.dequantize()).all()))
+            self.assertTrue(bool(torch.isfinite(layer(inputs)).all()))
+            self.assertTrue(bool(torch.isfinite(layer(inputs.repeat(4, 1))).all()))
+        self.assertTrue(layer.pruned)
+        self.assertTrue(bool((layer.dequantize()[3] == 0).all()))
+
+    def test_ultra_level_keeps_pruning_and_decomposition(self):
+        """Test that the ultra level's AQLM codes keep its pruned zeros, CALR factors and super weights"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_catalog import level_catalog
+        from nanoquant.core.low_rank import LowRankLinear
+        from nanoquant.core.aqlm import AqlmLinear
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        def build():
+            torch.manual_seed(0)
+            return torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 128))
+
+        config = level_catalog()["levels"]["ultra"]["config"]
+        model = UltraAdvancedCompressionEngine().compress_module(build(), config, torch.device("cpu"))
+
+        for index in (0, 2):
+            self.assertIsInstance(model[index], LowRankLinear)
+            self.assertGreater(model[index].num_outliers, 0)
+            for factor in (model[index].down, model[index].up):
+                self.assertIsInstance(factor, AqlmLinear)
+                self.assertTrue(factor.pruned)
+                sparsity = (factor.dequantize() == 0).float().mean().item()
+                self.assertAlmostEqual(sparsity, config["pruning"]["ratio"], delta=0.05)
+
+        # Few rows would take the lookup path, which cannot drop pruned entries
+        inputs = torch.randn(2, 64)
+        expected = torch.nn.functional.linear(inputs, model[0].down.dequantize().float())
+        self.assertTrue(torch.allclose(model[0].down(inputs), expected, atol=1e-5))
+
+        rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests for the content-addressed compressed-artifact cache
+"""
+import unittest
+import sys
+import os
+import time
+import tempfile
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestArtifactCache(unittest.TestCase):
+    """Test cases for ArtifactCache and its use in CompressionPipeline"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.cache_dir = tempfile.mkdtemp()
+        self.work_dir = tempfile.mkdtemp()
+        # The pipeline's user database goes to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def make_artifact(self, name, size):
+        path = os.path.join(self.work_dir, name)
+        os.makedirs(path)
+        with open(os.path.join(path, "model-00001-of-00001.safetensors"), "wb") as f:
+            f.write(os.urandom(size))
+        with open(os.path.join(path, "config.json"), "w") as f:
+            f.write("{}")
+        return path
+
+    def test_hits_link_shards_and_evict_least_recently_used(self):
+        """Test that hits hardlink the shards and eviction drops the stalest entry"""
+        from nanoquant.core.artifact_cache import ArtifactCache, cache_key
+
+        cache = ArtifactCache(self.cache_dir, max_bytes=10000)
+        keys = [cache_key("org/model", "abc123", {"level": level}) for level in range(3)]
+        self.assertEqual(len(set(keys)), 3)
+        self.assertEqual(keys[0], cache_key("org/model", "abc123", {"level": 0}))
+
+        self.assertTrue(cache.store(keys[0], self.make_artifact("a", 4000)))
+        self.assertFalse(cache.store(keys[0], self.make_artifact("a2", 4000)))
+        time.sleep(0.01)
+        self.assertTrue(cache.store(keys[1], self.make_artifact("b", 4000)))
+
+        destination = os.path.join(self.work_dir, "out")
+        time.sleep(0.01)
+        self.assertTrue(cache.fetch(keys[0], destination))
+        shard = "model-00001-of-00001.safetensors"
+        self.assertTrue(os.path.samefile(os.path.join(destination, shard),
+                                         os.path.join(self.work_dir, "a", shard)))
+        self.assertFalse(os.path.samefile(os.path.join(destination, "config.json"),
+                                          os.path.join(self.work_dir, "a", "config.json")))
+
+        # keys[1] is now the least recently used and makes room for keys[2]
+        time.sleep(0.01)
+        cache.store(keys[2], self.make_artifact("c", 4000))
+        self.assertTrue(cache.contains(keys[0]))
+        self.assertFalse(cache.contains(keys[1]))
+        self.assertFalse(cache.fetch(keys[1], os.path.join(self.work_dir, "missing")))
+        self.assertLessEqual(cache.size(), 10000)
+
+    def test_pipeline_reuses_cached_levels(self):
+        """Test that a second request for the same revision and level skips compression"""
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+
+        checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        LlamaForCausalLM(config).save_pretrained(checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(checkpoint_dir)
+
+        runs = []
+        for output_name in ("first", "second"):
+            pipeline = CompressionPipeline(os.path.join(self.work_dir, output_name), cache_dir=self.cache_dir)
+            pipeline.generator.compression_levels = {
+                "light": {"description": "test level", "quantization": {"type": "4bit"}}
+            }
+            with patch.object(pipeline.ingestion, "ingest_model", wraps=pipeline.ingestion.ingest_model) as ingest:
+                result = pipeline.process_model(checkpoint_dir, push_to_ollama=False)
+            runs.append((ingest.call_count, result["generated_models"][0]["path"]))
+
+        self.assertEqual([calls for calls, _ in runs], [1, 0])
+        self.assertTrue(os.path.samefile(os.path.join(runs[0][1], "model-00001-of-00001.safetensors"),
+                                         os.path.join(runs[1][1], "model-00001-of-00001.safetensors")))
+
+if __name__ == '__main__':
+    unittest.main()
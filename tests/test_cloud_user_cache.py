@@ -0,0 +1,162 @@
+"""
+Tests for the cloud user-data cache
+"""
+import unittest
+import sys
+import os
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class LocalTable:
+    """Local stand-in for a DynamoDB table resource"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_item(self, Key):
+        self.db.reads += 1
+        item = self.db.items.get(Key["user_id"])
+        return {"Item": dict(item)} if item else {}
+
+class LocalDynamoDB:
+    """Local stand-in for the subset of the DynamoDB service resource CloudStorage uses"""
+
+    def __init__(self):
+        self.items = {}
+        self.reads = 0
+        self.batch_sizes = []
+        self.throttle = set()
+
+    def Table(self, name):
+        return LocalTable(self)
+
+    def batch_write_item(self, RequestItems):
+        (table_name, requests), = RequestItems.items()
+        self.batch_sizes.append(len(requests))
+        unprocessed = []
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            if item["user_id"] in self.throttle:
+                self.throttle.discard(item["user_id"])
+                unprocessed.append(request)
+            else:
+                self.items[item["user_id"]] = item
+        return {"UnprocessedItems": {table_name: unprocessed} if unprocessed else {}}
+
+class TestCloudUserCache(unittest.TestCase):
+    """Test cases for CloudUserCache over CloudStorage"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.db = LocalDynamoDB()
+        self.now = 1000.0
+        self.clock = lambda: self.now
+
+    def test_reads_hit_memory_and_writes_coalesce(self):
+        """Test read-through with bounded staleness and batched, coalesced writes"""
+        from nanoquant.core.cloud_integration import CloudStorage, CloudUserCache
+
+        self.db.items["alice"] = {"user_id": "alice", "credits": 100}
+        cache = CloudUserCache(CloudStorage(db_client=self.db), ttl=30, flush_interval=3600, clock=self.clock)
+        self.assertEqual(cache.get_user_data("alice")["credits"], 100)
+        self.assertEqual(cache.get_user_data("alice")["credits"], 100)
+        self.assertIsNone(cache.get_user_data("nobody"))
+        self.assertIsNone(cache.get_user_data("nobody"))
+        self.assertEqual(self.db.reads, 2)
+
+        for credits in range(90, 40, -10):
+            self.assertTrue(cache.save_user_data("alice", {"credits": credits}))
+        self.assertEqual(cache.get_user_data("alice")["credits"], 50)
+        self.assertEqual(self.db.batch_sizes, [])
+
+        # Another process changes the record; it shows once the cached copy is older than ttl
+        self.assertEqual(cache.flush(), 1)
+        self.assertEqual(self.db.batch_sizes, [1])
+        self.db.items["alice"]["credits"] = 75
+        self.now += 29
+        self.assertEqual(cache.get_user_data("alice")["credits"], 50)
+        self.now += 1
+        self.assertEqual(cache.get_user_data("alice")["credits"], 75)
+
+        for index in range(30):
+            cache.save_user_data(f"user-{index}", {"credits": index})
+        cache.close()
+        self.assertEqual(sum(self.db.batch_sizes[1:]), 30)
+        self.assertLessEqual(max(self.db.batch_sizes), 25)
+        self.assertEqual(self.db.items["user-29"]["credits"], 29)
+
+    def test_background_flush_retries_unprocessed_items(self):
+        """Test that the writer thread sends queued writes and retries throttled ones"""
+        from nanoquant.core.cloud_integration import CloudStorage, CloudUserCache
+
+        cache = CloudUserCache(CloudStorage(db_client=self.db), ttl=30, flush_interval=0.05)
+        self.db.throttle = {"bob"}
+        cache.save_user_data("bob", {"credits": 10})
+        cache.save_user_data("carol", {"credits": 20})
+
+        deadline = time.time() + 5
+        while "bob" not in self.db.items and time.time() < deadline:
+            time.sleep(0.01)
+        cache.close()
+        self.assertEqual(self.db.items["bob"]["credits"], 10)
+        self.assertEqual(self.db.items["carol"]["credits"], 20)
+        self.assertGreaterEqual(cache.batches, 2)
+        self.assertEqual(cache.pending, {})
+
+    def test_failed_writes_back_off_and_are_dropped(self):
+        """Test that writes failing every flush back off and are given up after a few attempts"""
+        from nanoquant.core.cloud_integration import CloudStorage, CloudUserCache, CLOUD_WRITE_MAX_ATTEMPTS
+
+        def unavailable(RequestItems):
+            raise RuntimeError("Unable to locate credentials")
+
+        self.db.batch_write_item = unavailable
+        cache = CloudUserCache(CloudStorage(db_client=self.db), ttl=30, flush_interval=1, clock=self.clock)
+        cache.save_user_data("dave", {"credits": 5})
+        for attempt in range(1, CLOUD_WRITE_MAX_ATTEMPTS):
+            self.assertEqual(cache.flush(), 0)
+            self.assertIn("dave", cache.pending)
+            self.assertEqual(cache._retry_delay(), 2 ** attempt)
+        cache.flush()
+        self.assertEqual(cache.pending, {})
+        self.assertEqual(cache.attempts, {})
+        cache.close()
+
+    def test_no_dynamodb_client_disables_cache(self):
+        """Test that without a DynamoDB client nothing is cached or queued"""
+        from unittest.mock import patch
+        from nanoquant.core import cloud_integration
+        from nanoquant.core.cloud_integration import CloudStorage, CloudUserCache
+
+        cache = CloudUserCache(CloudStorage(s3_client=object()), flush_interval=3600)
+        self.assertFalse(cache.save_user_data("erin", {"credits": 1, "password_hash": "x"}))
+        self.assertIsNone(cache.get_user_data("erin"))
+        self.assertEqual(cache.pending, {})
+        self.assertEqual(len(cache.entries), 0)
+        cache.close()
+
+        with patch.object(cloud_integration, "CloudStorage", lambda: CloudStorage(s3_client=object())), \
+                patch.object(cloud_integration, "_cloud_user_cache", None), \
+                patch.object(cloud_integration, "_cloud_user_cache_opened", False):
+            self.assertIsNone(cloud_integration.open_cloud_user_cache())
+
+    def test_cached_profiles_hide_password_hash(self):
+        """Test that profiles served from the cloud cache never include the password hash"""
+        import tempfile
+        from nanoquant.core.cloud_integration import CloudStorage, CloudUserCache
+        from nanoquant.core.user_management import UserManager
+
+        manager = UserManager(os.path.join(tempfile.mkdtemp(), "users.db"))
+        manager.cloud_storage = CloudUserCache(CloudStorage(db_client=self.db), flush_interval=3600)
+        user_id = manager.register_user("frank@example.com", "secret")
+        manager.add_credits(user_id, 10)
+
+        profile = manager.get_user_profile(user_id)
+        self.assertEqual(profile["credits"], 110)
+        self.assertNotIn("password_hash", profile)
+        manager.cloud_storage.close()
+
+if __name__ == '__main__':
+    unittest.main()
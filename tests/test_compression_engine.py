@@ -5,6 +5,7 @@ import unittest
 from unittest.mock import Mock, patch
 import sys
 import os
+import tempfile
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -14,7 +15,14 @@ class TestCompressionEngine(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures before each test method."""
-        pass
+        self.work_dir = tempfile.mkdtemp()
+        # Databases opened at their default paths go to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        from nanoquant.core.job_queue import JOBS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db"),
+                                              JOBS_DB_ENV_VAR: os.path.join(self.work_dir, "jobs.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
 
     def test_imports(self):
         """Test that we can import the core modules"""
@@ -67,10 +75,144 @@ class TestCompressionEngine(unittest.TestCase):
         """Test that the compression pipeline can be initialized"""
         from nanoquant.core.compression_pipeline import CompressionPipeline
         try:
-            pipeline = CompressionPipeline()
+            pipeline = CompressionPipeline(os.path.join(self.work_dir, "nanoquants"))
             self.assertIsNotNone(pipeline)
         except Exception as e:
             self.fail(f"Failed to initialize compression pipeline: {e}")
 
+    def test_level_planner_shares_prefixes_and_keeps_base(self):
+        """Test that levels share step prefixes and never mutate the base model"""
+        import torch
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_planner import LevelPlanner
+
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(32, 32), torch.nn.ReLU(), torch.nn.Linear(32, 8))
+        reference = {k: v.clone() for k, v in model.state_dict().items()}
+        levels = {
+            "a": {"preserve_super_weights": True, "pruning": {"type": "sparsegpt", "ratio": 0.5}},
+            "b": {"preserve_super_weights": True, "pruning": {"type": "sparsegpt", "ratio": 0.9}},
+        }
+
+        planner = LevelPlanner(UltraAdvancedCompressionEngine())
+        root = planner.plan(levels)
+        self.assertEqual(len(root.children), 1)
+        self.assertEqual(len(next(iter(root.children.values())).children), 2)
+
+        sparsity = {}
+        for level_name, compressed in planner.run(model, levels, torch.device("cpu"), []):
+            weight = compressed[0].weight
+            sparsity[level_name] = (weight == 0).float().mean().item()
+
+        self.assertAlmostEqual(sparsity["a"], 0.5, delta=0.05)
+        self.assertAlmostEqual(sparsity["b"], 0.9, delta=0.05)
+        for key, value in model.state_dict().items():
+            self.assertTrue(torch.equal(value, reference[key]), key)
+        self.assertGreater(planner.stats.hits, 0)
+
+    def test_parallel_workers_match_serial(self):
+        """Test that sharding layers across worker processes gives identical weights"""
+        import torch
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+
+        config = {"preserve_super_weights": True, "pruning": {"type": "sparsegpt", "ratio": 0.4},
+                  "decomposition": {"type": "calr", "rank_ratio": 0.5}}
+        outputs = []
+        for workers in (1, 2):
+            torch.manual_seed(0)
+            model = torch.nn.Sequential(torch.nn.Linear(32, 32), torch.nn.Linear(32, 16))
+            engine = UltraAdvancedCompressionEngine(num_workers=workers)
+            with engine.executor:
+                compressed = engine.compress_module(model, config, torch.device("cpu"))
+            outputs.append([tensor.clone() for tensor in compressed.state_dict().values()])
+            self.assertEqual(set(engine.super_weights), {"0", "1"})
+
+        for serial, parallel in zip(*outputs):
+            self.assertTrue(torch.equal(serial, parallel))
+
+    def test_generator_shuts_down_layer_pool(self):
+        """Test that a generator run leaves no layer worker processes behind"""
+        import multiprocessing
+        import tempfile
+        import torch
+        from unittest.mock import Mock, patch
+        from nanoquant.core.nanoquant_generator import UltraNanoQuantGenerator
+        from nanoquant.core.parallel_executor import ParallelLayerExecutor, WORKERS_ENV_VAR
+
+        model = torch.nn.Sequential(torch.nn.Linear(32, 32), torch.nn.Linear(32, 16))
+        artifacts = {"model": model, "tokenizer": Mock(), "device": torch.device("cpu"),
+                     "info": {"model_id": "org/model", "target_modules": []}}
+        generator = UltraNanoQuantGenerator()
+        generator._save_model = Mock()
+        before = set(multiprocessing.active_children())
+        with patch.dict(os.environ, {WORKERS_ENV_VAR: "2"}), \
+                patch.object(ParallelLayerExecutor, "shutdown", autospec=True,
+                             side_effect=ParallelLayerExecutor.shutdown) as shutdown:
+            generator.generate_custom_nanoquant(artifacts, tempfile.mkdtemp(),
+                                                {"quantization": {"type": "4bit", "group_size": 16}})
+
+        shutdown.assert_called_once()
+        self.assertIsNone(shutdown.call_args.args[0]._pool)
+        self.assertTrue(set(multiprocessing.active_children()) <= before)
+
+    def test_lora_skipped_after_quantization(self):
+        """Test that LoRA is applied to Linear layers but skipped, and not counted, once they are quantized"""
+        import torch
+        from unittest.mock import Mock
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_planner import LevelPlanner
+
+        lora = {"r": 2, "alpha": 2, "dropout": 0.0}
+        engine = UltraAdvancedCompressionEngine()
+        engine.progress = Mock()
+        for config, adapted in (({"lora": lora}, True),
+                                ({"quantization": {"type": "4bit", "group_size": 16}, "lora": lora}, False)):
+            model = torch.nn.Sequential(torch.nn.Linear(32, 32), torch.nn.Linear(32, 16))
+            artifacts = {"model": model, "tokenizer": None, "device": torch.device("cpu"),
+                         "info": {"target_modules": ["0", "1"]}}
+            with self.assertLogs("nanoquant.core.compression_engine", level="INFO") as logs:
+                compressed = engine.compress_model(artifacts, config)["model"]
+            self.assertEqual(hasattr(compressed, "merge_and_unload"), adapted)
+            self.assertEqual(engine.progress.add_steps.call_args.args[0], len(config) - (not adapted))
+            self.assertEqual(any("Skipping LoRA" in line for line in logs.output), not adapted)
+
+        planner = LevelPlanner(UltraAdvancedCompressionEngine())
+        root = planner.plan({"quantized": {"quantization": {"type": "4bit"}, "lora": lora}, "plain": {"lora": lora}})
+        self.assertEqual(sorted(node.step for node in root.children.values()), ["lora", "quantization"])
+        self.assertEqual([node.step for node in root.children['quantization:{"type": "4bit"}'].children.values()], [])
+
+    def test_packed_levels_keep_pruning_and_decomposition(self):
+        """Test that the OneBit-family levels factor, prune and then pack every layer"""
+        import torch
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_catalog import level_catalog
+        from nanoquant.core.low_rank import LowRankLinear
+        from nanoquant.core.quantized_layers import (
+            QuantizedLinear, quantized_modules_manifest, restore_quantized_modules
+        )
+
+        def build():
+            return torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 256))
+
+        inputs = torch.randn(4, 64)
+        for level_name in ("nano", "atomic"):
+            config = level_catalog()["levels"][level_name]["config"]
+            torch.manual_seed(0)
+            model = UltraAdvancedCompressionEngine().compress_module(build(), config, torch.device("cpu"))
+
+            for index in (0, 2):
+                self.assertIsInstance(model[index], LowRankLinear, level_name)
+                self.assertGreater(model[index].num_outliers, 0, level_name)
+                for factor in (model[index].down, model[index].up):
+                    self.assertIsInstance(factor, QuantizedLinear, level_name)
+                    self.assertEqual(factor.scheme, config["quantization"]["type"])
+                    self.assertTrue(factor.pruned, level_name)
+                    sparsity = (factor.dequantize() == 0).float().mean().item()
+                    self.assertAlmostEqual(sparsity, config["pruning"]["ratio"], delta=0.05, msg=level_name)
+
+            rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+            rebuilt.load_state_dict(model.state_dict())
+            self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)), level_name)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Tests for concurrency-safe credit changes
+"""
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch
+import threading
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestCreditLedger(unittest.TestCase):
+    """Test cases for LedgerWriter and concurrent credit and trial changes"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # Keep user changes off any DynamoDB table the environment is configured for
+        cloud = patch("nanoquant.core.user_management.CLOUD_AVAILABLE", False)
+        cloud.start()
+        self.addCleanup(cloud.stop)
+        self.db_path = os.path.join(self.work_dir, "users.db")
+
+    def _run_concurrently(self, target, count):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(index):
+            barrier.wait()
+            results[index] = target(index)
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_deductions_never_overspend(self):
+        """Test that racing managers and a second writer never lose updates or go below zero"""
+        from nanoquant.core.user_management import UserManager
+        from nanoquant.core.user_store import SQLiteUserStore
+
+        user_id = UserManager(self.db_path).register_user("alice@example.com", "secret")
+        # A store of its own has its own writer, like another worker process on the same database
+        other_process = SQLiteUserStore(self.db_path)
+
+        def deduct(index):
+            if index % 2:
+                return other_process.adjust_credits(user_id, -3, "compression_heavy") is not None
+            return UserManager(self.db_path).deduct_credits(user_id, 3, "compression_heavy")
+
+        results = self._run_concurrently(deduct, 50)
+
+        manager = UserManager(self.db_path)
+        self.assertEqual(sum(results), 33)
+        self.assertEqual(manager.get_user_credits(user_id), 1)
+        history = manager.get_credit_history(user_id, limit=100)
+        self.assertEqual(len(history), 33)
+        self.assertEqual([entry["balance"] for entry in reversed(history)], list(range(97, 0, -3)))
+
+    def test_writer_group_commits_queued_changes(self):
+        """Test that changes queued together are committed in one transaction, each with its own outcome"""
+        from nanoquant.core.user_management import UserManager
+        from nanoquant.core.user_store import LedgerWriter, _apply_credit_change
+
+        user_id = UserManager(self.db_path).register_user("bob@example.com", "secret")
+        writer = LedgerWriter(self.db_path, batch_delay=0.5)
+        futures = [writer.submit(_apply_credit_change, user_id, -30, "compression_ultra") for _ in range(4)]
+        futures.append(writer.submit(_apply_credit_change, "missing", -1, "compression_heavy"))
+        futures.append(writer.submit(lambda connection: connection.execute("SELECT * FROM missing_table")))
+        outcomes = [future.exception() or future.result() for future in futures]
+        writer.close()
+
+        self.assertEqual(writer.batches, 1)
+        self.assertEqual(outcomes[:5], [70, 40, 10, None, None])
+        self.assertIsInstance(outcomes[5], Exception)
+        self.assertEqual(UserManager(self.db_path).get_user_credits(user_id), 10)
+
+    def test_last_trial_is_used_once(self):
+        """Test that concurrent jobs of a free user cannot share the last free trial"""
+        from nanoquant.core.user_management import UserManager
+        from nanoquant.core.user_store import FREE_TRIALS_PER_LEVEL
+
+        manager = UserManager(self.db_path)
+        user_id = manager.register_user("carol@example.com", "secret")
+        results = self._run_concurrently(lambda index: manager.use_trial(user_id, "atomic"), 10)
+
+        self.assertEqual(sum(results), FREE_TRIALS_PER_LEVEL)
+        self.assertEqual(manager._get_trials_count(user_id, "atomic"), FREE_TRIALS_PER_LEVEL)
+        self.assertFalse(manager.check_compression_access(user_id, "atomic"))
+
+if __name__ == '__main__':
+    unittest.main()
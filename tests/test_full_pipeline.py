@@ -16,7 +16,14 @@ class TestFullPipeline(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures before each test method."""
-        pass
+        self.work_dir = tempfile.mkdtemp()
+        # Databases opened at their default paths go to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        from nanoquant.core.job_queue import JOBS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db"),
+                                              JOBS_DB_ENV_VAR: os.path.join(self.work_dir, "jobs.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
 
     def test_ollama_integration_system(self):
         """Test the Ollama integration system functionality"""
@@ -51,7 +58,7 @@ class TestFullPipeline(unittest.TestCase):
             mock_run.return_value = mock_result
             
             # Initialize the pipeline
-            pipeline = CompressionPipeline()
+            pipeline = CompressionPipeline(os.path.join(self.work_dir, "nanoquants"))
             
             # Verify that the Ollama integration system is properly initialized
             self.assertIsNotNone(pipeline.ollama)
@@ -83,6 +90,32 @@ class TestFullPipeline(unittest.TestCase):
         for command in expected_commands:
             self.assertIn(command, command_names)
 
+    def test_compress_names_outputs(self):
+        """Test that compress --name names the output directories instead of the model ID"""
+        from typer.testing import CliRunner
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+        from nanoquant.cli.main import app
+        from nanoquant.core import nanoquant_generator
+
+        checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        LlamaForCausalLM(config).save_pretrained(checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(checkpoint_dir)
+
+        output_dir = os.path.join(self.work_dir, "out")
+        light = {"light": nanoquant_generator.COMPRESSION_LEVELS["light"]}
+        with patch.object(nanoquant_generator, "COMPRESSION_LEVELS", light), \
+                patch("nanoquant.cli.main.load_session", return_value=None):
+            result = CliRunner().invoke(app, ["compress", checkpoint_dir, "--level", "light", "--name", "mini",
+                                              "--output-dir", output_dir, "--no-push-to-ollama"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(os.listdir(output_dir), ["mini"])
+        self.assertEqual(os.listdir(os.path.join(output_dir, "mini")), ["mini_light"])
+
     def test_web_app_import(self):
         """Test that the web app can be imported without errors"""
         try:
@@ -0,0 +1,105 @@
+"""
+Tests for group-wise integer quantization (4bit and mixed modes)
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestGroupQuantization(unittest.TestCase):
+    """Test cases for GroupQuantizedLinear and the 4bit / mixed strategies"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.weight = torch.randn(64, 200)
+        self.inputs = torch.randn(3, 200)
+
+    def test_codes_round_trip(self):
+        """Test that packed codes unpack to the same values at every width"""
+        from nanoquant.core.quantized_layers import pack_codes, unpack_codes
+
+        for bits in (2, 4, 8):
+            codes = torch.randint(0, 1 << bits, (5, 32), dtype=torch.uint8)
+            packed = pack_codes(codes, bits)
+            self.assertEqual(packed.shape, (5, 32 * bits // 8))
+            self.assertTrue(torch.equal(unpack_codes(packed, bits), codes))
+
+    def test_4bit_layer_accuracy_and_size(self):
+        """Test that 4-bit groups stay accurate, keep zeros exact and pack two codes per byte"""
+        from nanoquant.core.quantized_layers import GroupQuantizedLinear
+
+        weight = self.weight.clone()
+        weight[:, :50] = 0
+        layer = GroupQuantizedLinear.from_weight(weight, None, bits=4, group_size=64)
+        restored = layer.dequantize().float()
+        self.assertTrue(bool((restored[:, :50] == 0).all()))
+        error = ((restored - weight) ** 2).sum() / (weight ** 2).sum()
+        self.assertLess(error.item(), 0.02)
+        self.assertEqual(layer.codes.shape, (64, 256 // 2))
+
+    def test_strategies_pack_and_reload(self):
+        """Test that 4bit and mixed modes swap in packed layers that rebuild from the manifest"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.quantized_layers import (
+            GroupQuantizedLinear, quantized_modules_manifest, restore_quantized_modules
+        )
+
+        def build():
+            torch.manual_seed(0)
+            model = torch.nn.Sequential(torch.nn.Linear(200, 128), torch.nn.Linear(128, 128),
+                                        torch.nn.Linear(128, 32))
+            with torch.no_grad():
+                model[1].weight.mul_(10)
+            return model
+
+        for config in ({"type": "4bit"}, {"type": "mixed", "target_bits": 5}):
+            model = UltraAdvancedCompressionEngine().compress_module(build(), {"quantization": config},
+                                                                     torch.device("cpu"))
+            layers = [model[index] for index in range(3)]
+            self.assertTrue(all(isinstance(layer, GroupQuantizedLinear) for layer in layers))
+            if config["type"] == "mixed":
+                # The layer with the largest weights loses the most and gets the widest codes
+                self.assertEqual(max(layers, key=lambda layer: layer.bits), layers[1])
+                bits = sum(layer.bits * layer.in_features * layer.out_features for layer in layers)
+                self.assertLessEqual(bits / sum(layer.in_features * layer.out_features for layer in layers), 5)
+
+            rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+            rebuilt.load_state_dict(model.state_dict())
+            self.assertTrue(torch.equal(rebuilt(self.inputs), model(self.inputs)))
+
+    def test_heavy_level_keeps_pruning_and_decomposition(self):
+        """Test that the heavy level's 4-bit codes keep its pruned zeros and low-rank factors"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_catalog import level_catalog
+        from nanoquant.core.low_rank import LowRankLinear
+        from nanoquant.core.quantized_layers import (
+            GroupQuantizedLinear, quantized_modules_manifest, restore_quantized_modules
+        )
+
+        def build():
+            torch.manual_seed(0)
+            return torch.nn.Sequential(torch.nn.Linear(128, 128), torch.nn.ReLU(), torch.nn.Linear(128, 32))
+
+        config = level_catalog()["levels"]["heavy"]["config"]
+        model = UltraAdvancedCompressionEngine().compress_module(build(), config, torch.device("cpu"))
+
+        # A rank-0.6 factorization only pays off for the narrow layer
+        self.assertIsInstance(model[0], GroupQuantizedLinear)
+        self.assertIsInstance(model[2], LowRankLinear)
+        for layer in (model[0], model[2].down, model[2].up):
+            self.assertIsInstance(layer, GroupQuantizedLinear)
+            self.assertEqual(layer.bits, 4)
+            sparsity = (layer.dequantize() == 0).float().mean().item()
+            self.assertAlmostEqual(sparsity, config["pruning"]["ratio"], delta=0.05)
+
+        rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        inputs = torch.randn(4, 128)
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ Integration tests for the NanoQuant system
 import unittest
 import sys
 import os
+import tempfile
+from unittest.mock import patch
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -11,6 +13,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 class TestNanoQuantIntegration(unittest.TestCase):
     """Integration tests for the NanoQuant system"""
 
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # Databases opened at their default paths go to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        from nanoquant.core.job_queue import JOBS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db"),
+                                              JOBS_DB_ENV_VAR: os.path.join(self.work_dir, "jobs.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+
     def test_full_pipeline_imports(self):
         """Test that all components of the full pipeline can be imported"""
         try:
@@ -43,7 +56,7 @@ class TestNanoQuantIntegration(unittest.TestCase):
             ingestion = ModelIngestionPipeline()
             generator = UltraNanoQuantGenerator()
             ollama = OllamaIntegrationSystem()
-            pipeline = CompressionPipeline()
+            pipeline = CompressionPipeline(os.path.join(self.work_dir, "nanoquants"))
             
             # Verify objects are created
             self.assertIsNotNone(engine)
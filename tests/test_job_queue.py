@@ -0,0 +1,132 @@
+"""
+Tests for the compression job queue
+"""
+import unittest
+import sys
+import os
+import time
+import tempfile
+import threading
+from unittest.mock import Mock, patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestJobQueue(unittest.TestCase):
+    """Test cases for JobStore, run_job and CompressionWorkerPool"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "jobs.db")
+        # The pipeline's user database goes to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def test_workers_claim_each_job_once(self):
+        """Test that concurrent claims hand out every job exactly once, oldest first"""
+        from nanoquant.core.job_queue import JobStore, RUNNING, QUEUED
+
+        store = JobStore(self.db_path)
+        job_ids = [store.create_job("alice", f"org/model-{index}", "light", {"index": index})
+                   for index in range(20)]
+
+        claimed = {}
+        def claim(worker):
+            claimed[worker] = []
+            while True:
+                job = store.claim_next(worker)
+                if job is None:
+                    return
+                claimed[worker].append(job["id"])
+
+        threads = [threading.Thread(target=claim, args=(f"worker-{index}",)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_claimed = sorted(job_id for ids in claimed.values() for job_id in ids)
+        self.assertEqual(all_claimed, job_ids)
+        for ids in claimed.values():
+            self.assertEqual(ids, sorted(ids))
+        job = store.get_job(job_ids[3])
+        self.assertEqual(job["status"], RUNNING)
+        self.assertEqual(job["request"], {"index": 3})
+
+        # A restarted pool takes over jobs whose workers died
+        self.assertEqual(store.requeue_running(), 20)
+        self.assertEqual(store.get_job(job_ids[0])["status"], QUEUED)
+        self.assertEqual([job["id"] for job in store.list_jobs("alice", limit=2)], job_ids[:-3:-1])
+
+    def test_run_job_records_outcome(self):
+        """Test that results and errors from the pipeline end up on the job row"""
+        from nanoquant.core.job_queue import JobStore, run_job, COMPLETED, FAILED
+
+        store = JobStore(self.db_path)
+        pipeline = Mock()
+        pipeline.process_model.return_value = {"model_id": "org/model", "output_directory": "/out/org_model"}
+        pipeline.process_custom_model.side_effect = PermissionError("Insufficient credits")
+
+        store.create_job("alice", "org/model", "heavy", {"push_to_ollama": False, "streaming": True})
+        self.assertTrue(run_job(store, store.claim_next("worker"), pipeline))
+        store.create_job("alice", "org/model", "light", {"custom_config": {"quantization": {"type": "4bit"}}})
+        self.assertFalse(run_job(store, store.claim_next("worker"), pipeline))
+
+        completed, failed = store.get_job(1), store.get_job(2)
+        self.assertEqual(completed["status"], COMPLETED)
+        self.assertEqual(completed["progress"], 1)
+        self.assertEqual(completed["output_path"], "/out/org_model")
+        self.assertEqual(completed["result"]["model_id"], "org/model")
+        self.assertEqual(pipeline.process_model.call_args.kwargs["streaming"], True)
+        self.assertEqual(pipeline.process_model.call_args.kwargs["run_id"], "job-1")
+        self.assertEqual(failed["status"], FAILED)
+        self.assertEqual(failed["error"], "Insufficient credits")
+
+    def test_worker_pool_compresses_queued_jobs(self):
+        """Test that worker processes run queued jobs to completion off the caller's process"""
+        self._run_pool_job(compression_workers=1)
+
+    def test_worker_pool_runs_parallel_compression(self):
+        """Test that job workers can shard layers across compression workers of their own"""
+        self._run_pool_job(compression_workers=2)
+
+    def _run_pool_job(self, compression_workers: int):
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+        from nanoquant.core.job_queue import CompressionWorkerPool, COMPLETED, FAILED
+        from nanoquant.core.parallel_executor import WORKERS_ENV_VAR
+
+        checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        LlamaForCausalLM(config).save_pretrained(checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(checkpoint_dir)
+
+        pool = CompressionWorkerPool(self.db_path, num_workers=1, poll_interval=0.1, pipeline_options={
+            "output_base_dir": os.path.join(self.work_dir, "out"),
+            "cache_dir": os.path.join(self.work_dir, "cache"),
+        })
+        request = {"push_to_ollama": False, "custom_config": {"quantization": {"type": "4bit"}}}
+        job_id = pool.store.create_job(None, checkpoint_dir, "custom", request)
+        # Spawned workers inherit the environment their engines read the worker count from
+        with patch.dict(os.environ, {WORKERS_ENV_VAR: str(compression_workers)}):
+            pool.start()
+        try:
+            deadline = time.time() + 300
+            while pool.store.get_job(job_id)["status"] not in (COMPLETED, FAILED) and time.time() < deadline:
+                time.sleep(0.2)
+        finally:
+            pool.shutdown()
+
+        job = pool.store.get_job(job_id)
+        self.assertEqual(job["status"], COMPLETED, job["error"])
+        self.assertNotEqual(job["worker"].split(":")[-1], str(os.getpid()))
+        self.assertTrue(os.path.isdir(job["result"]["custom_model"]["path"]))
+        self.assertEqual(pool.processes, [])
+
+if __name__ == '__main__':
+    unittest.main()
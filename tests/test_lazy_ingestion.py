@@ -0,0 +1,78 @@
+"""
+Tests for memory-mapped lazy model ingestion
+"""
+import unittest
+import sys
+import os
+import tempfile
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestLazyIngestion(unittest.TestCase):
+    """Test cases for LazyStateDict and lazy ingestion"""
+
+    def setUp(self):
+        """Save a tiny sharded Llama checkpoint with tied embeddings and a tokenizer."""
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models, pre_tokenizers
+
+        torch.manual_seed(0)
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=200,
+                             tie_word_embeddings=True)
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.reference = LlamaForCausalLM(config).to(torch.float16).eval()
+        self.reference.save_pretrained(self.checkpoint_dir, max_shard_size="30KB")
+
+        vocab = {f"t{index}": index for index in range(200)}
+        tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="t0"))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(self.checkpoint_dir)
+
+    def test_state_dict_maps_shards_on_demand(self):
+        """Test that only the shard holding a requested tensor is mapped, without copying it"""
+        from nanoquant.core.lazy_tensors import LazyStateDict
+
+        with LazyStateDict(self.checkpoint_dir) as tensors:
+            self.assertGreater(len(set(tensors.weight_map.values())), 2)
+            self.assertEqual(set(tensors), set(self.reference.state_dict()) - {"lm_head.weight"})
+            self.assertEqual(tensors.shards, {})
+
+            name = "model.layers.1.mlp.down_proj.weight"
+            tensor = tensors[name]
+            self.assertEqual(list(tensors.shards), [tensors.weight_map[name]])
+            self.assertEqual(tensor.dtype, torch.float16)
+            self.assertTrue(torch.equal(tensor, self.reference.state_dict()[name]))
+
+            # Views share the mapping, and writes stay private to this process
+            self.assertEqual(tensors[name].data_ptr(), tensor.data_ptr())
+            tensor.zero_()
+        with LazyStateDict(self.checkpoint_dir) as tensors:
+            self.assertTrue(torch.equal(tensors[name], self.reference.state_dict()[name]))
+
+    def test_lazy_ingestion_builds_working_model(self):
+        """Test that a lazily ingested model matches the original and compresses like one"""
+        from nanoquant.core.model_ingestion import ModelIngestionPipeline
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.quantized_layers import GroupQuantizedLinear
+
+        artifacts = ModelIngestionPipeline().ingest_local_model(self.checkpoint_dir, lazy=True)
+        model = artifacts["model"]
+        self.assertEqual(artifacts["torch_dtype"], torch.float16)
+        self.assertIs(model.lm_head.weight, model.model.embed_tokens.weight)
+        self.assertIn("model.norm.weight", artifacts["tensors"])
+
+        # The lazy model keeps its rotary frequencies in float32, the fp16 reference does not
+        inputs = torch.randint(0, 200, (1, 6))
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(inputs).logits, self.reference(inputs).logits, atol=1e-2))
+
+        compressed = UltraAdvancedCompressionEngine().compress_module(
+            model, {"quantization": {"type": "4bit"}}, artifacts["device"]
+        )
+        self.assertIsInstance(compressed.model.layers[0].self_attn.q_proj, GroupQuantizedLinear)
+
+if __name__ == '__main__':
+    unittest.main()
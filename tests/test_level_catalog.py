@@ -0,0 +1,77 @@
+"""
+Tests for the compression level catalog and cached access evaluation
+"""
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestLevelCatalog(unittest.TestCase):
+    """Test cases for level_catalog, access_vector and UserManager.get_level_access"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # Keep user changes off any DynamoDB table the environment is configured for
+        cloud = patch("nanoquant.core.user_management.CLOUD_AVAILABLE", False)
+        cloud.start()
+        self.addCleanup(cloud.stop)
+
+    def test_catalog_is_built_once_and_versioned(self):
+        """Test that every caller shares one catalog matching the generator's levels"""
+        from nanoquant.core.level_catalog import level_catalog, LEVEL_COSTS
+        from nanoquant.core.nanoquant_generator import UltraNanoQuantGenerator
+
+        catalog = level_catalog()
+        self.assertIs(level_catalog(), catalog)
+        self.assertEqual(len(catalog["version"]), 12)
+
+        generator = UltraNanoQuantGenerator()
+        self.assertEqual(list(catalog["levels"]), list(generator.compression_levels))
+        # Tuning one generator leaves the catalog alone
+        generator.compression_levels["light"]["pruning"]["ratio"] = 0.5
+        self.assertEqual(catalog["levels"]["light"]["config"]["pruning"]["ratio"], 0.15)
+
+        for level_name, level in catalog["levels"].items():
+            self.assertEqual(level["cost"], LEVEL_COSTS[level_name])
+            self.assertEqual(level["free"], level["cost"] == 0)
+        self.assertEqual(catalog["levels"]["heavy"]["name"], "Heavy")
+        self.assertEqual(catalog["levels"]["atomic"]["size_reduction"], "99-99.5%")
+
+    def test_access_follows_credit_tier_and_trial_changes(self):
+        """Test that cached access answers change as soon as credits, tier or trials do"""
+        from nanoquant.core.user_management import UserManager
+
+        manager = UserManager(os.path.join(self.work_dir, "users.db"))
+        user_id = manager.register_user("alice@example.com", "secret")
+
+        access = manager.get_level_access(user_id)
+        self.assertTrue(all(access.values()))
+        self.assertIs(manager.get_level_access(user_id), access)
+        # Users in the same state share one answer
+        other_id = manager.register_user("bob@example.com", "secret")
+        self.assertIs(manager.get_level_access(other_id), access)
+
+        for _ in range(2):
+            self.assertTrue(manager.use_trial(user_id, "atomic"))
+        # Trials used up and 100 credits are short of the 200 atomic costs
+        self.assertFalse(manager.check_compression_access(user_id, "atomic"))
+
+        manager.add_credits(user_id, 100, "purchase")
+        self.assertTrue(manager.check_compression_access(user_id, "atomic"))
+        manager.deduct_credits(user_id, 195, "compression_atomic")
+        self.assertFalse(manager.check_compression_access(user_id, "atomic"))
+        # Free users still have trials of heavy left, premium users pay for it
+        self.assertTrue(manager.check_compression_access(user_id, "heavy"))
+
+        manager.store.update_user(user_id, {"tier": "premium"})
+        self.assertFalse(manager.check_compression_access(user_id, "heavy"))
+        self.assertTrue(manager.check_compression_access(user_id, "medium"))
+        self.assertEqual(manager.get_level_access("missing"), {})
+
+if __name__ == '__main__':
+    unittest.main()
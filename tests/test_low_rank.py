@@ -0,0 +1,84 @@
+"""
+Tests for randomized SVD and factored Linear layers
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestLowRank(unittest.TestCase):
+    """Test cases for low-rank decomposition"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        # Rank-8 signal plus a little noise
+        self.weight = torch.randn(96, 8) @ torch.randn(8, 160) + 0.01 * torch.randn(96, 160)
+
+    def test_randomized_svd_matches_truncated_svd(self):
+        """Test that the range finder recovers the dominant singular triplets"""
+        from nanoquant.core.low_rank import randomized_svd
+
+        U, S, Vh = randomized_svd(self.weight, 8)
+        exact = torch.linalg.svdvals(self.weight)[:8]
+        self.assertTrue(torch.allclose(S, exact, rtol=1e-3))
+        error = (self.weight - U @ torch.diag(S) @ Vh).norm() / self.weight.norm()
+        self.assertLess(error.item(), 0.01)
+
+    def test_energy_rank(self):
+        """Test that the adaptive rank keeps only the components holding the energy"""
+        from nanoquant.core.low_rank import randomized_svd, energy_rank
+
+        _, S, _ = randomized_svd(self.weight, 20)
+        self.assertEqual(energy_rank(S, (self.weight ** 2).sum().item(), 0.99), 8)
+
+    def test_decomposition_replaces_linear_with_factors(self):
+        """Test that CALR swaps in a smaller factored layer with a close output"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.low_rank import LowRankLinear
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        model = torch.nn.Sequential(torch.nn.Linear(160, 96))
+        model[0].weight.data = self.weight.clone()
+        inputs = torch.randn(4, 160)
+        expected = model(inputs)
+
+        engine = UltraAdvancedCompressionEngine()
+        model = engine.compress_module(model, {"decomposition": {"type": "calr", "rank_ratio": 0.5,
+                                                                 "energy": 0.99}},
+                                       torch.device("cpu"))
+        self.assertIsInstance(model[0], LowRankLinear)
+        self.assertEqual(model[0].rank, 8)
+        self.assertLess(sum(p.numel() for p in model.parameters()), 160 * 96 / 4)
+        error = (model(inputs) - expected).norm() / expected.norm()
+        self.assertLess(error.item(), 0.01)
+
+        rebuilt = restore_quantized_modules(torch.nn.Sequential(torch.nn.Linear(160, 96)),
+                                            quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+    def test_decomposition_keeps_tied_output_projection(self):
+        """Test that an output projection tied to the input embedding is not factored"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.low_rank import LowRankLinear
+
+        model = torch.nn.ModuleDict({"embed": torch.nn.Embedding(160, 96),
+                                     "proj": torch.nn.Linear(160, 96),
+                                     "lm_head": torch.nn.Linear(96, 160, bias=False)})
+        model["lm_head"].weight = model["embed"].weight
+        model["proj"].weight.data = self.weight.clone()
+
+        engine = UltraAdvancedCompressionEngine()
+        model = engine.compress_module(model, {"decomposition": {"type": "calr", "rank_ratio": 0.5,
+                                                                 "energy": 0.99}},
+                                       torch.device("cpu"))
+        self.assertIsInstance(model["proj"], LowRankLinear)
+        self.assertIsInstance(model["lm_head"], torch.nn.Linear)
+        self.assertIs(model["lm_head"].weight, model["embed"].weight)
+
+if __name__ == '__main__':
+    unittest.main()
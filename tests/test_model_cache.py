@@ -0,0 +1,86 @@
+"""
+Tests for the resident model cache
+"""
+import unittest
+import sys
+import os
+import tempfile
+import torch
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestModelCache(unittest.TestCase):
+    """Test cases for ModelCache and resident models in CompressionPipeline"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # The pipeline's user database goes to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def _artifacts(self, size):
+        return {"model": torch.nn.Linear(size, size, bias=False), "tokenizer": None}
+
+    def test_lru_eviction_by_memory_budget(self):
+        """Test that models are evicted least recently used first once the budget is exceeded"""
+        from nanoquant.core.model_cache import ModelCache, model_bytes
+
+        model_size = model_bytes(self._artifacts(32)["model"])
+        cache = ModelCache(max_bytes=2 * model_size)
+        for name in ("a", "b"):
+            cache.put((name, "rev"), self._artifacts(32))
+        self.assertIsNotNone(cache.get(("a", "rev")))
+        cache.put(("c", "rev"), self._artifacts(32))
+
+        self.assertEqual(list(cache.entries), [("a", "rev"), ("c", "rev")])
+        self.assertEqual(cache.total_bytes, 2 * model_size)
+        self.assertIsNone(cache.get(("b", "rev")))
+        # Too large to ever fit: handed back without being kept
+        cache.put(("huge", "rev"), self._artifacts(64))
+        self.assertNotIn(("huge", "rev"), cache.entries)
+
+        # Checkouts share weights with the cached model but never its module tree
+        checkout = cache.get(("a", "rev"))
+        cached = cache.entries[("a", "rev")][0]["model"]
+        self.assertIsNot(checkout["model"], cached)
+        self.assertEqual(checkout["model"].weight.data_ptr(), cached.weight.data_ptr())
+
+    def test_back_to_back_jobs_skip_ingestion(self):
+        """Test that a second run on the same model reuses the resident one and produces the same levels"""
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+
+        checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        LlamaForCausalLM(config).save_pretrained(checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(checkpoint_dir)
+
+        pipeline = CompressionPipeline(os.path.join(self.work_dir, "out"), use_cache=False)
+        pipeline.generator.compression_levels = {
+            "heavy": {"description": "test level", "pruning": {"type": "wanda", "ratio": 0.5}},
+        }
+        custom_config = {"quantization": {"type": "4bit"}}
+        with patch.object(pipeline.ingestion, "ingest_model", wraps=pipeline.ingestion.ingest_model) as ingest:
+            first = pipeline.process_model(checkpoint_dir, push_to_ollama=False)
+            custom = pipeline.process_custom_model(checkpoint_dir, custom_config, push_to_ollama=False)
+            second = pipeline.process_model(checkpoint_dir, push_to_ollama=False)
+
+        self.assertEqual(ingest.call_count, 1)
+        self.assertEqual(pipeline.model_cache.hits, 2)
+        self.assertTrue(os.path.isdir(custom["custom_model"]["path"]))
+        self.assertEqual(first["generated_models"][0]["path"], second["generated_models"][0]["path"])
+        # The custom run swapped modules in its checkout, not in the resident model
+        resident = next(iter(pipeline.model_cache.entries.values()))[0]["model"]
+        self.assertTrue(all(type(module).__name__ == "Linear"
+                            for name, module in resident.named_modules() if name.endswith("proj")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Tests for compression progress events and their server-sent event stream
+"""
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestProgressEvents(unittest.TestCase):
+    """Test cases for ProgressTracker, the pipeline's events and follow_events"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # The pipeline's user database goes to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.events = []
+
+    def test_tracker_progress_and_sse_round_trip(self):
+        """Test that steps and layers drive progress and events survive SSE encoding"""
+        from nanoquant.core.progress import ProgressTracker, format_sse, read_sse, describe
+
+        tracker = ProgressTracker([self.events.append])
+        tracker.add_steps(4)
+        tracker.stage("ingest")
+        tracker.begin_step("compress", level="light", step="quantization")
+        for index in range(4):
+            tracker.layer_done(index, 4, 1000, f"layers.{index}")
+        tracker.begin_step("save", level="light")
+        self.assertEqual(self.events[-2]["progress"], 0.25)
+        self.assertEqual(self.events[-2]["bytes_done"], 4000)
+        self.assertIsNotNone(self.events[-2]["eta_seconds"])
+        self.assertEqual(describe(self.events[-2]), "Compress [light] quantization layer 4/4 ETA 0m00s")
+        tracker.finish()
+        self.assertEqual(self.events[-1]["progress"], 1.0)
+        self.assertEqual(self.events[-1]["event"], "done")
+
+        stream = "".join(format_sse(event, event="progress", event_id=index)
+                         for index, event in enumerate(self.events)) + ": keep-alive\n\n"
+        decoded = list(read_sse(stream.split("\n")))
+        self.assertEqual([event for _, event in decoded], self.events)
+
+        # Layer events are throttled, milestones never are
+        throttled = []
+        tracker = ProgressTracker([throttled.append], min_interval=60)
+        tracker.add_steps(1)
+        tracker.begin_step("compress")
+        for index in range(10):
+            tracker.layer_done(index, 10, 1)
+        tracker.finish()
+        self.assertEqual([event["event"] for event in throttled], ["stage", "done"])
+
+    def test_pipeline_reports_layers_for_every_level(self):
+        """Test that a real compression run reports per-layer events and ends at 100%"""
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+        from nanoquant.core.progress import ProgressTracker
+
+        checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        LlamaForCausalLM(config).save_pretrained(checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(checkpoint_dir)
+
+        pipeline = CompressionPipeline(os.path.join(self.work_dir, "out"), use_cache=False)
+        pipeline.generator.compression_levels = {
+            "light": {"description": "test level", "quantization": {"type": "4bit"}},
+            "heavy": {"description": "test level", "pruning": {"type": "wanda", "ratio": 0.5}},
+        }
+        for streaming in (False, True):
+            self.events = []
+            pipeline.process_model(checkpoint_dir, push_to_ollama=False, streaming=streaming,
+                                   progress=ProgressTracker([self.events.append]))
+
+            stages = [event["stage"] for event in self.events if event["event"] == "stage"]
+            self.assertEqual(stages[0], "ingest")
+            layer_events = [event for event in self.events if event["event"] == "layer"]
+            # 7 Linear layers in the block plus lm_head, quantized in light and pruned in heavy
+            self.assertEqual(len(layer_events), 16)
+            self.assertEqual({event["level"] for event in layer_events}, {"light", "heavy"})
+            progress = [event["progress"] for event in self.events]
+            self.assertEqual(progress, sorted(progress))
+            if streaming:
+                # The decoder block plus the group holding embeddings and lm_head
+                self.assertEqual({event["num_blocks"] for event in layer_events}, {2})
+            self.assertEqual((self.events[-1]["event"], progress[-1]), ("done", 1.0))
+            self.assertGreater(self.events[-1]["bytes_done"], 0)
+
+    def test_job_events_stream_until_the_job_finishes(self):
+        """Test that a job's recorded events are served as SSE, resumable from an event ID"""
+        from nanoquant.core.job_queue import JobStore, run_job, follow_events
+        from nanoquant.core.progress import read_sse
+
+        def process_model(model_id, level, progress=None, **kwargs):
+            progress.add_steps(2)
+            progress.begin_step("compress", level=level, step="quantization")
+            progress.layer_done(0, 1, 4096, "lm_head")
+            progress.finish()
+            return {"model_id": model_id, "output_directory": "/out"}
+
+        store = JobStore(os.path.join(self.work_dir, "jobs.db"))
+        pipeline = Mock()
+        pipeline.process_model.side_effect = process_model
+        job_id = store.create_job("alice", "org/model", "heavy", {"push_to_ollama": False})
+        run_job(store, store.claim_next("worker"), pipeline)
+
+        def read(after=0):
+            stream = "".join(follow_events(store, job_id, after, poll_interval=0.01))
+            return list(read_sse(stream.split("\n")))
+
+        events = read()
+        # The layer event arrived within EVENT_INTERVAL of the stage event and was not persisted
+        self.assertEqual([event_type for event_type, _ in events], ["progress"] * 2 + ["end"])
+        self.assertEqual([event["event"] for _, event in events[:2]], ["stage", "done"])
+        self.assertEqual(events[1][1]["bytes_done"], 4096)
+        self.assertEqual(events[-1][1]["status"], "completed")
+        self.assertEqual(store.get_job(job_id)["stage"], "done")
+
+        first_id = store.get_events(job_id)[0]["id"]
+        self.assertEqual(len(read(after=first_id)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
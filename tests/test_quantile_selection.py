@@ -0,0 +1,62 @@
+"""
+Tests for the threshold selection utility
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestQuantileSelection(unittest.TestCase):
+    """Test cases for exact, histogram and sampled quantiles"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.values = torch.randn(300, 200)
+        self.qs = [0.0, 0.001, 0.3, 0.5, 0.8, 0.999, 1.0]
+
+    def test_exact_matches_torch_quantile(self):
+        """Test that exact selection reproduces torch.quantile's interpolation"""
+        from nanoquant.core.quantile_selection import select_quantiles
+
+        reference = torch.quantile(self.values.flatten(), torch.tensor(self.qs)).tolist()
+        for value, expected in zip(select_quantiles(self.values, self.qs, "exact"), reference):
+            self.assertAlmostEqual(value, expected, places=5)
+
+        ties = torch.tensor([1.0, 1.0, 1.0, 2.0, 5.0])
+        self.assertEqual(select_quantiles(ties, [0.5, 0.625], "exact"), [1.0, 1.5])
+
+    def test_histogram_error_is_bounded(self):
+        """Test that chunked histogram quantiles stay within a bin of the exact value"""
+        from nanoquant.core.quantile_selection import select_quantiles
+
+        exact = select_quantiles(self.values, self.qs, "exact")
+        approx = select_quantiles(self.values, self.qs, "histogram", bins=64, chunk_size=1000)
+        bin_width = (self.values.max() - self.values.min()).item() / 64 ** 2
+        for value, expected in zip(approx, exact):
+            self.assertLess(abs(value - expected), 2 * bin_width)
+
+    def test_sampled_is_deterministic(self):
+        """Test that sampled estimates are repeatable and close"""
+        from nanoquant.core.quantile_selection import select_quantile
+
+        first = select_quantile(self.values, 0.3, "sample", num_samples=5000)
+        self.assertEqual(first, select_quantile(self.values, 0.3, "sample", num_samples=5000))
+        self.assertAlmostEqual(first, torch.quantile(self.values.flatten(), 0.3).item(), delta=0.1)
+
+    def test_rejects_bad_input(self):
+        """Test that empty tensors, bad quantiles and unknown methods raise"""
+        from nanoquant.core.quantile_selection import select_quantile
+
+        with self.assertRaises(ValueError):
+            select_quantile(torch.tensor([]), 0.5)
+        with self.assertRaises(ValueError):
+            select_quantile(self.values, 1.5)
+        with self.assertRaises(ValueError):
+            select_quantile(self.values, 0.5, "median-of-medians")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Unit tests for the packed low-bit Linear layers
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestQuantizedLayers(unittest.TestCase):
+    """Test cases for bit packing and QuantizedLinear"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.linear = torch.nn.Linear(100, 24)
+
+    def test_bit_packing_roundtrip(self):
+        """Test that packed bit planes and 2-bit codes unpack to the original values"""
+        from nanoquant.core.quantized_layers import pack_bits, unpack_bits, pack_2bit, unpack_2bit
+
+        bits = torch.rand(5, 64) > 0.5
+        packed = pack_bits(bits)
+        self.assertEqual(packed.dtype, torch.uint8)
+        self.assertEqual(packed.shape, (5, 8))
+        self.assertTrue(torch.equal(unpack_bits(packed), bits))
+
+        codes = torch.randint(0, 4, (37,))
+        packed_codes = pack_2bit(codes)
+        self.assertEqual(packed_codes.numel(), 10)
+        self.assertTrue(torch.equal(unpack_2bit(packed_codes, 37), codes.to(torch.uint8)))
+
+    def test_packed_schemes_forward(self):
+        """Test that every packed scheme produces a usable Linear replacement"""
+        from nanoquant.core.quantized_layers import QuantizedLinear
+
+        inputs = torch.randn(3, 100)
+        threshold = self.linear.weight.abs().flatten().quantile(0.8).item()
+        for scheme in ("onebit", "ptq1_61", "ultrasketch"):
+            packed = QuantizedLinear.from_linear(self.linear, scheme, group_size=32,
+                                                 salient_threshold=threshold)
+            weights = packed.dequantize().float()
+            self.assertEqual(weights.shape, self.linear.weight.shape)
+            self.assertEqual(packed(inputs).shape, (3, 24))
+
+            # Binary part must keep the sign of the original weights
+            agreement = (torch.sign(weights) == torch.sign(self.linear.weight)).float().mean()
+            self.assertGreater(agreement.item(), 0.7, scheme)
+
+    def test_packed_state_is_smaller(self):
+        """Test that packed storage is far smaller than the dense weights"""
+        from nanoquant.core.quantized_layers import QuantizedLinear
+
+        linear = torch.nn.Linear(512, 256, bias=False)
+        packed = QuantizedLinear.from_linear(linear, "onebit", group_size=128)
+        packed_bytes = sum(t.numel() * t.element_size() for t in packed.state_dict().values())
+        dense_bytes = linear.weight.numel() * linear.weight.element_size()
+        self.assertLess(packed_bytes, dense_bytes / 20)
+
+    def test_manifest_restores_layers(self):
+        """Test that a manifest rebuilds packed layers that accept the saved state"""
+        from nanoquant.core.quantized_layers import (
+            QuantizedLinear, quantized_modules_manifest, restore_quantized_modules, replace_module
+        )
+
+        model = torch.nn.Sequential(torch.nn.Linear(100, 24), torch.nn.ReLU())
+        threshold = model[0].weight.abs().flatten().quantile(0.8).item()
+        replace_module(model, "0", QuantizedLinear.from_linear(model[0], "ptq1_61",
+                                                               salient_threshold=threshold))
+        manifest = quantized_modules_manifest(model)
+        self.assertIn("0", manifest)
+
+        fresh = torch.nn.Sequential(torch.nn.Linear(100, 24), torch.nn.ReLU())
+        restore_quantized_modules(fresh, manifest)
+        fresh.load_state_dict(model.state_dict())
+        inputs = torch.randn(2, 100)
+        self.assertTrue(torch.allclose(fresh(inputs), model(inputs)))
+
+if __name__ == '__main__':
+    unittest.main()
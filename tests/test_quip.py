@@ -0,0 +1,113 @@
+"""
+Tests for QuIP incoherence-processing quantization
+"""
+import unittest
+import sys
+import os
+import math
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestQuip(unittest.TestCase):
+    """Test cases for the Hadamard transform, LDLQ and QuipLinear"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.weight = torch.randn(128, 192) * 0.02
+        inputs = torch.randn(2048, 192) @ (0.05 * torch.randn(192, 192) + torch.eye(192))
+        self.hessian = 2 * inputs.t() @ inputs / inputs.shape[0]
+
+    def proxy_loss(self, weight):
+        delta = weight.float() - self.weight
+        return (torch.trace(delta @ self.hessian @ delta.t()) /
+                torch.trace(self.weight @ self.hessian @ self.weight.t())).item()
+
+    def test_fwht_matches_dense_hadamard(self):
+        """Test that the fast transform equals a block Hadamard matmul and is its own inverse"""
+        from nanoquant.core.quip import fwht, hadamard_block
+
+        hadamard = torch.ones(1, 1)
+        while hadamard.shape[0] < 64:
+            hadamard = torch.cat([torch.cat([hadamard, hadamard], 1), torch.cat([hadamard, -hadamard], 1)])
+        hadamard /= math.sqrt(64)
+
+        x = torch.randn(3, 192)
+        self.assertEqual(hadamard_block(192), 64)
+        expected = (x.reshape(3, 3, 64) @ hadamard.t()).reshape(3, 192)
+        self.assertTrue(torch.allclose(fwht(x, 64), expected, atol=1e-5))
+        self.assertTrue(torch.allclose(fwht(fwht(x, 64), 64), x, atol=1e-5))
+
+    def test_ldlq_beats_round_to_nearest(self):
+        """Test that rotated LDLQ rounding at 2 bits loses less than plain group rounding"""
+        from nanoquant.core.quip import QuipLinear
+        from nanoquant.core.quantized_layers import GroupQuantizedLinear
+
+        nearest = GroupQuantizedLinear.from_weight(self.weight, None, bits=2).dequantize()
+        quip = QuipLinear.from_weight(self.weight, None, bits=2, hessian=self.hessian)
+        self.assertLess(self.proxy_loss(quip.dequantize()), 0.8 * self.proxy_loss(nearest))
+
+        inputs = torch.randn(4, 192)
+        expected = torch.nn.functional.linear(inputs, quip.dequantize().float())
+        self.assertTrue(torch.allclose(quip(inputs), expected, atol=1e-2))
+
+    def test_strategy_calibrates_and_reloads(self):
+        """Test that the quip strategy packs every Linear, keeps super weights and reloads"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.quip import QuipLinear
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        def build():
+            model = torch.nn.Sequential(torch.nn.Linear(192, 128), torch.nn.ReLU(), torch.nn.Linear(128, 40))
+            model[0].weight.data = self.weight.clone()
+            model[0].weight.data[5, 17] = 1.5
+            return model
+
+        engine = UltraAdvancedCompressionEngine()
+        engine.calibration_data = [torch.randn(32, 192) for _ in range(2)]
+        model = engine.compress_module(build(), {"preserve_super_weights": True, "quantization": {"type": "quip"}},
+                                       torch.device("cpu"))
+        self.assertIsInstance(model[0], QuipLinear)
+        self.assertIsInstance(model[2], QuipLinear)
+
+        # The super weight is stored exactly beside the rotated codes, not smeared by the rotation
+        self.assertIn(5 * 192 + 17, engine.super_weights["0"]["indices"].tolist())
+        self.assertAlmostEqual(model[0].dequantize()[5, 17].item(), 1.5, delta=0.02)
+
+        inputs = torch.randn(4, 192)
+        rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+    def test_extreme_level_keeps_pruning_and_decomposition(self):
+        """Test that the extreme level's QuIP codes keep its pruned zeros and CALR factors"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.level_catalog import level_catalog
+        from nanoquant.core.low_rank import LowRankLinear
+        from nanoquant.core.quip import QuipLinear
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        def build():
+            torch.manual_seed(0)
+            return torch.nn.Sequential(torch.nn.Linear(128, 128), torch.nn.ReLU(), torch.nn.Linear(128, 32))
+
+        config = level_catalog()["levels"]["extreme"]["config"]
+        model = UltraAdvancedCompressionEngine().compress_module(build(), config, torch.device("cpu"))
+
+        inputs = torch.randn(4, 128)
+        for index in (0, 2):
+            self.assertIsInstance(model[index], LowRankLinear)
+            for factor in (model[index].down, model[index].up):
+                self.assertIsInstance(factor, QuipLinear)
+                self.assertTrue(factor.pruned)
+                sparsity = (factor.dequantize() == 0).float().mean().item()
+                self.assertAlmostEqual(sparsity, config["pruning"]["ratio"], delta=0.05)
+
+        rebuilt = restore_quantized_modules(build(), quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt(inputs), model(inputs)))
+
+if __name__ == '__main__':
+    unittest.main()
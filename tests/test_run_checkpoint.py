@@ -0,0 +1,138 @@
+"""
+Tests for checkpointed, resumable compression runs
+"""
+import unittest
+import sys
+import os
+import tempfile
+import torch
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestRunCheckpoint(unittest.TestCase):
+    """Test cases for LayerCheckpoint, RunCheckpoint and resumed pipeline runs"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+        from tokenizers import Tokenizer, models
+
+        torch.manual_seed(0)
+        self.work_dir = tempfile.mkdtemp()
+        # The pipeline's user database goes to a temporary directory, not the cwd
+        from nanoquant.core.user_store import USERS_DB_ENV_VAR
+        environment = patch.dict(os.environ, {USERS_DB_ENV_VAR: os.path.join(self.work_dir, "users.db")})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.checkpoint_dir = os.path.join(self.work_dir, "checkpoint")
+        config = LlamaConfig(hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                             num_attention_heads=4, num_key_value_heads=4, vocab_size=100)
+        self.model = LlamaForCausalLM(config).eval()
+        self.model.save_pretrained(self.checkpoint_dir)
+        tokenizer = Tokenizer(models.WordLevel({f"t{index}": index for index in range(100)}, unk_token="t0"))
+        PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="t1").save_pretrained(self.checkpoint_dir)
+        self.levels = {
+            "light": {"description": "test level", "quantization": {"type": "4bit"}},
+            "heavy": {"description": "test level", "pruning": {"type": "wanda", "ratio": 0.5},
+                      "decomposition": {"type": "low_rank", "rank_ratio": 0.25}},
+        }
+
+    def test_engine_reuses_checkpointed_layers(self):
+        """Test that a second engine loads every layer result instead of recomputing it"""
+        import copy
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.run_checkpoint import LayerCheckpoint
+
+        outputs = []
+        for run in range(2):
+            engine = UltraAdvancedCompressionEngine()
+            engine.checkpoint = LayerCheckpoint(os.path.join(self.work_dir, "layers"))
+            model = copy.deepcopy(self.model)
+            config = {"pruning": {"type": "wanda", "ratio": 0.5}, "quantization": {"type": "4bit"}}
+            model = engine.compress_module(model, config, torch.device("cpu"))
+            outputs.append((engine.checkpoint.hits, model.state_dict()))
+
+        self.assertEqual(outputs[0][0], 0)
+        self.assertGreater(outputs[1][0], 0)
+        self.assertEqual(outputs[0][1].keys(), outputs[1][1].keys())
+        for name, tensor in outputs[0][1].items():
+            self.assertTrue(torch.equal(tensor, outputs[1][1][name]), name)
+
+    def test_interrupted_run_resumes_from_saved_levels(self):
+        """Test that a run killed after its first level skips that level and reuses layers on restart"""
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+
+        pipeline = CompressionPipeline(os.path.join(self.work_dir, "out"), use_cache=False)
+        pipeline.generator.compression_levels = self.levels
+        save_model = pipeline.generator._save_model
+        saved = []
+
+        def evicted_after_first_level(artifacts, path):
+            if saved:
+                raise RuntimeError("pod evicted")
+            saved.append(path)
+            save_model(artifacts, path)
+
+        with patch.object(pipeline.generator, "_save_model", side_effect=evicted_after_first_level):
+            with self.assertRaises(RuntimeError):
+                pipeline.process_model(self.checkpoint_dir, push_to_ollama=False)
+        checkpoint_root = os.path.join(self.work_dir, "out", self.checkpoint_dir.replace("/", "_"), ".checkpoint")
+        self.assertTrue(os.path.isdir(checkpoint_root))
+
+        with patch.object(pipeline.generator, "_save_model", wraps=save_model) as resumed_save:
+            result = pipeline.process_model(self.checkpoint_dir, push_to_ollama=False)
+        self.assertEqual(resumed_save.call_count, 1)
+        self.assertEqual([model["level"] for model in result["generated_models"]], ["light", "heavy"])
+        self.assertTrue(all(os.path.isdir(model["path"]) for model in result["generated_models"]))
+        self.assertFalse(os.path.exists(checkpoint_root))
+
+    def test_interrupted_streaming_run_keeps_written_blocks(self):
+        """Test that a resumed streaming run only writes the blocks the interrupted one did not"""
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+        from nanoquant.core import streaming_compression
+        from nanoquant.core.quantized_layers import load_packed_model
+
+        pipeline = CompressionPipeline(os.path.join(self.work_dir, "out"), use_cache=False)
+        pipeline.generator.compression_levels = {"light": self.levels["light"]}
+        write_shard = streaming_compression.write_shard
+
+        def evicted_after_two_blocks(state_dict, path, *args, **kwargs):
+            if os.path.basename(path).startswith("model-00003"):
+                raise RuntimeError("pod evicted")
+            return write_shard(state_dict, path, *args, **kwargs)
+
+        with patch.object(streaming_compression, "write_shard", side_effect=evicted_after_two_blocks):
+            with self.assertRaises(RuntimeError):
+                pipeline.process_model(self.checkpoint_dir, push_to_ollama=False, streaming=True)
+        with patch.object(streaming_compression, "write_shard", wraps=write_shard) as resumed_write:
+            result = pipeline.process_model(self.checkpoint_dir, push_to_ollama=False, streaming=True)
+
+        self.assertEqual([os.path.basename(call.args[1]) for call in resumed_write.call_args_list],
+                         ["model-00003-of-00003.safetensors"])
+        reloaded = load_packed_model(result["generated_models"][0]["path"]).eval()
+        inputs = torch.randint(0, 100, (1, 6))
+        with torch.no_grad():
+            self.assertEqual(reloaded(inputs).logits.shape, (1, 6, 100))
+
+    def test_concurrent_jobs_keep_separate_checkpoints(self):
+        """Test that runs with their own run_id never share, or clear, each other's checkpoint"""
+        from nanoquant.core.compression_pipeline import CompressionPipeline
+
+        pipeline = CompressionPipeline(os.path.join(self.work_dir, "out"), use_cache=False)
+        pipeline.ingestion.resolve_revision = lambda model_id: "rev"
+        output_dir = os.path.join(self.work_dir, "out", "model")
+        first = pipeline._run_checkpoint("org/model", output_dir, self.levels, run_id="job-1")
+        second = pipeline._run_checkpoint("org/model", output_dir, self.levels, run_id="job-2")
+        self.assertNotEqual(first.directory, second.directory)
+
+        first.clear()
+        second.layers.save("0" * 40, {"weight": torch.ones(2)})
+        second.complete_level("light", {"path": self.work_dir})
+        # A requeued job finds the checkpoint it left
+        requeued = pipeline._run_checkpoint("org/model", output_dir, self.levels, run_id="job-2")
+        self.assertEqual(requeued.completed_level("light"), {"path": self.work_dir})
+
+if __name__ == '__main__':
+    unittest.main()
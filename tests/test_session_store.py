@@ -0,0 +1,130 @@
+"""
+Tests for the expiring session store
+"""
+import unittest
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class LocalRedis:
+    """Local stand-in for the subset of a Redis server the session store uses"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+        self.expiries = {}
+
+    def _live(self, key):
+        if key in self.expiries and self.expiries[key] <= self.clock():
+            self.values.pop(key, None)
+            self.expiries.pop(key)
+        return key in self.values
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value.encode("utf-8")
+        self.expiries[key] = self.clock() + ttl
+
+    def get(self, key):
+        return self.values[key] if self._live(key) else None
+
+    def sadd(self, key, member):
+        self._live(key)
+        self.values.setdefault(key, set()).add(member.encode("utf-8"))
+
+    def srem(self, key, member):
+        if self._live(key):
+            self.values[key].discard(member.encode("utf-8"))
+
+    def smembers(self, key):
+        return set(self.values[key]) if self._live(key) else set()
+
+    def expire(self, key, ttl):
+        if self._live(key):
+            self.expiries[key] = self.clock() + ttl
+
+    def delete(self, *keys):
+        removed = sum(1 for key in keys if self._live(key))
+        for key in keys:
+            self.values.pop(key, None)
+            self.expiries.pop(key, None)
+        return removed
+
+class TestSessionStore(unittest.TestCase):
+    """Test cases for SessionStore and RedisSessionStore"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.now = 1000.0
+        self.clock = lambda: self.now
+
+    def _exercise(self, store):
+        alice = [store.create("alice") for _ in range(3)]
+        bob = store.create("bob")
+        self.assertEqual({store.resolve(token) for token in alice}, {"alice"})
+        self.assertIsNone(store.resolve("not-a-token"))
+
+        self.assertTrue(store.revoke(alice[0]))
+        self.assertIsNone(store.resolve(alice[0]))
+        self.assertEqual(store.revoke_user("alice"), 2)
+        self.assertIsNone(store.resolve(alice[1]))
+        self.assertEqual(store.resolve(bob), "bob")
+
+        self.now += 3601
+        self.assertIsNone(store.resolve(bob))
+
+    def test_in_process_store(self):
+        """Test lookups, logout, logout everywhere and expiry swept by the timing wheel"""
+        from nanoquant.core.session_store import SessionStore
+
+        store = SessionStore(ttl=3600, resolution=60, slots=16, clock=self.clock)
+        # One turn of the wheel spans the TTL, so a slot is only swept once its sessions expired
+        self.assertGreaterEqual(store.resolution * (len(store.wheel) - 1), store.ttl)
+        live_scans = []
+
+        class Sessions(dict):
+            def get(inner, token_hash, default=None):
+                session = dict.get(inner, token_hash, default)
+                if session is not None and session[1] > self.now:
+                    live_scans.append(token_hash)
+                return session
+
+        # create only looks sessions up through the sweep
+        store.sessions = Sessions()
+        for _ in range(3 * 3 * 16):
+            store.create("zoe")
+            self.now += store.resolution / 3
+        self.assertLess(len(store), 3 * 3 * 16)
+        self.assertEqual(live_scans, [])
+        store.revoke_user("zoe")
+        self.assertEqual(SessionStore(ttl=600, resolution=60, slots=16).resolution, 60)
+        self._exercise(store)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.user_sessions, {})
+
+        # Expired sessions are swept without ever being looked up, also after more than a full turn
+        store.create("carol")
+        late = store.create("dave")
+        self.now += 1800
+        fresh = store.create("erin")
+        # Sweeps run at the wheel's resolution, widened here to fit the TTL in one turn
+        self.now += 1800 + 2 * store.resolution
+        store.create("frank")
+        # carol and dave expired and were swept; erin and frank remain
+        self.assertEqual(len(store), 2)
+        self.assertNotIn("dave", store.user_sessions)
+        self.assertIsNone(store.resolve(late))
+        self.now += 60 * 16 * 10
+        self.assertIsNone(store.resolve(fresh))
+        self.assertEqual(len(store), 0)
+        self.assertTrue(all(not slot for slot in store.wheel))
+
+    def test_redis_store(self):
+        """Test the same behaviour against a Redis-compatible server"""
+        from nanoquant.core.session_store import RedisSessionStore
+
+        self._exercise(RedisSessionStore(LocalRedis(self.clock), ttl=3600))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests for single-flight execution of identical compression jobs
+"""
+import unittest
+import sys
+import os
+import sqlite3
+import tempfile
+from unittest.mock import Mock
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for flight keys, claim_next, claim_followers and result fan-out in run_job"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "jobs.db")
+
+    def test_identical_jobs_wait_for_the_running_one(self):
+        """Test that workers skip queued jobs identical to a running job but take different ones"""
+        from nanoquant.core.job_queue import JobStore, flight_key
+
+        self.assertEqual(flight_key("org/model", "heavy", {"streaming": True, "lazy": True}),
+                         flight_key("org/model", "heavy", {"streaming": True}))
+        self.assertNotEqual(flight_key("org/model", "heavy", {"streaming": True}),
+                            flight_key("org/model", "heavy", {"streaming": False}))
+
+        store = JobStore(self.db_path)
+        leader = store.create_job("alice", "org/model", "heavy", {"push_to_ollama": False})
+        twin = store.create_job("bob", "org/model", "heavy", {"push_to_ollama": False, "lazy": True})
+        other = store.create_job("bob", "org/model", "light", {"push_to_ollama": False})
+
+        self.assertEqual(store.claim_next("worker-1")["id"], leader)
+        self.assertEqual(store.claim_next("worker-2")["id"], other)
+        self.assertIsNone(store.claim_next("worker-3"))
+
+        # Once no twin is running, the waiting job runs on its own
+        store.fail_job(leader, "pod evicted")
+        self.assertEqual(store.claim_next("worker-3")["id"], twin)
+
+    def test_result_fans_out_with_per_user_credits(self):
+        """Test that one execution completes every identical job and charges each user separately"""
+        from nanoquant.core.job_queue import JobStore, run_job, COMPLETED, FAILED
+
+        def share_result(result, user_id=None, compression_level=None):
+            if user_id == "mallory":
+                raise PermissionError("Insufficient credits")
+            return result
+
+        store = JobStore(self.db_path)
+        pipeline = Mock()
+        pipeline.process_model.return_value = {"model_id": "org/model", "output_directory": "/out/org_model"}
+        pipeline.share_result.side_effect = share_result
+        request = {"push_to_ollama": False}
+        job_ids = [store.create_job(user, "org/model", "heavy", request) for user in ("alice", "bob", "mallory")]
+
+        leader = store.claim_next("worker")
+        self.assertIsNone(store.claim_next("worker"))
+        self.assertTrue(run_job(store, leader, pipeline))
+
+        self.assertEqual(pipeline.process_model.call_count, 1)
+        self.assertEqual(pipeline.process_model.call_args.kwargs["user_id"], "alice")
+        self.assertEqual([call.kwargs["user_id"] for call in pipeline.share_result.call_args_list], ["bob", "mallory"])
+        self.assertEqual({call.kwargs["compression_level"] for call in pipeline.share_result.call_args_list}, {"heavy"})
+        alice, bob, mallory = (store.get_job(job_id) for job_id in job_ids)
+        self.assertEqual((alice["status"], bob["status"], mallory["status"]), (COMPLETED, COMPLETED, FAILED))
+        self.assertEqual(bob["result"], alice["result"])
+        self.assertEqual(bob["output_path"], "/out/org_model")
+        self.assertEqual(bob["leader_id"], alice["id"])
+        self.assertEqual(mallory["error"], "Insufficient credits")
+
+    def test_failed_leader_leaves_followers_queued(self):
+        """Test that a failed run is not shared, and that older databases gain the new columns"""
+        from nanoquant.core.job_queue import JobStore, run_job, QUEUED, FAILED
+
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("CREATE TABLE compression_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+                           "model_id TEXT NOT NULL, compression_level TEXT NOT NULL, status TEXT NOT NULL, "
+                           "created_at TIMESTAMP, started_at TIMESTAMP, completed_at TIMESTAMP, output_path TEXT, "
+                           "credits_used INTEGER, request TEXT, progress REAL DEFAULT 0, stage TEXT, result TEXT, "
+                           "error TEXT, worker TEXT)")
+        connection.commit()
+        connection.close()
+
+        store = JobStore(self.db_path)
+        pipeline = Mock()
+        pipeline.process_model.side_effect = PermissionError("Insufficient credits")
+        leader = store.create_job("mallory", "org/model", "ultra", {})
+        follower = store.create_job("alice", "org/model", "ultra", {})
+
+        self.assertFalse(run_job(store, store.claim_next("worker"), pipeline))
+        self.assertEqual(store.get_job(leader)["status"], FAILED)
+        self.assertEqual(store.get_job(follower)["status"], QUEUED)
+        pipeline.share_result.assert_not_called()
+        self.assertEqual(store.claim_next("worker")["id"], follower)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests for sparse storage of pruned layers
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestSparseLayers(unittest.TestCase):
+    """Test cases for SparseLinear and pruning materialization"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.weight = torch.randn(24, 64)
+        self.bias = torch.randn(24)
+        self.inputs = torch.randn(2, 5, 64)
+
+    def test_layouts_round_trip(self):
+        """Test that every layout reproduces the pruned weights and their outputs"""
+        from nanoquant.core.sparse_layers import SparseLinear
+        from nanoquant.core.layer_kernels import _n_m_prune_mask
+
+        masks = {
+            "bitmap": torch.rand(24, 64) < 0.7,
+            "csr": torch.rand(24, 64) < 0.95,
+            "n:m": _n_m_prune_mask(torch.rand(24, 64), 2, 4),
+        }
+        for layout, mask in masks.items():
+            pruned = self.weight.masked_fill(mask, 0)
+            layer = SparseLinear.from_weight(pruned, self.bias, layout)
+            self.assertTrue(torch.equal(layer.to_dense(), pruned), layout)
+            expected = torch.nn.functional.linear(self.inputs, pruned, self.bias)
+            self.assertTrue(torch.allclose(layer(self.inputs), expected, atol=1e-5), layout)
+
+    def test_sparse_storage_is_smaller(self):
+        """Test that a 0.7-sparse layer takes well under half of its dense size"""
+        from nanoquant.core.sparse_layers import SparseLinear
+
+        pruned = self.weight.masked_fill(torch.rand(24, 64) < 0.7, 0)
+        layer = SparseLinear.from_weight(pruned, None)
+        stored = sum(buffer.numel() * buffer.element_size() for buffer in layer.buffers())
+        self.assertLess(stored, 0.4 * pruned.numel() * pruned.element_size())
+
+    def test_pruning_materializes_and_reloads(self):
+        """Test that pruned models keep no reparametrizations and rebuild from the manifest"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.sparse_layers import SparseLinear, materialize_sparse_layers
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        model = torch.nn.Sequential(torch.nn.Linear(64, 32), torch.nn.Linear(32, 8))
+        engine = UltraAdvancedCompressionEngine()
+        model = engine.compress_module(model, {"pruning": {"type": "wanda", "pattern": "2:4"}},
+                                       torch.device("cpu"))
+        self.assertEqual(sorted(name for name, _ in model.named_parameters()),
+                         ["0.bias", "0.weight", "1.bias", "1.weight"])
+
+        expected = model(self.inputs)
+        materialize_sparse_layers(model)
+        self.assertIsInstance(model[0], SparseLinear)
+        self.assertEqual(model[0].layout, "n:m")
+
+        rebuilt = torch.nn.Sequential(torch.nn.Linear(64, 32), torch.nn.Linear(32, 8))
+        restore_quantized_modules(rebuilt, quantized_modules_manifest(model))
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.allclose(rebuilt(self.inputs), expected, atol=1e-5))
+
+    def test_pruning_leaves_tied_embeddings_intact(self):
+        """Test that pruning skips an output projection tied to the input embedding"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+
+        class TiedModel(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.embed = torch.nn.Embedding(50, 32)
+                self.proj = torch.nn.Linear(32, 32)
+                self.lm_head = torch.nn.Linear(32, 50, bias=False)
+                self.lm_head.weight = self.embed.weight
+
+            def forward(self, input_ids, use_cache=False):
+                return self.lm_head(self.proj(self.embed(input_ids)))
+
+        model = TiedModel()
+        embedding = model.embed.weight.detach().clone()
+        for calibration_data in (None, [torch.randint(0, 50, (2, 16))]):
+            engine = UltraAdvancedCompressionEngine()
+            engine.calibration_data = calibration_data
+            pruned = engine.compress_module(model, {"pruning": {"type": "sparsegpt", "ratio": 0.9}},
+                                            torch.device("cpu"))
+            self.assertIs(pruned.lm_head.weight, pruned.embed.weight)
+            self.assertTrue(torch.equal(pruned.embed.weight, embedding))
+            self.assertAlmostEqual((pruned.proj.weight == 0).float().mean().item(), 0.9, delta=0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Tests for super-weight outlier preservation
+"""
+import unittest
+import sys
+import os
+import torch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestSuperWeights(unittest.TestCase):
+    """Test cases for the super-weight outlier side-table"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        torch.manual_seed(0)
+        self.model = torch.nn.Sequential(torch.nn.Linear(256, 128), torch.nn.Linear(128, 64))
+        with torch.no_grad():
+            # A few very large weights, as found in real LLM projections
+            self.model[0].weight[3, 7] = 40.0
+            self.model[0].weight[90, 200] = -25.0
+        self.inputs = torch.randn(2, 256)
+
+    def test_outliers_survive_packed_quantization_and_reload(self):
+        """Test that QuantizedLinear stores super weights exactly and restores them at load"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+        from nanoquant.core.quantized_layers import quantized_modules_manifest, restore_quantized_modules
+
+        engine = UltraAdvancedCompressionEngine()
+        original = self.model[0].weight.data.clone()
+        model = engine.compress_module(self.model, {"preserve_super_weights": True,
+                                                    "quantization": {"type": "onebit"}},
+                                       torch.device("cpu"))
+        outliers = engine.super_weights["0"]
+        self.assertEqual(model[0].num_outliers, len(outliers["indices"]))
+
+        weight = model[0].dequantize()
+        self.assertEqual(weight[3, 7].item(), 40.0)
+        self.assertEqual(weight[90, 200].item(), -25.0)
+        # The rest of the layer is not dragged towards the outliers' magnitude
+        self.assertLess(weight[3, 8:].abs().max().item(), 1.0)
+
+        table = sum(t.numel() * t.element_size() for t in outliers.values())
+        self.assertLess(table, 0.01 * original.numel() * 2)
+
+        rebuilt = restore_quantized_modules(
+            torch.nn.Sequential(torch.nn.Linear(256, 128), torch.nn.Linear(128, 64)),
+            quantized_modules_manifest(model)
+        )
+        rebuilt.load_state_dict(model.state_dict())
+        self.assertTrue(torch.equal(rebuilt[0].dequantize(), weight))
+
+    def test_pruners_keep_super_weights(self):
+        """Test that every pruner leaves the identified super weights in place"""
+        from nanoquant.core.compression_engine import UltraAdvancedCompressionEngine
+
+        for prune_type in ("unstructured", "wanda", "sparsegpt"):
+            for pattern in (None, "2:4"):
+                model = torch.nn.Sequential(torch.nn.Linear(256, 128), torch.nn.Linear(128, 64))
+                model.load_state_dict(self.model.state_dict())
+                engine = UltraAdvancedCompressionEngine()
+                config = {"preserve_super_weights": True,
+                          "pruning": {"type": prune_type, "ratio": 0.95, "pattern": pattern}}
+                model = engine.compress_module(model, config, torch.device("cpu"))
+
+                for name, outliers in engine.super_weights.items():
+                    kept = model.get_submodule(name).weight.flatten()[outliers["indices"].long()]
+                    self.assertTrue(bool((kept != 0).all()), f"{prune_type} {pattern} {name}")
+
+if __name__ == '__main__':
+    unittest.main()
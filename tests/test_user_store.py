@@ -0,0 +1,112 @@
+"""
+Tests for the user storage backends
+"""
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class TestUserStore(unittest.TestCase):
+    """Test cases for SQLiteUserStore, JsonUserStore and UserManager over them"""
+
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.work_dir = tempfile.mkdtemp()
+        # Keep user changes off any DynamoDB table the environment is configured for
+        cloud = patch("nanoquant.core.user_management.CLOUD_AVAILABLE", False)
+        cloud.start()
+        self.addCleanup(cloud.stop)
+
+    def _exercise(self, manager):
+        user_id = manager.register_user("alice@example.com", "secret")
+        self.assertIsNotNone(user_id)
+        self.assertIsNone(manager.register_user("alice@example.com", "other"))
+        self.assertEqual(manager.authenticate_user("alice@example.com", "secret"), user_id)
+        self.assertIsNone(manager.authenticate_user("alice@example.com", "wrong"))
+
+        self.assertTrue(manager.add_credits(user_id, 50, "purchase"))
+        self.assertTrue(manager.deduct_credits(user_id, 120, "compression_heavy"))
+        self.assertFalse(manager.deduct_credits(user_id, 31, "compression_heavy"))
+        self.assertEqual(manager.get_user_credits(user_id), 30)
+        self.assertEqual([entry["amount"] for entry in manager.get_credit_history(user_id)], [-120, 50])
+
+        for _ in range(2):
+            self.assertTrue(manager.check_compression_access(user_id, "ultra"))
+            manager.increment_trial_usage(user_id, "ultra")
+        self.assertEqual(manager._get_trials_count(user_id, "ultra"), 2)
+        # Trials used up and 30 credits are short of the 50 ultra costs
+        self.assertFalse(manager.check_compression_access(user_id, "ultra"))
+
+        coupon = manager.create_coupon(25, "nanoquant_admin_secret")
+        self.assertTrue(manager.redeem_coupon(user_id, coupon))
+        self.assertFalse(manager.redeem_coupon(user_id, coupon))
+        profile = manager.get_user_profile(user_id)
+        self.assertEqual(profile["credits"], 55)
+        self.assertNotIn("password_hash", profile)
+        return user_id
+
+    def test_sqlite_backend(self):
+        """Test registration, login, credits, trials and coupons against SQLite"""
+        from nanoquant.core.user_management import UserManager
+        from nanoquant.core.user_store import SQLiteUserStore
+
+        db_path = os.path.join(self.work_dir, "users.db")
+        manager = UserManager(db_path)
+        self.assertIsInstance(manager.store, SQLiteUserStore)
+        user_id = self._exercise(manager)
+
+        # A second manager in the process shares the same store
+        other = UserManager(db_path)
+        self.assertEqual(other.get_user_credits(user_id), 55)
+        self.assertEqual(other.store.credit_history(user_id)[0]["balance"], 55)
+
+    def test_json_backend(self):
+        """Test that a .json path keeps the legacy file backend with the same behaviour"""
+        from nanoquant.core.user_management import UserManager
+        from nanoquant.core.user_store import JsonUserStore
+
+        db_path = os.path.join(self.work_dir, "users.json")
+        manager = UserManager(db_path)
+        self.assertIsInstance(manager.store, JsonUserStore)
+        user_id = self._exercise(manager)
+        with open(db_path) as f:
+            self.assertEqual(json.load(f)["users"][user_id]["credits"], 55)
+
+    def test_new_sqlite_database_imports_legacy_json(self):
+        """Test that users, ledger, trials and coupons move over from nanoquant_users.json"""
+        from nanoquant.core.user_management import UserManager
+
+        legacy = UserManager(os.path.join(self.work_dir, "nanoquant_users.json"))
+        user_id = legacy.register_user("bob@example.com", "secret", social_id="gh-1")
+        legacy.add_credits(user_id, 40, "purchase")
+        legacy.deduct_credits(user_id, 10, "compression_heavy")
+        legacy.increment_trial_usage(user_id, "nano")
+        coupon = legacy.create_coupon(5, "nanoquant_admin_secret")
+
+        manager = UserManager(os.path.join(self.work_dir, "nanoquant_users.db"))
+        self.assertEqual(manager.authenticate_user("bob@example.com", "secret"), user_id)
+        self.assertEqual(manager.authenticate_social_user("gh-1", "github"), user_id)
+        self.assertEqual(manager.get_user_credits(user_id), 130)
+        self.assertEqual([(entry["amount"], entry["balance"]) for entry in manager.get_credit_history(user_id)],
+                         [(-10, 130), (40, 140)])
+        self.assertEqual(manager._get_trials_count(user_id, "nano"), 1)
+        self.assertTrue(manager.redeem_coupon(user_id, coupon))
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """Test that a backend missing part of the interface fails when instantiated"""
+        from nanoquant.core.user_store import UserStore
+
+        class ReadOnlyStore(UserStore):
+            def get_user(self, user_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnlyStore()
+
+if __name__ == '__main__':
+    unittest.main()